@@ -1,6 +1,4 @@
-import cron from "node-cron";
 import {
-  checkPendingSignatures,
   checkPendingProcurementProposals,
   checkOverdueDeliveries,
   checkBudgetAlerts,
@@ -77,394 +75,244 @@ import {
   checkBirthdays,
   sendMonthlyCashFlowSummaryToAdmins,
   sendWeeklySummaryToAdmins,
+  runPendingSignaturesSweep,
+  runEventRemindersSweep,
 } from "./controllers/notification.controller.js";
-import { addMonthlyVacationDays } from "./controllers/employees.controller.js";
+import {
+  addMonthlyVacationDays,
+  updateSickDays,
+  checkEmployeeDetails,
+} from "./controllers/employees.controller.js";
+import {
+  checkAndNotifySubscriptionsEndingSoon,
+  syncSubscriptionsWithStripe,
+} from "./controllers/payment.controller.js";
 import { sendInvoiceReminders } from "./controllers/invoiceReminder.controller.js";
 import { checkAndCreateProjectRisks } from "./controllers/advancedProject.controller.js";
 import Company from "./models/companies.model.js";
-import Salary from "./models/salary.model.js";
-import Employee from "./models/employees.model.js";
-import Shift from "./models/Shifts.model.js";
-import TaxConfig from "./models/TaxConfig.model.js";
+import { registerJob, startJobs, forEachCompany } from "./services/jobEngine.service.js";
+import { startPayrollRun, resumeStalePayrollRuns } from "./services/payrollEngine.service.js";
+import { rebuildAllReportRollups } from "./services/reportRollupBackfill.service.js";
 
-console.log("🚀 Starting all notification cron jobs...");
+// ========================
+// JOB HANDLERS
+// ========================
 
-// ⏰ כל שעה - דחוף
-cron.schedule("0 * * * *", async () => {
-  console.log("\n⏰ Running hourly notifications...");
-  try {
-    await checkPendingSignatures();
-    await checkPendingProcurementProposals();
-  } catch (error) {
-    console.error("Error in hourly notifications:", error);
+// חישוב משכורות אוטומטי לחודש הנוכחי - דרך מנוע השכר (תצורת מס לפי מדינת העובד)
+const calculateMonthlyPayroll = async () => {
+  console.log("\n💰 Running automatic payroll calculation...");
+  const now = new Date();
+  const year = now.getFullYear();
+  const month = now.getMonth() + 1;
+
+  await forEachCompany(
+    async (companyId) => {
+      const { run, completion } = await startPayrollRun({
+        companyId,
+        year,
+        month,
+        mode: "calculate",
+        taxSource: "employeeCountry",
+        trigger: "cron",
+        notes: "חושב אוטומטית",
+      });
+      if (!run) return;
+
+      const finished = completion ? await completion : run;
+      console.log(`✅ Calculated ${finished?.succeeded || 0} salaries for company ${companyId}`);
+    },
+    { concurrency: 2 }
+  );
+};
+
+// ניקוי חברות שלא שילמו אחרי שבוע
+const cleanupUnpaidCompanies = async () => {
+  console.log("\n🧹 Cleaning up unpaid companies...");
+  const sevenDaysAgo = new Date();
+  sevenDaysAgo.setDate(sevenDaysAgo.getDate() - 7);
+  
+  const unpaidCompanies = await Company.find({
+    status: "Pending",
+    "subscription.paymentStatus": "Pending",
+    createdAt: { $lt: sevenDaysAgo },
+    "subscription.subscriptionId": { $exists: false }
+  });
+
+  let deletedCount = 0;
+  for (const company of unpaidCompanies) {
+    try {
+      console.log(`Deleting unpaid company: ${company.name} (${company._id})`);
+      await Company.findByIdAndDelete(company._id);
+      deletedCount++;
+    } catch (error) {
+      console.error(`Error deleting company ${company._id}:`, error.message);
+    }
   }
-});
 
-// ⏰ כל 6 שעות - חשוב
-cron.schedule("0 */6 * * *", async () => {
-  console.log("\n⏰ Running 6-hour notifications...");
-  try {
-    // Existing
-    await checkProjectDeadlines();
-    await checkTaskDeadlines();
-    await checkOverdueDeliveries();
-    
-    // New notifications
-    await checkBlockedProductionOrders();
-    await checkCustomerOrderStatusChanges();
-    await checkSupplierPaymentIssues();
-    await checkUnapprovedShifts();
-    await checkBlockedTasks();
-    await checkUnassignedTasks();
-  } catch (error) {
-    console.error("Error in 6-hour notifications:", error);
+  if (deletedCount > 0) {
+    console.log(`✅ Cleaned up ${deletedCount} unpaid companies`);
+  } else {
+    console.log("✅ No unpaid companies to clean up");
   }
+};
+
+// ========================
+// JOB REGISTRATION
+// ========================
+// כל job רץ תחת נעילת Redis - רק instance אחד מריץ אותו גם כשיש כמה שרתים.
+// הצעדים בתוך job רצים ברצף; שגיאה בצעד אחד לא עוצרת את הבאים.
+
+// ⏰ כל דקה - חתימות ממתינות ותזכורות אירועים
+registerJob("pending-signatures", "*/1 * * * *", [runPendingSignaturesSweep], {
+  lockTtlMs: 5 * 60 * 1000,
 });
+registerJob("event-reminders", "*/1 * * * *", [runEventRemindersSweep], {
+  lockTtlMs: 5 * 60 * 1000,
+});
+
+// ⏰ כל שעה - דחוף
+registerJob("hourly-notifications", "0 * * * *", [checkPendingProcurementProposals]);
+
+// ⏰ כל שעה - פרטי עובדים חסרים ומנויים שמסתיימים בקרוב
+registerJob("hourly-account-checks", "0 * * * *", [
+  checkEmployeeDetails,
+  checkAndNotifySubscriptionsEndingSoon,
+]);
+
+// ⏰ כל 6 שעות - חשוב
+registerJob("six-hour-notifications", "0 */6 * * *", [
+  checkProjectDeadlines,
+  checkTaskDeadlines,
+  checkOverdueDeliveries,
+  checkBlockedProductionOrders,
+  checkCustomerOrderStatusChanges,
+  checkSupplierPaymentIssues,
+  checkUnapprovedShifts,
+  checkBlockedTasks,
+  checkUnassignedTasks,
+]);
 
 // ⏰ פעמיים ביום (9:00, 17:00) - מלאי ומחסנים
-cron.schedule("0 9,17 * * *", async () => {
-  console.log("\n⏰ Running inventory & warehouse notifications...");
-  try {
-    // Existing
-    await checkLowInventory();
-    await checkExpiringProducts();
-    await checkMissingComponentsAvailability();
-    
-    // New notifications
-    await checkWarehouseCapacityAlerts();
-    await checkInventoryDiscrepancies();
-    await checkInventoryTransferPending();
-    await checkInventoryLocationIssues();
-  } catch (error) {
-    console.error("Error in inventory & warehouse notifications:", error);
-  }
-});
+registerJob("inventory-notifications", "0 9,17 * * *", [
+  checkLowInventory,
+  checkExpiringProducts,
+  checkMissingComponentsAvailability,
+  checkWarehouseCapacityAlerts,
+  checkInventoryDiscrepancies,
+  checkInventoryTransferPending,
+  checkInventoryLocationIssues,
+]);
 
 // ⏰ פעם ביום (8:00) - HR & לקוחות & כספים
-cron.schedule("0 8 * * *", async () => {
-  console.log("\n⏰ Running daily morning notifications (8:00 AM)...");
-  try {
-    // Existing
-    await checkUpcomingPerformanceReviews();
-    await checkCustomerOrders();
-    await checkOverdueInvoices();
-    await updateOverdueInvoiceStatus();
-    await sendInvoiceReminders();
-    await checkUpcomingPaymentDueDates();
-    await checkOverduePayments();
-    
-    // New notifications
-    await checkUncontactedLeads();
-    await checkHotLeads();
-    await checkLeadConversionDeadline();
-    await checkDelayedProductionOrders();
-    await checkProductionOrderDeadlines();
-    await checkPendingCustomerOrders();
-    await checkCustomerPaymentOverdue();
-    await checkUnsentInvoices();
-    await checkEmployeeBirthdays();
-    await checkEmployeeAnniversaries();
-    await checkBirthdays(); // שליחת מיילי יום הולדת
-    await checkCashFlowAlerts();
-    await checkLargeTransactions();
-    await checkProcurementApprovalDeadline();
-  } catch (error) {
-    console.error("Error in daily morning notifications:", error);
-  }
-});
+registerJob("daily-morning-notifications", "0 8 * * *", [
+  checkUpcomingPerformanceReviews,
+  checkCustomerOrders,
+  checkOverdueInvoices,
+  updateOverdueInvoiceStatus,
+  sendInvoiceReminders,
+  checkUpcomingPaymentDueDates,
+  checkOverduePayments,
+  checkUncontactedLeads,
+  checkHotLeads,
+  checkLeadConversionDeadline,
+  checkDelayedProductionOrders,
+  checkProductionOrderDeadlines,
+  checkPendingCustomerOrders,
+  checkCustomerPaymentOverdue,
+  checkUnsentInvoices,
+  checkEmployeeBirthdays,
+  checkEmployeeAnniversaries,
+  checkBirthdays, // שליחת מיילי יום הולדת
+  checkCashFlowAlerts,
+  checkLargeTransactions,
+  checkProcurementApprovalDeadline,
+]);
 
 // ⏰ פעם ביום (9:00) - תקציבים ופרויקטים
-cron.schedule("0 9 * * *", async () => {
-  console.log("\n⏰ Running daily budget & project notifications...");
-  try {
-    // Existing
-    await checkBudgetAlerts();
-    
-    // New notifications
-    await checkProjectBudgetOverrun();
-    await checkProjectResourceConflicts();
-    await checkInvoiceApprovalPending();
-    await checkInvoiceDiscrepancies();
-    await checkDuplicateFinanceRecords();
-    await checkSupplierInvoiceMismatch();
-    await checkProcurementQualityIssues();
-  } catch (error) {
-    console.error("Error in daily budget & project notifications:", error);
-  }
-});
+registerJob("daily-budget-project-notifications", "0 9 * * *", [
+  checkBudgetAlerts,
+  checkProjectBudgetOverrun,
+  checkProjectResourceConflicts,
+  checkInvoiceApprovalPending,
+  checkInvoiceDiscrepancies,
+  checkDuplicateFinanceRecords,
+  checkSupplierInvoiceMismatch,
+  checkProcurementQualityIssues,
+]);
 
 // ⏰ כל 30 דקות - אירועים קרובים
-cron.schedule("*/30 * * * *", async () => {
-  try {
-    await checkUpcomingEvents();
-  } catch (error) {
-    console.error("Error in event notifications:", error);
-  }
-});
+registerJob("upcoming-events", "*/30 * * * *", [checkUpcomingEvents]);
 
 // ⏰ פעם ביום (9:00 בבוקר) - בדיקת סיכונים בפרויקטים
-cron.schedule("0 9 * * *", async () => {
-  console.log("\n🔍 Running daily project risk detection (9:00 AM)...");
-  try {
-    await checkAndCreateProjectRisks();
-  } catch (error) {
-    console.error("Error in automatic project risk detection:", error);
-  }
-});
+registerJob("project-risks", "0 9 * * *", [checkAndCreateProjectRisks]);
 
 // ⏰ שבועי - ראשון בבוקר (9:00)
-cron.schedule("0 9 * * 0", async () => {
-  console.log("\n⏰ Running weekly reports...");
-  try {
-    await sendWeeklyReports();
-    await sendWeeklySummaryToAdmins(); // סיכום שבועי - מכירות, פרויקטים, הזמנות
-  } catch (error) {
-    console.error("Error in weekly reports:", error);
-  }
+registerJob("weekly-reports", "0 9 * * 0", [
+  sendWeeklyReports,
+  sendWeeklySummaryToAdmins, // סיכום שבועי - מכירות, פרויקטים, הזמנות
+]);
+
+// ⏰ חודשי - 1 לחודש (חצות) - צבירת ימי חופשה ומחלה, פעם אחת לכל ה-instances
+registerJob("monthly-leave-accrual", "0 0 1 * *", [addMonthlyVacationDays, updateSickDays], {
+  lockTtlMs: 60 * 60 * 1000,
 });
 
 // ⏰ חודשי - 1 לחודש (8:00)
-cron.schedule("0 8 1 * *", async () => {
-  console.log("\n⏰ Running monthly tasks...");
-  try {
-    await sendMonthlyReports();
-    await addMonthlyVacationDays();
-    await sendMonthlyCashFlowSummaryToAdmins(); // סיכום תזרים מזומנים חודשי
-  } catch (error) {
-    console.error("Error in monthly tasks:", error);
-  }
-});
+registerJob("monthly-tasks", "0 8 1 * *", [
+  sendMonthlyReports,
+  sendMonthlyCashFlowSummaryToAdmins, // סיכום תזרים מזומנים חודשי
+]);
 
 // ⏰ חישוב משכורות אוטומטי - 25 לחודש (9:00)
-cron.schedule("0 9 25 * *", async () => {
-  console.log("\n💰 Running automatic payroll calculation...");
-  try {
-    // Get all companies
-    const companies = await Company.find({});
-    
-    for (const company of companies) {
-      try {
-        // Get previous month (calculate for last month)
-        const now = new Date();
-        const year = now.getFullYear();
-        const month = now.getMonth(); // Previous month (0-indexed)
-        
-        const periodStart = new Date(year, month, 1);
-        const periodEnd = new Date(year, month + 1, 0);
-        
-        // Get all active employees for this company
-        const employees = await Employee.find({
-          companyId: company._id,
-          status: "active",
-          deletedAt: { $exists: false },
-        });
-        
-        let calculatedCount = 0;
-        
-        for (const employee of employees) {
-          try {
-            // Get all shifts for this employee in this period
-            const shifts = await Shift.find({
-              companyId: company._id,
-              employeeId: employee._id,
-              shiftDate: {
-                $gte: periodStart,
-                $lte: periodEnd,
-              },
-            });
-            
-            if (shifts.length === 0) continue;
-            
-            // Calculate total hours and pay
-            let totalHours = 0;
-            let totalPay = 0;
-            
-            shifts.forEach((shift) => {
-              totalHours += shift.hoursWorked || 0;
-              totalPay += shift.totalPay || 0;
-            });
-            
-            // Get tax config
-            const countryCode = employee.countryCode || "IL";
-            const taxConfig = await TaxConfig.findOne({
-              countryCode,
-              companyId: company._id,
-              isActive: true,
-            });
-            
-            let taxDeduction = 0;
-            let otherDeductions = [];
-            
-            if (taxConfig && taxConfig.taxBrackets && taxConfig.taxBrackets.length > 0) {
-              // Calculate income tax
-              const taxableIncome = Number(totalPay);
-              let previousLimit = 0;
-              
-              const sortedBrackets = [...taxConfig.taxBrackets].sort((a, b) => a.limit - b.limit);
-              
-              for (const bracket of sortedBrackets) {
-                if (taxableIncome > previousLimit) {
-                  const taxableInBracket = Math.min(taxableIncome, bracket.limit) - previousLimit;
-                  if (taxableInBracket > 0) {
-                    // Rate is stored as decimal (0.10 = 10%, max is 1.0)
-                    // If rate > 1, it means it's stored as percentage (10 = 10%), so divide by 100
-                    const rate = bracket.rate > 1 ? bracket.rate / 100 : bracket.rate;
-                    taxDeduction += taxableInBracket * rate;
-                  }
-                }
-                previousLimit = bracket.limit;
-              }
-              
-              // Calculate other taxes
-              if (taxConfig.otherTaxes && taxConfig.otherTaxes.length > 0) {
-                taxConfig.otherTaxes.forEach((tax) => {
-                  // If rate > 1, it means it's stored as percentage, so divide by 100
-                  const rate = tax.rate > 1 ? tax.rate / 100 : tax.rate;
-                  const amount = tax.fixedAmount || (taxableIncome * rate);
-                  if (amount > 0) {
-                    otherDeductions.push({
-                      description: tax.name,
-                      amount: parseFloat(Number(amount).toFixed(2)),
-                    });
-                  }
-                });
-              }
-            }
-            
-            // Calculate net pay
-            const totalOtherDeductions = otherDeductions.reduce((sum, d) => sum + Number(d.amount || 0), 0);
-            const calculatedNetPay = Number(totalPay) - Number(taxDeduction) - Number(totalOtherDeductions);
-            const netPay = Math.max(0, calculatedNetPay);
-            
-            // Check if salary already exists
-            let salary = await Salary.findOne({
-              companyId: company._id,
-              employeeId: employee._id,
-              periodStart: {
-                $gte: new Date(year, month, 1),
-                $lt: new Date(year, month + 1, 1),
-              },
-            });
-            
-            if (salary) {
-              // Update existing
-              salary.totalHours = parseFloat(Number(totalHours).toFixed(2));
-              salary.totalPay = parseFloat(Number(totalPay).toFixed(2));
-              salary.taxDeduction = parseFloat(Number(taxDeduction).toFixed(2));
-              salary.otherDeductions = otherDeductions;
-              salary.netPay = parseFloat(Number(netPay).toFixed(2));
-              salary.status = "Draft";
-              await salary.save();
-            } else {
-              // Create new
-              await Salary.create({
-                companyId: company._id,
-                employeeId: employee._id,
-                periodStart,
-                periodEnd,
-                totalHours: parseFloat(Number(totalHours).toFixed(2)),
-                totalPay: parseFloat(Number(totalPay).toFixed(2)),
-                bonus: 0,
-                taxDeduction: parseFloat(Number(taxDeduction).toFixed(2)),
-                otherDeductions,
-                netPay: parseFloat(Number(netPay).toFixed(2)),
-                status: "Draft",
-                notes: "חושב אוטומטית",
-              });
-            }
-            
-            calculatedCount++;
-          } catch (error) {
-            console.error(`Error calculating salary for employee ${employee._id}:`, error.message);
-          }
-        }
-        
-        console.log(`✅ Calculated ${calculatedCount} salaries for company ${company.name}`);
-      } catch (error) {
-        console.error(`Error calculating payroll for company ${company._id}:`, error.message);
-      }
-    }
-  } catch (error) {
-    console.error("Error in automatic payroll calculation:", error);
-  }
+registerJob("monthly-payroll", "0 9 25 * *", [calculateMonthlyPayroll], {
+  lockTtlMs: 60 * 60 * 1000,
 });
 
-// ⏰ יומי - מחיקת התראות ישנות (3:00 בלילה)
-cron.schedule("0 3 * * *", async () => {
-  console.log("\n🧹 Cleaning up expired notifications...");
-  try {
-    await cleanupExpiredNotifications();
-  } catch (error) {
-    console.error("Error in cleanup:", error);
-  }
+// ⏰ כל 5 דקות - המשך ריצות שכר שנקטעו (קריסה / deploy)
+registerJob("payroll-run-recovery", "*/5 * * * *", [resumeStalePayrollRuns], {
+  lockTtlMs: 60 * 60 * 1000,
 });
 
-// ⏰ יומי - ניקוי חברות שלא שילמו אחרי שבוע (4:00 בלילה)
-cron.schedule("0 4 * * *", async () => {
-  console.log("\n🧹 Cleaning up unpaid companies...");
-  try {
-    const sevenDaysAgo = new Date();
-    sevenDaysAgo.setDate(sevenDaysAgo.getDate() - 7);
-    
-    const unpaidCompanies = await Company.find({
-      status: "Pending",
-      "subscription.paymentStatus": "Pending",
-      createdAt: { $lt: sevenDaysAgo },
-      "subscription.subscriptionId": { $exists: false }
-    });
-
-    let deletedCount = 0;
-    for (const company of unpaidCompanies) {
-      try {
-        console.log(`Deleting unpaid company: ${company.name} (${company._id})`);
-        await Company.findByIdAndDelete(company._id);
-        deletedCount++;
-      } catch (error) {
-        console.error(`Error deleting company ${company._id}:`, error.message);
-      }
-    }
+// ⏰ יומי - מחיקת התראות ישנות (3:00 בלילה)
+registerJob("cleanup-expired-notifications", "0 3 * * *", [cleanupExpiredNotifications]);
 
-    if (deletedCount > 0) {
-      console.log(`✅ Cleaned up ${deletedCount} unpaid companies`);
-    } else {
-      console.log("✅ No unpaid companies to clean up");
-    }
-  } catch (error) {
-    console.error("❌ Error cleaning up unpaid companies:", error);
-  }
+// ⏰ יומי - בנייה מחדש של סיכומי הדוחות (2:30 בלילה) - מתקן סטיות מכתיבות שעקפו את ה-hooks
+registerJob("report-rollups-rebuild", "30 2 * * *", [rebuildAllReportRollups], {
+  lockTtlMs: 2 * 60 * 60 * 1000,
 });
 
-console.log("✅ All notification cron jobs initialized successfully!");
+// ⏰ יומי - סנכרון מנויים מול Stripe (2:00 בלילה)
+registerJob("stripe-subscription-sync", "0 2 * * *", [syncSubscriptionsWithStripe]);
+
+// ⏰ יומי - ניקוי חברות שלא שילמו אחרי שבוע (4:00 בלילה)
+registerJob("cleanup-unpaid-companies", "0 4 * * *", [cleanupUnpaidCompanies]);
 
 // ⏰ פעם בשבוע (ראשון בבוקר) - בדיקות שבועיות
-cron.schedule("0 7 * * 0", async () => {
-  console.log("\n⏰ Running weekly notifications (Sunday 7:00 AM)...");
-  try {
-    await checkStaleLeads();
-    await checkQualityIssues();
-    await checkWarehouseUtilizationLow();
-    await checkWarehouseLocationIssues();
-    await checkCustomerInactivity();
-    await checkSupplierPerformanceIssues();
-    await checkSupplierContractRenewal();
-    await checkEmployeeContractExpiry();
-    await checkEmployeeAbsencePatterns();
-    await checkSlowMovingInventory();
-    await checkUnreconciledTransactions();
-  } catch (error) {
-    console.error("Error in weekly notifications:", error);
-  }
-});
+registerJob("weekly-notifications", "0 7 * * 0", [
+  checkStaleLeads,
+  checkQualityIssues,
+  checkWarehouseUtilizationLow,
+  checkWarehouseLocationIssues,
+  checkCustomerInactivity,
+  checkSupplierPerformanceIssues,
+  checkSupplierContractRenewal,
+  checkEmployeeContractExpiry,
+  checkEmployeeAbsencePatterns,
+  checkSlowMovingInventory,
+  checkUnreconciledTransactions,
+]);
 
 // ⏰ פעם ביום (13:00) - משמרות ומשכורות
-cron.schedule("0 13 * * *", async () => {
-  console.log("\n⏰ Running shifts & salary notifications (1:00 PM)...");
-  try {
-    await checkSalaryApprovalDeadline();
-    await checkUnpaidSalaries();
-  } catch (error) {
-    console.error("Error in shifts & salary notifications:", error);
-  }
-});
+registerJob("shift-salary-notifications", "0 13 * * *", [
+  checkSalaryApprovalDeadline,
+  checkUnpaidSalaries,
+]);
 
-console.log("✅ All notification cron jobs initialized successfully!");
+/**
+ * הפעלת כל ה-jobs - נקרא במפורש מ-server.js (הייבוא עצמו לא מתזמן דבר)
+ */
+export const startCronJobs = () => {
+  console.log("🚀 Starting all notification cron jobs...");
+  const count = startJobs();
+  console.log(`✅ ${count} cron jobs initialized successfully!`);
+};
@@ -0,0 +1,218 @@
+// Managed pool of warm headless browsers for PDF rendering.
+//
+// Launching Chromium per document costs seconds and hundreds of MB, so we keep
+// a small number of browsers alive and reuse their pages:
+//   - at most PDF_BROWSER_POOL_SIZE browsers, launched lazily
+//   - at most PDF_RENDER_CONCURRENCY renders at a time; the rest wait in a
+//     FIFO queue (bounded by PDF_RENDER_QUEUE_LIMIT)
+//   - pages are reused up to PAGE_MAX_USES times, browsers are recycled after
+//     BROWSER_MAX_RENDERS renders to cap memory growth
+//   - a crashed/disconnected browser is dropped and the render retried once
+//   - idle browsers are closed after PDF_BROWSER_IDLE_MS
+//
+// Usage:
+//   const pdfBuffer = await renderPdf(html, { format: "A4" });
+
+import { launchBrowser } from "./browser.js";
+
+const isServerless = Boolean(
+  process.env.VERCEL || process.env.AWS_LAMBDA_FUNCTION_VERSION
+);
+
+const POOL_SIZE = Number(process.env.PDF_BROWSER_POOL_SIZE) || (isServerless ? 1 : 2);
+const CONCURRENCY = Number(process.env.PDF_RENDER_CONCURRENCY) || POOL_SIZE * 2;
+const QUEUE_LIMIT = Number(process.env.PDF_RENDER_QUEUE_LIMIT) || 1000;
+const IDLE_TIMEOUT_MS = Number(process.env.PDF_BROWSER_IDLE_MS) || 5 * 60 * 1000;
+const RENDER_TIMEOUT_MS = Number(process.env.PDF_RENDER_TIMEOUT_MS) || 30 * 1000;
+const PAGE_MAX_USES = 50;
+const BROWSER_MAX_RENDERS = 500;
+
+const DEFAULT_PDF_OPTIONS = {
+  format: "A4",
+  printBackground: true,
+  margin: { top: "20px", right: "20px", bottom: "20px", left: "20px" },
+};
+
+// { browser, launching, idlePages: [{ page, uses }], renders, active, retired }
+const slots = [];
+const waiters = [];
+let activeRenders = 0;
+let idleTimer = null;
+
+const stats = { rendered: 0, failed: 0, crashes: 0, launches: 0 };
+
+const isCrashError = (error) =>
+  /Target closed|Session closed|Protocol error|browser has disconnected|Connection closed/i.test(
+    error?.message || ""
+  );
+
+const closeSlot = async (slot) => {
+  const index = slots.indexOf(slot);
+  if (index !== -1) slots.splice(index, 1);
+  slot.retired = true;
+  try {
+    await slot.browser?.close();
+  } catch (error) {
+    // Browser already gone
+  }
+};
+
+const launchSlot = () => {
+  const slot = { browser: null, launching: null, idlePages: [], renders: 0, active: 0, retired: false };
+  slot.launching = launchBrowser()
+    .then((browser) => {
+      stats.launches++;
+      slot.browser = browser;
+      browser.on("disconnected", () => {
+        if (!slot.retired) {
+          stats.crashes++;
+          console.warn("⚠️  PDF browser disconnected, removing from pool");
+          closeSlot(slot);
+        }
+      });
+      return slot;
+    })
+    .catch((error) => {
+      const index = slots.indexOf(slot);
+      if (index !== -1) slots.splice(index, 1);
+      throw error;
+    });
+  slots.push(slot);
+  return slot;
+};
+
+// Least-loaded live browser; launch a new one while under POOL_SIZE
+const pickSlot = async () => {
+  // Slots past BROWSER_MAX_RENDERS are draining and get closed once idle
+  const live = slots.filter((slot) => !slot.retired && slot.renders < BROWSER_MAX_RENDERS);
+  let slot = live.sort((a, b) => a.active - b.active)[0];
+  if (!slot || (slot.active > 0 && live.length < POOL_SIZE)) {
+    slot = launchSlot();
+  }
+  await slot.launching;
+  return slot;
+};
+
+const acquirePage = async (slot) => {
+  const idle = slot.idlePages.pop();
+  if (idle) return idle;
+  return { page: await slot.browser.newPage(), uses: 0 };
+};
+
+const releasePage = async (slot, entry, healthy) => {
+  entry.uses++;
+  if (healthy && !slot.retired && entry.uses < PAGE_MAX_USES) {
+    slot.idlePages.push(entry);
+    return;
+  }
+  try {
+    await entry.page.close();
+  } catch (error) {
+    // Page already closed with its browser
+  }
+};
+
+const withTimeout = (promise, ms) =>
+  Promise.race([
+    promise,
+    new Promise((_, reject) =>
+      setTimeout(() => reject(new Error(`PDF render timed out after ${ms}ms`)), ms).unref()
+    ),
+  ]);
+
+const renderOnce = async (html, pdfOptions) => {
+  const slot = await pickSlot();
+  slot.active++;
+  let entry = null;
+  let healthy = true;
+
+  try {
+    entry = await acquirePage(slot);
+    // "load" waits for images/styles without the extra networkidle0 idle window
+    await entry.page.setContent(html, { waitUntil: "load", timeout: RENDER_TIMEOUT_MS });
+    return await withTimeout(entry.page.pdf({ ...DEFAULT_PDF_OPTIONS, ...pdfOptions }), RENDER_TIMEOUT_MS);
+  } catch (error) {
+    healthy = false;
+    throw error;
+  } finally {
+    slot.active--;
+    slot.renders++;
+    if (entry) await releasePage(slot, entry, healthy);
+    if (slot.renders >= BROWSER_MAX_RENDERS && slot.active === 0) {
+      await closeSlot(slot);
+    }
+  }
+};
+
+const scheduleIdleShutdown = () => {
+  clearTimeout(idleTimer);
+  idleTimer = setTimeout(() => {
+    if (activeRenders === 0 && waiters.length === 0) {
+      shutdownBrowserPool().catch(() => {});
+    }
+  }, IDLE_TIMEOUT_MS);
+  idleTimer.unref();
+};
+
+const acquireRenderSlot = () => {
+  if (activeRenders < CONCURRENCY) {
+    activeRenders++;
+    return Promise.resolve();
+  }
+  if (waiters.length >= QUEUE_LIMIT) {
+    return Promise.reject(new Error("PDF render queue is full, try again later"));
+  }
+  return new Promise((resolve) => waiters.push(resolve));
+};
+
+const releaseRenderSlot = () => {
+  const next = waiters.shift();
+  if (next) {
+    next();
+  } else {
+    activeRenders--;
+    if (activeRenders === 0) scheduleIdleShutdown();
+  }
+};
+
+/**
+ * Render HTML to a PDF buffer through the shared browser pool (queued)
+ */
+export const renderPdf = async (html, pdfOptions = {}) => {
+  await acquireRenderSlot();
+  try {
+    try {
+      const buffer = await renderOnce(html, pdfOptions);
+      stats.rendered++;
+      return buffer;
+    } catch (error) {
+      if (!isCrashError(error)) throw error;
+      // Crash recovery: the dead browser was dropped, retry once on a fresh one
+      console.warn("⚠️  PDF render hit a crashed browser, retrying:", error.message);
+      const buffer = await renderOnce(html, pdfOptions);
+      stats.rendered++;
+      return buffer;
+    }
+  } catch (error) {
+    stats.failed++;
+    throw error;
+  } finally {
+    releaseRenderSlot();
+  }
+};
+
+/**
+ * Close every pooled browser (idle timeout / graceful shutdown)
+ */
+export const shutdownBrowserPool = async () => {
+  clearTimeout(idleTimer);
+  await Promise.all([...slots].map(closeSlot));
+};
+
+export const getBrowserPoolStats = () => ({
+  ...stats,
+  browsers: slots.length,
+  activeRenders,
+  queued: waiters.length,
+  concurrency: CONCURRENCY,
+});
@@ -59,14 +59,88 @@ if (process.env.REDIS_ENABLED === "true" || process.env.REDIS_HOST) {
  * Helper functions
  */
 
+const INVALIDATION_CHANNEL = "cache:invalidate";
+
+// מזהה ה-instance - כדי לא לטפל בהודעות invalidation שפרסמנו בעצמנו
+export const INSTANCE_ID = `${process.pid}:${Math.random().toString(36).slice(2)}`;
+
+const tagKey = (tag) => `tag:${tag}`;
+
+// מונה דורות לכל תגית - עולה בכל invalidation
+const generationKey = (tag) => `tag-gen:${tag}`;
+const GENERATION_TTL_SECONDS = 24 * 60 * 60;
+
+/**
+ * כתיבת ערך ורישומו בתגיות.
+ * כל תגית היא ZSET שהציון בו הוא זמן התפוגה של ה-key - חברים שפגו נמחקים בכל כתיבה,
+ * ותוקף התגית עצמה הוא התפוגה של החבר המאוחר ביותר, כך שהיא לא גדלה בלי גבול.
+ * אם הועברו דורות צפויים והתגית עברה invalidation מאז שנלקחו - לא כותבים (מחזיר 0).
+ * KEYS[1] = key, KEYS[2..n+1] = תגיות, KEYS[n+2..2n+1] = מוני דורות (כשיש בדיקה)
+ * ARGV = payload, ttl בשניות, עכשיו במילישניות, n, דורות צפויים...
+ */
+const SET_TAGGED_SCRIPT = `
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local n = tonumber(ARGV[4])
+if #KEYS > n + 1 then
+  for i = 1, n do
+    if (redis.call("GET", KEYS[n + 1 + i]) or "0") ~= ARGV[4 + i] then
+      return 0
+    end
+  end
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", ttl)
+for i = 2, n + 1 do
+  redis.call("ZADD", KEYS[i], now + ttl * 1000, KEYS[1])
+  redis.call("ZREMRANGEBYSCORE", KEYS[i], "-inf", now)
+  local last = redis.call("ZRANGE", KEYS[i], -1, -1, "WITHSCORES")
+  redis.call("PEXPIREAT", KEYS[i], last[2])
+end
+return 1
+`;
+
+/**
+ * הדורות הנוכחיים של התגיות - לקחת לפני חישוב ולהעביר ל-setCache
+ * מחזיר null אם Redis לא זמין
+ */
+export const getTagGenerations = async (tags) => {
+  if (!redis) return null;
+  if (tags.length === 0) return [];
+  try {
+    const values = await redis.mget(...tags.map(generationKey));
+    return values.map((value) => value || "0");
+  } catch (error) {
+    console.error("Cache generations error:", error);
+    return null;
+  }
+};
+
 /**
  * שמירה בcache
+ * tags - רשימת תגיות (למשל company:<id>:analytics) שמאפשרות מחיקה בלי סריקת keyspace
+ * generations - תוצאת getTagGenerations מלפני החישוב; אם תגית עברה invalidation בינתיים, לא נשמר
  */
-export const setCache = async (key, data, ttl = 300) => {
+export const setCache = async (key, data, ttl = 300, tags = [], generations = null) => {
   if (!redis) return false;
   try {
-    await redis.setex(key, ttl, JSON.stringify(data));
-    return true;
+    if (tags.length === 0) {
+      await redis.setex(key, ttl, JSON.stringify(data));
+      return true;
+    }
+    const checked = Array.isArray(generations) && generations.length === tags.length;
+    const result = await redis.eval(
+      SET_TAGGED_SCRIPT,
+      1 + tags.length * (checked ? 2 : 1),
+      key,
+      ...tags.map(tagKey),
+      ...(checked ? tags.map(generationKey) : []),
+      JSON.stringify(data),
+      ttl,
+      Date.now(),
+      tags.length,
+      ...(checked ? generations : [])
+    );
+    return result === 1;
   } catch (error) {
     console.error("Cache set error:", error);
     return false;
@@ -88,18 +162,76 @@ export const getCache = async (key) => {
 };
 
 /**
- * מחיקת cache לפי pattern
+ * מחיקת cache לפי תגיות - O(גודל התגית), ללא KEYS
+ * מפרסם הודעת invalidation כדי ששכבות L1 בשאר ה-instances יתעדכנו
  */
-export const clearCachePattern = async (pattern) => {
-  if (!redis) return 0;
+export const invalidateTags = async (tags) => {
+  if (!redis || tags.length === 0) return 0;
   try {
-    const keys = await redis.keys(pattern);
-    if (keys.length > 0) {
-      await redis.del(...keys);
-      console.log(`🗑️  Cleared ${keys.length} cache keys matching: ${pattern}`);
-      return keys.length;
+    // קידום הדור לפני קריאת החברים: חישוב שהתחיל לפני ה-invalidation לא יכתוב אחריה,
+    // וכתיבה שהספיקה לפני הקידום כבר רשומה בתגית ותימחק כאן
+    const bump = redis.multi();
+    for (const tag of tags) {
+      bump.incr(generationKey(tag)).expire(generationKey(tag), GENERATION_TTL_SECONDS);
     }
+    await bump.exec();
+
+    const members = await Promise.all(tags.map((tag) => redis.zrange(tagKey(tag), 0, -1)));
+    const keys = [...new Set(members.flat())];
+
+    const pipeline = redis.multi();
+    if (keys.length > 0) pipeline.del(...keys);
+    pipeline.del(...tags.map(tagKey));
+    pipeline.publish(INVALIDATION_CHANNEL, JSON.stringify({ origin: INSTANCE_ID, tags }));
+    await pipeline.exec();
+
+    return keys.length;
+  } catch (error) {
+    console.error("Invalidate tags error:", error);
     return 0;
+  }
+};
+
+/**
+ * האזנה להודעות invalidation מ-instances אחרים (חיבור subscriber נפרד)
+ */
+export const subscribeToInvalidations = (handler) => {
+  if (!redis) return null;
+  const subscriber = redis.duplicate();
+  subscriber.subscribe(INVALIDATION_CHANNEL).catch((error) => {
+    console.error("Cache invalidation subscribe error:", error.message);
+  });
+  subscriber.on("message", (channel, message) => {
+    if (channel !== INVALIDATION_CHANNEL) return;
+    try {
+      const { origin, tags } = JSON.parse(message);
+      if (origin !== INSTANCE_ID && Array.isArray(tags)) handler(tags);
+    } catch (error) {
+      console.error("Cache invalidation message error:", error.message);
+    }
+  });
+  subscriber.on("error", (err) => {
+    console.error("❌ Redis subscriber error:", err.message);
+  });
+  return subscriber;
+};
+
+/**
+ * מחיקת cache לפי pattern - עם SCAN (לא חוסם את Redis), לשימוש ידני/תחזוקה בלבד
+ */
+export const clearCachePattern = async (pattern) => {
+  if (!redis) return 0;
+  try {
+    let cursor = "0";
+    let deleted = 0;
+    do {
+      const [nextCursor, keys] = await redis.scan(cursor, "MATCH", pattern, "COUNT", 500);
+      cursor = nextCursor;
+      if (keys.length > 0) {
+        deleted += await redis.unlink(...keys);
+      }
+    } while (cursor !== "0");
+    return deleted;
   } catch (error) {
     console.error("Clear cache error:", error);
     return 0;
@@ -120,6 +252,44 @@ export const deleteCache = async (key) => {
   }
 };
 
+/**
+ * נעילה מבוזרת (SET NX PX) - מבטיחה שרק instance אחד מריץ job מסוים
+ * מחזיר token לשחרור, או null אם הנעילה תפוסה.
+ * כאשר Redis לא פעיל מחזירים token מקומי (הרצה על instance יחיד).
+ */
+export const acquireLock = async (key, ttlMs = 10 * 60 * 1000) => {
+  const token = `${process.pid}:${Date.now()}:${Math.random().toString(36).slice(2)}`;
+  if (!redis || redis.status !== "ready") return token;
+  try {
+    const result = await redis.set(key, token, "PX", ttlMs, "NX");
+    return result === "OK" ? token : null;
+  } catch (error) {
+    console.error("Acquire lock error:", error);
+    return null;
+  }
+};
+
+const RELEASE_LOCK_SCRIPT = `
+if redis.call("get", KEYS[1]) == ARGV[1] then
+  return redis.call("del", KEYS[1])
+end
+return 0
+`;
+
+/**
+ * שחרור נעילה - רק אם היא עדיין שלנו (compare-and-delete)
+ */
+export const releaseLock = async (key, token) => {
+  if (!redis || redis.status !== "ready" || !token) return false;
+  try {
+    const result = await redis.eval(RELEASE_LOCK_SCRIPT, 1, key, token);
+    return result === 1;
+  } catch (error) {
+    console.error("Release lock error:", error);
+    return false;
+  }
+};
+
 /**
  * בדיקה אם Redis פעיל
  */
@@ -12,7 +12,7 @@ import Lead from "../models/Lead.model.js";
 import Department from "../models/department.model.js";
 import jwt from "jsonwebtoken";
 import mongoose from "mongoose";
-import { launchBrowser } from "../config/lib/browser.js";
+import { renderPdf } from "../config/lib/browserPool.js";
 import { transporter } from "../config/lib/nodemailer.js";
 import { createOrderSummaryEmail, createPaymentInvoiceEmail } from "../emails/emailHandlers.js";
 import { uploadToCloudinaryFile } from "../config/lib/cloudinary.js";
@@ -184,18 +184,7 @@ const sendInvoiceEmailFromOrder = async (invoice) => {
       // Import generateInvoiceHTML from invoice controller (we'll create it inline here)
       const html = await generateInvoiceHTMLForPDF(invoice);
       
-      const browser = await launchBrowser();
-      
-      const page = await browser.newPage();
-      await page.setContent(html, { waitUntil: 'networkidle0' });
-      
-      pdfBuffer = await page.pdf({
-        format: 'A4',
-        printBackground: true,
-        margin: { top: '20px', right: '20px', bottom: '20px', left: '20px' }
-      });
-      
-      await browser.close();
+      pdfBuffer = await renderPdf(html);
       console.log(`✅ PDF buffer generated successfully (${pdfBuffer.length} bytes)`);
     } catch (pdfError) {
       console.error("❌ Error generating PDF buffer, sending email without attachment:", pdfError.message);
@@ -648,18 +637,7 @@ const sendOrderSummaryEmail = async (order, financialRecord) => {
     try {
       const html = await generateOrderHTMLForPDF(order);
       
-      const browser = await launchBrowser();
-      
-      const page = await browser.newPage();
-      await page.setContent(html, { waitUntil: 'networkidle0' });
-      
-      pdfBuffer = await page.pdf({
-        format: 'A4',
-        printBackground: true,
-        margin: { top: '20px', right: '20px', bottom: '20px', left: '20px' }
-      });
-      
-      await browser.close();
+      pdfBuffer = await renderPdf(html);
       console.log(`✅ Order PDF buffer generated successfully (${pdfBuffer.length} bytes)`);
 
       // Upload PDF to Cloudinary
@@ -13,6 +13,10 @@ import Task from "../models/tasks.model.js";
 import jwt from "jsonwebtoken";
 import mongoose from "mongoose";
 import { notifyAdminsAndManagers } from "./notification.controller.js";
+import {
+  planProductionAvailability,
+  loadOpenProductionOrders,
+} from "../services/productionAvailability.service.js";
 
 // Helper function to format address string
 const formatAddressString = (address) => {
@@ -29,60 +33,11 @@ const formatAddressString = (address) => {
 
 /**
  * Check component availability and calculate missing components
+ * (all BOM levels; stock and product names are loaded in batch)
  */
 export const checkComponentAvailability = async (bom, quantity, companyId, session = null) => {
-  const components = [];
-  const missingComponents = [];
-  let totalEstimatedCost = 0;
-
-  for (const bomComponent of bom.components || []) {
-    const componentId = bomComponent.componentId;
-    const requiredQuantity = (bomComponent.quantity || 0) * quantity;
-
-    // Get inventory for this component
-    const inventory = await Inventory.findOne({
-      companyId,
-      productId: componentId,
-    }).session(session || null);
-
-    const availableQuantity = inventory?.quantity || 0;
-    const unitCost = bomComponent.unitCost || 0;
-    const componentCost = requiredQuantity * unitCost;
-    totalEstimatedCost += componentCost;
-
-    // Get product name
-    const product = await Product.findById(componentId).session(session || null);
-    const componentName = product?.productName || "Unknown Component";
-
-    let status = "Available";
-    if (availableQuantity < requiredQuantity) {
-      status = availableQuantity > 0 ? "Partial" : "Unavailable";
-      missingComponents.push({
-        componentId,
-        componentName,
-        required: requiredQuantity,
-        available: availableQuantity,
-        missing: requiredQuantity - availableQuantity,
-      });
-    }
-
-    components.push({
-      componentId,
-      componentName,
-      requiredQuantity,
-      availableQuantity,
-      reservedQuantity: 0,
-      status,
-      unitCost,
-    });
-  }
-
-  return {
-    components,
-    missingComponents,
-    totalEstimatedCost,
-    allComponentsAvailable: missingComponents.length === 0,
-  };
+  const { plans } = await planProductionAvailability(companyId, [{ bomId: bom, quantity }], { session });
+  return plans[0];
 };
 
 /**
@@ -1148,13 +1103,14 @@ export const recheckAvailability = async (req, res) => {
       return res.status(400).json({ success: false, message: "Production order has no BOM" });
     }
 
-    // Recheck availability
-    const availabilityCheck = await checkComponentAvailability(
-      order.bomId,
-      order.quantity,
+    // Recheck availability against the stock left after the other open orders claim theirs
+    const openOrders = await loadOpenProductionOrders(companyId, session);
+    const { plans } = await planProductionAvailability(
       companyId,
-      session
+      [...openOrders.filter((openOrder) => !order._id.equals(openOrder._id)), order],
+      { session }
     );
+    const availabilityCheck = plans[plans.length - 1];
 
     // Update order with new availability data
     order.components = availabilityCheck.components;
@@ -1387,138 +1343,23 @@ export const getAllMissingComponents = async (req, res) => {
     const decodedToken = jwt.verify(token, process.env.JWT_SECRET);
     const companyId = decodedToken.companyId;
 
-    // Get all production orders with missing components
-    const orders = await ProductionOrder.find({
-      companyId,
-      missingComponents: { $exists: true, $ne: [] },
-    })
-      .populate("productId", "productName sku")
-      .populate("missingComponents.componentId", "productName sku unitPrice")
-      .sort({ createdAt: -1 });
-
-    // Aggregate missing components
-    const missingComponentsMap = new Map();
-
-    // First pass: collect all required quantities per component
-    for (const order of orders) {
-      if (!order.missingComponents || order.missingComponents.length === 0) continue;
-
-      for (const missing of order.missingComponents) {
-        const componentId = missing.componentId?._id?.toString() || missing.componentId?.toString();
-        if (!componentId) continue;
-
-        const key = componentId;
-        if (!missingComponentsMap.has(key)) {
-          missingComponentsMap.set(key, {
-            componentId,
-            componentName: missing.componentName || missing.componentId?.productName || "Unknown",
-            sku: missing.componentId?.sku || "N/A",
-            unitPrice: missing.componentId?.unitPrice || 0,
-            totalRequired: 0,
-            totalAvailable: 0, // Will be set from inventory
-            totalMissing: 0,
-            affectedOrders: [],
-          });
-        }
-
-        const aggregated = missingComponentsMap.get(key);
-        // Sum up required quantities from all orders
-        aggregated.totalRequired += missing.required || 0;
-        
-        // Store individual order details
-        aggregated.affectedOrders.push({
-          orderId: order._id.toString(),
-          orderNumber: order.orderNumber,
-          productName: order.productName,
-          required: missing.required || 0,
-          available: missing.available || 0, // This is per-order, for display only
-          missing: missing.missing || 0, // This is per-order, for display only
-        });
-      }
-    }
-
-    // Second pass: get actual available quantity from inventory and calculate ordered quantities
-    const componentIds = Array.from(missingComponentsMap.keys());
-    
-    // Get all procurement orders that contain these components and are not cancelled
-    const procurementOrders = await Procurement.find({
-      companyId,
-      "products.productId": { $in: componentIds },
-      orderStatus: { $in: ["Pending", "In Progress", "Delivered"] },
-    }).select("products orderStatus PurchaseOrder _id");
-
-    // Create a map to track ordered quantities per component
-    const orderedQuantitiesMap = new Map();
-    const procurementOrdersMap = new Map(); // Track which procurements are related to each component
-
-    for (const procurement of procurementOrders) {
-      for (const product of procurement.products || []) {
-        const productId = product.productId?.toString();
-        if (!componentIds.includes(productId)) continue;
-
-        // Use receivedQuantity if available and order is Delivered, otherwise use quantity
-        const orderedQty = 
-          procurement.orderStatus === "Delivered" && product.receivedQuantity 
-            ? product.receivedQuantity 
-            : product.quantity || 0;
-
-        if (!orderedQuantitiesMap.has(productId)) {
-          orderedQuantitiesMap.set(productId, 0);
-          procurementOrdersMap.set(productId, []);
-        }
-
-        orderedQuantitiesMap.set(
-          productId,
-          orderedQuantitiesMap.get(productId) + orderedQty
-        );
-
-        procurementOrdersMap.get(productId).push({
-          procurementId: procurement._id.toString(),
-          PurchaseOrder: procurement.PurchaseOrder,
-          orderStatus: procurement.orderStatus,
-          quantity: orderedQty,
-        });
-      }
-    }
-
-    // Update aggregated data with inventory and ordered quantities
-    for (const [componentId, aggregated] of missingComponentsMap.entries()) {
-      try {
-        const inventory = await Inventory.findOne({
-          companyId,
-          productId: componentId,
-        });
-
-        // Set the actual available quantity from inventory (not accumulated)
-        aggregated.totalAvailable = inventory?.quantity || 0;
-        
-        // Get ordered quantity for this component
-        const totalOrdered = orderedQuantitiesMap.get(componentId) || 0;
-        aggregated.totalOrdered = totalOrdered;
-        aggregated.procurementOrders = procurementOrdersMap.get(componentId) || [];
-        
-        // Calculate total missing: required - available - ordered
-        aggregated.totalMissing = Math.max(0, aggregated.totalRequired - aggregated.totalAvailable - totalOrdered);
-      } catch (inventoryError) {
-        console.error(`Error fetching inventory for component ${componentId}:`, inventoryError);
-        // If we can't get inventory, keep the aggregated available from orders
-        aggregated.totalOrdered = orderedQuantitiesMap.get(componentId) || 0;
-        aggregated.procurementOrders = procurementOrdersMap.get(componentId) || [];
-        aggregated.totalMissing = Math.max(0, aggregated.totalRequired - aggregated.totalAvailable - (aggregated.totalOrdered || 0));
-      }
-    }
+    // Plan all open production orders against one stock snapshot (all BOM levels),
+    // net of quantities already on open procurement orders
+    const openOrders = await loadOpenProductionOrders(companyId);
+    const { plans, purchaseList } = await planProductionAvailability(companyId, openOrders, {
+      includeOnOrder: true,
+    });
 
     // Filter out components that are not actually missing (totalMissing <= 0)
-    const missingComponents = Array.from(missingComponentsMap.values()).filter(
-      (component) => component.totalMissing > 0
-    );
+    const missingComponents = purchaseList.filter((component) => component.totalMissing > 0);
+    const affectedOrders = plans.filter((plan) => plan.purchaseRequirements.length > 0);
 
     res.status(200).json({
       success: true,
       data: {
         missingComponents,
         totalUniqueComponents: missingComponents.length,
-        totalProductionOrders: orders.length,
+        totalProductionOrders: affectedOrders.length,
       },
     });
   } catch (error) {
@@ -1575,80 +1416,42 @@ export const createProcurementFromMultipleMissingComponents = async (req, res) =
       return res.status(404).json({ success: false, message: "Supplier not found" });
     }
 
-    // Get all production orders with missing components
-    const orders = await ProductionOrder.find({
-      companyId,
-      missingComponents: { $exists: true, $ne: [] },
-    })
-      .populate("missingComponents.componentId")
-      .session(session);
-
-    // Collect all missing components for selected componentIds
-    const selectedComponents = new Map();
-    const affectedOrderIds = new Set();
-
-    for (const order of orders) {
-      if (!order.missingComponents || order.missingComponents.length === 0) continue;
-
-      for (const missing of order.missingComponents) {
-        const componentId = missing.componentId?._id?.toString() || missing.componentId?.toString();
-        if (!componentIds.includes(componentId)) continue;
-
-        if (!selectedComponents.has(componentId)) {
-          selectedComponents.set(componentId, {
-            componentId,
-            componentName: missing.componentName || missing.componentId?.productName || "Unknown",
-            totalRequired: 0,
-            totalAvailable: 0,
-            totalMissing: 0,
-            affectedOrders: [],
-          });
-        }
-
-        const aggregated = selectedComponents.get(componentId);
-        aggregated.totalRequired += missing.required || 0;
-        aggregated.totalAvailable = missing.available || 0; // Will be updated from inventory
-        aggregated.totalMissing += missing.missing || 0;
-        aggregated.affectedOrders.push({
-          orderId: order._id.toString(),
-          orderNumber: order.orderNumber,
-          required: missing.required || 0,
-          missing: missing.missing || 0,
-        });
-        affectedOrderIds.add(order._id.toString());
-      }
-    }
+    // Purchase list from one planning run over all open production orders
+    const openOrders = await loadOpenProductionOrders(companyId, session);
+    const { purchaseList } = await planProductionAvailability(companyId, openOrders, {
+      session,
+      includeOnOrder: true,
+    });
 
-    // Get actual inventory for each component
+    const selectedIds = new Set(componentIds.map(String));
     const products = [];
+    const affectedOrderIds = new Set();
     let totalCost = 0;
 
-    for (const [componentId, aggregated] of selectedComponents.entries()) {
-      // Get product details
-      const product = await Product.findById(componentId).session(session);
-      if (!product) continue;
-
-      // Get current price from inventory
-      const inventory = await Inventory.findOne({
-        companyId,
-        productId: componentId,
-      }).session(session);
+    for (const item of purchaseList) {
+      if (!selectedIds.has(item.componentId) || !item.inCatalog || item.totalMissing <= 0) continue;
 
-      const unitPrice = inventory?.unitCost || product.unitPrice || procurementFormData.products?.find(p => p.productId === componentId)?.unitPrice || 0;
-      const quantity = aggregated.totalMissing;
+      const unitPrice =
+        item.unitPrice ||
+        procurementFormData.products?.find((p) => String(p.productId) === item.componentId)?.unitPrice ||
+        0;
+      const quantity = item.totalMissing;
       const productTotal = unitPrice * quantity;
 
       products.push({
-        productId: componentId,
-        productName: product.productName || aggregated.componentName,
-        sku: product.sku || "N/A",
-        category: product.category || "Other",
+        productId: item.componentId,
+        productName: item.componentName,
+        sku: item.sku,
+        category: item.category,
         unitPrice,
         quantity,
         total: productTotal,
       });
 
       totalCost += productTotal;
+      for (const affected of item.affectedOrders) {
+        affectedOrderIds.add(affected.orderId);
+      }
     }
 
     if (products.length === 0) {
@@ -1725,16 +1528,22 @@ export const createProcurementFromMultipleMissingComponents = async (req, res) =
     console.log("✅ [CREATE PROCUREMENT FROM MISSING] Procurement saved:", procurement._id);
 
     // Update production orders notes
-    for (const orderId of affectedOrderIds) {
-      const order = await ProductionOrder.findById(orderId).session(session);
-      if (order) {
-        if (!order.notes) {
-          order.notes = "";
-        }
-        order.notes += `\nהזמנת רכש ${PurchaseOrder} נוצרה עבור רכיבים חסרים ב-${new Date().toLocaleString("he-IL")}`;
-        await order.save({ session });
-      }
-    }
+    await ProductionOrder.updateMany(
+      { _id: { $in: Array.from(affectedOrderIds) }, companyId },
+      [
+        {
+          $set: {
+            notes: {
+              $concat: [
+                { $ifNull: ["$notes", ""] },
+                `\nהזמנת רכש ${PurchaseOrder} נוצרה עבור רכיבים חסרים ב-${new Date().toLocaleString("he-IL")}`,
+              ],
+            },
+          },
+        },
+      ],
+      { session }
+    );
 
     await session.commitTransaction();
     console.log("✅ [CREATE PROCUREMENT FROM MISSING] Transaction committed");
@@ -5,6 +5,38 @@ import BankAccount from "../models/BankAccount.model.js";
 import BankTransaction from "../models/BankTransaction.model.js";
 import jwt from "jsonwebtoken";
 import mongoose from "mongoose";
+import {
+  applyLedgerEntriesToSnapshots,
+  getAccountMovements,
+  getAccountBalancesAsOf,
+  rebuildAccountSnapshots,
+  markAccountSnapshotsDirty,
+  markDirtyIfRebuildOverlapped,
+  ensureAccountSnapshots,
+  signedBalance,
+  parseReportDate,
+} from "../services/accountBalance.service.js";
+import { keysetPaginate, parseKeysetQuery } from "../middleware/pagination.js";
+import { isExportFormat, streamExport } from "../utils/exportStream.js";
+
+const JOURNAL_ENTRY_SORT = { entryDate: -1, createdAt: -1, _id: -1 };
+
+const JOURNAL_ENTRY_EXPORT_COLUMNS = [
+  { header: "Entry Number", path: "entryNumber" },
+  { header: "Date", path: "entryDate" },
+  { header: "Description", path: "description" },
+  { header: "Reference", path: "reference" },
+  { header: "Status", path: "status" },
+  { header: "Total Debit", path: "totalDebit" },
+  { header: "Total Credit", path: "totalCredit" },
+  { header: "Currency", path: "currency" },
+  { header: "Lines", value: (entry) => entry.entries?.length || 0 },
+  {
+    header: "Created By",
+    value: (entry) => [entry.createdBy?.name, entry.createdBy?.lastName].filter(Boolean).join(" "),
+  },
+  { header: "Posted At", path: "postedAt" },
+];
 
 // Helper function to verify token
 const verifyToken = (req) => {
@@ -345,6 +377,7 @@ export const postJournalEntry = async (req, res) => {
     }
 
     // Create ledger entries
+    const postStartedAt = new Date();
     const ledgerEntries = [];
     for (const entry of journalEntry.entries) {
       // Get current balance for account
@@ -390,6 +423,22 @@ export const postJournalEntry = async (req, res) => {
       });
     }
 
+    // עדכון snapshots של יתרות (יום + חודש) - הדוחות הכספיים נשענים עליהם
+    try {
+      await applyLedgerEntriesToSnapshots(ledgerEntries);
+      // בנייה מחדש שרצה במקביל עלולה לדרוס את ה-$inc - מסמנים לבנייה נוספת
+      await markDirtyIfRebuildOverlapped(decoded.companyId, postStartedAt);
+    } catch (snapshotError) {
+      // ה-ledger כבר נשמר - מסמנים את החברה, והדוח הבא יבנה את ה-snapshots מחדש
+      console.error(
+        "❌ Error updating balance snapshots, marking for rebuild:",
+        snapshotError
+      );
+      await markAccountSnapshotsDirty(decoded.companyId).catch((markError) =>
+        console.error("❌ Error marking balance snapshots for rebuild:", markError)
+      );
+    }
+
     // Update journal entry status
     journalEntry.status = "Posted";
     journalEntry.postedBy = decoded.employeeId || decoded.userId;
@@ -429,11 +478,30 @@ export const getAllJournalEntries = async (req, res) => {
     }
     if (status) filter.status = status;
 
-    const journalEntries = await JournalEntry.find(filter)
+    const query = JournalEntry.find(filter)
       .populate("createdBy", "name lastName")
       .populate("postedBy", "name lastName")
-      .populate("entries.accountId", "accountNumber accountName accountType")
-      .sort({ entryDate: -1, createdAt: -1 });
+      .populate("entries.accountId", "accountNumber accountName accountType");
+
+    // ?format=csv|ndjson - ייצוא מלא בזרימה
+    if (isExportFormat(req.query.format)) {
+      return streamExport(res, query.sort(JOURNAL_ENTRY_SORT), {
+        format: req.query.format,
+        filename: "journal-entries",
+        columns: JOURNAL_ENTRY_EXPORT_COLUMNS,
+      });
+    }
+
+    // ?limit / ?cursor - דף לפי keyset cursor
+    if (req.query.limit !== undefined || req.query.cursor !== undefined) {
+      const { data, pagination } = await keysetPaginate(query, {
+        ...parseKeysetQuery(req.query),
+        sort: JOURNAL_ENTRY_SORT,
+      });
+      return res.status(200).json({ success: true, data, pagination });
+    }
+
+    const journalEntries = await query.sort({ entryDate: -1, createdAt: -1 });
 
     res.status(200).json({
       success: true,
@@ -441,7 +509,7 @@ export const getAllJournalEntries = async (req, res) => {
     });
   } catch (error) {
     console.error("Error fetching journal entries:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error fetching journal entries",
     });
@@ -529,20 +597,23 @@ export const getAccountBalance = async (req, res) => {
       });
     }
 
-    const filter = {
-      companyId: decoded.companyId,
-      accountId,
-    };
-
-    if (asOfDate) {
-      filter.entryDate = { $lte: new Date(asOfDate) };
+    const asOf = asOfDate ? parseReportDate(asOfDate) : new Date();
+    if (!asOf) {
+      return res.status(400).json({
+        success: false,
+        message: "Invalid asOfDate",
+      });
     }
 
-    const lastEntry = await Ledger.findOne(filter)
-      .sort({ entryDate: -1, createdAt: -1 })
-      .limit(1);
+    await ensureAccountSnapshots(decoded.companyId);
+    const [account, movements] = await Promise.all([
+      Account.findById(accountId),
+      getAccountBalancesAsOf(decoded.companyId, asOf, {
+        accountIds: [accountId],
+      }),
+    ]);
 
-    const account = await Account.findById(accountId);
+    const movement = movements.get(String(accountId));
 
     res.status(200).json({
       success: true,
@@ -550,52 +621,92 @@ export const getAccountBalance = async (req, res) => {
         accountId,
         accountNumber: account?.accountNumber,
         accountName: account?.accountName,
-        balance: lastEntry?.balance || account?.balance || 0,
-        asOfDate: asOfDate || new Date(),
+        balance:
+          (movement && signedBalance(account?.accountType, movement)) ||
+          account?.balance ||
+          0,
+        asOfDate: asOfDate || asOf,
       },
     });
   } catch (error) {
     console.error("Error fetching account balance:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error fetching account balance",
     });
   }
 };
 
+// ========== BALANCE SNAPSHOTS ==========
+
+// Rebuild balance snapshots from the ledger
+export const rebuildBalanceSnapshots = async (req, res) => {
+  try {
+    const decoded = verifyToken(req);
+
+    const result = await rebuildAccountSnapshots(decoded.companyId);
+
+    res.status(200).json({
+      success: true,
+      message: "Balance snapshots rebuilt successfully",
+      data: result,
+    });
+  } catch (error) {
+    console.error("Error rebuilding balance snapshots:", error);
+    res.status(error.statusCode || 500).json({
+      success: false,
+      message: error.message || "Error rebuilding balance snapshots",
+    });
+  }
+};
+
 // ========== FINANCIAL REPORTS ==========
 
+const toAccountSummary = (account) => ({
+  accountId: account._id,
+  accountNumber: account.accountNumber,
+  accountName: account.accountName,
+});
+
+// סכום תנועות (זכות פחות חובה) לחשבונות מסוג מסוים
+const sumCreditMinusDebit = (accounts, movements) =>
+  accounts.reduce((total, account) => {
+    const movement = movements.get(account._id.toString());
+    return movement ? total + movement.credit - movement.debit : total;
+  }, 0);
+
 // Trial Balance
 export const getTrialBalance = async (req, res) => {
   try {
     const decoded = verifyToken(req);
     const { asOfDate } = req.query;
 
-    const filter = {
-      companyId: decoded.companyId,
-    };
-
-    if (asOfDate) {
-      filter.entryDate = { $lte: new Date(asOfDate) };
+    const asOf = asOfDate ? parseReportDate(asOfDate) : new Date();
+    if (!asOf) {
+      return res.status(400).json({
+        success: false,
+        message: "Invalid asOfDate",
+      });
     }
 
-    // Get all accounts
-    const accounts = await Account.find({
-      companyId: decoded.companyId,
-      isActive: true,
-    });
+    // חשבונות + יתרות מ-snapshots (שתי שאילתות, ללא תלות במספר החשבונות)
+    await ensureAccountSnapshots(decoded.companyId);
+    const [accounts, movements] = await Promise.all([
+      Account.find({
+        companyId: decoded.companyId,
+        isActive: true,
+      }).lean(),
+      getAccountBalancesAsOf(decoded.companyId, asOf),
+    ]);
 
     const trialBalance = [];
 
     for (const account of accounts) {
-      const lastLedgerEntry = await Ledger.findOne({
-        ...filter,
-        accountId: account._id,
-      })
-        .sort({ entryDate: -1, createdAt: -1 })
-        .limit(1);
-
-      const balance = lastLedgerEntry?.balance || account.balance || 0;
+      const movement = movements.get(account._id.toString());
+      const balance =
+        (movement && signedBalance(account.accountType, movement)) ||
+        account.balance ||
+        0;
 
       if (balance !== 0) {
         const isDebit =
@@ -620,7 +731,7 @@ export const getTrialBalance = async (req, res) => {
     res.status(200).json({
       success: true,
       data: {
-        asOfDate: asOfDate || new Date(),
+        asOfDate: asOfDate || asOf,
         accounts: trialBalance,
         totals: {
           totalDebit,
@@ -631,7 +742,7 @@ export const getTrialBalance = async (req, res) => {
     });
   } catch (error) {
     console.error("Error generating trial balance:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error generating trial balance",
     });
@@ -651,54 +762,34 @@ export const getProfitAndLoss = async (req, res) => {
       });
     }
 
-    const filter = {
-      companyId: decoded.companyId,
-      entryDate: {
-        $gte: new Date(startDate),
-        $lte: new Date(endDate),
-      },
-    };
-
-    // Revenue accounts
-    const revenueAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Revenue",
-      isActive: true,
-    });
-
-    // Expense accounts
-    const expenseAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Expense",
-      isActive: true,
-    });
-
-    // COGS accounts
-    const cogsAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Cost of Goods Sold",
-      isActive: true,
-    });
+    const from = parseReportDate(startDate);
+    const to = parseReportDate(endDate);
+    if (!from || !to) {
+      return res.status(400).json({
+        success: false,
+        message: "Invalid start date or end date",
+      });
+    }
 
-    const calculateTotal = async (accounts) => {
-      let total = 0;
-      for (const account of accounts) {
-        const entries = await Ledger.find({
-          ...filter,
-          accountId: account._id,
-        });
-        const accountTotal = entries.reduce(
-          (sum, e) => sum + e.credit - e.debit,
-          0
-        );
-        total += accountTotal;
-      }
-      return total;
-    };
+    await ensureAccountSnapshots(decoded.companyId);
+    const [accounts, movements] = await Promise.all([
+      Account.find({
+        companyId: decoded.companyId,
+        accountType: { $in: ["Revenue", "Expense", "Cost of Goods Sold"] },
+        isActive: true,
+      }).lean(),
+      getAccountMovements(decoded.companyId, { from, to }),
+    ]);
+
+    const revenueAccounts = accounts.filter((a) => a.accountType === "Revenue");
+    const expenseAccounts = accounts.filter((a) => a.accountType === "Expense");
+    const cogsAccounts = accounts.filter(
+      (a) => a.accountType === "Cost of Goods Sold"
+    );
 
-    const revenue = await calculateTotal(revenueAccounts);
-    const expenses = await calculateTotal(expenseAccounts);
-    const cogs = await calculateTotal(cogsAccounts);
+    const revenue = sumCreditMinusDebit(revenueAccounts, movements);
+    const expenses = sumCreditMinusDebit(expenseAccounts, movements);
+    const cogs = sumCreditMinusDebit(cogsAccounts, movements);
 
     const grossProfit = revenue - cogs;
     const netProfit = grossProfit - expenses;
@@ -712,35 +803,23 @@ export const getProfitAndLoss = async (req, res) => {
         },
         revenue: {
           total: revenue,
-          accounts: revenueAccounts.map((a) => ({
-            accountId: a._id,
-            accountNumber: a.accountNumber,
-            accountName: a.accountName,
-          })),
+          accounts: revenueAccounts.map(toAccountSummary),
         },
         costOfGoodsSold: {
           total: cogs,
-          accounts: cogsAccounts.map((a) => ({
-            accountId: a._id,
-            accountNumber: a.accountNumber,
-            accountName: a.accountName,
-          })),
+          accounts: cogsAccounts.map(toAccountSummary),
         },
         grossProfit,
         expenses: {
           total: expenses,
-          accounts: expenseAccounts.map((a) => ({
-            accountId: a._id,
-            accountNumber: a.accountNumber,
-            accountName: a.accountName,
-          })),
+          accounts: expenseAccounts.map(toAccountSummary),
         },
         netProfit,
       },
     });
   } catch (error) {
     console.error("Error generating profit and loss:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error generating profit and loss",
     });
@@ -753,113 +832,59 @@ export const getBalanceSheet = async (req, res) => {
     const decoded = verifyToken(req);
     const { asOfDate } = req.query;
 
-    const filter = {
-      companyId: decoded.companyId,
-    };
-
-    if (asOfDate) {
-      filter.entryDate = { $lte: new Date(asOfDate) };
-    }
-
-    const getAccountBalance = async (accountId) => {
-      const lastEntry = await Ledger.findOne({
-        ...filter,
-        accountId,
-      })
-        .sort({ entryDate: -1, createdAt: -1 })
-        .limit(1);
-      return lastEntry?.balance || 0;
-    };
-
-    // Assets
-    const assetAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Asset",
-      isActive: true,
-    });
-
-    const assets = [];
-    let totalAssets = 0;
-    for (const account of assetAccounts) {
-      const balance = await getAccountBalance(account._id);
-      if (balance !== 0) {
-        assets.push({
-          accountId: account._id,
-          accountNumber: account.accountNumber,
-          accountName: account.accountName,
-          balance: Math.abs(balance),
-        });
-        totalAssets += Math.abs(balance);
-      }
+    const asOf = asOfDate ? parseReportDate(asOfDate) : new Date();
+    if (!asOf) {
+      return res.status(400).json({
+        success: false,
+        message: "Invalid asOfDate",
+      });
     }
 
-    // Liabilities
-    const liabilityAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Liability",
-      isActive: true,
-    });
-
-    const liabilities = [];
-    let totalLiabilities = 0;
-    for (const account of liabilityAccounts) {
-      const balance = await getAccountBalance(account._id);
-      if (balance !== 0) {
-        liabilities.push({
-          accountId: account._id,
-          accountNumber: account.accountNumber,
-          accountName: account.accountName,
-          balance: Math.abs(balance),
-        });
-        totalLiabilities += Math.abs(balance);
+    await ensureAccountSnapshots(decoded.companyId);
+    const [accounts, movements] = await Promise.all([
+      Account.find({
+        companyId: decoded.companyId,
+        accountType: { $in: ["Asset", "Liability", "Equity"] },
+        isActive: true,
+      }).lean(),
+      getAccountBalancesAsOf(decoded.companyId, asOf),
+    ]);
+
+    const buildSection = (accountType) => {
+      const section = { accounts: [], total: 0 };
+      for (const account of accounts) {
+        if (account.accountType !== accountType) continue;
+        const movement = movements.get(account._id.toString());
+        const balance = movement ? signedBalance(accountType, movement) : 0;
+        if (balance !== 0) {
+          section.accounts.push({
+            ...toAccountSummary(account),
+            balance: Math.abs(balance),
+          });
+          section.total += Math.abs(balance);
+        }
       }
-    }
+      return section;
+    };
 
-    // Equity
-    const equityAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Equity",
-      isActive: true,
-    });
-
-    const equity = [];
-    let totalEquity = 0;
-    for (const account of equityAccounts) {
-      const balance = await getAccountBalance(account._id);
-      if (balance !== 0) {
-        equity.push({
-          accountId: account._id,
-          accountNumber: account.accountNumber,
-          accountName: account.accountName,
-          balance: Math.abs(balance),
-        });
-        totalEquity += Math.abs(balance);
-      }
-    }
+    const assets = buildSection("Asset");
+    const liabilities = buildSection("Liability");
+    const equity = buildSection("Equity");
 
     res.status(200).json({
       success: true,
       data: {
-        asOfDate: asOfDate || new Date(),
-        assets: {
-          accounts: assets,
-          total: totalAssets,
-        },
-        liabilities: {
-          accounts: liabilities,
-          total: totalLiabilities,
-        },
-        equity: {
-          accounts: equity,
-          total: totalEquity,
-        },
-        total: totalAssets,
-        totalLiabilitiesAndEquity: totalLiabilities + totalEquity,
+        asOfDate: asOfDate || asOf,
+        assets,
+        liabilities,
+        equity,
+        total: assets.total,
+        totalLiabilitiesAndEquity: liabilities.total + equity.total,
       },
     });
   } catch (error) {
     console.error("Error generating balance sheet:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error generating balance sheet",
     });
@@ -879,73 +904,50 @@ export const getCashFlowStatement = async (req, res) => {
       });
     }
 
-    const filter = {
-      companyId: decoded.companyId,
-      entryDate: {
-        $gte: new Date(startDate),
-        $lte: new Date(endDate),
-      },
-    };
-
-    // Operating Activities (Revenue - Expenses)
-    const operatingAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: { $in: ["Revenue", "Expense"] },
-      isActive: true,
-    });
-
-    let operatingCashFlow = 0;
-    for (const account of operatingAccounts) {
-      const entries = await Ledger.find({
-        ...filter,
-        accountId: account._id,
+    const from = parseReportDate(startDate);
+    const to = parseReportDate(endDate);
+    if (!from || !to) {
+      return res.status(400).json({
+        success: false,
+        message: "Invalid start date or end date",
       });
-      const accountFlow =
-        account.accountType === "Revenue"
-          ? entries.reduce((sum, e) => sum + e.credit - e.debit, 0)
-          : entries.reduce((sum, e) => sum + e.debit - e.credit, 0);
-      operatingCashFlow +=
-        account.accountType === "Revenue" ? accountFlow : -accountFlow;
     }
 
-    // Investing Activities (Asset purchases/sales)
-    const investingAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: "Asset",
-      isActive: true,
-    });
+    await ensureAccountSnapshots(decoded.companyId);
+    const [accounts, movements] = await Promise.all([
+      Account.find({
+        companyId: decoded.companyId,
+        accountType: {
+          $in: ["Revenue", "Expense", "Asset", "Liability", "Equity"],
+        },
+        isActive: true,
+      }).lean(),
+      getAccountMovements(decoded.companyId, { from, to }),
+    ]);
 
+    let operatingCashFlow = 0;
     let investingCashFlow = 0;
-    for (const account of investingAccounts) {
-      const entries = await Ledger.find({
-        ...filter,
-        accountId: account._id,
-      });
-      const accountFlow = entries.reduce(
-        (sum, e) => sum + e.debit - e.credit,
-        0
-      );
-      investingCashFlow -= accountFlow; // Asset purchases are negative
-    }
-
-    // Financing Activities (Liabilities and Equity)
-    const financingAccounts = await Account.find({
-      companyId: decoded.companyId,
-      accountType: { $in: ["Liability", "Equity"] },
-      isActive: true,
-    });
-
     let financingCashFlow = 0;
-    for (const account of financingAccounts) {
-      const entries = await Ledger.find({
-        ...filter,
-        accountId: account._id,
-      });
-      const accountFlow = entries.reduce(
-        (sum, e) => sum + e.credit - e.debit,
-        0
-      );
-      financingCashFlow += accountFlow;
+
+    for (const account of accounts) {
+      const movement = movements.get(account._id.toString());
+      if (!movement) continue;
+      const creditMinusDebit = movement.credit - movement.debit;
+
+      switch (account.accountType) {
+        // Operating Activities (Revenue - Expenses)
+        case "Revenue":
+        case "Expense":
+          operatingCashFlow += creditMinusDebit;
+          break;
+        // Investing Activities (Asset purchases are negative)
+        case "Asset":
+          investingCashFlow += creditMinusDebit;
+          break;
+        // Financing Activities (Liabilities and Equity)
+        default:
+          financingCashFlow += creditMinusDebit;
+      }
     }
 
     const netCashFlow =
@@ -972,10 +974,9 @@ export const getCashFlowStatement = async (req, res) => {
     });
   } catch (error) {
     console.error("Error generating cash flow statement:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error generating cash flow statement",
     });
   }
 };
-
@@ -4,7 +4,28 @@ import JournalEntry from "../models/JournalEntry.model.js";
 import Account from "../models/Account.model.js";
 import jwt from "jsonwebtoken";
 import csv from "csv-parser";
-import { Readable } from "stream";
+import fs from "fs";
+import { Readable, pipeline } from "stream";
+import { keysetPaginate, parseKeysetQuery } from "../middleware/pagination.js";
+import { isExportFormat, streamExport } from "../utils/exportStream.js";
+import { importBankStatement } from "../services/bankImport.service.js";
+
+const BANK_TRANSACTION_SORT = { transactionDate: -1, createdAt: -1, _id: -1 };
+
+const BANK_TRANSACTION_EXPORT_COLUMNS = [
+  { header: "Date", path: "transactionDate" },
+  { header: "Value Date", path: "valueDate" },
+  { header: "Account", path: "bankAccountId.accountName" },
+  { header: "Account Number", path: "bankAccountId.accountNumber" },
+  { header: "Type", path: "transactionType" },
+  { header: "Amount", path: "amount" },
+  { header: "Currency", path: "currency" },
+  { header: "Description", path: "description" },
+  { header: "Reference", path: "reference" },
+  { header: "Category", path: "category" },
+  { header: "Reconciliation Status", path: "reconciliationStatus" },
+  { header: "Journal Entry", path: "journalEntryId.entryNumber" },
+];
 
 // Helper function to verify token
 const verifyToken = (req) => {
@@ -259,9 +280,29 @@ export const getBankTransactions = async (req, res) => {
     if (reconciliationStatus) filter.reconciliationStatus = reconciliationStatus;
     if (category) filter.category = category;
 
-    const transactions = await BankTransaction.find(filter)
+    const query = BankTransaction.find(filter)
       .populate("bankAccountId", "accountName accountNumber")
-      .populate("journalEntryId", "entryNumber")
+      .populate("journalEntryId", "entryNumber");
+
+    // ?format=csv|ndjson - ייצוא מלא בזרימה
+    if (isExportFormat(req.query.format)) {
+      return streamExport(res, query.sort(BANK_TRANSACTION_SORT), {
+        format: req.query.format,
+        filename: "bank-transactions",
+        columns: BANK_TRANSACTION_EXPORT_COLUMNS,
+      });
+    }
+
+    // ?limit / ?cursor - דף לפי keyset cursor
+    if (req.query.limit !== undefined || req.query.cursor !== undefined) {
+      const { data, pagination } = await keysetPaginate(query.populate("financeRecordId"), {
+        ...parseKeysetQuery(req.query),
+        sort: BANK_TRANSACTION_SORT,
+      });
+      return res.status(200).json({ success: true, data, pagination });
+    }
+
+    const transactions = await query
       .populate("financeRecordId")
       .sort({ transactionDate: -1, createdAt: -1 });
 
@@ -271,18 +312,18 @@ export const getBankTransactions = async (req, res) => {
     });
   } catch (error) {
     console.error("Error fetching bank transactions:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: error.message || "Error fetching bank transactions",
     });
   }
 };
 
-// Import Bank Transactions (CSV/Excel)
+// Import Bank Transactions (CSV) - streamed in chunks, see services/bankImport.service.js
 export const importBankTransactions = async (req, res) => {
   try {
     const decoded = verifyToken(req);
-    const { bankAccountId, format, dateFormat, delimiter } = req.body;
+    const { bankAccountId, dateFormat, delimiter } = req.body;
 
     if (!bankAccountId || !req.file) {
       return res.status(400).json({
@@ -291,7 +332,10 @@ export const importBankTransactions = async (req, res) => {
       });
     }
 
-    const bankAccount = await BankAccount.findById(bankAccountId);
+    const bankAccount = await BankAccount.findOne({
+      _id: bankAccountId,
+      companyId: decoded.companyId,
+    });
     if (!bankAccount) {
       return res.status(404).json({
         success: false,
@@ -299,77 +343,30 @@ export const importBankTransactions = async (req, res) => {
       });
     }
 
-    const transactions = [];
-    const fileBuffer = req.file.buffer;
-    const fileStream = Readable.from(fileBuffer.toString());
-
-    return new Promise((resolve, reject) => {
-      fileStream
-        .pipe(csv({ separator: delimiter || "," }))
-        .on("data", (row) => {
-          // Parse CSV row (adjust based on your CSV format)
-          const transaction = {
-            companyId: decoded.companyId,
-            bankAccountId,
-            transactionDate: new Date(row.date || row.transactionDate),
-            valueDate: row.valueDate ? new Date(row.valueDate) : undefined,
-            amount: parseFloat(row.amount || row.credit || -row.debit || 0),
-            currency: row.currency || bankAccount.currency,
-            description: row.description || row.narrative || "",
-            reference: row.reference || row.ref || "",
-            transactionType:
-              parseFloat(row.amount || row.credit || -row.debit || 0) >= 0
-                ? "Credit"
-                : "Debit",
-            category: row.category || "",
-            source: "Import",
-            importedData: {
-              originalDescription: row.description || row.narrative || "",
-              originalReference: row.reference || row.ref || "",
-              importDate: new Date(),
-            },
-          };
-          transactions.push(transaction);
-        })
-        .on("end", async () => {
-          try {
-            // Insert transactions
-            const inserted = await BankTransaction.insertMany(transactions);
-
-            // Update bank account balance
-            const totalAmount = transactions.reduce(
-              (sum, t) => sum + t.amount,
-              0
-            );
-            bankAccount.currentBalance += totalAmount;
-            await bankAccount.save();
-
-            res.status(200).json({
-              success: true,
-              message: `${inserted.length} transactions imported successfully`,
-              data: {
-                imported: inserted.length,
-                transactions: inserted,
-              },
-            });
-            resolve();
-          } catch (error) {
-            console.error("Error importing transactions:", error);
-            res.status(500).json({
-              success: false,
-              message: error.message || "Error importing transactions",
-            });
-            reject(error);
-          }
-        })
-        .on("error", (error) => {
-          console.error("Error parsing CSV:", error);
-          res.status(500).json({
-            success: false,
-            message: "Error parsing CSV file",
-          });
-          reject(error);
-        });
+    // הקובץ נשמר לדיסק ונקרא בזרימה - לא נטען כולו לזיכרון
+    const fileStream = req.file.path
+      ? fs.createReadStream(req.file.path)
+      : Readable.from([req.file.buffer]);
+    const rows = pipeline(
+      fileStream,
+      csv({
+        separator: delimiter || ",",
+        mapHeaders: ({ header }) => header.replace(/^\uFEFF/, "").trim(),
+      }),
+      () => {}
+    );
+
+    const summary = await importBankStatement(rows, {
+      companyId: decoded.companyId,
+      bankAccount,
+      dateFormat,
+      reconciledBy: decoded.employeeId || decoded.userId,
+    });
+
+    res.status(200).json({
+      success: true,
+      message: `${summary.imported} transactions imported successfully`,
+      data: summary,
     });
   } catch (error) {
     console.error("Error importing bank transactions:", error);
@@ -377,6 +374,10 @@ export const importBankTransactions = async (req, res) => {
       success: false,
       message: error.message || "Error importing bank transactions",
     });
+  } finally {
+    if (req.file?.path) {
+      fs.promises.unlink(req.file.path).catch(() => {});
+    }
   }
 };
 
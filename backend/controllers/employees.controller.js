@@ -6,10 +6,10 @@ import Salary from "../models/salary.model.js";
 import Notification from "../models/notification.model.js";
 
 
-import cron from "node-cron";
 import bcrypt from "bcryptjs";
 import jwt from "jsonwebtoken";
 import cloudinary, { uploadToCloudinary } from "../config/lib/cloudinary.js";
+import { bumpUserAuthVersion } from "../services/authSnapshot.service.js";
 import vacationRules from "../config/vacation.json" with { type: "json" };
 
 // Helper function to extract Cloudinary public ID from URL
@@ -341,6 +341,7 @@ export const updateEmployee = async (req, res) => {
     if (!updated) {
       return res.status(404).json({ success: false, message: "Employee not found" });
     }
+    await bumpUserAuthVersion(updated._id);
 
     return res.status(200).json({ success: true, data: updated });
   } catch (err) {
@@ -430,6 +431,7 @@ export const changePassword = async (req, res) => {
     // 3) hash and save new password
     user.password = await bcrypt.hash(newPassword, 10);
     await user.save();
+    await bumpUserAuthVersion(user._id);
 
     res.json({ success: true, message: "Password updated successfully." });
   } catch (err) {
@@ -545,6 +547,7 @@ export const deleteEmployee = async (req, res) => {
     employee.status = "deleted";
     employee.deletedAt = new Date();
     await employee.save();
+    await bumpUserAuthVersion(employee._id);
 
     res.status(200).json({ success: true, message: "Employee soft deleted successfully" });
   } catch (error) {
@@ -674,16 +677,6 @@ export const addMonthlyVacationDays = async (companyId) => {
   }
 };
 
-cron.schedule("0 0 1 * *", async () => {
-  console.log("Running monthly vacation update...");
-  try {
-    await addMonthlyVacationDays();
-    console.log("Monthly vacation update completed");
-  } catch (error) {
-    console.error("Error in monthly vacation update:", error.message);
-  }
-});
-
 export const triggerMonthlyVacationUpdate = async (req, res) => {
   try {
     const token = req.cookies["auth_token"];
@@ -716,6 +709,9 @@ export const updateSickDays = async (req, res) => {
     const year = currentDate.getFullYear();
     const monthYear = `${month}/${year}`;
     for (const employee of employees) {
+      // בדיקה למניעת כפילויות - כבר זוכה החודש
+      if (employee.sickHistory.some((entry) => entry.month === monthYear)) continue;
+
       const policy = await SickDays.findOne({ country: employee.address.country });
       if (!policy) continue;
 
@@ -766,16 +762,6 @@ export const updateSickDays = async (req, res) => {
   }
 };
 
-cron.schedule("0 0 1 * *", async () => {
-  console.log("מריץ עדכון חודשי של ימי מחלה...");
-  try {
-    await updateSickDays();
-    console.log("העדכון החודשי של ימי מחלה הושלם.");
-  } catch (error) {
-    console.error("שגיאה בעדכון ימי מחלה:", error.message);
-  }
-});
-
 
 export const useSickDay = async (req, res) => {
   try {
@@ -1160,17 +1146,6 @@ export const checkEmployeeDetails = async () => {
   }
 };
 
-// Schedule the check every hours
-cron.schedule("0 * * * *", async () => {
-  console.log("Running scheduled employee details check...");
-  try {
-    await checkEmployeeDetails();
-    console.log("Employee details check completed");
-  } catch (error) {
-    console.error("Error in scheduled employee details check:", error.message);
-  }
-});
-
 // API endpoint to manually trigger the check
 export const triggerEmployeeDetailsCheck = async (req, res) => {
   try {
@@ -8,6 +8,23 @@ import mongoose from "mongoose";
 import Notification from "../models/notification.model.js";
 import Employee from "../models/employees.model.js";
 import { updateWarehouseUtilization, checkWarehouseCapacity } from "../utils/warehouseUtilization.js";
+import { keysetPaginate, parseKeysetQuery } from "../middleware/pagination.js";
+import { isExportFormat, streamExport } from "../utils/exportStream.js";
+
+const INVENTORY_HISTORY_SORT = { timestamp: -1, _id: -1 };
+
+const INVENTORY_HISTORY_EXPORT_COLUMNS = [
+  { header: "Date", path: "timestamp" },
+  { header: "Product", value: (entry) => entry.productName || entry.productId?.productName },
+  { header: "Type", path: "type" },
+  { header: "Reason", path: "reason" },
+  { header: "Old Quantity", path: "oldQuantity" },
+  { header: "New Quantity", path: "newQuantity" },
+  { header: "Change", path: "changeAmount" },
+  { header: "Order", path: "orderId.orderNumber" },
+  { header: "User", value: (entry) => [entry.userId?.name, entry.userId?.lastName].filter(Boolean).join(" ") },
+  { header: "Notes", path: "notes" },
+];
 
 /**
  * Create a new inventory item
@@ -542,15 +559,35 @@ export const getInventoryHistory = async (req, res) => {
       }
     }
 
+    const historyQuery = InventoryHistory.find(query)
+      .populate("productId", "productName SKU")
+      .populate("userId", "name lastName")
+      .populate("orderId", "orderNumber");
+
+    // ?format=csv|ndjson - ייצוא מלא בזרימה
+    if (isExportFormat(req.query.format)) {
+      return streamExport(res, historyQuery.sort(INVENTORY_HISTORY_SORT), {
+        format: req.query.format,
+        filename: "inventory-history",
+        columns: INVENTORY_HISTORY_EXPORT_COLUMNS,
+      });
+    }
+
+    // ?cursor - דף לפי keyset cursor (ללא skip, total רק לפי בקשה)
+    if (req.query.cursor !== undefined) {
+      const { data, pagination } = await keysetPaginate(historyQuery, {
+        ...parseKeysetQuery(req.query, { defaultLimit: 100 }),
+        sort: INVENTORY_HISTORY_SORT,
+      });
+      return res.status(200).json({ success: true, data, pagination });
+    }
+
     const skip = (parseInt(page) - 1) * parseInt(limit);
 
-    const history = await InventoryHistory.find(query)
+    const history = await historyQuery
       .sort({ timestamp: -1 })
       .limit(parseInt(limit))
-      .skip(skip)
-      .populate("productId", "productName SKU")
-      .populate("userId", "name lastName")
-      .populate("orderId", "orderNumber");
+      .skip(skip);
 
     const total = await InventoryHistory.countDocuments(query);
 
@@ -566,9 +603,9 @@ export const getInventoryHistory = async (req, res) => {
     });
   } catch (error) {
     console.error("Error fetching inventory history:", error.message);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
-      message: "Error fetching inventory history",
+      message: error.statusCode ? error.message : "Error fetching inventory history",
       error: error.message,
     });
   }
@@ -10,7 +10,9 @@ import mongoose from "mongoose";
 import jwt from "jsonwebtoken";
 import { transporter } from "../config/lib/nodemailer.js";
 import { createPaymentInvoiceEmail } from "../emails/emailHandlers.js";
-import { launchBrowser } from "../config/lib/browser.js";
+import { renderPdf } from "../config/lib/browserPool.js";
+import { ZipStream } from "../utils/zipStream.js";
+import { mapWithConcurrency } from "../utils/concurrency.js";
 import { uploadToCloudinary } from "../config/lib/cloudinary.js";
 import { getFrontendUrl, getApiUrl } from "../utils/appUrls.js";
 
@@ -1718,29 +1720,8 @@ const generateInvoicePDFBuffer = async (invoice, uploadToCloud = true) => {
     // Generate HTML for invoice
     const html = generateInvoiceHTML(invoice);
     
-    // Launch puppeteer
-    const browser = await launchBrowser();
-    
-    const page = await browser.newPage();
-    
-    // Set content with HTML
-    await page.setContent(html, {
-      waitUntil: 'networkidle0'
-    });
-    
-    // Generate PDF buffer
-    const pdfBuffer = await page.pdf({
-      format: 'A4',
-      printBackground: true,
-      margin: {
-        top: '20px',
-        right: '20px',
-        bottom: '20px',
-        left: '20px'
-      }
-    });
-    
-    await browser.close();
+    // Render through the shared warm browser pool (queued, concurrency-capped)
+    const pdfBuffer = await renderPdf(html);
     
     console.log(`✅ PDF buffer generated successfully (${pdfBuffer.length} bytes)`);
     
@@ -1799,6 +1780,198 @@ const generateInvoicePDFBuffer = async (invoice, uploadToCloud = true) => {
   }
 };
 
+const BULK_PDF_MAX_INVOICES = 2000;
+const BULK_PDF_CONCURRENCY = 4;
+
+/**
+ * Bulk render invoice PDFs (e.g. a whole billing period) and stream them back as a zip
+ * Body: { invoiceIds?: string[], startDate?, endDate?, status? }
+ * Each invoice's pdfStatus is updated to generated/failed; manifest.json in the zip lists the results
+ */
+export const generateBulkInvoicePDFs = async (req, res) => {
+  try {
+    const token = req.cookies["auth_token"];
+    if (!token) {
+      return res.status(401).json({
+        success: false,
+        message: "Authentication required",
+      });
+    }
+
+    let decodedToken;
+    try {
+      decodedToken = jwt.verify(token, process.env.JWT_SECRET);
+    } catch (jwtError) {
+      return res.status(401).json({
+        success: false,
+        message: "Invalid token",
+      });
+    }
+
+    const companyId = decodedToken.companyId;
+    if (!companyId) {
+      return res.status(400).json({
+        success: false,
+        message: "Company ID is required",
+      });
+    }
+
+    const { invoiceIds, startDate, endDate, status } = req.body;
+    const query = { companyId };
+    if (invoiceIds !== undefined) {
+      if (
+        !Array.isArray(invoiceIds) ||
+        invoiceIds.length > BULK_PDF_MAX_INVOICES ||
+        !invoiceIds.every((id) => typeof id === "string" && mongoose.Types.ObjectId.isValid(id))
+      ) {
+        return res.status(400).json({
+          success: false,
+          message: `invoiceIds must be an array of up to ${BULK_PDF_MAX_INVOICES} valid invoice IDs`,
+        });
+      }
+      if (invoiceIds.length > 0) {
+        query._id = { $in: invoiceIds };
+      }
+    }
+    if (startDate || endDate) {
+      const from = startDate ? new Date(startDate) : null;
+      const to = endDate ? new Date(endDate) : null;
+      if ((from && isNaN(from.getTime())) || (to && isNaN(to.getTime()))) {
+        return res.status(400).json({
+          success: false,
+          message: "startDate and endDate must be valid dates",
+        });
+      }
+      if (from && to && from > to) {
+        return res.status(400).json({
+          success: false,
+          message: "startDate must be before endDate",
+        });
+      }
+      query.issueDate = {};
+      if (from) query.issueDate.$gte = from;
+      if (to) query.issueDate.$lte = to;
+    }
+    if (status !== undefined) {
+      if (typeof status !== "string") {
+        return res.status(400).json({
+          success: false,
+          message: "status must be a string",
+        });
+      }
+      query.status = status;
+    }
+    if (!query._id && !query.issueDate) {
+      return res.status(400).json({
+        success: false,
+        message: "invoiceIds or a startDate/endDate period is required",
+      });
+    }
+
+    const ids = await Invoice.find(query).select("_id pdfStatus").sort({ issueDate: 1 }).limit(BULK_PDF_MAX_INVOICES + 1).lean();
+    if (ids.length === 0) {
+      return res.status(404).json({
+        success: false,
+        message: "No invoices found",
+      });
+    }
+    if (ids.length > BULK_PDF_MAX_INVOICES) {
+      return res.status(400).json({
+        success: false,
+        message: `Too many invoices (max ${BULK_PDF_MAX_INVOICES}), narrow the period`,
+      });
+    }
+
+    await Invoice.updateMany({ _id: { $in: ids.map((i) => i._id) } }, { $set: { pdfStatus: "pending" } });
+
+    res.setHeader("Content-Type", "application/zip");
+    res.setHeader("Content-Disposition", `attachment; filename="invoices_${Date.now()}.zip"`);
+
+    const zip = new ZipStream(res);
+    const results = [];
+    let aborted = false;
+    res.on("close", () => {
+      aborted = !res.writableFinished;
+    });
+
+    try {
+      // Invoices are loaded one at a time so memory stays bounded by the render concurrency
+      await mapWithConcurrency(ids, BULK_PDF_CONCURRENCY, async ({ _id }) => {
+        if (aborted) return;
+        let invoice = null;
+        try {
+          invoice = await Invoice.findById(_id)
+            .populate("customerId", "name email phone address")
+            .populate("companyId", "name email phone address logo")
+            .populate("createdBy", "name email");
+          if (!invoice) {
+            throw new Error("Invoice not found");
+          }
+          const pdfBuffer = await renderPdf(generateInvoiceHTML(invoice));
+          await zip.addFile(`${invoice.invoiceNumber || invoice._id}.pdf`, pdfBuffer);
+          results.push({ invoiceId: _id, invoiceNumber: invoice.invoiceNumber, status: "generated" });
+        } catch (error) {
+          console.error(`❌ Bulk PDF failed for invoice ${_id}:`, error.message);
+          results.push({ invoiceId: _id, invoiceNumber: invoice?.invoiceNumber, status: "failed", error: error.message });
+        }
+      });
+    } finally {
+      const now = new Date();
+      const processed = new Set(results.map((result) => result.invoiceId.toString()));
+      // Invoices that were never rendered (client aborted, or the run failed) go back to their previous status
+      const untouched = ids.filter(({ _id }) => !processed.has(_id.toString()));
+      const updates = [
+        ...results.map(({ invoiceId, status: pdfStatus }) => ({
+          updateOne: {
+            filter: { _id: invoiceId },
+            update: {
+              $set: pdfStatus === "generated" ? { pdfStatus, pdfGeneratedAt: now } : { pdfStatus },
+            },
+          },
+        })),
+        ...untouched.map(({ _id, pdfStatus }) => ({
+          updateOne: {
+            filter: { _id, pdfStatus: "pending" },
+            update: pdfStatus ? { $set: { pdfStatus } } : { $unset: { pdfStatus: "" } },
+          },
+        })),
+      ];
+      if (updates.length > 0) {
+        await Invoice.bulkWrite(updates, { ordered: false }).catch((error) =>
+          console.error("❌ Error updating bulk PDF statuses:", error.message)
+        );
+      }
+    }
+
+    if (aborted) return;
+
+    await zip.addFile(
+      "manifest.json",
+      JSON.stringify(
+        {
+          total: ids.length,
+          generated: results.filter((r) => r.status === "generated").length,
+          failed: results.filter((r) => r.status === "failed").length,
+          results,
+        },
+        null,
+        2
+      )
+    );
+    await zip.finalize();
+  } catch (error) {
+    console.error("Error generating bulk invoice PDFs:", error);
+    if (!res.headersSent) {
+      return res.status(500).json({
+        success: false,
+        message: "Error generating bulk invoice PDFs",
+        error: error.message,
+      });
+    }
+    res.destroy(error);
+  }
+};
+
 /**
  * Send invoice email automatically
  * @param {Object} invoice - The invoice object
@@ -1,5 +1,6 @@
 // backend/controllers/notification.controller.js
 // מרכז כל פונקציות ההתראות במערכת
+import mongoose from "mongoose";
 import Procurement from "../models/procurement.model.js";
 import Notification from "../models/notification.model.js";
 import Budget from "../models/Budget.model.js";
@@ -7,6 +8,7 @@ import Event from "../models/events.model.js";
 import Company from "../models/companies.model.js";
 import Employee from "../models/employees.model.js";
 import Inventory from "../models/inventory.model.js";
+import InventoryHistory from "../models/InventoryHistory.model.js";
 import Task from "../models/tasks.model.js";
 import Project from "../models/project.model.js";
 import CustomerOrder from "../models/CustomerOrder.model.js";
@@ -18,7 +20,6 @@ import ProductionOrder from "../models/ProductionOrder.model.js";
 import Warehouse from "../models/warehouse.model.js";
 import productTree from "../models/productTree.model.js";
 import Product from "../models/product.model.js";
-import { checkComponentAvailability } from "./ProductionOrder.controller.js";
 import Shift from "../models/Shifts.model.js";
 import Salary from "../models/salary.model.js";
 import Invoice from "../models/invoice.model.js";
@@ -26,7 +27,13 @@ import Suppliers from "../models/suppliers.model.js";
 import Customer from "../models/customers.model.js";
 import Activity from "../models/Activity.model.js";
 import jwt from "jsonwebtoken";
-import cron from "node-cron";
+import { forEachCompany } from "../services/jobEngine.service.js";
+import { keysetPaginate, parseKeysetQuery } from "../middleware/pagination.js";
+import { runNotificationRule } from "../services/notificationRules.service.js";
+import {
+  planProductionAvailability,
+  loadOpenProductionOrders,
+} from "../services/productionAvailability.service.js";
 import {
   sendBirthdayEmail,
   sendMonthlyCashFlowSummary,
@@ -136,60 +143,11 @@ export const notifyAdminsAndManagers = async ({
 };
 
 /**
- * התראות רק ל-Admins
+ * מטבע הבסיס של כל חברה - Map של companyId -> baseCurrency
  */
-const notifyAdmins = async ({
-  companyId,
-  title,
-  content,
-  type = "Info",
-  category,
-  priority = "medium",
-  relatedEntity = null,
-  actionUrl = null,
-  actionLabel = null,
-  metadata = null,
-  dedupe = null,
-}) => {
-  const admins = await Employee.find({
-    companyId,
-    role: "Admin",
-    status: "active",
-  }).select("_id");
-
-  const notifications = [];
-  for (const admin of admins) {
-    if (dedupe?.enabled) {
-      const skip = await shouldSkipNotification({
-        companyId,
-        employeeId: admin._id,
-        category,
-        title: dedupe.titleOverride || title,
-        relatedEntity: dedupe.relatedEntityOverride || relatedEntity,
-        hours: dedupe.hours ?? 24,
-      });
-
-      if (skip) {
-        continue;
-      }
-    }
-
-    const notification = await createNotification({
-      companyId,
-      employeeId: admin._id,
-      title,
-      content,
-      type,
-      category,
-      priority,
-      relatedEntity,
-      actionUrl,
-      actionLabel,
-      metadata,
-    });
-    notifications.push(notification);
-  }
-  return notifications;
+const loadBaseCurrencies = async (companyIds) => {
+  const companies = await Company.find({ _id: { $in: companyIds } }).select("baseCurrency").lean();
+  return new Map(companies.map((company) => [company._id.toString(), company.baseCurrency || "ILS"]));
 };
 
 /**
@@ -234,74 +192,100 @@ const shouldSkipNotification = async ({
 // EXISTING FUNCTIONS (IMPROVED)
 // ========================
 
+// ========================
+// PENDING SIGNATURES & EVENT REMINDERS (כל דקה)
+// ========================
+
+const ONE_DAY_MS = 24 * 60 * 60 * 1000;
+
+// החותם הנוכחי (signers[order == currentSignerIndex]) לא חתם ותורו התחיל לפני before - מסונן במסד
+const currentSignerWaitingSince = (before) => ({
+  $expr: {
+    $let: {
+      vars: {
+        signer: {
+          $arrayElemAt: [
+            { $filter: { input: "$signers", cond: { $eq: ["$$this.order", "$currentSignerIndex"] } } },
+            0,
+          ],
+        },
+      },
+      in: {
+        $and: [
+          { $ne: ["$$signer.hasSigned", true] },
+          { $lte: [{ $ifNull: ["$$signer.timeStamp", "$createdAt"] }, before] },
+        ],
+      },
+    },
+  },
+});
+
 /**
- * בדיקת חתימות ממתינות (IMPROVED)
+ * מסמכים (רכש / תקציב) שהחותם הנוכחי שלהם ממתין מעל יממה - [{ doc, signer }]
  */
-const checkPendingSignaturesLogic = async (companyId) => {
-  try {
-    const now = new Date();
-    const procurements = await Procurement.find({
-      status: { $ne: "completed" },
-      companyId: companyId,
-    });
-
-    const notifications = [];
+const findWaitingSigners = async (Model, companyIds, filter, fields, now) => {
+  const docs = await Model.find({
+    companyId: { $in: companyIds },
+    ...filter,
+    ...currentSignerWaitingSince(new Date(now.getTime() - ONE_DAY_MS)),
+  })
+    .select(`companyId currentSignerIndex signers createdAt ${fields}`)
+    .lean();
 
-    for (const procurement of procurements) {
-      const { currentSignerIndex, signers, PurchaseOrder } = procurement;
-      const currentSigner = signers.find(
-        (signer) => signer.order === currentSignerIndex
-      );
-      
-      if (!currentSigner || currentSigner.hasSigned) continue;
+  return docs.flatMap((doc) => {
+    const signer = doc.signers?.find((candidate) => candidate.order === doc.currentSignerIndex);
+    return signer && !signer.hasSigned && signer.employeeId ? [{ doc, signer }] : [];
+  });
+};
 
-      const timeSinceLastTurn =
-        now - new Date(currentSigner.timeStamp || procurement.createdAt);
-      const oneDayInMs = 24 * 60 * 60 * 1000;
+// איפוס זמן התור של החותם - התזכורת הבאה רק אחרי יממה נוספת
+const resetSignerTimestamp = (doc, now) => ({
+  updateOne: {
+    filter: { _id: doc._id, "signers.order": doc.currentSignerIndex },
+    update: { $set: { "signers.$.timeStamp": now } },
+  },
+});
 
-      if (timeSinceLastTurn >= oneDayInMs) {
-        const isDuplicate = await shouldSkipNotification({
-          companyId,
-          employeeId: currentSigner.employeeId,
-          category: "procurement",
+/**
+ * תזכורות לחותמים על הזמנות רכש שממתינות מעל 24 שעות
+ * companyIds - חברות מסוימות (endpoint), ברירת מחדל: כל החברות
+ */
+const checkPendingSignaturesLogic = async (companyIds = null) => {
+  const now = new Date();
+  const signerResets = [];
+
+  const created = await runNotificationRule({
+    name: "checkPendingSignatures",
+    category: "procurement",
+    hours: 24,
+    companyIds,
+    collectAll: async (ids) => {
+      const waiting = await findWaitingSigners(Procurement, ids, { status: { $ne: "completed" } }, "PurchaseOrder", now);
+      return waiting.map(({ doc, signer }) => {
+        signerResets.push(resetSignerTimestamp(doc, now));
+        return {
+          companyId: doc.companyId,
+          employeeIds: [signer.employeeId],
           title: "⏰ תזכורת: חתימה ממתינה",
+          content: `הזמנת רכש ${doc.PurchaseOrder} ממתינה לחתימתך מעל 24 שעות`,
+          type: "Reminder",
+          priority: "high",
           relatedEntity: {
             entityType: "PurchaseOrder",
-            entityId: PurchaseOrder,
+            entityId: doc.PurchaseOrder,
           },
-          hours: 24,
-        });
-
-        if (!isDuplicate) {
-          const notification = await createNotification({
-            companyId,
-            employeeId: currentSigner.employeeId,
-            title: "⏰ תזכורת: חתימה ממתינה",
-            content: `הזמנת רכש ${PurchaseOrder} ממתינה לחתימתך מעל 24 שעות`,
-            type: "Reminder",
-            category: "procurement",
-            priority: "high",
-            relatedEntity: {
-              entityType: "PurchaseOrder",
-              entityId: PurchaseOrder,
-            },
-            actionUrl: `/dashboard/procurement`,
-            actionLabel: "צפה בהזמנה",
-            PurchaseOrder, // לתאימות לאחור
-          });
-
-          notifications.push(notification);
-          currentSigner.timeStamp = now;
-          await procurement.save();
-        } 
-      } 
-    }
+          actionUrl: `/dashboard/procurement`,
+          actionLabel: "צפה בהזמנה",
+          PurchaseOrder: doc.PurchaseOrder, // לתאימות לאחור
+        };
+      });
+    },
+  });
 
-    return notifications;
-  } catch (error) {
-    console.error("Error checking pending signatures:", error);
-    throw error;
+  if (signerResets.length > 0) {
+    await Procurement.bulkWrite(signerResets, { ordered: false });
   }
+  return created;
 };
 
 // HTTP controller to check pending signatures
@@ -323,12 +307,12 @@ export const checkPendingSignatures = async (req, res) => {
   const companyId = decodedToken.companyId;
 
   try {
-    const notifications = await checkPendingSignaturesLogic(companyId);
+    const created = await checkPendingSignaturesLogic([new mongoose.Types.ObjectId(String(companyId))]);
 
     res.status(200).json({
       success: true,
       message: "Notifications created for pending signatures",
-      notifications,
+      created,
     });
   } catch (error) {
     console.error("Error in checkPendingSignatures:", error);
@@ -360,6 +344,15 @@ export const getAdminNotifications = async (req, res) => {
   const companyId = decodedToken.companyId;
 
   try {
+    // ?limit / ?cursor - דף לפי keyset cursor
+    if (req.query.limit !== undefined || req.query.cursor !== undefined) {
+      const { data, pagination } = await keysetPaginate(Notification.find({ companyId }), {
+        ...parseKeysetQuery(req.query),
+        sort: { createdAt: -1, _id: -1 },
+      });
+      return res.status(200).json({ success: true, data, pagination });
+    }
+
     const notifications = await Notification.find({
       companyId: companyId,
     }).sort({ createdAt: -1 });
@@ -367,7 +360,7 @@ export const getAdminNotifications = async (req, res) => {
     res.status(200).json({ success: true, data: notifications });
   } catch (error) {
     console.error("Error fetching admin notifications:", error);
-    res.status(500).json({
+    res.status(error.statusCode || 500).json({
       success: false,
       message: "Error fetching admin notifications",
       error: error.message,
@@ -375,75 +368,50 @@ export const getAdminNotifications = async (req, res) => {
   }
 };
 
-// פונקציה נפרדת ללוגיקה עסקית לבדיקה של חתימות תקציב
-const checkPendingBudgetSignaturesLogic = async (companyId) => {
-  try {
-    const now = new Date();
-
-
-    const budgets = await Budget.find({
-      status: { $ne: "Approved" },
-      companyId: companyId,
-    });
-
-    const notifications = [];
-    const oneDayInMs = 60 * 1000 * 60 * 24; // 24 hours in milliseconds
-
-    for (const budget of budgets) {
-      const { currentSignerIndex, signers, departmentOrProjectName } = budget;
+/**
+ * תזכורות לחותמים על תקציבים שממתינים מעל 24 שעות
+ */
+const checkPendingBudgetSignaturesLogic = async (companyIds = null) => {
+  const now = new Date();
+  const signerResets = [];
 
-      const currentSigner = signers.find(
-        (signer) => signer.order === currentSignerIndex
+  const created = await runNotificationRule({
+    name: "checkPendingBudgetSignatures",
+    category: "finance",
+    hours: 24,
+    companyIds,
+    collectAll: async (ids) => {
+      const waiting = await findWaitingSigners(
+        Budget,
+        ids,
+        { status: { $ne: "Approved" } },
+        "departmentOrProjectName",
+        now
       );
-      if (!currentSigner || currentSigner.hasSigned) {
-        continue;
-      }
-
-      const timeSinceLastTurn =
-        now - new Date(currentSigner.timeStamp || budget.createdAt);
-     
-
-      if (timeSinceLastTurn >= oneDayInMs) {
-        // Check for existing notification in the last 24 hours
-        const existingNotification = await Notification.findOne({
-          companyId: companyId,
-          employeeId: currentSigner.employeeId,
-          budgetName: departmentOrProjectName,
+      return waiting.map(({ doc, signer }) => {
+        signerResets.push(resetSignerTimestamp(doc, now));
+        return {
+          companyId: doc.companyId,
+          employeeIds: [signer.employeeId],
+          title: "⏰ תזכורת: חתימה על תקציב ממתינה",
+          content: `The signer ${signer.name} has not signed the budget for ${doc.departmentOrProjectName} after 24 hours.`,
           type: "Reminder",
-          createdAt: { $gte: new Date(now - oneDayInMs) },
-        });
-        console.log(
-          `Existing notification check for budget ${departmentOrProjectName}:`,
-          existingNotification
-        );
-
-        if (!existingNotification) {
-          const message = `The signer ${currentSigner.name} has not signed the budget for ${departmentOrProjectName} after 24 hours.`;
-
-          const notification = new Notification({
-            companyId: companyId,
-            content: message,
-            type: "Reminder",
-            employeeId: currentSigner.employeeId,
-            budgetName: departmentOrProjectName,
-          });
-
-          await notification.save();
-          notifications.push(notification);
-
-          // Reset timestamp to prevent repeated notifications
-          currentSigner.timeStamp = now;
-          await budget.save();
-
-        }
-      } 
-    }
+          priority: "high",
+          relatedEntity: {
+            entityType: "Budget",
+            entityId: doc._id.toString(),
+          },
+          actionUrl: `/dashboard/finance/budget-details/${doc._id}`,
+          actionLabel: "צפה בתקציב",
+        };
+      });
+    },
+  });
 
-    return notifications;
-  } catch (error) {
-    console.error("Error checking pending budget signatures:", error);
-    throw error;
+  if (signerResets.length > 0) {
+    await Budget.bulkWrite(signerResets, { ordered: false });
   }
+  return created;
 };
 
 // HTTP controller to check pending budget signatures
@@ -467,12 +435,12 @@ export const checkPendingBudgetSignatures = async (req, res) => {
   const companyId = decodedToken.companyId;
 
   try {
-    const notifications = await checkPendingBudgetSignaturesLogic(companyId);
+    const created = await checkPendingBudgetSignaturesLogic([new mongoose.Types.ObjectId(String(companyId))]);
 
     res.status(200).json({
       success: true,
       message: "Notifications created for pending budget signatures",
-      notifications,
+      created,
     });
   } catch (error) {
     console.error("Error in checkPendingBudgetSignatures:", error);
@@ -484,29 +452,14 @@ export const checkPendingBudgetSignatures = async (req, res) => {
   }
 };
 
-cron.schedule("*/1 * * * *", async () => {
-  try {
-    const companies = await Company.find(); // קבלת כל החברות
-
-    for (const company of companies) {
-      const companyId = company._id;
-
-      try {
-        const procurementNotifications = await checkPendingSignaturesLogic(
-          companyId
-        );
-
-        const budgetNotifications = await checkPendingBudgetSignaturesLogic(
-          companyId
-        );
-      } catch (error) {
-        console.error(`Error in company ${companyId} cron job:`, error);
-      }
-    }
-  } catch (error) {
-    console.error("Error in cron job:", error);
-  }
-});
+/**
+ * סריקת חתימות ממתינות (רכש + תקציב) לכל החברות - רצה מה-CronJob
+ * שאילתה אחת לכל מודל, dedupe באגרגציה אחת ו-insertMany (runNotificationRule)
+ */
+export const runPendingSignaturesSweep = async () => {
+  await checkPendingSignaturesLogic();
+  await checkPendingBudgetSignaturesLogic();
+};
 
 export const deleteNotification = async (req, res) => {
   try {
@@ -624,90 +577,95 @@ export const markNotificationAsReadAll = async (req, res) => {
   }
 };
 
-cron.schedule("0 0 * * *", async () => {
-  try {
-    const now = new Date();
-    const result = await Notification.deleteMany({
-      expirationDate: { $lt: now },
-    });
-  } catch (error) {
-    console.error("Error cleaning up expired notifications:", error);
-  }
-});
-const reminderEventsLogic = async (companyId) => {
-  try {
-    // הגדרת הזמנים לצורך השוואות
-    const now = new Date();
-    const twoHours = 2 * 60 * 60 * 1000; // 2 שעות במילישניות
-    const oneDay = 24 * 60 * 60 * 1000; // 24 שעות במילישניות
-
-    // שליפת האירועים של החברה הרצויה
-    const events = await Event.find({ companyId });
-    const notifications = [];
-
-    // מעבר על כל אירוע
-    for (const event of events) {
-      // נבנה אובייקט Date שמגלם את התאריך והשעה של האירוע
-      const startDateTime = new Date(event.startDate);
-
-      // אם יש ערך בשדה startTime (פורמט "HH:MM"), נמיר ונגדיר על האובייקט
-      if (event.startTime) {
-        const [hour, minute] = event.startTime.split(":").map(Number);
-        startDateTime.setHours(hour, minute, 0, 0);
-      }
+/**
+ * תזכורות לאירועים שמתחילים ב-24 השעות הקרובות (דגלי התזכורת באירוע מונעים כפילויות)
+ */
+const reminderEventsLogic = async (companyIds = null) => {
+  // הגדרת הזמנים לצורך השוואות
+  const now = new Date();
+  const twoHours = 2 * 60 * 60 * 1000; // 2 שעות במילישניות
+  const reminderUpdates = [];
 
-      // מחשבים כמה זמן נשאר עד תחילת האירוע
-      const timeUntilStart = startDateTime - now;
+  const created = await runNotificationRule({
+    name: "reminderEvents",
+    category: "system",
+    dedupe: false,
+    companyIds,
+    collectAll: async (ids) => {
+      // startTime מוצב על היום של startDate, לכן אירוע שמתחיל ב-24 השעות הקרובות
+      // הוא עם startDate בטווח (עכשיו - יממה, עכשיו + יומיים)
+      const events = await Event.find({
+        companyId: { $in: ids },
+        startDate: { $gt: new Date(now.getTime() - ONE_DAY_MS), $lt: new Date(now.getTime() + 2 * ONE_DAY_MS) },
+        $or: [{ dayReminderSent: { $ne: true } }, { twoHoursReminderSent: { $ne: true } }],
+      })
+        .select("companyId title eventType startDate startTime createdBy dayReminderSent twoHoursReminderSent")
+        .lean();
 
-      // אם האירוע כבר התחיל או עבר (timeUntilStart <= 0) - לא שולחים תזכורת
-      if (timeUntilStart <= 0) {
-        continue;
-      }
+      const candidates = [];
+      for (const event of events) {
+        // נבנה אובייקט Date שמגלם את התאריך והשעה של האירוע
+        const startDateTime = new Date(event.startDate);
+        if (event.startTime) {
+          const [hour, minute] = event.startTime.split(":").map(Number);
+          startDateTime.setHours(hour, minute, 0, 0);
+        }
 
-      let message;
+        // אם האירוע כבר התחיל או עבר - לא שולחים תזכורת
+        const timeUntilStart = startDateTime - now;
+        if (timeUntilStart <= 0) continue;
 
-      if (event.eventType === "meeting") {
-        if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
-          message = `Reminder: There is a meeting in under two hours (Event: "${event.title}").`;
-          event.twoHoursReminderSent = true;
-        } else if (timeUntilStart < oneDay && !event.dayReminderSent) {
-          message = `Reminder: There is a meeting in under one day (Event: "${event.title}").`;
-          event.dayReminderSent = true;
-        }
-      } else if (event.eventType === "holiday") {
-        if (timeUntilStart < oneDay && !event.dayReminderSent) {
-          message = `Reminder: A holiday starts in under one day (Event: "${event.title}").`;
-          event.dayReminderSent = true;
-        }
-      } else {
-        if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
-          message = `Reminder: Your event "${event.title}" starts in under two hours.`;
-          event.twoHoursReminderSent = true;
-        } else if (timeUntilStart < oneDay && !event.dayReminderSent) {
-          message = `Reminder: Your event "${event.title}" starts in under 24 hours.`;
-          event.dayReminderSent = true;
+        let message;
+        let flag;
+        if (event.eventType === "meeting") {
+          if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
+            message = `Reminder: There is a meeting in under two hours (Event: "${event.title}").`;
+            flag = "twoHoursReminderSent";
+          } else if (timeUntilStart < ONE_DAY_MS && !event.dayReminderSent) {
+            message = `Reminder: There is a meeting in under one day (Event: "${event.title}").`;
+            flag = "dayReminderSent";
+          }
+        } else if (event.eventType === "holiday") {
+          if (timeUntilStart < ONE_DAY_MS && !event.dayReminderSent) {
+            message = `Reminder: A holiday starts in under one day (Event: "${event.title}").`;
+            flag = "dayReminderSent";
+          }
+        } else {
+          if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
+            message = `Reminder: Your event "${event.title}" starts in under two hours.`;
+            flag = "twoHoursReminderSent";
+          } else if (timeUntilStart < ONE_DAY_MS && !event.dayReminderSent) {
+            message = `Reminder: Your event "${event.title}" starts in under 24 hours.`;
+            flag = "dayReminderSent";
+          }
         }
-      }
 
-      if (message) {
-        const notification = new Notification({
-          companyId,
+        if (!message || !event.createdBy) continue;
+        reminderUpdates.push({
+          updateOne: { filter: { _id: event._id }, update: { $set: { [flag]: true } } },
+        });
+        candidates.push({
+          companyId: event.companyId,
+          employeeIds: [event.createdBy],
+          title: "⏰ תזכורת לאירוע",
           content: message,
           type: "Reminder",
-          employeeId: event.createdBy,
+          relatedEntity: {
+            entityType: "Event",
+            entityId: event._id.toString(),
+          },
+          actionUrl: `/dashboard/Events`,
+          actionLabel: "צפה באירועים",
         });
-
-        await notification.save();
-        notifications.push(notification);
-        await event.save();
       }
-    }
+      return candidates;
+    },
+  });
 
-    return notifications;
-  } catch (error) {
-    console.error("Error in reminderEventsLogic:", error);
-    throw error;
+  if (reminderUpdates.length > 0) {
+    await Event.bulkWrite(reminderUpdates, { ordered: false });
   }
+  return created;
 };
 
 // בקר (Controller) - אם תרצה להפעיל את הלוגיקה ידנית דרך קריאת API
@@ -724,12 +682,12 @@ export const reminderEventsController = async (req, res) => {
     }
 
     const companyId = decodedToken.companyId;
-    const notifications = await reminderEventsLogic(companyId);
+    const created = await reminderEventsLogic([new mongoose.Types.ObjectId(String(companyId))]);
 
     return res.status(200).json({
       success: true,
       message: "Event reminders created",
-      data: notifications,
+      data: { created },
     });
   } catch (error) {
     console.error("Error creating event reminders:", error);
@@ -741,25 +699,10 @@ export const reminderEventsController = async (req, res) => {
   }
 };
 
-cron.schedule("*/1 * * * *", async () => {
-  try {
-    const companies = await Company.find();
-
-    for (const company of companies) {
-      const companyId = company._id.toString();
-      try {
-        const eventNotifications = await reminderEventsLogic(companyId);
-      } catch (error) {
-        console.error(
-          `Error creating event notifications for company ${companyId}:`,
-          error
-        );
-      }
-    }
-  } catch (error) {
-    console.error("Error in event reminders cron job:", error);
-  }
-});
+/**
+ * סריקת תזכורות אירועים לכל החברות - רצה מה-CronJob
+ */
+export const runEventRemindersSweep = async () => reminderEventsLogic();
 
 export const checkDateProjectForCompany = async (companyId) => {
   try {
@@ -811,55 +754,41 @@ export const checkDateProjectForCompany = async (companyId) => {
  */
 export const checkPendingProcurementProposals = async () => {
   try {
-    console.log("🔍 Checking pending procurement proposals...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const pendingProposals = await ProcurementProposal.find({
-        companyId: company._id,
-        status: "pending",
-      });
-
-      for (const proposal of pendingProposals) {
-        const daysSinceCreation = Math.floor(
-          (Date.now() - new Date(proposal.createdAt)) / (1000 * 60 * 60 * 24)
-        );
+    await runNotificationRule({
+      name: "checkPendingProcurementProposals",
+      category: "procurement",
+      hours: 72,
+      recipients: "admins",
+      collectAll: async (companyIds) => {
+        const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
+        const pendingProposals = await ProcurementProposal.find({
+          companyId: { $in: companyIds },
+          status: "pending",
+          createdAt: { $lte: threeDaysAgo },
+        })
+          .select("_id companyId createdAt")
+          .lean();
 
-        if (daysSinceCreation >= 3) {
-          const isDuplicate = await shouldSkipNotification({
-            companyId: company._id,
-            employeeId: proposal.createdBy,
-            category: "procurement",
+        return pendingProposals.map((proposal) => {
+          const daysSinceCreation = Math.floor(
+            (Date.now() - new Date(proposal.createdAt)) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: proposal.companyId,
             title: "📋 הצעת רכש ממתינה",
+            content: `הצעת רכש ממתינה לאישור ${daysSinceCreation} ימים`,
+            type: "Warning",
+            priority: "medium",
             relatedEntity: {
               entityType: "ProcurementProposal",
               entityId: proposal._id.toString(),
             },
-            hours: 72,
-          });
-
-          if (!isDuplicate) {
-            await notifyAdmins({
-              companyId: company._id,
-              title: "📋 הצעת רכש ממתינה",
-              content: `הצעת רכש ממתינה לאישור ${daysSinceCreation} ימים`,
-              type: "Warning",
-              category: "procurement",
-              priority: "medium",
-              relatedEntity: {
-                entityType: "ProcurementProposal",
-                entityId: proposal._id.toString(),
-              },
-              actionUrl: `/dashboard/ProcurementProposalsList`,
-              actionLabel: "צפה בהצעה",
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} pending proposal notifications`);
+            actionUrl: `/dashboard/ProcurementProposalsList`,
+            actionLabel: "צפה בהצעה",
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkPendingProcurementProposals:", error);
   }
@@ -870,43 +799,29 @@ export const checkPendingProcurementProposals = async () => {
  */
 export const checkOverdueDeliveries = async () => {
   try {
-    console.log("🔍 Checking overdue deliveries...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const overdueOrders = await Procurement.find({
-        companyId: company._id,
-        orderStatus: { $nin: ["Delivered", "Cancelled"] },
-        deliveryDate: { $lt: new Date() },
-      });
-
-      for (const order of overdueOrders) {
-        const daysOverdue = Math.floor(
-          (Date.now() - new Date(order.deliveryDate)) / (1000 * 60 * 60 * 1000) / 24
-        );
-
-        const isDuplicate = await shouldSkipNotification({
-          companyId: company._id,
-          employeeId:
-            order.createdBy ||
-            (await Employee.findOne({ companyId: company._id, role: "Admin" }))?._id,
-          category: "procurement",
-          title: "🚨 איחור באספקה",
-          relatedEntity: {
-            entityType: "PurchaseOrder",
-            entityId: order.PurchaseOrder,
-          },
-          hours: 72,
-        });
+    await runNotificationRule({
+      name: "checkOverdueDeliveries",
+      category: "procurement",
+      hours: 72,
+      collectAll: async (companyIds) => {
+        const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
+        const overdueOrders = await Procurement.find({
+          companyId: { $in: companyIds },
+          orderStatus: { $nin: ["Delivered", "Cancelled"] },
+          deliveryDate: { $lte: oneDayAgo },
+        })
+          .select("companyId PurchaseOrder deliveryDate")
+          .lean();
 
-        if (!isDuplicate && daysOverdue >= 1) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return overdueOrders.map((order) => {
+          const daysOverdue = Math.floor(
+            (Date.now() - new Date(order.deliveryDate)) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: order.companyId,
             title: "🚨 איחור באספקה",
             content: `הזמנת רכש ${order.PurchaseOrder} מאחרת ${daysOverdue} ימים`,
             type: "Urgent",
-            category: "procurement",
             priority: "high",
             relatedEntity: {
               entityType: "PurchaseOrder",
@@ -914,13 +829,10 @@ export const checkOverdueDeliveries = async () => {
             },
             actionUrl: `/dashboard/procurement`,
             actionLabel: "צפה בהזמנה",
-            PurchaseOrder: order.PurchaseOrder,
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} overdue delivery notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkOverdueDeliveries:", error);
   }
@@ -931,60 +843,40 @@ export const checkOverdueDeliveries = async () => {
  */
 export const checkBudgetAlerts = async () => {
   try {
-    console.log("🔍 Checking budget alerts...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const budgets = await Budget.find({ companyId: company._id });
-
-      for (const budget of budgets) {
-        const usagePercent = (budget.spent / budget.allocatedAmount) * 100;
-
-        if (usagePercent >= 100) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "🔴 תקציב חרג!",
-            content: `תקציב "${budget.name}" חרג ב-${Math.round(usagePercent - 100)}%`,
-            type: "Error",
-            category: "finance",
-            priority: "critical",
-            relatedEntity: {
-              entityType: "Budget",
-              entityId: budget._id.toString(),
-            },
-            actionUrl: `/dashboard/finance/budget-details/${budget._id}`,
-            actionLabel: "צפה בתקציב",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        } else if (usagePercent >= 80) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "⚠️ אזהרת תקציב",
-            content: `תקציב "${budget.name}" בשימוש של ${Math.round(usagePercent)}%`,
-            type: "Warning",
-            category: "finance",
-            priority: "high",
+    await runNotificationRule({
+      name: "checkBudgetAlerts",
+      category: "finance",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const budgets = await Budget.find({
+          companyId: { $in: companyIds },
+          amount: { $gt: 0 },
+          $expr: { $gte: ["$spentAmount", { $multiply: ["$amount", 0.8] }] },
+        })
+          .select("_id companyId departmentOrProjectName spentAmount amount")
+          .lean();
+
+        return budgets.map((budget) => {
+          const usagePercent = (budget.spentAmount / budget.amount) * 100;
+          const exceeded = usagePercent >= 100;
+          return {
+            companyId: budget.companyId,
+            title: exceeded ? "🔴 תקציב חרג!" : "⚠️ אזהרת תקציב",
+            content: exceeded
+              ? `תקציב "${budget.departmentOrProjectName}" חרג ב-${Math.round(usagePercent - 100)}%`
+              : `תקציב "${budget.departmentOrProjectName}" בשימוש של ${Math.round(usagePercent)}%`,
+            type: exceeded ? "Error" : "Warning",
+            priority: exceeded ? "critical" : "high",
             relatedEntity: {
               entityType: "Budget",
               entityId: budget._id.toString(),
             },
             actionUrl: `/dashboard/finance/budget-details/${budget._id}`,
             actionLabel: "צפה בתקציב",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} budget alert notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkBudgetAlerts:", error);
   }
@@ -995,45 +887,42 @@ export const checkBudgetAlerts = async () => {
  */
 export const checkOverdueInvoices = async () => {
   try {
-    console.log("🔍 Checking overdue invoices (Finance)...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const thirtyDaysAgo = new Date(Date.now() - 30 * 24 * 60 * 60 * 1000);
-
-      const overdueInvoices = await Finance.find({
-        companyId: company._id,
-        transactionType: "Expense",
-        paymentStatus: { $ne: "paid" },
-        transactionDate: { $lt: thirtyDaysAgo },
-      });
-
-      if (overdueInvoices.length > 0) {
-        const totalAmount = overdueInvoices.reduce(
-          (sum, inv) => sum + inv.transactionAmount,
-          0
-        );
+    await runNotificationRule({
+      name: "checkOverdueInvoices",
+      category: "finance",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const thirtyDaysAgo = new Date(Date.now() - 30 * 24 * 60 * 60 * 1000);
+        const overdueByCompany = await Finance.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              transactionType: "Expense",
+              paymentStatus: { $ne: "paid" },
+              transactionDate: { $lt: thirtyDaysAgo },
+            },
+          },
+          {
+            $group: {
+              _id: "$companyId",
+              invoiceCount: { $sum: 1 },
+              totalAmount: { $sum: "$transactionAmount" },
+            },
+          },
+        ]);
 
-        await notifyAdminsAndManagers({
-          companyId: company._id,
+        return overdueByCompany.map(({ _id, invoiceCount, totalAmount }) => ({
+          companyId: _id,
           title: "💸 חשבוניות שלא שולמו",
-          content: `יש ${overdueInvoices.length} חשבוניות שלא שולמו מעל 30 יום, סה"כ ₪${totalAmount.toLocaleString()}`,
+          content: `יש ${invoiceCount} חשבוניות שלא שולמו מעל 30 יום, סה"כ ₪${totalAmount.toLocaleString()}`,
           type: "Warning",
-          category: "finance",
           priority: "high",
           actionUrl: `/dashboard/finance`,
           actionLabel: "צפה בחשבוניות",
-          metadata: { invoiceCount: overdueInvoices.length, totalAmount },
-          dedupe: {
-            enabled: true,
-            hours: 24,
-          },
-        });
-        totalNotifications++;
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} overdue invoice notifications`);
+          metadata: { invoiceCount, totalAmount },
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkOverdueInvoices:", error);
   }
@@ -1073,73 +962,55 @@ export const updateOverdueInvoiceStatus = async () => {
  */
 export const checkLowInventory = async () => {
   try {
-    console.log("🔍 Checking low inventory...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const lowStockItems = await Inventory.find({
-        companyId: company._id,
-        $expr: { $lte: ["$quantity", "$minStockLevel"] },
-      }).populate("productId");
-
-      // יצירת התראה נפרדת לכל מוצר
-      for (const item of lowStockItems) {
-        const product = item.productId;
-        if (!product) continue;
-
-        const targetEmployee =
-          (await Employee.findOne({ companyId: company._id, role: "Admin" }))?._id ||
-          (await Employee.findOne({ companyId: company._id }))?._id;
-
-        const isDuplicate = await shouldSkipNotification({
-          companyId: company._id,
-          employeeId: targetEmployee,
-          category: "inventory",
-          title: "📦 התראת מלאי נמוך",
-          relatedEntity: {
-            entityType: "Inventory",
-            entityId: item._id.toString(),
-          },
-          hours: 24,
-        });
-
-        if (!isDuplicate) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "📦 התראת מלאי נמוך",
-            content: `המוצר "${product.productName}" במלאי נמוך: ${item.quantity} יחידות (מינימום: ${item.minStockLevel})`,
-            type: "Warning",
-            category: "inventory",
-            priority: "high",
-            relatedEntity: {
-              entityType: "Inventory",
-              entityId: item._id.toString(),
-            },
-            actionUrl: `/dashboard/products`,
-            actionLabel: "צפה במלאי",
-            metadata: {
-              products: [
-                {
-                  productId: product._id,
-                  productName: product.productName,
-                  quantity: item.quantity,
-                  minStockLevel: item.minStockLevel,
-                  reorderQuantity: item.reorderQuantity || 10,
-                  sku: product.sku,
-                  category: product.category,
-                  unitPrice: product.unitPrice,
-                  supplierId: product.supplierId,
-                },
-              ],
-            },
-            PurchaseOrder: "Inventory", // לתאימות לאחור
+    await runNotificationRule({
+      name: "checkLowInventory",
+      category: "inventory",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const lowStockItems = await Inventory.find({
+          companyId: { $in: companyIds },
+          $expr: { $lte: ["$quantity", "$minStockLevel"] },
+        })
+          .select("companyId productId quantity minStockLevel reorderQuantity")
+          .populate("productId", "productName sku category unitPrice supplierId")
+          .lean();
+
+        // התראה נפרדת לכל מוצר
+        return lowStockItems
+          .filter((item) => item.productId)
+          .map((item) => {
+            const product = item.productId;
+            return {
+              companyId: item.companyId,
+              title: "📦 התראת מלאי נמוך",
+              content: `המוצר "${product.productName}" במלאי נמוך: ${item.quantity} יחידות (מינימום: ${item.minStockLevel})`,
+              type: "Warning",
+              priority: "high",
+              relatedEntity: {
+                entityType: "Inventory",
+                entityId: item._id.toString(),
+              },
+              actionUrl: `/dashboard/products`,
+              actionLabel: "צפה במלאי",
+              metadata: {
+                products: [
+                  {
+                    productId: product._id,
+                    productName: product.productName,
+                    quantity: item.quantity,
+                    minStockLevel: item.minStockLevel,
+                    reorderQuantity: item.reorderQuantity || 10,
+                    sku: product.sku,
+                    category: product.category,
+                    unitPrice: product.unitPrice,
+                    supplierId: product.supplierId,
+                  },
+                ],
+              },
+            };
           });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} low inventory notifications`);
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkLowInventory:", error);
   }
@@ -1150,38 +1021,34 @@ export const checkLowInventory = async () => {
  */
 export const checkExpiringProducts = async () => {
   try {
-    console.log("🔍 Checking expiring products...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const thirtyDaysFromNow = new Date(Date.now() + 30 * 24 * 60 * 60 * 1000);
-
-      const expiringItems = await Inventory.find({
-        companyId: company._id,
-        expirationDate: { $lte: thirtyDaysFromNow, $gt: new Date() },
-      }).populate("productId");
+    await runNotificationRule({
+      name: "checkExpiringProducts",
+      category: "inventory",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const thirtyDaysFromNow = new Date(Date.now() + 30 * 24 * 60 * 60 * 1000);
+        const expiringByCompany = await Inventory.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              expirationDate: { $lte: thirtyDaysFromNow, $gt: new Date() },
+            },
+          },
+          { $group: { _id: "$companyId", itemCount: { $sum: 1 } } },
+        ]);
 
-      if (expiringItems.length > 0) {
-        await notifyAdminsAndManagers({
-          companyId: company._id,
+        return expiringByCompany.map(({ _id, itemCount }) => ({
+          companyId: _id,
           title: "⏳ מוצרים שעומדים לפוג",
-          content: `${expiringItems.length} מוצרים יפוגו תוך 30 יום`,
+          content: `${itemCount} מוצרים יפוגו תוך 30 יום`,
           type: "Warning",
-          category: "inventory",
           priority: "medium",
           actionUrl: `/dashboard/products`,
           actionLabel: "צפה במוצרים",
-          metadata: { itemCount: expiringItems.length },
-          dedupe: {
-            enabled: true,
-            hours: 24,
-          },
-        });
-        totalNotifications++;
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} expiring product notifications`);
+          metadata: { itemCount },
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkExpiringProducts:", error);
   }
@@ -1192,82 +1059,66 @@ export const checkExpiringProducts = async () => {
  */
 export const checkTaskDeadlines = async () => {
   try {
-    console.log("🔍 Checking task deadlines...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const twoDaysFromNow = new Date(Date.now() + 2 * 24 * 60 * 60 * 1000);
-
-      const upcomingTasks = await Task.find({
-        companyId: company._id,
-        status: { $ne: "completed" },
-        endDate: { $lte: twoDaysFromNow, $gt: new Date() },
-      });
-
-      for (const task of upcomingTasks) {
-        if (task.assignedTo) {
-          const skipReminder = await shouldSkipNotification({
-            companyId: company._id,
-            employeeId: task.assignedTo,
-            category: "tasks",
-            title: "⏰ משימה מתקרבת לדדליין",
-            relatedEntity: {
-              entityType: "Task",
-              entityId: task._id.toString(),
-            },
-            hours: 12,
-          });
-
-          if (skipReminder) {
-            continue;
-          }
+    await runNotificationRule({
+      name: "checkTaskDeadlines",
+      category: "tasks",
+      hours: 12,
+      collectAll: async (companyIds) => {
+        const twoDaysFromNow = new Date(Date.now() + 2 * 24 * 60 * 60 * 1000);
+        const upcomingTasks = await Task.find({
+          companyId: { $in: companyIds },
+          status: { $ne: "completed" },
+          endDate: { $lte: twoDaysFromNow, $gt: new Date() },
+          "assignedTo.0": { $exists: true },
+        })
+          .select("_id companyId taskName assignedTo")
+          .lean();
+
+        return upcomingTasks.map((task) => ({
+          companyId: task.companyId,
+          employeeIds: task.assignedTo,
+          title: "⏰ משימה מתקרבת לדדליין",
+          content: `המשימה "${task.taskName}" תסתיים בעוד יומיים`,
+          type: "Reminder",
+          priority: "high",
+          relatedEntity: {
+            entityType: "Task",
+            entityId: task._id.toString(),
+          },
+          actionUrl: `/dashboard/tasks`,
+          actionLabel: "צפה במשימה",
+        }));
+      },
+    });
 
-          await createNotification({
-            companyId: company._id,
-            employeeId: task.assignedTo,
-            title: "⏰ משימה מתקרבת לדדליין",
-            content: `המשימה "${task.taskName}" תסתיים בעוד יומיים`,
-            type: "Reminder",
-            category: "tasks",
-            priority: "high",
-            relatedEntity: {
-              entityType: "Task",
-              entityId: task._id.toString(),
+    await runNotificationRule({
+      name: "checkTaskDeadlines:overdue",
+      category: "tasks",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const overdueByCompany = await Task.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: { $ne: "completed" },
+              endDate: { $lt: new Date() },
             },
-            actionUrl: `/dashboard/tasks`,
-            actionLabel: "צפה במשימה",
-          });
-          totalNotifications++;
-        }
-      }
-
-      const overdueTasks = await Task.find({
-        companyId: company._id,
-        status: { $ne: "completed" },
-        endDate: { $lt: new Date() },
-      });
+          },
+          { $group: { _id: "$companyId", taskCount: { $sum: 1 } } },
+        ]);
 
-      if (overdueTasks.length > 0) {
-        await notifyAdminsAndManagers({
-          companyId: company._id,
+        return overdueByCompany.map(({ _id, taskCount }) => ({
+          companyId: _id,
           title: "🔴 משימות שעברו דדליין",
-          content: `יש ${overdueTasks.length} משימות שעברו את הדדליין`,
+          content: `יש ${taskCount} משימות שעברו את הדדליין`,
           type: "Urgent",
-          category: "tasks",
           priority: "critical",
           actionUrl: `/dashboard/tasks`,
           actionLabel: "צפה במשימות",
-          metadata: { taskCount: overdueTasks.length },
-          dedupe: {
-            enabled: true,
-            hours: 24,
-          },
-        });
-        totalNotifications++;
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} task deadline notifications`);
+          metadata: { taskCount },
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkTaskDeadlines:", error);
   }
@@ -1278,67 +1129,61 @@ export const checkTaskDeadlines = async () => {
  */
 export const checkProjectDeadlines = async () => {
   try {
-    console.log("🔍 Checking project deadlines...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const sevenDaysFromNow = new Date(Date.now() + 7 * 24 * 60 * 60 * 1000);
-
-      const upcomingProjects = await Project.find({
-        companyId: company._id,
-        status: { $in: ["active", "in-progress"] },
-        endDate: { $lte: sevenDaysFromNow, $gt: new Date() },
-      });
-
-      for (const project of upcomingProjects) {
-        await notifyAdminsAndManagers({
-          companyId: company._id,
-          title: "⏰ פרויקט מתקרב לדדליין",
-          content: `הפרויקט "${project.projectName}" יסתיים בעוד 7 ימים`,
-          type: "Reminder",
-          category: "projects",
-          priority: "high",
-          relatedEntity: {
-            entityType: "Project",
-            entityId: project._id.toString(),
-          },
-          actionUrl: `/dashboard/projects`,
-          actionLabel: "צפה בפרויקט",
-          dedupe: {
-            enabled: true,
-            hours: 24,
-          },
-        });
-        totalNotifications++;
-      }
-
-      const overdueProjects = await Project.find({
-        companyId: company._id,
-        status: { $in: ["active", "in-progress"] },
-        endDate: { $lt: new Date() },
-      });
+    await runNotificationRule({
+      name: "checkProjectDeadlines",
+      category: "projects",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const now = new Date();
+        const sevenDaysFromNow = new Date(Date.now() + 7 * 24 * 60 * 60 * 1000);
+        const projects = await Project.find({
+          companyId: { $in: companyIds },
+          status: { $in: ["active", "in-progress"] },
+          endDate: { $lte: sevenDaysFromNow },
+        })
+          .select("_id companyId projectName endDate")
+          .lean();
+
+        const candidates = [];
+        const overdueCounts = new Map();
+        for (const project of projects) {
+          if (project.endDate > now) {
+            candidates.push({
+              companyId: project.companyId,
+              title: "⏰ פרויקט מתקרב לדדליין",
+              content: `הפרויקט "${project.projectName}" יסתיים בעוד 7 ימים`,
+              type: "Reminder",
+              priority: "high",
+              relatedEntity: {
+                entityType: "Project",
+                entityId: project._id.toString(),
+              },
+              actionUrl: `/dashboard/projects`,
+              actionLabel: "צפה בפרויקט",
+            });
+          } else if (project.endDate < now) {
+            const key = project.companyId.toString();
+            const entry = overdueCounts.get(key) || { companyId: project.companyId, projectCount: 0 };
+            entry.projectCount++;
+            overdueCounts.set(key, entry);
+          }
+        }
 
-      if (overdueProjects.length > 0) {
-        await notifyAdminsAndManagers({
-          companyId: company._id,
-          title: "🔴 פרויקטים שעברו דדליין",
-          content: `יש ${overdueProjects.length} פרויקטים שעברו את הדדליין`,
-          type: "Urgent",
-          category: "projects",
-          priority: "critical",
-          actionUrl: `/dashboard/projects`,
-          actionLabel: "צפה בפרויקטים",
-          metadata: { projectCount: overdueProjects.length },
-          dedupe: {
-            enabled: true,
-            hours: 24,
-          },
-        });
-        totalNotifications++;
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} project deadline notifications`);
+        for (const { companyId, projectCount } of overdueCounts.values()) {
+          candidates.push({
+            companyId,
+            title: "🔴 פרויקטים שעברו דדליין",
+            content: `יש ${projectCount} פרויקטים שעברו את הדדליין`,
+            type: "Urgent",
+            priority: "critical",
+            actionUrl: `/dashboard/projects`,
+            actionLabel: "צפה בפרויקטים",
+            metadata: { projectCount },
+          });
+        }
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkProjectDeadlines:", error);
   }
@@ -1349,65 +1194,60 @@ export const checkProjectDeadlines = async () => {
  */
 export const checkCustomerOrders = async () => {
   try {
-    console.log("🔍 Checking customer orders...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
-
-      const pendingOrders = await CustomerOrder.find({
-        companyId: company._id,
-        status: "Pending",
-        createdAt: { $lt: threeDaysAgo },
-      });
+    await runNotificationRule({
+      name: "checkCustomerOrders:pending",
+      category: "customers",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
+        const pendingByCompany = await CustomerOrder.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: "Pending",
+              createdAt: { $lt: threeDaysAgo },
+            },
+          },
+          { $group: { _id: "$companyId", orderCount: { $sum: 1 } } },
+        ]);
 
-      if (pendingOrders.length > 0) {
-        await notifyAdminsAndManagers({
-          companyId: company._id,
+        return pendingByCompany.map(({ _id, orderCount }) => ({
+          companyId: _id,
           title: "🛒 הזמנות ממתינות",
-          content: `יש ${pendingOrders.length} הזמנות ממתינות מעל 3 ימים`,
+          content: `יש ${orderCount} הזמנות ממתינות מעל 3 ימים`,
           type: "Warning",
-          category: "customers",
           priority: "medium",
           actionUrl: `/dashboard/Customers/Orders`,
           actionLabel: "צפה בהזמנות",
-          metadata: { orderCount: pendingOrders.length },
-          dedupe: {
-            enabled: true,
-            hours: 24,
-          },
-        });
-        totalNotifications++;
-      }
-
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-
-      const newOrders = await CustomerOrder.find({
-        companyId: company._id,
-        createdAt: { $gte: today },
-      });
+          metadata: { orderCount },
+        }));
+      },
+    });
 
-      if (newOrders.length > 0) {
-        await notifyAdmins({
-          companyId: company._id,
+    await runNotificationRule({
+      name: "checkCustomerOrders:new",
+      category: "customers",
+      hours: 12,
+      recipients: "admins",
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+        const newByCompany = await CustomerOrder.aggregate([
+          { $match: { companyId: { $in: companyIds }, createdAt: { $gte: today } } },
+          { $group: { _id: "$companyId", orderCount: { $sum: 1 } } },
+        ]);
+
+        return newByCompany.map(({ _id, orderCount }) => ({
+          companyId: _id,
           title: "🎉 הזמנות חדשות",
-          content: `התקבלו ${newOrders.length} הזמנות חדשות היום`,
+          content: `התקבלו ${orderCount} הזמנות חדשות היום`,
           type: "Info",
-          category: "customers",
           priority: "medium",
           actionUrl: `/dashboard/Customers/Orders`,
           actionLabel: "צפה בהזמנות",
-          dedupe: {
-            enabled: true,
-            hours: 12,
-          },
-        });
-        totalNotifications++;
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} customer order notifications`);
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkCustomerOrders:", error);
   }
@@ -1418,56 +1258,36 @@ export const checkCustomerOrders = async () => {
  */
 export const checkUpcomingPerformanceReviews = async () => {
   try {
-    console.log("🔍 Checking upcoming performance reviews...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const sevenDaysFromNow = new Date(Date.now() + 7 * 24 * 60 * 60 * 1000);
-
-      const upcomingReviews = await PerformanceReview.find({
-        companyId: company._id,
-        reviewDate: { $lte: sevenDaysFromNow, $gt: new Date() },
-      });
-
-      for (const review of upcomingReviews) {
-        if (review.reviewedBy) {
-          const skipReviewReminder = await shouldSkipNotification({
-            companyId: company._id,
-            employeeId: review.reviewedBy,
-            category: "hr",
-            title: "📝 תזכורת: ביקורת ביצועים",
-            relatedEntity: {
-              entityType: "Employee",
-              entityId: review.employeeId?.toString(),
-            },
-            hours: 24,
-          });
-
-          if (skipReviewReminder) {
-            continue;
-          }
-
-          await createNotification({
-            companyId: company._id,
-            employeeId: review.reviewedBy,
-            title: "📝 תזכורת: ביקורת ביצועים",
-            content: `יש לבצע ביקורת ביצועים בעוד שבוע`,
-            type: "Reminder",
-            category: "hr",
-            priority: "medium",
-            relatedEntity: {
-              entityType: "Employee",
-              entityId: review.employeeId?.toString(),
-            },
-            actionUrl: `/dashboard/performance-reviews`,
-            actionLabel: "צפה בביקורות",
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} performance review notifications`);
+    await runNotificationRule({
+      name: "checkUpcomingPerformanceReviews",
+      category: "hr",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const sevenDaysFromNow = new Date(Date.now() + 7 * 24 * 60 * 60 * 1000);
+        const upcomingReviews = await PerformanceReview.find({
+          companyId: { $in: companyIds },
+          reviewDate: { $lte: sevenDaysFromNow, $gt: new Date() },
+          reviewedBy: { $ne: null },
+        })
+          .select("companyId employeeId reviewedBy")
+          .lean();
+
+        return upcomingReviews.map((review) => ({
+          companyId: review.companyId,
+          employeeIds: [review.reviewedBy],
+          title: "📝 תזכורת: ביקורת ביצועים",
+          content: `יש לבצע ביקורת ביצועים בעוד שבוע`,
+          type: "Reminder",
+          priority: "medium",
+          relatedEntity: {
+            entityType: "Employee",
+            entityId: review.employeeId?.toString(),
+          },
+          actionUrl: `/dashboard/performance-reviews`,
+          actionLabel: "צפה בביקורות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUpcomingPerformanceReviews:", error);
   }
@@ -1478,63 +1298,65 @@ export const checkUpcomingPerformanceReviews = async () => {
  */
 export const checkUpcomingEvents = async () => {
   try {
-    console.log("🔍 Checking upcoming events...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const now = new Date();
-      const twoHours = 2 * 60 * 60 * 1000;
-      const oneDay = 24 * 60 * 60 * 1000;
-
-      const upcomingEvents = await Event.find({
-        companyId: company._id,
-        eventDate: { $gt: now },
-      });
-
-      for (const event of upcomingEvents) {
-        const timeUntilStart = new Date(event.eventDate) - now;
-        if (timeUntilStart <= 0) continue;
-
-        let message,
-          shouldNotify = false;
-
-        if (event.eventType === "meeting") {
-          if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
-            message = `הפגישה "${event.title}" מתחילה בעוד פחות משעתיים`;
-            event.twoHoursReminderSent = true;
-            shouldNotify = true;
-          } else if (timeUntilStart < oneDay && !event.dayReminderSent) {
-            message = `הפגישה "${event.title}" מתחילה מחר`;
-            event.dayReminderSent = true;
-            shouldNotify = true;
-          }
-        } else if (event.eventType === "holiday") {
-          if (timeUntilStart < oneDay && !event.dayReminderSent) {
-            message = `חג "${event.title}" מתחיל מחר`;
-            event.dayReminderSent = true;
-            shouldNotify = true;
-          }
-        } else {
-          if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
-            message = `האירוע "${event.title}" מתחיל בעוד שעתיים`;
-            event.twoHoursReminderSent = true;
-            shouldNotify = true;
-          } else if (timeUntilStart < oneDay && !event.dayReminderSent) {
-            message = `האירוע "${event.title}" מתחיל מחר`;
-            event.dayReminderSent = true;
-            shouldNotify = true;
+    const reminderUpdates = [];
+
+    await runNotificationRule({
+      name: "checkUpcomingEvents",
+      category: "system",
+      // דגלי התזכורת באירוע מונעים כפילויות
+      dedupe: false,
+      collectAll: async (companyIds) => {
+        const now = new Date();
+        const twoHours = 2 * 60 * 60 * 1000;
+        const oneDay = 24 * 60 * 60 * 1000;
+
+        const upcomingEvents = await Event.find({
+          companyId: { $in: companyIds },
+          eventDate: { $gt: now, $lt: new Date(now.getTime() + oneDay) },
+        })
+          .select("_id companyId title eventType eventDate createdBy twoHoursReminderSent dayReminderSent")
+          .lean();
+
+        const candidates = [];
+        for (const event of upcomingEvents) {
+          const timeUntilStart = new Date(event.eventDate) - now;
+          if (timeUntilStart <= 0) continue;
+
+          let message;
+          let flag;
+          if (event.eventType === "meeting") {
+            if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
+              message = `הפגישה "${event.title}" מתחילה בעוד פחות משעתיים`;
+              flag = "twoHoursReminderSent";
+            } else if (timeUntilStart < oneDay && !event.dayReminderSent) {
+              message = `הפגישה "${event.title}" מתחילה מחר`;
+              flag = "dayReminderSent";
+            }
+          } else if (event.eventType === "holiday") {
+            if (timeUntilStart < oneDay && !event.dayReminderSent) {
+              message = `חג "${event.title}" מתחיל מחר`;
+              flag = "dayReminderSent";
+            }
+          } else {
+            if (timeUntilStart < twoHours && !event.twoHoursReminderSent) {
+              message = `האירוע "${event.title}" מתחיל בעוד שעתיים`;
+              flag = "twoHoursReminderSent";
+            } else if (timeUntilStart < oneDay && !event.dayReminderSent) {
+              message = `האירוע "${event.title}" מתחיל מחר`;
+              flag = "dayReminderSent";
+            }
           }
-        }
 
-        if (shouldNotify) {
-          await createNotification({
-            companyId: company._id,
-            employeeId: event.createdBy,
+          if (!message || !event.createdBy) continue;
+          reminderUpdates.push({
+            updateOne: { filter: { _id: event._id }, update: { $set: { [flag]: true } } },
+          });
+          candidates.push({
+            companyId: event.companyId,
+            employeeIds: [event.createdBy],
             title: "📅 תזכורת אירוע",
             content: message,
             type: "Reminder",
-            category: "system",
             priority: "medium",
             relatedEntity: {
               entityType: "Event",
@@ -1543,12 +1365,14 @@ export const checkUpcomingEvents = async () => {
             actionUrl: `/dashboard/Events`,
             actionLabel: "צפה באירועים",
           });
-          totalNotifications++;
-          await event.save();
         }
-      }
+        return candidates;
+      },
+    });
+
+    if (reminderUpdates.length > 0) {
+      await Event.bulkWrite(reminderUpdates, { ordered: false });
     }
-    console.log(`✅ Created ${totalNotifications} event notifications`);
   } catch (error) {
     console.error("❌ Error in checkUpcomingEvents:", error);
   }
@@ -1574,22 +1398,21 @@ export const cleanupExpiredNotifications = async () => {
  */
 export const sendWeeklyReports = async () => {
   try {
-    console.log("📊 Sending weekly reports...");
-    const companies = await Company.find();
-
-    for (const company of companies) {
-      await notifyAdminsAndManagers({
-        companyId: company._id,
-        title: "📊 דוח שבועי",
-        content: "דוח סיכום שבועי זמין לצפייה בדשבורד",
-        type: "Info",
-        category: "system",
-        priority: "low",
-        actionUrl: `/dashboard`,
-        actionLabel: "צפה בדוח",
-      });
-    }
-    console.log("✅ Weekly reports sent");
+    await runNotificationRule({
+      name: "sendWeeklyReports",
+      category: "system",
+      dedupe: false,
+      collectAll: async (companyIds) =>
+        companyIds.map((companyId) => ({
+          companyId,
+          title: "📊 דוח שבועי",
+          content: "דוח סיכום שבועי זמין לצפייה בדשבורד",
+          type: "Info",
+          priority: "low",
+          actionUrl: `/dashboard`,
+          actionLabel: "צפה בדוח",
+        })),
+    });
   } catch (error) {
     console.error("❌ Error in sendWeeklyReports:", error);
   }
@@ -1604,84 +1427,69 @@ export const sendWeeklyReports = async () => {
  */
 export const checkUpcomingPaymentDueDates = async () => {
   try {
-    console.log("💰 Checking upcoming payment due dates (3 days or less)...");
-    const companies = await Company.find();
-
-    for (const company of companies) {
-      const companyId = company._id;
-      
-      // תאריך היום
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      
-      // תאריך בעוד 3 ימים
-      const in3Days = new Date(today);
-      in3Days.setDate(in3Days.getDate() + 3);
-      
-      // מציאת רשומות פיננסיות עם מועד תשלום קרוב (3 ימים או פחות)
-      const upcomingPayments = await Finance.find({
-        companyId,
-        transactionStatus: "Pending",
-        dueDate: {
-          $gte: today,
-          $lte: in3Days,
-        },
-        paymentReminderSent: false,
-      }).populate("partyId");
-
-      for (const payment of upcomingPayments) {
-        if (!payment.dueDate) {
-          console.log(`⚠️ Payment ${payment._id} has no dueDate, skipping...`);
-          continue;
-        }
-
-        const dueDate = new Date(payment.dueDate);
-        dueDate.setHours(0, 0, 0, 0);
-        
-        const daysUntilDue = Math.ceil((dueDate - today) / (1000 * 60 * 60 * 24));
-        
-        // בודק רק אם נשארו 3 ימים או פחות
-        if (daysUntilDue <= 3 && daysUntilDue >= 0) {
-          const priority = daysUntilDue === 0 ? "critical" : "high";
-          const title = daysUntilDue === 0 
-            ? `🚨 מועד תשלום היום!`
-            : `⚠️ מועד תשלום קרוב - ${daysUntilDue} ימים`;
-          
-          const content = `רשומה פיננסית בסך ${payment.transactionAmount} ${payment.transactionCurrency} תפוג בעוד ${daysUntilDue} ימים (${dueDate.toLocaleDateString("he-IL")})\n` +
-            `תנאי תשלום: ${payment.paymentTerms || "לא צוין"}\n` +
-            `קטגוריה: ${payment.category}\n` +
-            `תיאור: ${payment.transactionDescription || "ללא תיאור"}`;
-          
-          // שליחת התראה למנהלים ואדמינים
-          await notifyAdminsAndManagers({
-            companyId,
-            title,
-            content,
+    let remindedPaymentIds = [];
+
+    await runNotificationRule({
+      name: "checkUpcomingPaymentDueDates",
+      category: "finance",
+      // paymentReminderSent מונע שליחה חוזרת
+      dedupe: false,
+      collectAll: async (companyIds) => {
+        // תאריך היום
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+
+        // תאריך בעוד 3 ימים
+        const in3Days = new Date(today);
+        in3Days.setDate(in3Days.getDate() + 3);
+
+        // מציאת רשומות פיננסיות עם מועד תשלום קרוב (3 ימים או פחות)
+        const upcomingPayments = await Finance.find({
+          companyId: { $in: companyIds },
+          transactionStatus: "Pending",
+          dueDate: { $gte: today, $lte: in3Days },
+          paymentReminderSent: false,
+        })
+          .select(
+            "_id companyId dueDate transactionAmount transactionCurrency paymentTerms category transactionDescription"
+          )
+          .lean();
+
+        remindedPaymentIds = upcomingPayments.map((payment) => payment._id);
+
+        return upcomingPayments.map((payment) => {
+          const dueDate = new Date(payment.dueDate);
+          dueDate.setHours(0, 0, 0, 0);
+          const daysUntilDue = Math.ceil((dueDate - today) / (1000 * 60 * 60 * 24));
+
+          return {
+            companyId: payment.companyId,
+            title: daysUntilDue === 0 ? `🚨 מועד תשלום היום!` : `⚠️ מועד תשלום קרוב - ${daysUntilDue} ימים`,
+            content:
+              `רשומה פיננסית בסך ${payment.transactionAmount} ${payment.transactionCurrency} תפוג בעוד ${daysUntilDue} ימים (${dueDate.toLocaleDateString("he-IL")})\n` +
+              `תנאי תשלום: ${payment.paymentTerms || "לא צוין"}\n` +
+              `קטגוריה: ${payment.category}\n` +
+              `תיאור: ${payment.transactionDescription || "ללא תיאור"}`,
             type: "Warning",
-            category: "finance",
-            priority,
+            priority: daysUntilDue === 0 ? "critical" : "high",
             actionUrl: `/dashboard/finance`,
             actionLabel: "צפה ברשומה",
             relatedEntity: {
               entityType: "Finance",
               entityId: payment._id.toString(),
             },
-          });
-          
-          // סימון שהתראה נשלחה
-          payment.paymentReminderSent = true;
-          await payment.save();
-          
-          console.log(`✅ Sent reminder for payment ${payment._id} (${daysUntilDue} days until due)`);
-        }
-      }
-      
-      if (upcomingPayments.length > 0) {
-        console.log(`✅ Found ${upcomingPayments.length} upcoming payments for company ${companyId}`);
-      }
+          };
+        });
+      },
+    });
+
+    // סימון שהתראה נשלחה
+    if (remindedPaymentIds.length > 0) {
+      await Finance.updateMany(
+        { _id: { $in: remindedPaymentIds } },
+        { $set: { paymentReminderSent: true } }
+      );
     }
-    
-    console.log("✅ Payment due date check completed");
   } catch (error) {
     console.error("❌ Error in checkUpcomingPaymentDueDates:", error);
   }
@@ -1693,89 +1501,52 @@ export const checkUpcomingPaymentDueDates = async () => {
  */
 export const checkOverduePayments = async () => {
   try {
-    console.log("🚨 Checking overdue payments...");
-    const companies = await Company.find();
-
-    for (const company of companies) {
-      const companyId = company._id;
-      
-      // תאריך היום
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      
-      // מציאת רשומות פיננסיות שפג תוקפן (dueDate < today)
-      const overduePayments = await Finance.find({
-        companyId,
-        transactionStatus: "Pending",
-        dueDate: {
-          $lt: today,
-        },
-      }).populate("partyId");
-
-      for (const payment of overduePayments) {
-        if (!payment.dueDate) {
-          continue;
-        }
-
-        const dueDate = new Date(payment.dueDate);
-        dueDate.setHours(0, 0, 0, 0);
-        
-        const daysOverdue = Math.ceil((today - dueDate) / (1000 * 60 * 60 * 24));
-        
-        // שליחת התראה למנהלים ואדמינים
-        const priority = daysOverdue > 30 ? "critical" : daysOverdue > 14 ? "high" : "medium";
-        const title = `🚨 תשלום שפג תוקפו - ${daysOverdue} ימים`;
-        
-        const content = `רשומה פיננסית בסך ${payment.transactionAmount} ${payment.transactionCurrency} פגה לפני ${daysOverdue} ימים (${dueDate.toLocaleDateString("he-IL")})\n` +
-          `תנאי תשלום: ${payment.paymentTerms || "לא צוין"}\n` +
-          `קטגוריה: ${payment.category}\n` +
-          `תיאור: ${payment.transactionDescription || "ללא תיאור"}`;
-        
-        // בדיקה אם כבר נשלחה התראה על חריגה זו היום
-        const todayStart = new Date();
-        todayStart.setHours(0, 0, 0, 0);
-        const todayEnd = new Date();
-        todayEnd.setHours(23, 59, 59, 999);
-        
-        const existingNotification = await Notification.findOne({
-          companyId,
-          category: "finance",
-          "relatedEntity.entityId": payment._id.toString(),
-          "relatedEntity.entityType": "Finance",
-          title: { $regex: /פג תוקפו/ },
-          createdAt: {
-            $gte: todayStart,
-            $lte: todayEnd,
-          },
-        });
-        
-        // אם לא נשלחה התראה היום, שולח התראה חדשה
-        if (!existingNotification) {
-          await notifyAdminsAndManagers({
-            companyId,
-            title,
-            content,
+    // תאריך היום
+    const today = new Date();
+    today.setHours(0, 0, 0, 0);
+
+    await runNotificationRule({
+      name: "checkOverduePayments",
+      category: "finance",
+      // התראה אחת לכל רשומה ביום (הכותרת כוללת את מספר הימים)
+      hours: (Date.now() - today.getTime()) / (60 * 60 * 1000),
+      collectAll: async (companyIds) => {
+        // מציאת רשומות פיננסיות שפג תוקפן (dueDate < today)
+        const overduePayments = await Finance.find({
+          companyId: { $in: companyIds },
+          transactionStatus: "Pending",
+          dueDate: { $lt: today },
+        })
+          .select(
+            "_id companyId dueDate transactionAmount transactionCurrency paymentTerms category transactionDescription"
+          )
+          .lean();
+
+        return overduePayments.map((payment) => {
+          const dueDate = new Date(payment.dueDate);
+          dueDate.setHours(0, 0, 0, 0);
+          const daysOverdue = Math.ceil((today - dueDate) / (1000 * 60 * 60 * 24));
+
+          return {
+            companyId: payment.companyId,
+            title: `🚨 תשלום שפג תוקפו - ${daysOverdue} ימים`,
+            content:
+              `רשומה פיננסית בסך ${payment.transactionAmount} ${payment.transactionCurrency} פגה לפני ${daysOverdue} ימים (${dueDate.toLocaleDateString("he-IL")})\n` +
+              `תנאי תשלום: ${payment.paymentTerms || "לא צוין"}\n` +
+              `קטגוריה: ${payment.category}\n` +
+              `תיאור: ${payment.transactionDescription || "ללא תיאור"}`,
             type: "Error",
-            category: "finance",
-            priority,
+            priority: daysOverdue > 30 ? "critical" : daysOverdue > 14 ? "high" : "medium",
             actionUrl: `/dashboard/finance`,
             actionLabel: "צפה ברשומה",
             relatedEntity: {
               entityType: "Finance",
               entityId: payment._id.toString(),
             },
-          });
-          
-          console.log(`✅ Sent overdue reminder for payment ${payment._id} (${daysOverdue} days overdue)`);
-        }
-      }
-      
-      if (overduePayments.length > 0) {
-        console.log(`✅ Found ${overduePayments.length} overdue payments for company ${companyId}`);
-      }
-    }
-    
-    console.log("✅ Overdue payment check completed");
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkOverduePayments:", error);
   }
@@ -1786,22 +1557,21 @@ export const checkOverduePayments = async () => {
  */
 export const sendMonthlyReports = async () => {
   try {
-    console.log("📊 Sending monthly reports...");
-    const companies = await Company.find();
-
-    for (const company of companies) {
-      await notifyAdminsAndManagers({
-        companyId: company._id,
-        title: "📊 דוח חודשי",
-        content: "דוח סיכום חודשי זמין לצפייה בדשבורד",
-        type: "Info",
-        category: "system",
-        priority: "low",
-        actionUrl: `/dashboard`,
-        actionLabel: "צפה בדוח",
-      });
-    }
-    console.log("✅ Monthly reports sent");
+    await runNotificationRule({
+      name: "sendMonthlyReports",
+      category: "system",
+      dedupe: false,
+      collectAll: async (companyIds) =>
+        companyIds.map((companyId) => ({
+          companyId,
+          title: "📊 דוח חודשי",
+          content: "דוח סיכום חודשי זמין לצפייה בדשבורד",
+          type: "Info",
+          priority: "low",
+          actionUrl: `/dashboard`,
+          actionLabel: "צפה בדוח",
+        })),
+    });
   } catch (error) {
     console.error("❌ Error in sendMonthlyReports:", error);
   }
@@ -1816,46 +1586,33 @@ export const sendMonthlyReports = async () => {
  */
 export const checkUncontactedLeads = async () => {
   try {
-    console.log("🔍 Checking uncontacted leads...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
-
-      const uncontactedLeads = await Lead.find({
-        companyId: company._id,
-        status: { $in: ["New", "Contacted"] },
-        $or: [
-          { lastContacted: { $exists: false } },
-          { lastContacted: { $lt: threeDaysAgo } },
-        ],
-        createdAt: { $lt: threeDaysAgo },
-      }).populate("assignedTo");
-
-      for (const lead of uncontactedLeads) {
-        const daysSinceCreation = Math.floor(
-          (Date.now() - new Date(lead.createdAt)) / (1000 * 60 * 60 * 24)
-        );
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "leads",
-          title: "📞 ליד שלא יצר קשר",
-          relatedEntity: {
-            entityType: "Lead",
-            entityId: lead._id.toString(),
-          },
-          hours: 24,
-        });
+    await runNotificationRule({
+      name: "checkUncontactedLeads",
+      category: "leads",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
+        const uncontactedLeads = await Lead.find({
+          companyId: { $in: companyIds },
+          status: { $in: ["New", "Contacted"] },
+          $or: [
+            { lastContacted: { $exists: false } },
+            { lastContacted: { $lt: threeDaysAgo } },
+          ],
+          createdAt: { $lt: threeDaysAgo },
+        })
+          .select("_id companyId name createdAt estimatedValue currency leadScore")
+          .lean();
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return uncontactedLeads.map((lead) => {
+          const daysSinceCreation = Math.floor(
+            (Date.now() - new Date(lead.createdAt)) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: lead.companyId,
             title: "📞 ליד שלא יצר קשר",
             content: `ליד "${lead.name}" לא יצר קשר כבר ${daysSinceCreation} ימים. ערך משוער: ${lead.estimatedValue || 0} ${lead.currency || "ILS"}`,
             type: "Warning",
-            category: "leads",
             priority: lead.leadScore >= 70 ? "high" : "medium",
             relatedEntity: {
               entityType: "Lead",
@@ -1863,16 +1620,10 @@ export const checkUncontactedLeads = async () => {
             },
             actionUrl: `/dashboard/leads`,
             actionLabel: "צפה בליד",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} uncontacted leads notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUncontactedLeads:", error);
   }
@@ -1883,46 +1634,33 @@ export const checkUncontactedLeads = async () => {
  */
 export const checkStaleLeads = async () => {
   try {
-    console.log("🔍 Checking stale leads...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
-
-      const staleLeads = await Lead.find({
-        companyId: company._id,
-        status: { $nin: ["Closed Won", "Closed Lost"] },
-        $or: [
-          { lastContacted: { $exists: false } },
-          { lastContacted: { $lt: sevenDaysAgo } },
-        ],
-        updatedAt: { $lt: sevenDaysAgo },
-      });
-
-      for (const lead of staleLeads) {
-        const daysSinceUpdate = Math.floor(
-          (Date.now() - new Date(lead.updatedAt)) / (1000 * 60 * 60 * 24)
-        );
+    await runNotificationRule({
+      name: "checkStaleLeads",
+      category: "leads",
+      hours: 72,
+      collectAll: async (companyIds) => {
+        const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
+        const staleLeads = await Lead.find({
+          companyId: { $in: companyIds },
+          status: { $nin: ["Closed Won", "Closed Lost"] },
+          $or: [
+            { lastContacted: { $exists: false } },
+            { lastContacted: { $lt: sevenDaysAgo } },
+          ],
+          updatedAt: { $lt: sevenDaysAgo },
+        })
+          .select("_id companyId name status updatedAt")
+          .lean();
 
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "leads",
-          title: "⏰ ליד ללא פעילות",
-          relatedEntity: {
-            entityType: "Lead",
-            entityId: lead._id.toString(),
-          },
-          hours: 72,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return staleLeads.map((lead) => {
+          const daysSinceUpdate = Math.floor(
+            (Date.now() - new Date(lead.updatedAt)) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: lead.companyId,
             title: "⏰ ליד ללא פעילות",
             content: `ליד "${lead.name}" ללא פעילות כבר ${daysSinceUpdate} ימים. סטטוס: ${lead.status}`,
             type: "Warning",
-            category: "leads",
             priority: "medium",
             relatedEntity: {
               entityType: "Lead",
@@ -1930,16 +1668,10 @@ export const checkStaleLeads = async () => {
             },
             actionUrl: `/dashboard/leads`,
             actionLabel: "צפה בליד",
-            dedupe: {
-              enabled: true,
-              hours: 72,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} stale leads notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkStaleLeads:", error);
   }
@@ -1950,65 +1682,51 @@ export const checkStaleLeads = async () => {
  */
 export const checkHotLeads = async () => {
   try {
-    console.log("🔍 Checking hot leads...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const hotLeads = await Lead.find({
-        companyId: company._id,
-        status: { $nin: ["Closed Won", "Closed Lost"] },
-        $or: [
-          { leadScore: { $gte: 70 } },
-          { probability: { $gte: 60 } },
-          { estimatedValue: { $gte: 10000 } },
-        ],
-      }).populate("assignedTo");
-
-      for (const lead of hotLeads) {
+    await runNotificationRule({
+      name: "checkHotLeads",
+      category: "leads",
+      hours: 12,
+      collectAll: async (companyIds) => {
         const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
-        const needsAttention =
-          !lead.lastContacted ||
-          new Date(lead.lastContacted) < oneDayAgo ||
-          lead.status === "New";
-
-        if (needsAttention) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "leads",
-            title: "🔥 ליד חם דורש טיפול",
-            relatedEntity: {
-              entityType: "Lead",
-              entityId: lead._id.toString(),
+        const hotLeads = await Lead.find({
+          companyId: { $in: companyIds },
+          status: { $nin: ["Closed Won", "Closed Lost"] },
+          $and: [
+            {
+              $or: [
+                { leadScore: { $gte: 70 } },
+                { probability: { $gte: 60 } },
+                { estimatedValue: { $gte: 10000 } },
+              ],
             },
-            hours: 12,
-          });
+            // ליד שלא טופל ביממה האחרונה או שעדיין חדש
+            {
+              $or: [
+                { lastContacted: null },
+                { lastContacted: { $lt: oneDayAgo } },
+                { status: "New" },
+              ],
+            },
+          ],
+        })
+          .select("_id companyId name leadScore probability estimatedValue currency")
+          .lean();
 
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "🔥 ליד חם דורש טיפול",
-              content: `ליד "${lead.name}" עם ניקוד ${lead.leadScore || 0} והסתברות ${lead.probability || 0}% דורש טיפול דחוף. ערך משוער: ${lead.estimatedValue || 0} ${lead.currency || "ILS"}`,
-              type: "Urgent",
-              category: "leads",
-              priority: "high",
-              relatedEntity: {
-                entityType: "Lead",
-                entityId: lead._id.toString(),
-              },
-              actionUrl: `/dashboard/leads`,
-              actionLabel: "צפה בליד",
-              dedupe: {
-                enabled: true,
-                hours: 12,
-              },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} hot leads notifications`);
+        return hotLeads.map((lead) => ({
+          companyId: lead.companyId,
+          title: "🔥 ליד חם דורש טיפול",
+          content: `ליד "${lead.name}" עם ניקוד ${lead.leadScore || 0} והסתברות ${lead.probability || 0}% דורש טיפול דחוף. ערך משוער: ${lead.estimatedValue || 0} ${lead.currency || "ILS"}`,
+          type: "Urgent",
+          priority: "high",
+          relatedEntity: {
+            entityType: "Lead",
+            entityId: lead._id.toString(),
+          },
+          actionUrl: `/dashboard/leads`,
+          actionLabel: "צפה בליד",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkHotLeads:", error);
   }
@@ -2019,50 +1737,33 @@ export const checkHotLeads = async () => {
  */
 export const checkLeadConversionDeadline = async () => {
   try {
-    console.log("🔍 Checking lead conversion deadlines...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      const sevenDaysFromNow = new Date(today);
-      sevenDaysFromNow.setDate(sevenDaysFromNow.getDate() + 7);
-
-      const leadsNearDeadline = await Lead.find({
-        companyId: company._id,
-        status: { $nin: ["Closed Won", "Closed Lost"] },
-        expectedCloseDate: {
-          $gte: today,
-          $lte: sevenDaysFromNow,
-        },
-      });
-
-      for (const lead of leadsNearDeadline) {
-        if (!lead.expectedCloseDate) continue;
-
-        const daysUntilClose = Math.ceil(
-          (new Date(lead.expectedCloseDate) - today) / (1000 * 60 * 60 * 24)
-        );
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "leads",
-          title: "📅 מועד המרה קרוב",
-          relatedEntity: {
-            entityType: "Lead",
-            entityId: lead._id.toString(),
-          },
-          hours: 24,
-        });
+    await runNotificationRule({
+      name: "checkLeadConversionDeadline",
+      category: "leads",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+        const sevenDaysFromNow = new Date(today);
+        sevenDaysFromNow.setDate(sevenDaysFromNow.getDate() + 7);
+
+        const leadsNearDeadline = await Lead.find({
+          companyId: { $in: companyIds },
+          status: { $nin: ["Closed Won", "Closed Lost"] },
+          expectedCloseDate: { $gte: today, $lte: sevenDaysFromNow },
+        })
+          .select("_id companyId name expectedCloseDate probability")
+          .lean();
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return leadsNearDeadline.map((lead) => {
+          const daysUntilClose = Math.ceil(
+            (new Date(lead.expectedCloseDate) - today) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: lead.companyId,
             title: "📅 מועד המרה קרוב",
             content: `ליד "${lead.name}" קרוב למועד המרה הצפוי בעוד ${daysUntilClose} ימים (${new Date(lead.expectedCloseDate).toLocaleDateString("he-IL")}). הסתברות: ${lead.probability || 0}%`,
             type: "Reminder",
-            category: "leads",
             priority: daysUntilClose <= 3 ? "high" : "medium",
             relatedEntity: {
               entityType: "Lead",
@@ -2070,16 +1771,10 @@ export const checkLeadConversionDeadline = async () => {
             },
             actionUrl: `/dashboard/leads`,
             actionLabel: "צפה בליד",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} lead conversion deadline notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkLeadConversionDeadline:", error);
   }
@@ -2094,43 +1789,31 @@ export const checkLeadConversionDeadline = async () => {
  */
 export const checkDelayedProductionOrders = async () => {
   try {
-    console.log("🔍 Checking delayed production orders...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-
-      const delayedOrders = await ProductionOrder.find({
-        companyId: company._id,
-        status: { $in: ["Pending", "In Progress"] },
-        dueDate: { $lt: today },
-      }).populate("productId");
-
-      for (const order of delayedOrders) {
-        const daysOverdue = Math.ceil(
-          (today - new Date(order.dueDate)) / (1000 * 60 * 60 * 24)
-        );
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "production",
-          title: "🚨 הזמנת ייצור מאחרת",
-          relatedEntity: {
-            entityType: "ProductionOrder",
-            entityId: order._id.toString(),
-          },
-          hours: 24,
-        });
+    await runNotificationRule({
+      name: "checkDelayedProductionOrders",
+      category: "production",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+
+        const delayedOrders = await ProductionOrder.find({
+          companyId: { $in: companyIds },
+          status: { $in: ["Pending", "In Progress"] },
+          dueDate: { $lt: today },
+        })
+          .select("_id companyId orderNumber productName quantity dueDate")
+          .lean();
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return delayedOrders.map((order) => {
+          const daysOverdue = Math.ceil(
+            (today - new Date(order.dueDate)) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: order.companyId,
             title: "🚨 הזמנת ייצור מאחרת",
             content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) מאחרת ${daysOverdue} ימים. כמות: ${order.quantity}`,
             type: "Error",
-            category: "production",
             priority: daysOverdue > 7 ? "critical" : "high",
             relatedEntity: {
               entityType: "ProductionOrder",
@@ -2138,16 +1821,10 @@ export const checkDelayedProductionOrders = async () => {
             },
             actionUrl: `/dashboard/production/${order._id}`,
             actionLabel: "צפה בהזמנה",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} delayed production orders notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkDelayedProductionOrders:", error);
   }
@@ -2158,48 +1835,33 @@ export const checkDelayedProductionOrders = async () => {
  */
 export const checkProductionOrderDeadlines = async () => {
   try {
-    console.log("🔍 Checking production order deadlines...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      const threeDaysFromNow = new Date(today);
-      threeDaysFromNow.setDate(threeDaysFromNow.getDate() + 3);
-
-      const upcomingOrders = await ProductionOrder.find({
-        companyId: company._id,
-        status: { $in: ["Pending", "In Progress"] },
-        dueDate: {
-          $gte: today,
-          $lte: threeDaysFromNow,
-        },
-      }).populate("productId");
-
-      for (const order of upcomingOrders) {
-        const daysUntilDue = Math.ceil(
-          (new Date(order.dueDate) - today) / (1000 * 60 * 60 * 24)
-        );
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "production",
-          title: "⏰ הזמנת ייצור מתקרבת לדדליין",
-          relatedEntity: {
-            entityType: "ProductionOrder",
-            entityId: order._id.toString(),
-          },
-          hours: 24,
-        });
+    await runNotificationRule({
+      name: "checkProductionOrderDeadlines",
+      category: "production",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+        const threeDaysFromNow = new Date(today);
+        threeDaysFromNow.setDate(threeDaysFromNow.getDate() + 3);
+
+        const upcomingOrders = await ProductionOrder.find({
+          companyId: { $in: companyIds },
+          status: { $in: ["Pending", "In Progress"] },
+          dueDate: { $gte: today, $lte: threeDaysFromNow },
+        })
+          .select("_id companyId orderNumber productName quantity dueDate")
+          .lean();
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return upcomingOrders.map((order) => {
+          const daysUntilDue = Math.ceil(
+            (new Date(order.dueDate) - today) / (1000 * 60 * 60 * 24)
+          );
+          return {
+            companyId: order.companyId,
             title: "⏰ הזמנת ייצור מתקרבת לדדליין",
             content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) תפוג בעוד ${daysUntilDue} ימים. כמות: ${order.quantity}`,
             type: "Warning",
-            category: "production",
             priority: daysUntilDue === 1 ? "high" : "medium",
             relatedEntity: {
               entityType: "ProductionOrder",
@@ -2207,16 +1869,10 @@ export const checkProductionOrderDeadlines = async () => {
             },
             actionUrl: `/dashboard/production/${order._id}`,
             actionLabel: "צפה בהזמנה",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} production order deadline notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkProductionOrderDeadlines:", error);
   }
@@ -2227,67 +1883,43 @@ export const checkProductionOrderDeadlines = async () => {
  */
 export const checkBlockedProductionOrders = async () => {
   try {
-    console.log("🔍 Checking blocked production orders...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const blockedOrders = await ProductionOrder.find({
-        companyId: company._id,
-        status: { $in: ["Pending", "In Progress", "On Hold"] },
-        $or: [
-          { "components.status": "Unavailable" },
-          { missingComponents: { $exists: true, $ne: [] } },
-        ],
-      }).populate("productId");
-
-      for (const order of blockedOrders) {
-        const hasMissingComponents =
-          order.missingComponents && order.missingComponents.length > 0;
-        const hasUnavailableComponents =
-          order.components && order.components.some((c) => c.status === "Unavailable");
-
-        if (hasMissingComponents || hasUnavailableComponents) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "production",
+    await runNotificationRule({
+      name: "checkBlockedProductionOrders",
+      category: "production",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const blockedOrders = await ProductionOrder.find({
+          companyId: { $in: companyIds },
+          status: { $in: ["Pending", "In Progress", "On Hold"] },
+          $or: [
+            { "components.status": "Unavailable" },
+            { missingComponents: { $exists: true, $ne: [] } },
+          ],
+        })
+          .select("_id companyId orderNumber productName missingComponents")
+          .lean();
+
+        return blockedOrders.map((order) => {
+          const missingList =
+            order.missingComponents?.length > 0
+              ? order.missingComponents.map((c) => `${c.componentName} (חסר: ${c.missing})`).join(", ")
+              : "רכיבים לא זמינים";
+          return {
+            companyId: order.companyId,
             title: "⚠️ הזמנת ייצור תקועה",
+            content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) תקועה עקב: ${missingList}`,
+            type: "Warning",
+            priority: "high",
             relatedEntity: {
               entityType: "ProductionOrder",
               entityId: order._id.toString(),
             },
-            hours: 24,
-          });
-
-          if (!skip) {
-            const missingList = hasMissingComponents
-              ? order.missingComponents.map((c) => `${c.componentName} (חסר: ${c.missing})`).join(", ")
-              : "רכיבים לא זמינים";
-
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ הזמנת ייצור תקועה",
-              content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) תקועה עקב: ${missingList}`,
-              type: "Warning",
-              category: "production",
-              priority: "high",
-              relatedEntity: {
-                entityType: "ProductionOrder",
-                entityId: order._id.toString(),
-              },
-              actionUrl: `/dashboard/production/${order._id}`,
-              actionLabel: "צפה בהזמנה",
-              dedupe: {
-                enabled: true,
-                hours: 24,
-              },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} blocked production orders notifications`);
+            actionUrl: `/dashboard/production/${order._id}`,
+            actionLabel: "צפה בהזמנה",
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkBlockedProductionOrders:", error);
   }
@@ -2298,65 +1930,41 @@ export const checkBlockedProductionOrders = async () => {
  */
 export const checkQualityIssues = async () => {
   try {
-    console.log("🔍 Checking production quality issues...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // בדיקה של הזמנות ייצור שהושלמו לאחרונה עם בעיות פוטנציאליות
-      const recentCompletedOrders = await ProductionOrder.find({
-        companyId: company._id,
-        status: "Completed",
-        completedDate: {
-          $gte: new Date(Date.now() - 7 * 24 * 60 * 60 * 1000),
-        },
-        $or: [
-          { actualCost: { $gt: 0 }, estimatedCost: { $gt: 0 }, $expr: { $gt: ["$actualCost", { $multiply: ["$estimatedCost", 1.2] }] } },
-        ],
-      }).populate("productId");
-
-      for (const order of recentCompletedOrders) {
-        const costOverrun = order.estimatedCost > 0
-          ? ((order.actualCost - order.estimatedCost) / order.estimatedCost) * 100
-          : 0;
+    await runNotificationRule({
+      name: "checkQualityIssues",
+      category: "production",
+      hours: 72,
+      collectAll: async (companyIds) => {
+        // הזמנות ייצור שהושלמו לאחרונה וחרגו ביותר מ-20% מהעלות המשוערת
+        const overrunOrders = await ProductionOrder.find({
+          companyId: { $in: companyIds },
+          status: "Completed",
+          completedDate: { $gte: new Date(Date.now() - 7 * 24 * 60 * 60 * 1000) },
+          actualCost: { $gt: 0 },
+          estimatedCost: { $gt: 0 },
+          $expr: { $gt: ["$actualCost", { $multiply: ["$estimatedCost", 1.2] }] },
+        })
+          .select("_id companyId orderNumber productName actualCost estimatedCost")
+          .lean();
 
-        if (costOverrun > 20) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "production",
+        return overrunOrders.map((order) => {
+          const costOverrun = ((order.actualCost - order.estimatedCost) / order.estimatedCost) * 100;
+          return {
+            companyId: order.companyId,
             title: "⚠️ חריגת עלות בהזמנת ייצור",
+            content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) חרגה בעלות של ${costOverrun.toFixed(1)}%. עלות משוערת: ${order.estimatedCost}, עלות בפועל: ${order.actualCost}`,
+            type: "Warning",
+            priority: "medium",
             relatedEntity: {
               entityType: "ProductionOrder",
               entityId: order._id.toString(),
             },
-            hours: 72,
-          });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ חריגת עלות בהזמנת ייצור",
-              content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) חרגה בעלות של ${costOverrun.toFixed(1)}%. עלות משוערת: ${order.estimatedCost}, עלות בפועל: ${order.actualCost}`,
-              type: "Warning",
-              category: "production",
-              priority: "medium",
-              relatedEntity: {
-                entityType: "ProductionOrder",
-                entityId: order._id.toString(),
-              },
-              actionUrl: `/dashboard/production/${order._id}`,
-              actionLabel: "צפה בהזמנה",
-              dedupe: {
-                enabled: true,
-                hours: 72,
-              },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} quality issues notifications`);
+            actionUrl: `/dashboard/production/${order._id}`,
+            actionLabel: "צפה בהזמנה",
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkQualityIssues:", error);
   }
@@ -2368,135 +1976,89 @@ export const checkQualityIssues = async () => {
  */
 export const checkMissingComponentsAvailability = async () => {
   try {
-    console.log("🔍 Checking missing components availability...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
     let totalUpdated = 0;
 
-    for (const company of companies) {
-      // מצא כל הזמנות ייצור עם חוסרים
-      const ordersWithMissing = await ProductionOrder.find({
-        companyId: company._id,
-        status: { $in: ["On Hold", "Pending"] },
-        missingComponents: { $exists: true, $ne: [] },
-      })
-        .populate("bomId")
-        .populate("productId");
-
-      for (const order of ordersWithMissing) {
-        if (!order.bomId) continue;
-
-        try {
-          // בדוק זמינות מחדש
-          const availabilityCheck = await checkComponentAvailability(
-            order.bomId,
-            order.quantity,
-            company._id,
-            null
-          );
+    await runNotificationRule({
+      name: "checkMissingComponentsAvailability",
+      category: "production",
+      hours: 24,
+      collect: async (companyId) => {
+        // כל ההזמנות הפתוחות מתוכננות יחד מול אותה תמונת מלאי
+        const openOrders = await loadOpenProductionOrders(companyId);
+        if (!openOrders.some((order) => order.bomId && order.missingComponents?.length > 0)) return [];
+
+        const { plans } = await planProductionAvailability(companyId, openOrders);
+        const updates = [];
+        const notifications = [];
+
+        openOrders.forEach((order, index) => {
+          const previousMissing = order.missingComponents?.length || 0;
+          if (!order.bomId || previousMissing === 0) return;
+
+          const availabilityCheck = plans[index];
+          const currentMissing = availabilityCheck.missingComponents.length;
+          const relatedEntity = {
+            entityType: "ProductionOrder",
+            entityId: order._id.toString(),
+          };
 
           // אם כל הרכיבים כעת זמינים
-          if (availabilityCheck.allComponentsAvailable && order.missingComponents?.length > 0) {
-            // עדכן את ההזמנה
-            order.components = availabilityCheck.components;
-            order.missingComponents = [];
-            order.estimatedCost = availabilityCheck.totalEstimatedCost;
-            
+          if (availabilityCheck.allComponentsAvailable) {
+            const update = {
+              components: availabilityCheck.components,
+              missingComponents: [],
+              estimatedCost: availabilityCheck.totalEstimatedCost,
+            };
             if (order.status === "On Hold") {
-              order.status = "Pending";
-              order.priority = order.priority === "urgent" ? "high" : order.priority;
+              update.status = "Pending";
+              update.priority = order.priority === "urgent" ? "high" : order.priority;
             }
+            updates.push({ updateOne: { filter: { _id: order._id }, update: { $set: update } } });
 
-            await order.save();
-            totalUpdated++;
-
-            // שלח התראה
-            const skip = await shouldSkipNotification({
-              companyId: company._id,
-              category: "production",
+            notifications.push({
               title: "✅ כל הרכיבים זמינים",
-              relatedEntity: {
-                entityType: "ProductionOrder",
-                entityId: order._id.toString(),
-              },
-              hours: 24,
+              content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) - כל הרכיבים כעת זמינים וניתן להתחיל בייצור`,
+              type: "Success",
+              priority: "medium",
+              relatedEntity,
+              actionUrl: `/dashboard/production/${order._id}`,
+              actionLabel: "צפה בהזמנת ייצור",
             });
-
-            if (!skip) {
-              await notifyAdminsAndManagers({
-                companyId: company._id,
-                title: "✅ כל הרכיבים זמינים",
-                content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) - כל הרכיבים כעת זמינים וניתן להתחיל בייצור`,
-                type: "Success",
-                category: "production",
-                priority: "medium",
-                relatedEntity: {
-                  entityType: "ProductionOrder",
-                  entityId: order._id.toString(),
-                },
-                actionUrl: `/dashboard/production/${order._id}`,
-                actionLabel: "צפה בהזמנת ייצור",
-                dedupe: {
-                  enabled: true,
-                  hours: 24,
-                },
-              });
-              totalNotifications++;
-            }
-          } else if (availabilityCheck.missingComponents.length < (order.missingComponents?.length || 0)) {
+          } else if (currentMissing < previousMissing) {
             // יש שיפור אבל עדיין יש חוסרים
-            const previousMissing = order.missingComponents?.length || 0;
-            const currentMissing = availabilityCheck.missingComponents.length;
-            
-            // עדכן את ההזמנה
-            order.components = availabilityCheck.components;
-            order.missingComponents = availabilityCheck.missingComponents;
-            order.estimatedCost = availabilityCheck.totalEstimatedCost;
-            await order.save();
-            totalUpdated++;
-
-            // שלח התראה על שיפור
-            const skip = await shouldSkipNotification({
-              companyId: company._id,
-              category: "production",
-              title: "📈 שיפור בזמינות רכיבים",
-              relatedEntity: {
-                entityType: "ProductionOrder",
-                entityId: order._id.toString(),
+            updates.push({
+              updateOne: {
+                filter: { _id: order._id },
+                update: {
+                  $set: {
+                    components: availabilityCheck.components,
+                    missingComponents: availabilityCheck.missingComponents,
+                    estimatedCost: availabilityCheck.totalEstimatedCost,
+                  },
+                },
               },
-              hours: 24,
             });
 
-            if (!skip) {
-              await notifyAdminsAndManagers({
-                companyId: company._id,
-                title: "📈 שיפור בזמינות רכיבים",
-                content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) - מספר הרכיבים החסרים ירד מ-${previousMissing} ל-${currentMissing}`,
-                type: "Info",
-                category: "production",
-                priority: "low",
-                relatedEntity: {
-                  entityType: "ProductionOrder",
-                  entityId: order._id.toString(),
-                },
-                actionUrl: `/dashboard/production/${order._id}`,
-                actionLabel: "צפה בהזמנת ייצור",
-                dedupe: {
-                  enabled: true,
-                  hours: 24,
-                },
-              });
-              totalNotifications++;
-            }
+            notifications.push({
+              title: "📈 שיפור בזמינות רכיבים",
+              content: `הזמנת ייצור ${order.orderNumber} (${order.productName}) - מספר הרכיבים החסרים ירד מ-${previousMissing} ל-${currentMissing}`,
+              type: "Info",
+              priority: "low",
+              relatedEntity,
+              actionUrl: `/dashboard/production/${order._id}`,
+              actionLabel: "צפה בהזמנת ייצור",
+            });
           }
-        } catch (orderError) {
-          console.error(`❌ Error checking order ${order._id}:`, orderError);
-          // Continue with next order
-        }
-      }
-    }
+        });
+
+        if (updates.length === 0) return [];
+        await ProductionOrder.bulkWrite(updates, { ordered: false });
+        totalUpdated += updates.length;
+        return notifications;
+      },
+    });
 
-    console.log(`✅ Checked missing components: ${totalUpdated} orders updated, ${totalNotifications} notifications sent`);
+    console.log(`✅ Checked missing components: ${totalUpdated} orders updated`);
   } catch (error) {
     console.error("❌ Error in checkMissingComponentsAvailability:", error);
   }
@@ -2511,83 +2073,59 @@ export const checkMissingComponentsAvailability = async () => {
  */
 export const checkUnapprovedShifts = async () => {
   try {
-    console.log("🔍 Checking unapproved shifts...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
-
-      // נניח שיש שדה approvalStatus או status במשמרות
-      // אם לא, נבדוק משמרות ישנות שלא עודכנו
-      const unapprovedShifts = await Shift.find({
-        companyId: company._id,
-        shiftDate: { $lt: threeDaysAgo },
-        createdAt: { $lt: threeDaysAgo },
-      })
-        .populate("employeeId")
-        .sort({ shiftDate: -1 })
-        .limit(50);
-
-      // קבוצת משמרות לפי עובד
-      const shiftsByEmployee = {};
-      for (const shift of unapprovedShifts) {
-        const empId = shift.employeeId?._id?.toString() || shift.employeeId?.toString();
-        if (!empId) continue;
-
-        if (!shiftsByEmployee[empId]) {
-          shiftsByEmployee[empId] = {
-            employee: shift.employeeId,
-            shifts: [],
-          };
+    await runNotificationRule({
+      name: "checkUnapprovedShifts",
+      category: "hr",
+      hours: 24,
+      collect: async (companyId) => {
+        const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
+
+        // משמרות ישנות שלא עודכנו, מקובצות לפי עובד
+        const unapprovedShifts = await Shift.find({
+          companyId,
+          shiftDate: { $lt: threeDaysAgo },
+          createdAt: { $lt: threeDaysAgo },
+        })
+          .select("employeeId shiftDate")
+          .populate("employeeId", "name")
+          .sort({ shiftDate: -1 })
+          .limit(50)
+          .lean();
+
+        const shiftsByEmployee = new Map();
+        for (const shift of unapprovedShifts) {
+          const empId = shift.employeeId?._id?.toString() || shift.employeeId?.toString();
+          if (!empId) continue;
+          if (!shiftsByEmployee.has(empId)) {
+            shiftsByEmployee.set(empId, { employee: shift.employeeId, shifts: [] });
+          }
+          shiftsByEmployee.get(empId).shifts.push(shift);
         }
-        shiftsByEmployee[empId].shifts.push(shift);
-      }
 
-      for (const empId in shiftsByEmployee) {
-        const { employee, shifts } = shiftsByEmployee[empId];
-        const oldestShift = shifts[shifts.length - 1];
-        const daysSinceOldest = Math.floor(
-          (Date.now() - new Date(oldestShift.shiftDate)) / (1000 * 60 * 60 * 24)
-        );
+        const candidates = [];
+        for (const [empId, { employee, shifts }] of shiftsByEmployee) {
+          const oldestShift = shifts[shifts.length - 1];
+          const daysSinceOldest = Math.floor(
+            (Date.now() - new Date(oldestShift.shiftDate)) / (1000 * 60 * 60 * 24)
+          );
+          if (daysSinceOldest < 3) continue;
 
-        if (daysSinceOldest >= 3) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "hr",
+          candidates.push({
             title: "⏰ משמרות ממתינות לאישור",
+            content: `יש ${shifts.length} משמרות של ${employee?.name || "עובד"} ממתינות לאישור כבר ${daysSinceOldest} ימים`,
+            type: "Reminder",
+            priority: "medium",
             relatedEntity: {
               entityType: "Employee",
               entityId: empId,
             },
-            hours: 24,
+            actionUrl: `/dashboard/Shifts-List`,
+            actionLabel: "צפה במשמרות",
           });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⏰ משמרות ממתינות לאישור",
-              content: `יש ${shifts.length} משמרות של ${employee?.name || "עובד"} ממתינות לאישור כבר ${daysSinceOldest} ימים`,
-              type: "Reminder",
-              category: "hr",
-              priority: "medium",
-              relatedEntity: {
-                entityType: "Employee",
-                entityId: empId,
-              },
-              actionUrl: `/dashboard/Shifts-List`,
-              actionLabel: "צפה במשמרות",
-              dedupe: {
-                enabled: true,
-                hours: 24,
-              },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} unapproved shifts notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUnapprovedShifts:", error);
   }
@@ -2598,61 +2136,44 @@ export const checkUnapprovedShifts = async () => {
  */
 export const checkSalaryApprovalDeadline = async () => {
   try {
-    console.log("🔍 Checking salary approval deadlines...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      const fiveDaysFromNow = new Date(today);
-      fiveDaysFromNow.setDate(fiveDaysFromNow.getDate() + 5);
-
-      // נניח שתאריך התשלום הוא בסוף החודש או תחילת החודש הבא
-      const currentMonth = today.getMonth();
-      const currentYear = today.getFullYear();
-      const paymentDate = new Date(currentYear, currentMonth + 1, 1); // 1 לחודש הבא
-
-      if (paymentDate >= today && paymentDate <= fiveDaysFromNow) {
-        const pendingSalaries = await Salary.find({
-          companyId: company._id,
-          status: "Draft",
-          periodEnd: {
-            $lt: new Date(currentYear, currentMonth, 1),
+    const today = new Date();
+    today.setHours(0, 0, 0, 0);
+    const fiveDaysFromNow = new Date(today);
+    fiveDaysFromNow.setDate(fiveDaysFromNow.getDate() + 5);
+
+    // נניח שתאריך התשלום הוא בסוף החודש או תחילת החודש הבא
+    const currentMonth = today.getMonth();
+    const currentYear = today.getFullYear();
+    const paymentDate = new Date(currentYear, currentMonth + 1, 1); // 1 לחודש הבא
+    if (paymentDate < today || paymentDate > fiveDaysFromNow) return;
+
+    await runNotificationRule({
+      name: "checkSalaryApprovalDeadline",
+      category: "hr",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const pendingByCompany = await Salary.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: "Draft",
+              periodEnd: { $lt: new Date(currentYear, currentMonth, 1) },
+            },
           },
-        })
-          .populate("employeeId")
-          .limit(100);
-
-        if (pendingSalaries.length > 0) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "hr",
-            title: "💰 משכורות ממתינות לאישור",
-            hours: 24,
-          });
+          { $group: { _id: "$companyId", salaryCount: { $sum: 1 } } },
+        ]);
 
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "💰 משכורות ממתינות לאישור",
-              content: `יש ${pendingSalaries.length} משכורות ממתינות לאישור לפני תאריך התשלום (${paymentDate.toLocaleDateString("he-IL")})`,
-              type: "Warning",
-              category: "hr",
-              priority: "high",
-              actionUrl: `/dashboard/salary`,
-              actionLabel: "צפה במשכורות",
-              dedupe: {
-                enabled: true,
-                hours: 24,
-              },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} salary approval deadline notifications`);
+        return pendingByCompany.map(({ _id, salaryCount }) => ({
+          companyId: _id,
+          title: "💰 משכורות ממתינות לאישור",
+          content: `יש ${salaryCount} משכורות ממתינות לאישור לפני תאריך התשלום (${paymentDate.toLocaleDateString("he-IL")})`,
+          type: "Warning",
+          priority: "high",
+          actionUrl: `/dashboard/salary`,
+          actionLabel: "צפה במשכורות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkSalaryApprovalDeadline:", error);
   }
@@ -2663,66 +2184,48 @@ export const checkSalaryApprovalDeadline = async () => {
  */
 export const checkUnpaidSalaries = async () => {
   try {
-    console.log("🔍 Checking unpaid salaries...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      const currentMonth = today.getMonth();
-      const currentYear = today.getFullYear();
-      const paymentDate = new Date(currentYear, currentMonth, 1); // 1 לחודש הנוכחי
-
-      if (today > paymentDate) {
-        const unpaidSalaries = await Salary.find({
-          companyId: company._id,
-          status: "Approved",
-          periodEnd: {
-            $lt: paymentDate,
-          },
-        })
-          .populate("employeeId")
-          .limit(100);
-
-        if (unpaidSalaries.length > 0) {
-          const daysSincePayment = Math.floor(
-            (today - paymentDate) / (1000 * 60 * 60 * 24)
-          );
-
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "hr",
-            title: "🚨 משכורות שלא שולמו",
-            hours: 24,
-          });
-
-          if (!skip) {
-            const totalAmount = unpaidSalaries.reduce(
-              (sum, s) => sum + (s.netPay || 0),
-              0
-            );
-
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "🚨 משכורות שלא שולמו",
-              content: `יש ${unpaidSalaries.length} משכורות מאושרות שלא שולמו כבר ${daysSincePayment} ימים. סה"כ: ${totalAmount.toLocaleString()} ${company.baseCurrency || "ILS"}`,
-              type: "Error",
-              category: "hr",
-              priority: "critical",
-              actionUrl: `/dashboard/salary`,
-              actionLabel: "צפה במשכורות",
-              dedupe: {
-                enabled: true,
-                hours: 24,
+    const today = new Date();
+    today.setHours(0, 0, 0, 0);
+    const paymentDate = new Date(today.getFullYear(), today.getMonth(), 1); // 1 לחודש הנוכחי
+    if (today <= paymentDate) return;
+
+    await runNotificationRule({
+      name: "checkUnpaidSalaries",
+      category: "hr",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const [unpaidByCompany, currencies] = await Promise.all([
+          Salary.aggregate([
+            {
+              $match: {
+                companyId: { $in: companyIds },
+                status: "Approved",
+                periodEnd: { $lt: paymentDate },
               },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} unpaid salaries notifications`);
+            },
+            {
+              $group: {
+                _id: "$companyId",
+                salaryCount: { $sum: 1 },
+                totalAmount: { $sum: { $ifNull: ["$netPay", 0] } },
+              },
+            },
+          ]),
+          loadBaseCurrencies(companyIds),
+        ]);
+
+        const daysSincePayment = Math.floor((today - paymentDate) / (1000 * 60 * 60 * 24));
+        return unpaidByCompany.map(({ _id, salaryCount, totalAmount }) => ({
+          companyId: _id,
+          title: "🚨 משכורות שלא שולמו",
+          content: `יש ${salaryCount} משכורות מאושרות שלא שולמו כבר ${daysSincePayment} ימים. סה"כ: ${totalAmount.toLocaleString()} ${currencies.get(_id.toString())}`,
+          type: "Error",
+          priority: "critical",
+          actionUrl: `/dashboard/salary`,
+          actionLabel: "צפה במשכורות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUnpaidSalaries:", error);
   }
@@ -2737,54 +2240,34 @@ export const checkUnpaidSalaries = async () => {
  */
 export const checkWarehouseCapacityAlerts = async () => {
   try {
-    console.log("🔍 Checking warehouse capacity alerts...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const warehouses = await Warehouse.find({
-        companyId: company._id,
-        status: "operational",
-      });
+    await runNotificationRule({
+      name: "checkWarehouseCapacityAlerts",
+      category: "warehouse",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const warehouses = await Warehouse.find({
+          companyId: { $in: companyIds },
+          status: "operational",
+          utilization: { $gte: 80 },
+        })
+          .select("_id companyId name utilization capacity")
+          .lean();
 
-      for (const warehouse of warehouses) {
-        if (warehouse.utilization >= 80) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "warehouse",
-            title: "📦 מחסן קרוב לתפוסה מלאה",
-            relatedEntity: {
-              entityType: "Warehouse",
-              entityId: warehouse._id.toString(),
-            },
-            hours: 24,
-          });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "📦 מחסן קרוב לתפוסה מלאה",
-              content: `מחסן "${warehouse.name}" בשימוש של ${warehouse.utilization.toFixed(1)}% (${warehouse.capacity ? `תפוסה: ${warehouse.capacity} יחידות` : "תפוסה מלאה"})`,
-              type: "Warning",
-              category: "warehouse",
-              priority: warehouse.utilization >= 95 ? "critical" : "high",
-              relatedEntity: {
-                entityType: "Warehouse",
-                entityId: warehouse._id.toString(),
-              },
-              actionUrl: `/dashboard/warehouses`,
-              actionLabel: "צפה במחסן",
-              dedupe: {
-                enabled: true,
-                hours: 24,
-              },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} warehouse capacity alerts`);
+        return warehouses.map((warehouse) => ({
+          companyId: warehouse.companyId,
+          title: "📦 מחסן קרוב לתפוסה מלאה",
+          content: `מחסן "${warehouse.name}" בשימוש של ${warehouse.utilization.toFixed(1)}% (${warehouse.capacity ? `תפוסה: ${warehouse.capacity} יחידות` : "תפוסה מלאה"})`,
+          type: "Warning",
+          priority: warehouse.utilization >= 95 ? "critical" : "high",
+          relatedEntity: {
+            entityType: "Warehouse",
+            entityId: warehouse._id.toString(),
+          },
+          actionUrl: `/dashboard/warehouses`,
+          actionLabel: "צפה במחסן",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkWarehouseCapacityAlerts:", error);
   }
@@ -2795,53 +2278,34 @@ export const checkWarehouseCapacityAlerts = async () => {
  */
 export const checkWarehouseUtilizationLow = async () => {
   try {
-    console.log("🔍 Checking low warehouse utilization...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const warehouses = await Warehouse.find({
-        companyId: company._id,
-        status: "operational",
-        utilization: { $lt: 20 },
-      });
+    await runNotificationRule({
+      name: "checkWarehouseUtilizationLow",
+      category: "warehouse",
+      hours: 168, // שבוע
+      collectAll: async (companyIds) => {
+        const warehouses = await Warehouse.find({
+          companyId: { $in: companyIds },
+          status: "operational",
+          utilization: { $lt: 20 },
+        })
+          .select("_id companyId name utilization")
+          .lean();
 
-      for (const warehouse of warehouses) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "warehouse",
+        return warehouses.map((warehouse) => ({
+          companyId: warehouse.companyId,
           title: "📉 מחסן עם ניצול נמוך",
+          content: `מחסן "${warehouse.name}" בשימוש של ${warehouse.utilization.toFixed(1)}% בלבד. שקול לאחד מחסנים או לשחרר שטח`,
+          type: "Info",
+          priority: "low",
           relatedEntity: {
             entityType: "Warehouse",
             entityId: warehouse._id.toString(),
           },
-          hours: 168, // שבוע
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "📉 מחסן עם ניצול נמוך",
-            content: `מחסן "${warehouse.name}" בשימוש של ${warehouse.utilization.toFixed(1)}% בלבד. שקול לאחד מחסנים או לשחרר שטח`,
-            type: "Info",
-            category: "warehouse",
-            priority: "low",
-            relatedEntity: {
-              entityType: "Warehouse",
-              entityId: warehouse._id.toString(),
-            },
-            actionUrl: `/dashboard/warehouses`,
-            actionLabel: "צפה במחסן",
-            dedupe: {
-              enabled: true,
-              hours: 168,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} low warehouse utilization notifications`);
+          actionUrl: `/dashboard/warehouses`,
+          actionLabel: "צפה במחסן",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkWarehouseUtilizationLow:", error);
   }
@@ -2852,52 +2316,33 @@ export const checkWarehouseUtilizationLow = async () => {
  */
 export const checkWarehouseLocationIssues = async () => {
   try {
-    console.log("🔍 Checking warehouse location issues...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const warehouses = await Warehouse.find({
-        companyId: company._id,
-        status: { $in: ["maintenance", "offline"] },
-      });
+    await runNotificationRule({
+      name: "checkWarehouseLocationIssues",
+      category: "warehouse",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const warehouses = await Warehouse.find({
+          companyId: { $in: companyIds },
+          status: { $in: ["maintenance", "offline"] },
+        })
+          .select("_id companyId name status")
+          .lean();
 
-      for (const warehouse of warehouses) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "warehouse",
+        return warehouses.map((warehouse) => ({
+          companyId: warehouse.companyId,
           title: "⚠️ מחסן לא פעיל",
+          content: `מחסן "${warehouse.name}" במצב ${warehouse.status === "maintenance" ? "תחזוקה" : "לא פעיל"}. יש לטפל בהקדם`,
+          type: "Warning",
+          priority: warehouse.status === "offline" ? "high" : "medium",
           relatedEntity: {
             entityType: "Warehouse",
             entityId: warehouse._id.toString(),
           },
-          hours: 24,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "⚠️ מחסן לא פעיל",
-            content: `מחסן "${warehouse.name}" במצב ${warehouse.status === "maintenance" ? "תחזוקה" : "לא פעיל"}. יש לטפל בהקדם`,
-            type: "Warning",
-            category: "warehouse",
-            priority: warehouse.status === "offline" ? "high" : "medium",
-            relatedEntity: {
-              entityType: "Warehouse",
-              entityId: warehouse._id.toString(),
-            },
-            actionUrl: `/dashboard/warehouses`,
-            actionLabel: "צפה במחסן",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} warehouse location issues notifications`);
+          actionUrl: `/dashboard/warehouses`,
+          actionLabel: "צפה במחסן",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkWarehouseLocationIssues:", error);
   }
@@ -2912,54 +2357,41 @@ export const checkWarehouseLocationIssues = async () => {
  */
 export const checkPendingCustomerOrders = async () => {
   try {
-    console.log("🔍 Checking pending customer orders...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
-
-      const pendingOrders = await CustomerOrder.find({
-        companyId: company._id,
-        status: "Pending",
-        orderDate: { $lt: threeDaysAgo },
-      })
-        .populate("customer")
-        .limit(50);
+    await runNotificationRule({
+      name: "checkPendingCustomerOrders",
+      category: "customers",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
+        const pendingByCompany = await CustomerOrder.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: "Pending",
+              orderDate: { $lt: threeDaysAgo },
+            },
+          },
+          {
+            $group: {
+              _id: "$companyId",
+              orderCount: { $sum: 1 },
+              totalAmount: { $sum: { $ifNull: ["$orderTotal", 0] } },
+              currency: { $first: "$currency" },
+            },
+          },
+        ]);
 
-      if (pendingOrders.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "customers",
+        return pendingByCompany.map(({ _id, orderCount, totalAmount, currency }) => ({
+          companyId: _id,
           title: "🛒 הזמנות לקוחות ממתינות",
-          hours: 24,
-        });
-
-        if (!skip) {
-          const totalAmount = pendingOrders.reduce(
-            (sum, order) => sum + (order.orderTotal || 0),
-            0
-          );
-
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "🛒 הזמנות לקוחות ממתינות",
-            content: `יש ${pendingOrders.length} הזמנות לקוחות ממתינות מעל 3 ימים. סה"כ: ${totalAmount.toLocaleString()} ${pendingOrders[0]?.currency || "ILS"}`,
-            type: "Warning",
-            category: "customers",
-            priority: "medium",
-            actionUrl: `/dashboard/Customers/Orders`,
-            actionLabel: "צפה בהזמנות",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} pending customer orders notifications`);
+          content: `יש ${orderCount} הזמנות לקוחות ממתינות מעל 3 ימים. סה"כ: ${totalAmount.toLocaleString()} ${currency || "ILS"}`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/Customers/Orders`,
+          actionLabel: "צפה בהזמנות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkPendingCustomerOrders:", error);
   }
@@ -2970,47 +2402,36 @@ export const checkPendingCustomerOrders = async () => {
  */
 export const checkCustomerOrderStatusChanges = async () => {
   try {
-    console.log("🔍 Checking customer order status changes...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
-
-      // בדיקת הזמנות שהשתנו לאחרונה לסטטוסים חשובים
-      const importantStatusOrders = await CustomerOrder.find({
-        companyId: company._id,
-        status: { $in: ["Shipped", "Delivered", "Cancelled"] },
-        updatedAt: { $gte: oneDayAgo },
-      })
-        .populate("customer")
-        .limit(20);
-
-      for (const order of importantStatusOrders) {
-        const statusLabels = {
-          Shipped: "נשלח",
-          Delivered: "נמסר",
-          Cancelled: "בוטל",
-        };
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "customers",
-          title: `📦 הזמנה ${statusLabels[order.status] || order.status}`,
-          relatedEntity: {
-            entityType: "CustomerOrder",
-            entityId: order._id.toString(),
-          },
-          hours: 12,
-        });
+    const statusLabels = {
+      Shipped: "נשלח",
+      Delivered: "נמסר",
+      Cancelled: "בוטל",
+    };
+
+    await runNotificationRule({
+      name: "checkCustomerOrderStatusChanges",
+      category: "customers",
+      hours: 12,
+      collect: async (companyId) => {
+        const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: `📦 הזמנה ${statusLabels[order.status] || order.status}`,
-            content: `הזמנה #${order.orderNumber || order._id} של ${order.customer?.name || "לקוח"} ${statusLabels[order.status] || order.status}. סכום: ${order.orderTotal?.toLocaleString() || 0} ${order.currency || "ILS"}`,
+        // הזמנות שהשתנו לאחרונה לסטטוסים חשובים
+        const importantStatusOrders = await CustomerOrder.find({
+          companyId,
+          status: { $in: ["Shipped", "Delivered", "Cancelled"] },
+          updatedAt: { $gte: oneDayAgo },
+        })
+          .select("_id orderNumber status orderTotal currency customer")
+          .populate("customer", "name")
+          .limit(20)
+          .lean();
+
+        return importantStatusOrders.map((order) => {
+          const statusLabel = statusLabels[order.status] || order.status;
+          return {
+            title: `📦 הזמנה ${statusLabel}`,
+            content: `הזמנה #${order.orderNumber || order._id} של ${order.customer?.name || "לקוח"} ${statusLabel}. סכום: ${order.orderTotal?.toLocaleString() || 0} ${order.currency || "ILS"}`,
             type: order.status === "Cancelled" ? "Warning" : "Success",
-            category: "customers",
             priority: order.status === "Cancelled" ? "high" : "medium",
             relatedEntity: {
               entityType: "CustomerOrder",
@@ -3018,16 +2439,10 @@ export const checkCustomerOrderStatusChanges = async () => {
             },
             actionUrl: `/dashboard/Customers/Orders/${order._id}`,
             actionLabel: "צפה בהזמנה",
-            dedupe: {
-              enabled: true,
-              hours: 12,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} customer order status change notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkCustomerOrderStatusChanges:", error);
   }
@@ -3038,57 +2453,45 @@ export const checkCustomerOrderStatusChanges = async () => {
  */
 export const checkCustomerPaymentOverdue = async () => {
   try {
-    console.log("🔍 Checking customer payment overdue...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-
-      // מציאת הזמנות עם תשלומים מאחרים
-      const overdueOrders = await CustomerOrder.find({
-        companyId: company._id,
-        status: { $in: ["Confirmed", "Shipped", "Delivered"] },
-        paymentStatus: { $ne: "Paid" },
-        deliveryDate: { $lt: today },
-      })
-        .populate("customer")
-        .limit(50);
-
-      if (overdueOrders.length > 0) {
-        const totalOverdue = overdueOrders.reduce(
-          (sum, order) => sum + (order.orderTotal || 0),
-          0
-        );
+    await runNotificationRule({
+      name: "checkCustomerPaymentOverdue",
+      category: "customers",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+
+        // הזמנות עם תשלומים מאחרים
+        const overdueByCompany = await CustomerOrder.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: { $in: ["Confirmed", "Shipped", "Delivered"] },
+              paymentStatus: { $ne: "Paid" },
+              deliveryDate: { $lt: today },
+            },
+          },
+          {
+            $group: {
+              _id: "$companyId",
+              orderCount: { $sum: 1 },
+              totalOverdue: { $sum: { $ifNull: ["$orderTotal", 0] } },
+              currency: { $first: "$currency" },
+            },
+          },
+        ]);
 
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "customers",
+        return overdueByCompany.map(({ _id, orderCount, totalOverdue, currency }) => ({
+          companyId: _id,
           title: "💸 תשלומי לקוחות מאחרים",
-          hours: 24,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "💸 תשלומי לקוחות מאחרים",
-            content: `יש ${overdueOrders.length} הזמנות עם תשלומים מאחרים. סה"כ חוב: ${totalOverdue.toLocaleString()} ${overdueOrders[0]?.currency || "ILS"}`,
-            type: "Warning",
-            category: "customers",
-            priority: "high",
-            actionUrl: `/dashboard/Customers/Orders`,
-            actionLabel: "צפה בהזמנות",
-            dedupe: {
-              enabled: true,
-              hours: 24,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} customer payment overdue notifications`);
+          content: `יש ${orderCount} הזמנות עם תשלומים מאחרים. סה"כ חוב: ${totalOverdue.toLocaleString()} ${currency || "ILS"}`,
+          type: "Warning",
+          priority: "high",
+          actionUrl: `/dashboard/Customers/Orders`,
+          actionLabel: "צפה בהזמנות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkCustomerPaymentOverdue:", error);
   }
@@ -3099,57 +2502,35 @@ export const checkCustomerPaymentOverdue = async () => {
  */
 export const checkCustomerInactivity = async () => {
   try {
-    console.log("🔍 Checking customer inactivity...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeMonthsAgo = new Date();
-      threeMonthsAgo.setMonth(threeMonthsAgo.getMonth() - 3);
-
-      // מציאת לקוחות ללא הזמנות לאחרונה
-      const inactiveCustomers = await Customer.find({
-        companyId: company._id,
-      })
-        .populate({
-          path: "orders",
-          match: { orderDate: { $gte: threeMonthsAgo } },
-          select: "_id",
-        })
-        .limit(50);
-
-      const trulyInactive = inactiveCustomers.filter(
-        (customer) => !customer.orders || customer.orders.length === 0
-      );
-
-      if (trulyInactive.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "customers",
-          title: "😴 לקוחות ללא פעילות",
-          hours: 168, // שבוע
+    await runNotificationRule({
+      name: "checkCustomerInactivity",
+      category: "customers",
+      hours: 168, // שבוע
+      collectAll: async (companyIds) => {
+        const threeMonthsAgo = new Date();
+        threeMonthsAgo.setMonth(threeMonthsAgo.getMonth() - 3);
+
+        // לקוחות שאין להם הזמנה מאז threeMonthsAgo
+        const activeCustomerIds = await CustomerOrder.distinct("customer", {
+          companyId: { $in: companyIds },
+          orderDate: { $gte: threeMonthsAgo },
         });
+        const inactiveByCompany = await Customer.aggregate([
+          { $match: { companyId: { $in: companyIds }, _id: { $nin: activeCustomerIds } } },
+          { $group: { _id: "$companyId", customerCount: { $sum: 1 } } },
+        ]);
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "😴 לקוחות ללא פעילות",
-            content: `יש ${trulyInactive.length} לקוחות ללא פעילות כבר 3 חודשים. שקול ליצור קשר מחדש`,
-            type: "Info",
-            category: "customers",
-            priority: "low",
-            actionUrl: `/dashboard/Customers`,
-            actionLabel: "צפה בלקוחות",
-            dedupe: {
-              enabled: true,
-              hours: 168,
-            },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} customer inactivity notifications`);
+        return inactiveByCompany.map(({ _id, customerCount }) => ({
+          companyId: _id,
+          title: "😴 לקוחות ללא פעילות",
+          content: `יש ${customerCount} לקוחות ללא פעילות כבר 3 חודשים. שקול ליצור קשר מחדש`,
+          type: "Info",
+          priority: "low",
+          actionUrl: `/dashboard/Customers`,
+          actionLabel: "צפה בלקוחות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkCustomerInactivity:", error);
   }
@@ -3164,73 +2545,62 @@ export const checkCustomerInactivity = async () => {
  */
 export const checkSupplierPerformanceIssues = async () => {
   try {
-    console.log("🔍 Checking supplier performance issues...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const suppliers = await Suppliers.find({
-        companyId: company._id,
-        IsActive: true,
-      });
+    await runNotificationRule({
+      name: "checkSupplierPerformanceIssues",
+      category: "suppliers",
+      hours: 72,
+      collectAll: async (companyIds) => {
+        // הזמנות רכש מאחרות לפי ספק - אגרגציה אחת במקום שאילתה לכל ספק
+        const [suppliers, delayedBySupplier] = await Promise.all([
+          Suppliers.find({ companyId: { $in: companyIds }, IsActive: true })
+            .select("_id companyId SupplierName averageRating")
+            .lean(),
+          Procurement.aggregate([
+            {
+              $match: {
+                companyId: { $in: companyIds },
+                orderStatus: { $in: ["Pending", "In Progress"] },
+                deliveryDate: { $lt: new Date() },
+              },
+            },
+            { $group: { _id: "$supplierId", delayedCount: { $sum: 1 } } },
+          ]),
+        ]);
+        const delayedCounts = new Map(
+          delayedBySupplier.map(({ _id, delayedCount }) => [String(_id), Math.min(delayedCount, 5)])
+        );
 
-      for (const supplier of suppliers) {
-        const hasLowRating = supplier.averageRating && supplier.averageRating < 3;
-        const hasNoRating = !supplier.averageRating || supplier.averageRating === 0;
-
-        // בדיקת הזמנות רכש מאחרות מהספק
-        const delayedProcurements = await Procurement.find({
-          companyId: company._id,
-          supplierId: supplier._id,
-          orderStatus: { $in: ["Pending", "In Progress"] },
-          deliveryDate: { $lt: new Date() },
-        }).limit(5);
-
-        if (hasLowRating || delayedProcurements.length > 0) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "suppliers",
+        const candidates = [];
+        for (const supplier of suppliers) {
+          const hasLowRating = supplier.averageRating && supplier.averageRating < 3;
+          const delayedCount = delayedCounts.get(supplier._id.toString()) || 0;
+          if (!hasLowRating && delayedCount === 0) continue;
+
+          const issues = [];
+          if (hasLowRating) {
+            issues.push(`דירוג נמוך: ${supplier.averageRating.toFixed(1)}/5`);
+          }
+          if (delayedCount > 0) {
+            issues.push(`${delayedCount} הזמנות מאחרות`);
+          }
+
+          candidates.push({
+            companyId: supplier.companyId,
             title: "⚠️ בעיית ביצועים בספק",
+            content: `ספק "${supplier.SupplierName}" עם בעיות: ${issues.join(", ")}`,
+            type: "Warning",
+            priority: hasLowRating && supplier.averageRating < 2 ? "high" : "medium",
             relatedEntity: {
               entityType: "Supplier",
               entityId: supplier._id.toString(),
             },
-            hours: 72,
+            actionUrl: `/dashboard/supplier`,
+            actionLabel: "צפה בספק",
           });
-
-          if (!skip) {
-            const issues = [];
-            if (hasLowRating) {
-              issues.push(`דירוג נמוך: ${supplier.averageRating.toFixed(1)}/5`);
-            }
-            if (delayedProcurements.length > 0) {
-              issues.push(`${delayedProcurements.length} הזמנות מאחרות`);
-            }
-
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ בעיית ביצועים בספק",
-              content: `ספק "${supplier.SupplierName}" עם בעיות: ${issues.join(", ")}`,
-              type: "Warning",
-              category: "suppliers",
-              priority: hasLowRating && supplier.averageRating < 2 ? "high" : "medium",
-              relatedEntity: {
-                entityType: "Supplier",
-                entityId: supplier._id.toString(),
-              },
-              actionUrl: `/dashboard/supplier`,
-              actionLabel: "צפה בספק",
-              dedupe: {
-                enabled: true,
-                hours: 72,
-              },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} supplier performance issues notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkSupplierPerformanceIssues:", error);
   }
@@ -3241,72 +2611,44 @@ export const checkSupplierPerformanceIssues = async () => {
  */
 export const checkSupplierContractRenewal = async () => {
   try {
-    console.log("🔍 Checking supplier contract renewals...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // נניח שיש שדה contractExpiryDate במודל Suppliers
-      // אם לא, נדלג על זה
-      const suppliers = await Suppliers.find({
-        companyId: company._id,
-        IsActive: true,
-      });
-
-      // אם אין שדה contractExpiryDate, נדלג על הפונקציה הזו
-      // נבדוק אם יש שדה כזה
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-      const thirtyDaysFromNow = new Date(today);
-      thirtyDaysFromNow.setDate(thirtyDaysFromNow.getDate() + 30);
-
-      // נניח שיש שדה contractExpiryDate (אם לא, נדלג)
-      for (const supplier of suppliers) {
-        // אם אין שדה contractExpiryDate, נדלג
-        if (!supplier.contractExpiryDate) continue;
-
-        const expiryDate = new Date(supplier.contractExpiryDate);
-        if (expiryDate >= today && expiryDate <= thirtyDaysFromNow) {
-          const daysUntilExpiry = Math.ceil(
-            (expiryDate - today) / (1000 * 60 * 60 * 24)
-          );
-
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "suppliers",
+    await runNotificationRule({
+      name: "checkSupplierContractRenewal",
+      category: "suppliers",
+      hours: 168, // שבוע
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+        const thirtyDaysFromNow = new Date(today);
+        thirtyDaysFromNow.setDate(thirtyDaysFromNow.getDate() + 30);
+
+        // ספקים בלי contractExpiryDate לא נכללים
+        const suppliers = await Suppliers.find({
+          companyId: { $in: companyIds },
+          IsActive: true,
+          contractExpiryDate: { $gte: today, $lte: thirtyDaysFromNow },
+        })
+          .select("_id companyId SupplierName contractExpiryDate")
+          .lean();
+
+        return suppliers.map((supplier) => {
+          const expiryDate = new Date(supplier.contractExpiryDate);
+          const daysUntilExpiry = Math.ceil((expiryDate - today) / (1000 * 60 * 60 * 24));
+          return {
+            companyId: supplier.companyId,
             title: "📄 חוזה ספק קרוב למועד חידוש",
+            content: `חוזה של ספק "${supplier.SupplierName}" יפוג בעוד ${daysUntilExpiry} ימים (${expiryDate.toLocaleDateString("he-IL")})`,
+            type: "Reminder",
+            priority: daysUntilExpiry <= 7 ? "high" : "medium",
             relatedEntity: {
               entityType: "Supplier",
               entityId: supplier._id.toString(),
             },
-            hours: 168, // שבוע
-          });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "📄 חוזה ספק קרוב למועד חידוש",
-              content: `חוזה של ספק "${supplier.SupplierName}" יפוג בעוד ${daysUntilExpiry} ימים (${expiryDate.toLocaleDateString("he-IL")})`,
-              type: "Reminder",
-              category: "suppliers",
-              priority: daysUntilExpiry <= 7 ? "high" : "medium",
-              relatedEntity: {
-                entityType: "Supplier",
-                entityId: supplier._id.toString(),
-              },
-              actionUrl: `/dashboard/supplier`,
-              actionLabel: "צפה בספק",
-              dedupe: {
-                enabled: true,
-                hours: 168,
-              },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} supplier contract renewal notifications`);
+            actionUrl: `/dashboard/supplier`,
+            actionLabel: "צפה בספק",
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkSupplierContractRenewal:", error);
   }
@@ -3317,60 +2659,47 @@ export const checkSupplierContractRenewal = async () => {
  */
 export const checkSupplierPaymentIssues = async () => {
   try {
-    console.log("🔍 Checking supplier payment issues...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // מציאת הזמנות רכש עם תשלומים מאחרים
-      const today = new Date();
-      today.setHours(0, 0, 0, 0);
-
-      const overdueProcurements = await Procurement.find({
-        companyId: company._id,
-        orderStatus: "Delivered",
-        paymentStatus: { $ne: "Paid" },
-        deliveryDate: { $lt: today },
-      })
-        .populate("supplierId")
-        .limit(50);
-
-      if (overdueProcurements.length > 0) {
-        const totalOverdue = overdueProcurements.reduce((sum, proc) => {
-          const procTotal = proc.products?.reduce(
-            (pSum, p) => pSum + (p.total || 0),
-            0
-          ) || 0;
-          return sum + procTotal;
-        }, 0);
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "suppliers",
-          title: "💸 תשלומים לספקים מאחרים",
-          hours: 24,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "💸 תשלומים לספקים מאחרים",
-            content: `יש ${overdueProcurements.length} הזמנות רכש עם תשלומים מאחרים לספקים. סה"כ: ${totalOverdue.toLocaleString()} ${company.baseCurrency || "ILS"}`,
-            type: "Warning",
-            category: "suppliers",
-            priority: "high",
-            actionUrl: `/dashboard/procurement`,
-            actionLabel: "צפה בהזמנות רכש",
-            dedupe: {
-              enabled: true,
-              hours: 24,
+    await runNotificationRule({
+      name: "checkSupplierPaymentIssues",
+      category: "suppliers",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        today.setHours(0, 0, 0, 0);
+
+        // הזמנות רכש שסופקו ועדיין לא שולמו
+        const [overdueByCompany, currencies] = await Promise.all([
+          Procurement.aggregate([
+            {
+              $match: {
+                companyId: { $in: companyIds },
+                orderStatus: "Delivered",
+                paymentStatus: { $ne: "Paid" },
+                deliveryDate: { $lt: today },
+              },
             },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created ${totalNotifications} supplier payment issues notifications`);
+            {
+              $group: {
+                _id: "$companyId",
+                procurementCount: { $sum: 1 },
+                totalOverdue: { $sum: { $sum: "$products.total" } },
+              },
+            },
+          ]),
+          loadBaseCurrencies(companyIds),
+        ]);
+
+        return overdueByCompany.map(({ _id, procurementCount, totalOverdue }) => ({
+          companyId: _id,
+          title: "💸 תשלומים לספקים מאחרים",
+          content: `יש ${procurementCount} הזמנות רכש עם תשלומים מאחרים לספקים. סה"כ: ${totalOverdue.toLocaleString()} ${currencies.get(_id.toString())}`,
+          type: "Warning",
+          priority: "high",
+          actionUrl: `/dashboard/procurement`,
+          actionLabel: "צפה בהזמנות רכש",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkSupplierPaymentIssues:", error);
   }
@@ -3385,47 +2714,42 @@ export const checkSupplierPaymentIssues = async () => {
  */
 export const checkUnsentInvoices = async () => {
   try {
-    console.log("🔍 Checking unsent invoices...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const sixHoursAgo = new Date(Date.now() - 6 * 60 * 60 * 1000);
-
-      const unsentInvoices = await Invoice.find({
-        companyId: company._id,
-        status: "Draft",
-        createdAt: { $lt: sixHoursAgo },
-        sentDate: { $exists: false },
-      }).limit(20);
-
-      if (unsentInvoices.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "invoices",
-          title: "📄 חשבוניות שלא נשלחו",
-          hours: 24,
-        });
-
-        if (!skip) {
-          const totalAmount = unsentInvoices.reduce((sum, inv) => sum + (inv.totalAmount || 0), 0);
+    await runNotificationRule({
+      name: "checkUnsentInvoices",
+      category: "invoices",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const sixHoursAgo = new Date(Date.now() - 6 * 60 * 60 * 1000);
+        const unsentByCompany = await Invoice.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: "Draft",
+              createdAt: { $lt: sixHoursAgo },
+              sentDate: { $exists: false },
+            },
+          },
+          {
+            $group: {
+              _id: "$companyId",
+              invoiceCount: { $sum: 1 },
+              totalAmount: { $sum: { $ifNull: ["$totalAmount", 0] } },
+              currency: { $first: "$currency" },
+            },
+          },
+        ]);
 
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "📄 חשבוניות שלא נשלחו",
-            content: `יש ${unsentInvoices.length} חשבוניות שנוצרו ולא נשלחו עדיין. סה"כ: ${totalAmount.toLocaleString()} ${unsentInvoices[0]?.currency || "USD"}`,
-            type: "Warning",
-            category: "invoices",
-            priority: "medium",
-            actionUrl: `/dashboard/invoices`,
-            actionLabel: "צפה בחשבוניות",
-            dedupe: { enabled: true, hours: 24 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} unsent invoices notifications`);
+        return unsentByCompany.map(({ _id, invoiceCount, totalAmount, currency }) => ({
+          companyId: _id,
+          title: "📄 חשבוניות שלא נשלחו",
+          content: `יש ${invoiceCount} חשבוניות שנוצרו ולא נשלחו עדיין. סה"כ: ${totalAmount.toLocaleString()} ${currency || "USD"}`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/invoices`,
+          actionLabel: "צפה בחשבוניות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUnsentInvoices:", error);
   }
@@ -3436,45 +2760,36 @@ export const checkUnsentInvoices = async () => {
  */
 export const checkInvoiceApprovalPending = async () => {
   try {
-    console.log("🔍 Checking invoice approval pending...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const twoDaysAgo = new Date(Date.now() - 2 * 24 * 60 * 60 * 1000);
-
-      // נניח שיש שדה approvalStatus או שחשבוניות ב-Draft הן ממתינות לאישור
-      const pendingInvoices = await Invoice.find({
-        companyId: company._id,
-        status: "Draft",
-        createdAt: { $lt: twoDaysAgo },
-      }).limit(20);
-
-      if (pendingInvoices.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "invoices",
-          title: "⏰ חשבוניות ממתינות לאישור",
-          hours: 24,
-        });
+    await runNotificationRule({
+      name: "checkInvoiceApprovalPending",
+      category: "invoices",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const twoDaysAgo = new Date(Date.now() - 2 * 24 * 60 * 60 * 1000);
+
+        // חשבוניות ב-Draft נחשבות ממתינות לאישור
+        const pendingByCompany = await Invoice.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: "Draft",
+              createdAt: { $lt: twoDaysAgo },
+            },
+          },
+          { $group: { _id: "$companyId", invoiceCount: { $sum: 1 } } },
+        ]);
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "⏰ חשבוניות ממתינות לאישור",
-            content: `יש \${pendingInvoices.length} חשבוניות ממתינות לאישור מעל יומיים`,
-            type: "Reminder",
-            category: "invoices",
-            priority: "medium",
-            actionUrl: `/dashboard/invoices`,
-            actionLabel: "צפה בחשבוניות",
-            dedupe: { enabled: true, hours: 24 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} invoice approval pending notifications`);
+        return pendingByCompany.map(({ _id, invoiceCount }) => ({
+          companyId: _id,
+          title: "⏰ חשבוניות ממתינות לאישור",
+          content: `יש ${invoiceCount} חשבוניות ממתינות לאישור מעל יומיים`,
+          type: "Reminder",
+          priority: "medium",
+          actionUrl: `/dashboard/invoices`,
+          actionLabel: "צפה בחשבוניות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkInvoiceApprovalPending:", error);
   }
@@ -3485,63 +2800,48 @@ export const checkInvoiceApprovalPending = async () => {
  */
 export const checkInvoiceDiscrepancies = async () => {
   try {
-    console.log("🔍 Checking invoice discrepancies...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const recentInvoices = await Invoice.find({
-        companyId: company._id,
-        createdAt: { $gte: new Date(Date.now() - 7 * 24 * 60 * 60 * 1000) },
-      }).populate("orderId").limit(50);
-
-      for (const invoice of recentInvoices) {
-        let hasDiscrepancy = false;
-        let discrepancyDetails = [];
-
-        // בדיקת התאמה בין חשבונית להזמנה (אם קיימת)
-        if (invoice.orderId) {
-          const order = invoice.orderId;
-          if (Math.abs(invoice.totalAmount - order.orderTotal) > 0.01) {
-            hasDiscrepancy = true;
-            discrepancyDetails.push(`סכום לא תואם להזמנה: \${invoice.totalAmount} vs \${order.orderTotal}`);
+    await runNotificationRule({
+      name: "checkInvoiceDiscrepancies",
+      category: "invoices",
+      hours: 72,
+      collect: async (companyId) => {
+        const recentInvoices = await Invoice.find({
+          companyId,
+          createdAt: { $gte: new Date(Date.now() - 7 * 24 * 60 * 60 * 1000) },
+        })
+          .select("_id invoiceNumber totalAmount items orderId")
+          .populate("orderId", "orderTotal")
+          .limit(50)
+          .lean();
+
+        const candidates = [];
+        for (const invoice of recentInvoices) {
+          const discrepancyDetails = [];
+
+          // בדיקת התאמה בין חשבונית להזמנה (אם קיימת)
+          if (invoice.orderId && Math.abs(invoice.totalAmount - invoice.orderId.orderTotal) > 0.01) {
+            discrepancyDetails.push(`סכום לא תואם להזמנה: ${invoice.totalAmount} vs ${invoice.orderId.orderTotal}`);
           }
-        }
 
-        // בדיקת חשבוניות עם סכום 0
-        if (invoice.totalAmount === 0 && invoice.items && invoice.items.length > 0) {
-          hasDiscrepancy = true;
-          discrepancyDetails.push("חשבונית עם פריטים אך סכום 0");
-        }
+          // בדיקת חשבוניות עם סכום 0
+          if (invoice.totalAmount === 0 && invoice.items?.length > 0) {
+            discrepancyDetails.push("חשבונית עם פריטים אך סכום 0");
+          }
 
-        if (hasDiscrepancy) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "invoices",
+          if (discrepancyDetails.length === 0) continue;
+          candidates.push({
             title: "⚠️ אי-התאמה בחשבונית",
+            content: `חשבונית #${invoice.invoiceNumber || invoice._id}: ${discrepancyDetails.join(", ")}`,
+            type: "Warning",
+            priority: "medium",
             relatedEntity: { entityType: "Invoice", entityId: invoice._id.toString() },
-            hours: 72,
+            actionUrl: `/dashboard/invoices/${invoice._id}`,
+            actionLabel: "צפה בחשבונית",
           });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ אי-התאמה בחשבונית",
-              content: `חשבונית #\${invoice.invoiceNumber || invoice._id}: \${discrepancyDetails.join(", ")}`,
-              type: "Warning",
-              category: "invoices",
-              priority: "medium",
-              relatedEntity: { entityType: "Invoice", entityId: invoice._id.toString() },
-              actionUrl: `/dashboard/invoices/\${invoice._id}`,
-              actionLabel: "צפה בחשבונית",
-              dedupe: { enabled: true, hours: 72 },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} invoice discrepancies notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkInvoiceDiscrepancies:", error);
   }
@@ -3556,48 +2856,35 @@ export const checkInvoiceDiscrepancies = async () => {
  */
 export const checkBlockedTasks = async () => {
   try {
-    console.log("🔍 Checking blocked tasks...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const fiveDaysAgo = new Date(Date.now() - 5 * 24 * 60 * 60 * 1000);
-
-      const blockedTasks = await Task.find({
-        companyId: company._id,
-        status: { $in: ["InProgress", "Pending"] },
-        updatedAt: { $lt: fiveDaysAgo },
-      }).populate("assignedTo").limit(30);
-
-      for (const task of blockedTasks) {
-        const daysSinceUpdate = Math.floor((Date.now() - new Date(task.updatedAt)) / (1000 * 60 * 60 * 24));
-
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "tasks",
-          title: "🚧 משימה תקועה",
-          relatedEntity: { entityType: "Task", entityId: task._id.toString() },
-          hours: 48,
-        });
+    await runNotificationRule({
+      name: "checkBlockedTasks",
+      category: "tasks",
+      hours: 48,
+      collect: async (companyId) => {
+        const fiveDaysAgo = new Date(Date.now() - 5 * 24 * 60 * 60 * 1000);
+        const blockedTasks = await Task.find({
+          companyId,
+          status: { $in: ["InProgress", "Pending"] },
+          updatedAt: { $lt: fiveDaysAgo },
+        })
+          .select("_id title updatedAt")
+          .limit(30)
+          .lean();
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+        return blockedTasks.map((task) => {
+          const daysSinceUpdate = Math.floor((Date.now() - new Date(task.updatedAt)) / (1000 * 60 * 60 * 24));
+          return {
             title: "🚧 משימה תקועה",
-            content: `משימה "\${task.title}" ללא התקדמות כבר \${daysSinceUpdate} ימים`,
+            content: `משימה "${task.title}" ללא התקדמות כבר ${daysSinceUpdate} ימים`,
             type: "Warning",
-            category: "tasks",
             priority: daysSinceUpdate > 10 ? "high" : "medium",
             relatedEntity: { entityType: "Task", entityId: task._id.toString() },
-            actionUrl: `/dashboard/tasks/\${task._id}`,
+            actionUrl: `/dashboard/tasks/${task._id}`,
             actionLabel: "צפה במשימה",
-            dedupe: { enabled: true, hours: 48 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} blocked tasks notifications`);
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkBlockedTasks:", error);
   }
@@ -3608,53 +2895,47 @@ export const checkBlockedTasks = async () => {
  */
 export const checkProjectBudgetOverrun = async () => {
   try {
-    console.log("🔍 Checking project budget overruns...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // נניח שיש שדה actualCost או spentBudget בפרויקט
-      const projects = await Project.find({
-        companyId: company._id,
-        status: { $in: ["Active", "On Hold"] },
-        budget: { $gt: 0 },
-      }).limit(50);
-
-      for (const project of projects) {
-        // נחשב את העלות הבפועל מכל המשימות או מהשדה spentBudget
-        const tasks = await Task.find({ projectId: project._id });
-        const actualCost = tasks.reduce((sum, task) => sum + (task.actualCost || 0), 0);
-
-        if (actualCost > project.budget) {
-          const overrun = ((actualCost - project.budget) / project.budget) * 100;
+    await runNotificationRule({
+      name: "checkProjectBudgetOverrun",
+      category: "projects",
+      hours: 48,
+      collect: async (companyId) => {
+        const projects = await Project.find({
+          companyId,
+          status: { $in: ["Active", "On Hold"] },
+          budget: { $gt: 0 },
+        })
+          .select("_id name budget")
+          .limit(50)
+          .lean();
+        if (projects.length === 0) return [];
+
+        // העלות בפועל של כל הפרויקטים באגרגציה אחת על המשימות
+        const costs = await Task.aggregate([
+          { $match: { projectId: { $in: projects.map((project) => project._id) } } },
+          { $group: { _id: "$projectId", actualCost: { $sum: { $ifNull: ["$actualCost", 0] } } } },
+        ]);
+        const actualCostByProject = new Map(costs.map(({ _id, actualCost }) => [_id.toString(), actualCost]));
+
+        const candidates = [];
+        for (const project of projects) {
+          const actualCost = actualCostByProject.get(project._id.toString()) || 0;
+          if (actualCost <= project.budget) continue;
 
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "projects",
+          const overrun = ((actualCost - project.budget) / project.budget) * 100;
+          candidates.push({
             title: "💸 פרויקט חרג מתקציב",
+            content: `פרויקט "${project.name}" חרג בתקציב של ${overrun.toFixed(1)}%. תקציב: ${project.budget}, בפועל: ${actualCost}`,
+            type: "Error",
+            priority: overrun > 50 ? "critical" : "high",
             relatedEntity: { entityType: "Project", entityId: project._id.toString() },
-            hours: 48,
+            actionUrl: `/dashboard/projects/${project._id}`,
+            actionLabel: "צפה בפרויקט",
           });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "💸 פרויקט חרג מתקציב",
-              content: `פרויקט "\${project.name}" חרג בתקציב של \${overrun.toFixed(1)}%. תקציב: \${project.budget}, בפועל: \${actualCost}`,
-              type: "Error",
-              category: "projects",
-              priority: overrun > 50 ? "critical" : "high",
-              relatedEntity: { entityType: "Project", entityId: project._id.toString() },
-              actionUrl: `/dashboard/projects/\${project._id}`,
-              actionLabel: "צפה בפרויקט",
-              dedupe: { enabled: true, hours: 48 },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} project budget overrun notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkProjectBudgetOverrun:", error);
   }
@@ -3665,56 +2946,46 @@ export const checkProjectBudgetOverrun = async () => {
  */
 export const checkProjectResourceConflicts = async () => {
   try {
-    console.log("🔍 Checking project resource conflicts...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const activeProjects = await Project.find({
-        companyId: company._id,
-        status: "Active",
-      }).populate("teamMembers.employeeId");
-
-      // בדיקת עובדים שמשוייכים ליותר מ-3 פרויקטים פעילים
-      const employeeProjectCount = {};
-      for (const project of activeProjects) {
-        for (const member of project.teamMembers || []) {
-          const empId = member.employeeId?._id?.toString() || member.employeeId?.toString();
-          if (!empId) continue;
-          employeeProjectCount[empId] = (employeeProjectCount[empId] || 0) + 1;
-        }
-      }
-
-      for (const empId in employeeProjectCount) {
-        if (employeeProjectCount[empId] >= 3) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "projects",
-            title: "⚠️ קונפליקט במשאבים",
-            relatedEntity: { entityType: "Employee", entityId: empId },
-            hours: 168,
-          });
+    await runNotificationRule({
+      name: "checkProjectResourceConflicts",
+      category: "projects",
+      hours: 168,
+      collectAll: async (companyIds) => {
+        // עובדים שמשויכים ל-3 פרויקטים פעילים או יותר
+        const overloaded = await Project.aggregate([
+          { $match: { companyId: { $in: companyIds }, status: "Active" } },
+          { $unwind: "$teamMembers" },
+          { $match: { "teamMembers.employeeId": { $ne: null } } },
+          {
+            $group: {
+              _id: { companyId: "$companyId", employeeId: "$teamMembers.employeeId" },
+              projectCount: { $sum: 1 },
+            },
+          },
+          { $match: { projectCount: { $gte: 3 } } },
+          {
+            $lookup: {
+              from: Employee.collection.name,
+              localField: "_id.employeeId",
+              foreignField: "_id",
+              pipeline: [{ $project: { name: 1 } }],
+              as: "employee",
+            },
+          },
+        ]);
 
-          if (!skip) {
-            const employee = await Employee.findById(empId);
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ קונפליקט במשאבים",
-              content: `עובד \${employee?.name || "לא ידוע"} משויך ל-\${employeeProjectCount[empId]} פרויקטים פעילים`,
-              type: "Warning",
-              category: "projects",
-              priority: "medium",
-              relatedEntity: { entityType: "Employee", entityId: empId },
-              actionUrl: `/dashboard/projects`,
-              actionLabel: "צפה בפרויקטים",
-              dedupe: { enabled: true, hours: 168 },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} resource conflict notifications`);
+        return overloaded.map(({ _id, projectCount, employee }) => ({
+          companyId: _id.companyId,
+          title: "⚠️ קונפליקט במשאבים",
+          content: `עובד ${employee[0]?.name || "לא ידוע"} משויך ל-${projectCount} פרויקטים פעילים`,
+          type: "Warning",
+          priority: "medium",
+          relatedEntity: { entityType: "Employee", entityId: _id.employeeId.toString() },
+          actionUrl: `/dashboard/projects`,
+          actionLabel: "צפה בפרויקטים",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkProjectResourceConflicts:", error);
   }
@@ -3725,49 +2996,39 @@ export const checkProjectResourceConflicts = async () => {
  */
 export const checkUnassignedTasks = async () => {
   try {
-    console.log("🔍 Checking unassigned tasks...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const twoDaysAgo = new Date(Date.now() - 2 * 24 * 60 * 60 * 1000);
-
-      const unassignedTasks = await Task.find({
-        companyId: company._id,
-        status: { $in: ["Pending", "InProgress"] },
-        $or: [
-          { assignedTo: { $exists: false } },
-          { assignedTo: { $eq: null } },
-          { assignedTo: { $size: 0 } },
-        ],
-        createdAt: { $lt: twoDaysAgo },
-      }).limit(20);
+    await runNotificationRule({
+      name: "checkUnassignedTasks",
+      category: "tasks",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const twoDaysAgo = new Date(Date.now() - 2 * 24 * 60 * 60 * 1000);
+        const unassignedByCompany = await Task.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              status: { $in: ["Pending", "InProgress"] },
+              $or: [
+                { assignedTo: { $exists: false } },
+                { assignedTo: { $eq: null } },
+                { assignedTo: { $size: 0 } },
+              ],
+              createdAt: { $lt: twoDaysAgo },
+            },
+          },
+          { $group: { _id: "$companyId", taskCount: { $sum: 1 } } },
+        ]);
 
-      if (unassignedTasks.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "tasks",
+        return unassignedByCompany.map(({ _id, taskCount }) => ({
+          companyId: _id,
           title: "👤 משימות ללא הקצאה",
-          hours: 24,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "👤 משימות ללא הקצאה",
-            content: `יש \${unassignedTasks.length} משימות ללא עובד משויך מעל יומיים`,
-            type: "Warning",
-            category: "tasks",
-            priority: "medium",
-            actionUrl: `/dashboard/tasks`,
-            actionLabel: "צפה במשימות",
-            dedupe: { enabled: true, hours: 24 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} unassigned tasks notifications`);
+          content: `יש ${taskCount} משימות ללא עובד משויך מעל יומיים`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/tasks`,
+          actionLabel: "צפה במשימות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUnassignedTasks:", error);
   }
@@ -3782,57 +3043,44 @@ export const checkUnassignedTasks = async () => {
  */
 export const checkEmployeeBirthdays = async () => {
   try {
-    console.log("🔍 Checking employee birthdays...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      const threeDaysFromNow = new Date(today);
-      threeDaysFromNow.setDate(threeDaysFromNow.getDate() + 3);
-
-      const employees = await Employee.find({
-        companyId: company._id,
-        status: "active",
-        dateOfBirth: { $exists: true },
-      });
-
-      for (const employee of employees) {
-        if (!employee.dateOfBirth) continue;
+    await runNotificationRule({
+      name: "checkEmployeeBirthdays",
+      category: "employees",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        const threeDaysFromNow = new Date(today);
+        threeDaysFromNow.setDate(threeDaysFromNow.getDate() + 3);
+
+        const employees = await Employee.find({
+          companyId: { $in: companyIds },
+          status: "active",
+          dateOfBirth: { $exists: true, $ne: null },
+        })
+          .select("_id companyId name lastName dateOfBirth")
+          .lean();
 
-        const birthday = new Date(employee.dateOfBirth);
-        const thisYearBirthday = new Date(today.getFullYear(), birthday.getMonth(), birthday.getDate());
+        const candidates = [];
+        for (const employee of employees) {
+          const birthday = new Date(employee.dateOfBirth);
+          const thisYearBirthday = new Date(today.getFullYear(), birthday.getMonth(), birthday.getDate());
+          if (thisYearBirthday < today || thisYearBirthday > threeDaysFromNow) continue;
 
-        if (thisYearBirthday >= today && thisYearBirthday <= threeDaysFromNow) {
           const daysUntil = Math.ceil((thisYearBirthday - today) / (1000 * 60 * 60 * 24));
-
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "employees",
+          candidates.push({
+            companyId: employee.companyId,
             title: "🎂 יום הולדת של עובד",
+            content: `יום הולדת של ${employee.name} ${employee.lastName} בעוד ${daysUntil} ימים (${thisYearBirthday.toLocaleDateString("he-IL")})`,
+            type: "Info",
+            priority: "low",
             relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-            hours: 24,
+            actionUrl: `/dashboard/employees/${employee._id}`,
+            actionLabel: "צפה בעובד",
           });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "🎂 יום הולדת של עובד",
-              content: `יום הולדת של \${employee.name} \${employee.lastName} בעוד \${daysUntil} ימים (\${thisYearBirthday.toLocaleDateString("he-IL")})`,
-              type: "Info",
-              category: "employees",
-              priority: "low",
-              relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-              actionUrl: `/dashboard/employees/\${employee._id}`,
-              actionLabel: "צפה בעובד",
-              dedupe: { enabled: true, hours: 24 },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} employee birthday notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkEmployeeBirthdays:", error);
   }
@@ -3843,59 +3091,47 @@ export const checkEmployeeBirthdays = async () => {
  */
 export const checkEmployeeAnniversaries = async () => {
   try {
-    console.log("🔍 Checking employee work anniversaries...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      const sevenDaysFromNow = new Date(today);
-      sevenDaysFromNow.setDate(sevenDaysFromNow.getDate() + 7);
-
-      const employees = await Employee.find({
-        companyId: company._id,
-        status: "active",
-        createdAt: { $exists: true },
-      });
+    await runNotificationRule({
+      name: "checkEmployeeAnniversaries",
+      category: "employees",
+      hours: 168,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        const sevenDaysFromNow = new Date(today);
+        sevenDaysFromNow.setDate(sevenDaysFromNow.getDate() + 7);
+
+        const employees = await Employee.find({
+          companyId: { $in: companyIds },
+          status: "active",
+          createdAt: { $exists: true },
+        })
+          .select("_id companyId name lastName createdAt")
+          .lean();
 
-      for (const employee of employees) {
-        const hireDate = new Date(employee.createdAt);
-        const yearsWorked = today.getFullYear() - hireDate.getFullYear();
+        const candidates = [];
+        for (const employee of employees) {
+          const hireDate = new Date(employee.createdAt);
+          const yearsWorked = today.getFullYear() - hireDate.getFullYear();
+          if (yearsWorked <= 0) continue;
 
-        if (yearsWorked > 0) {
           const thisYearAnniversary = new Date(today.getFullYear(), hireDate.getMonth(), hireDate.getDate());
-
-          if (thisYearAnniversary >= today && thisYearAnniversary <= sevenDaysFromNow) {
-            const daysUntil = Math.ceil((thisYearAnniversary - today) / (1000 * 60 * 60 * 24));
-
-            const skip = await shouldSkipNotification({
-              companyId: company._id,
-              category: "employees",
-              title: "🎉 יום עבודה שנתי",
-              relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-              hours: 168,
-            });
-
-            if (!skip) {
-              await notifyAdminsAndManagers({
-                companyId: company._id,
-                title: "🎉 יום עבודה שנתי",
-                content: `\${employee.name} \${employee.lastName} חוגג \${yearsWorked} שנים בחברה בעוד \${daysUntil} ימים`,
-                type: "Success",
-                category: "employees",
-                priority: "low",
-                relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-                actionUrl: `/dashboard/employees/\${employee._id}`,
-                actionLabel: "צפה בעובד",
-                dedupe: { enabled: true, hours: 168 },
-              });
-              totalNotifications++;
-            }
-          }
+          if (thisYearAnniversary < today || thisYearAnniversary > sevenDaysFromNow) continue;
+
+          const daysUntil = Math.ceil((thisYearAnniversary - today) / (1000 * 60 * 60 * 24));
+          candidates.push({
+            companyId: employee.companyId,
+            title: "🎉 יום עבודה שנתי",
+            content: `${employee.name} ${employee.lastName} חוגג ${yearsWorked} שנים בחברה בעוד ${daysUntil} ימים`,
+            type: "Success",
+            priority: "low",
+            relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
+            actionUrl: `/dashboard/employees/${employee._id}`,
+            actionLabel: "צפה בעובד",
+          });
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} employee anniversary notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkEmployeeAnniversaries:", error);
   }
@@ -3906,56 +3142,40 @@ export const checkEmployeeAnniversaries = async () => {
  */
 export const checkEmployeeContractExpiry = async () => {
   try {
-    console.log("�� Checking employee contract expiry...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const today = new Date();
-      const thirtyDaysFromNow = new Date(today);
-      thirtyDaysFromNow.setDate(thirtyDaysFromNow.getDate() + 30);
-
-      // נניח שיש שדה contractEndDate בעובדים
-      const employees = await Employee.find({
-        companyId: company._id,
-        status: "active",
-      });
-
-      for (const employee of employees) {
-        // אם אין שדה contractEndDate, נדלג
-        if (!employee.contractEndDate) continue;
+    await runNotificationRule({
+      name: "checkEmployeeContractExpiry",
+      category: "employees",
+      hours: 168,
+      collectAll: async (companyIds) => {
+        const today = new Date();
+        const thirtyDaysFromNow = new Date(today);
+        thirtyDaysFromNow.setDate(thirtyDaysFromNow.getDate() + 30);
+
+        // עובדים בלי contractEndDate לא נכללים
+        const employees = await Employee.find({
+          companyId: { $in: companyIds },
+          status: "active",
+          contractEndDate: { $gte: today, $lte: thirtyDaysFromNow },
+        })
+          .select("_id companyId name lastName contractEndDate")
+          .lean();
 
-        const contractEnd = new Date(employee.contractEndDate);
-        if (contractEnd >= today && contractEnd <= thirtyDaysFromNow) {
+        return employees.map((employee) => {
+          const contractEnd = new Date(employee.contractEndDate);
           const daysUntilExpiry = Math.ceil((contractEnd - today) / (1000 * 60 * 60 * 24));
-
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "employees",
+          return {
+            companyId: employee.companyId,
             title: "📄 חוזה עובד קרוב לסיום",
+            content: `חוזה של ${employee.name} ${employee.lastName} יפוג בעוד ${daysUntilExpiry} ימים (${contractEnd.toLocaleDateString("he-IL")})`,
+            type: "Warning",
+            priority: daysUntilExpiry <= 7 ? "high" : "medium",
             relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-            hours: 168,
-          });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "📄 חוזה עובד קרוב לסיום",
-              content: `חוזה של \${employee.name} \${employee.lastName} יפוג בעוד \${daysUntilExpiry} ימים (\${contractEnd.toLocaleDateString("he-IL")})`,
-              type: "Warning",
-              category: "employees",
-              priority: daysUntilExpiry <= 7 ? "high" : "medium",
-              relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-              actionUrl: `/dashboard/employees/\${employee._id}`,
-              actionLabel: "צפה בעובד",
-              dedupe: { enabled: true, hours: 168 },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} employee contract expiry notifications`);
+            actionUrl: `/dashboard/employees/${employee._id}`,
+            actionLabel: "צפה בעובד",
+          };
+        });
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkEmployeeContractExpiry:", error);
   }
@@ -3966,57 +3186,54 @@ export const checkEmployeeContractExpiry = async () => {
  */
 export const checkEmployeeAbsencePatterns = async () => {
   try {
-    console.log("🔍 Checking employee absence patterns...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const thirtyDaysAgo = new Date(Date.now() - 30 * 24 * 60 * 60 * 1000);
-
-      const employees = await Employee.find({
-        companyId: company._id,
-        status: "active",
-      });
-
-      for (const employee of employees) {
-        const recentShifts = await Shift.find({
-          companyId: company._id,
-          employeeId: employee._id,
-          shiftDate: { $gte: thirtyDaysAgo },
-          dayType: { $in: ["Sickday", "Vacation"] },
-        });
-
-        if (recentShifts.length >= 5) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "employees",
-            title: "⚠️ דפוס היעדרות חריג",
-            relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-            hours: 168,
-          });
-
-          if (!skip) {
-            const sickDays = recentShifts.filter(s => s.dayType === "Sickday").length;
-            const vacationDays = recentShifts.filter(s => s.dayType === "Vacation").length;
+    await runNotificationRule({
+      name: "checkEmployeeAbsencePatterns",
+      category: "employees",
+      hours: 168,
+      collectAll: async (companyIds) => {
+        const thirtyDaysAgo = new Date(Date.now() - 30 * 24 * 60 * 60 * 1000);
+
+        // ימי היעדרות לפי עובד באגרגציה אחת במקום שאילתה לכל עובד
+        const absences = await Shift.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              shiftDate: { $gte: thirtyDaysAgo },
+              dayType: { $in: ["Sickday", "Vacation"] },
+            },
+          },
+          {
+            $group: {
+              _id: { companyId: "$companyId", employeeId: "$employeeId" },
+              absenceDays: { $sum: 1 },
+              sickDays: { $sum: { $cond: [{ $eq: ["$dayType", "Sickday"] }, 1, 0] } },
+            },
+          },
+          { $match: { absenceDays: { $gte: 5 } } },
+          {
+            $lookup: {
+              from: Employee.collection.name,
+              localField: "_id.employeeId",
+              foreignField: "_id",
+              pipeline: [{ $match: { status: "active" } }, { $project: { name: 1, lastName: 1 } }],
+              as: "employee",
+            },
+          },
+          { $unwind: "$employee" },
+        ]);
 
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ דפוס היעדרות חריג",
-              content: `עובד \${employee.name} \${employee.lastName} עם \${recentShifts.length} ימי היעדרות ב-30 ימים האחרונים (חולי: \${sickDays}, חופשה: \${vacationDays})`,
-              type: "Warning",
-              category: "employees",
-              priority: "medium",
-              relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
-              actionUrl: `/dashboard/employees/\${employee._id}`,
-              actionLabel: "צפה בעובד",
-              dedupe: { enabled: true, hours: 168 },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} employee absence pattern notifications`);
+        return absences.map(({ _id, absenceDays, sickDays, employee }) => ({
+          companyId: _id.companyId,
+          title: "⚠️ דפוס היעדרות חריג",
+          content: `עובד ${employee.name} ${employee.lastName} עם ${absenceDays} ימי היעדרות ב-30 ימים האחרונים (חולי: ${sickDays}, חופשה: ${absenceDays - sickDays})`,
+          type: "Warning",
+          priority: "medium",
+          relatedEntity: { entityType: "Employee", entityId: employee._id.toString() },
+          actionUrl: `/dashboard/employees/${employee._id}`,
+          actionLabel: "צפה בעובד",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkEmployeeAbsencePatterns:", error);
   }
@@ -4031,50 +3248,32 @@ export const checkEmployeeAbsencePatterns = async () => {
  */
 export const checkInventoryDiscrepancies = async () => {
   try {
-    console.log("🔍 Checking inventory discrepancies...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // נניח שיש שדה lastAudit או lastPhysicalCount במלאי
-      const inventoryItems = await Inventory.find({
-        companyId: company._id,
-        quantity: { $ne: 0 },
-      }).populate("productId").limit(100);
-
-      for (const item of inventoryItems) {
-        // בדיקת מלאי שיכול להיות בעייתי
-        const hasNegativeQuantity = item.quantity < 0;
-        const isBelowMin = item.quantity < item.minStockLevel;
-
-        if (hasNegativeQuantity) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "inventory",
-            title: "❌ אי-התאמה במלאי",
-            relatedEntity: { entityType: "Inventory", entityId: item._id.toString() },
-            hours: 24,
-          });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "❌ אי-התאמה במלאי",
-              content: `מלאי של מוצר "\${item.productId?.ProductName || "לא ידוע"}" בכמות שלילית: \${item.quantity}`,
-              type: "Error",
-              category: "inventory",
-              priority: "critical",
-              relatedEntity: { entityType: "Inventory", entityId: item._id.toString() },
-              actionUrl: `/dashboard/inventory`,
-              actionLabel: "צפה במלאי",
-              dedupe: { enabled: true, hours: 24 },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} inventory discrepancies notifications`);
+    await runNotificationRule({
+      name: "checkInventoryDiscrepancies",
+      category: "inventory",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        // מלאי בכמות שלילית
+        const negativeItems = await Inventory.find({
+          companyId: { $in: companyIds },
+          quantity: { $lt: 0 },
+        })
+          .select("_id companyId productId quantity")
+          .populate("productId", "ProductName")
+          .lean();
+
+        return negativeItems.map((item) => ({
+          companyId: item.companyId,
+          title: "❌ אי-התאמה במלאי",
+          content: `מלאי של מוצר "${item.productId?.ProductName || "לא ידוע"}" בכמות שלילית: ${item.quantity}`,
+          type: "Error",
+          priority: "critical",
+          relatedEntity: { entityType: "Inventory", entityId: item._id.toString() },
+          actionUrl: `/dashboard/inventory`,
+          actionLabel: "צפה במלאי",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkInventoryDiscrepancies:", error);
   }
@@ -4085,53 +3284,61 @@ export const checkInventoryDiscrepancies = async () => {
  */
 export const checkSlowMovingInventory = async () => {
   try {
-    console.log("🔍 Checking slow moving inventory...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeMonthsAgo = new Date();
-      threeMonthsAgo.setMonth(threeMonthsAgo.getMonth() - 3);
-
-      const inventoryItems = await Inventory.find({
-        companyId: company._id,
-        quantity: { $gt: 0 },
-        $or: [
-          { lastOrderDate: { $lt: threeMonthsAgo } },
-          { lastOrderDate: { $exists: false }, createdAt: { $lt: threeMonthsAgo } },
-        ],
-      }).populate("productId").limit(50);
+    await runNotificationRule({
+      name: "checkSlowMovingInventory",
+      category: "inventory",
+      hours: 168,
+      collectAll: async (companyIds) => {
+        const threeMonthsAgo = new Date();
+        threeMonthsAgo.setMonth(threeMonthsAgo.getMonth() - 3);
+
+        const [slowByCompany, currencies] = await Promise.all([
+          Inventory.aggregate([
+            {
+              $match: {
+                companyId: { $in: companyIds },
+                quantity: { $gt: 0 },
+                $or: [
+                  { lastOrderDate: { $lt: threeMonthsAgo } },
+                  { lastOrderDate: { $exists: false }, createdAt: { $lt: threeMonthsAgo } },
+                ],
+              },
+            },
+            {
+              $lookup: {
+                from: Product.collection.name,
+                localField: "productId",
+                foreignField: "_id",
+                pipeline: [{ $project: { Price: 1 } }],
+                as: "product",
+              },
+            },
+            {
+              $group: {
+                _id: "$companyId",
+                itemCount: { $sum: 1 },
+                totalValue: {
+                  $sum: {
+                    $multiply: [{ $ifNull: [{ $first: "$product.Price" }, 0] }, "$quantity"],
+                  },
+                },
+              },
+            },
+          ]),
+          loadBaseCurrencies(companyIds),
+        ]);
 
-      if (inventoryItems.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "inventory",
+        return slowByCompany.map(({ _id, itemCount, totalValue }) => ({
+          companyId: _id,
           title: "📦 מוצרים שלא נמכרו",
-          hours: 168,
-        });
-
-        if (!skip) {
-          const totalValue = inventoryItems.reduce((sum, item) => {
-            const price = item.productId?.Price || 0;
-            return sum + (price * item.quantity);
-          }, 0);
-
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "📦 מוצרים שלא נמכרו",
-            content: `יש \${inventoryItems.length} מוצרים במלאי שלא נמכרו כבר 3 חודשים. ערך משוער: \${totalValue.toLocaleString()} \${company.baseCurrency || "ILS"}`,
-            type: "Info",
-            category: "inventory",
-            priority: "low",
-            actionUrl: `/dashboard/Inventory`,
-            actionLabel: "צפה במלאי",
-            dedupe: { enabled: true, hours: 168 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} slow moving inventory notifications`);
+          content: `יש ${itemCount} מוצרים במלאי שלא נמכרו כבר 3 חודשים. ערך משוער: ${totalValue.toLocaleString()} ${currencies.get(_id.toString())}`,
+          type: "Info",
+          priority: "low",
+          actionUrl: `/dashboard/Inventory`,
+          actionLabel: "צפה במלאי",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkSlowMovingInventory:", error);
   }
@@ -4142,45 +3349,36 @@ export const checkSlowMovingInventory = async () => {
  */
 export const checkInventoryTransferPending = async () => {
   try {
-    console.log("🔍 Checking pending inventory transfers...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const twoDaysAgo = new Date(Date.now() - 2 * 24 * 60 * 60 * 1000);
-
-      // נבדוק רשומות ב-InventoryHistory עם סוג "transfer" שלא הושלם
-      const pendingTransfers = await InventoryHistory.find({
-        companyId: company._id,
-        movementType: "transfer",
-        createdAt: { $lt: twoDaysAgo },
-      }).populate("productId").limit(20);
-
-      if (pendingTransfers.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "inventory",
-          title: "⏳ העברות מלאי ממתינות",
-          hours: 24,
-        });
+    await runNotificationRule({
+      name: "checkInventoryTransferPending",
+      category: "inventory",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const twoDaysAgo = new Date(Date.now() - 2 * 24 * 60 * 60 * 1000);
+
+        // רשומות InventoryHistory מסוג "transfer" שלא הושלמו
+        const pendingByCompany = await InventoryHistory.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              movementType: "transfer",
+              createdAt: { $lt: twoDaysAgo },
+            },
+          },
+          { $group: { _id: "$companyId", transferCount: { $sum: 1 } } },
+        ]);
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "⏳ העברות מלאי ממתינות",
-            content: `יש \${pendingTransfers.length} העברות מלאי שלא הושלמו מעל יומיים`,
-            type: "Warning",
-            category: "inventory",
-            priority: "medium",
-            actionUrl: `/dashboard/Inventory`,
-            actionLabel: "צפה בהעברות",
-            dedupe: { enabled: true, hours: 24 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} pending inventory transfer notifications`);
+        return pendingByCompany.map(({ _id, transferCount }) => ({
+          companyId: _id,
+          title: "⏳ העברות מלאי ממתינות",
+          content: `יש ${transferCount} העברות מלאי שלא הושלמו מעל יומיים`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/Inventory`,
+          actionLabel: "צפה בהעברות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkInventoryTransferPending:", error);
   }
@@ -4191,46 +3389,34 @@ export const checkInventoryTransferPending = async () => {
  */
 export const checkInventoryLocationIssues = async () => {
   try {
-    console.log("🔍 Checking inventory location issues...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // בדיקת מלאי ללא מחסן או מיקום
-      const itemsWithoutLocation = await Inventory.find({
-        companyId: company._id,
-        quantity: { $gt: 0 },
-        $or: [
-          { warehouseId: { $exists: false } },
-          { warehouseId: null },
-        ],
-      }).populate("productId").limit(20);
+    await runNotificationRule({
+      name: "checkInventoryLocationIssues",
+      category: "inventory",
+      hours: 48,
+      collectAll: async (companyIds) => {
+        // מלאי ללא מחסן או מיקום
+        const withoutLocationByCompany = await Inventory.aggregate([
+          {
+            $match: {
+              companyId: { $in: companyIds },
+              quantity: { $gt: 0 },
+              $or: [{ warehouseId: { $exists: false } }, { warehouseId: null }],
+            },
+          },
+          { $group: { _id: "$companyId", itemCount: { $sum: 1 } } },
+        ]);
 
-      if (itemsWithoutLocation.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "inventory",
+        return withoutLocationByCompany.map(({ _id, itemCount }) => ({
+          companyId: _id,
           title: "📍 בעיות במיקומי מלאי",
-          hours: 48,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "📍 בעיות במיקומי מלאי",
-            content: `יש \${itemsWithoutLocation.length} פריטי מלאי ללא מיקום מחסן מוגדר`,
-            type: "Warning",
-            category: "inventory",
-            priority: "medium",
-            actionUrl: `/dashboard/Inventory`,
-            actionLabel: "צפה במלאי",
-            dedupe: { enabled: true, hours: 48 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} inventory location issues notifications`);
+          content: `יש ${itemCount} פריטי מלאי ללא מיקום מחסן מוגדר`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/Inventory`,
+          actionLabel: "צפה במלאי",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkInventoryLocationIssues:", error);
   }
@@ -4245,55 +3431,54 @@ export const checkInventoryLocationIssues = async () => {
  */
 export const checkCashFlowAlerts = async () => {
   try {
-    console.log("🔍 Checking cash flow alerts...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // חישוב מאזן חשבון
-      const allRecords = await Finance.find({
-        companyId: company._id,
-      });
-
-      let totalIncome = 0;
-      let totalExpense = 0;
-
-      for (const record of allRecords) {
-        if (record.transactionType === "Income") {
-          totalIncome += record.amount || 0;
-        } else if (record.transactionType === "Expense") {
-          totalExpense += record.amount || 0;
-        }
-      }
-
-      const cashFlow = totalIncome - totalExpense;
-      const minThreshold = 10000; // סף מינימום לדוגמה
+    const minThreshold = 10000; // סף מינימום לדוגמה
+
+    await runNotificationRule({
+      name: "checkCashFlowAlerts",
+      category: "finance",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        // מאזן הכנסות מול הוצאות לכל חברה באגרגציה אחת
+        const [balances, currencies] = await Promise.all([
+          Finance.aggregate([
+            { $match: { companyId: { $in: companyIds }, transactionType: { $in: ["Income", "Expense"] } } },
+            {
+              $group: {
+                _id: "$companyId",
+                cashFlow: {
+                  $sum: {
+                    $cond: [
+                      { $eq: ["$transactionType", "Income"] },
+                      { $ifNull: ["$transactionAmount", 0] },
+                      { $multiply: [{ $ifNull: ["$transactionAmount", 0] }, -1] },
+                    ],
+                  },
+                },
+              },
+            },
+          ]),
+          loadBaseCurrencies(companyIds),
+        ]);
+        const cashFlowByCompany = new Map(balances.map(({ _id, cashFlow }) => [_id.toString(), cashFlow]));
 
-      if (cashFlow < minThreshold) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "finance",
-          title: "💰 אזהרת תזרים מזומנים",
-          hours: 24,
-        });
+        const candidates = [];
+        for (const companyId of companyIds) {
+          const cashFlow = cashFlowByCompany.get(companyId.toString()) || 0;
+          if (cashFlow >= minThreshold) continue;
 
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
+          candidates.push({
+            companyId,
             title: "💰 אזהרת תזרים מזומנים",
-            content: `תזרים המזומנים נמוך: ${cashFlow.toLocaleString()} ${company.baseCurrency || "ILS"}. סף מינימום: ${minThreshold.toLocaleString()}`,
+            content: `תזרים המזומנים נמוך: ${cashFlow.toLocaleString()} ${currencies.get(companyId.toString())}. סף מינימום: ${minThreshold.toLocaleString()}`,
             type: cashFlow < 0 ? "Error" : "Warning",
-            category: "finance",
             priority: cashFlow < 0 ? "critical" : "high",
             actionUrl: `/dashboard/finance`,
             actionLabel: "צפה בכספים",
-            dedupe: { enabled: true, hours: 24 },
           });
-          totalNotifications++;
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} cash flow alert notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkCashFlowAlerts:", error);
   }
@@ -4304,47 +3489,34 @@ export const checkCashFlowAlerts = async () => {
  */
 export const checkLargeTransactions = async () => {
   try {
-    console.log("🔍 Checking large transactions...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const largeThreshold = 50000; // סף לעסקה גדולה
-      const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
-
-      const largeTransactions = await Finance.find({
-        companyId: company._id,
-        amount: { $gte: largeThreshold },
-        createdAt: { $gte: oneDayAgo },
-      }).limit(10);
-
-      for (const transaction of largeTransactions) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "finance",
+    const largeThreshold = 50000; // סף לעסקה גדולה
+
+    await runNotificationRule({
+      name: "checkLargeTransactions",
+      category: "finance",
+      hours: 24,
+      collect: async (companyId) => {
+        const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
+        const largeTransactions = await Finance.find({
+          companyId,
+          transactionAmount: { $gte: largeThreshold },
+          createdAt: { $gte: oneDayAgo },
+        })
+          .select("_id transactionAmount transactionCurrency transactionType transactionDescription")
+          .limit(10)
+          .lean();
+
+        return largeTransactions.map((transaction) => ({
           title: "💵 עסקה גדולה זוהתה",
+          content: `עסקה של ${transaction.transactionAmount.toLocaleString()} ${transaction.transactionCurrency} (${transaction.transactionType}) - ${transaction.transactionDescription || "ללא תיאור"}`,
+          type: "Info",
+          priority: "medium",
           relatedEntity: { entityType: "Finance", entityId: transaction._id.toString() },
-          hours: 24,
-        });
-
-        if (!skip) {
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "💵 עסקה גדולה זוהתה",
-            content: `עסקה של \${transaction.amount.toLocaleString()} \${transaction.currency} (\${transaction.transactionType}) - \${transaction.description || "ללא תיאור"}`,
-            type: "Info",
-            category: "finance",
-            priority: "medium",
-            relatedEntity: { entityType: "Finance", entityId: transaction._id.toString() },
-            actionUrl: `/dashboard/finance`,
-            actionLabel: "צפה בעסקה",
-            dedupe: { enabled: true, hours: 24 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} large transaction notifications`);
+          actionUrl: `/dashboard/finance`,
+          actionLabel: "צפה בעסקה",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkLargeTransactions:", error);
   }
@@ -4355,57 +3527,44 @@ export const checkLargeTransactions = async () => {
  */
 export const checkDuplicateFinanceRecords = async () => {
   try {
-    console.log("🔍 Checking duplicate finance records...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
-
-      const recentRecords = await Finance.find({
-        companyId: company._id,
-        createdAt: { $gte: oneDayAgo },
-      });
-
-      const duplicates = new Map();
-
-      for (const record of recentRecords) {
-        const key = `\${record.amount}_\${record.transactionType}_\${record.description || ""}_\${new Date(record.transactionDate).toDateString()}`;
-        if (duplicates.has(key)) {
-          duplicates.get(key).push(record);
-        } else {
-          duplicates.set(key, [record]);
-        }
-      }
-
-      for (const [key, records] of duplicates) {
-        if (records.length > 1) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "finance",
-            title: "⚠️ רשומות פיננסיות כפולות",
-            hours: 24,
-          });
+    await runNotificationRule({
+      name: "checkDuplicateFinanceRecords",
+      category: "finance",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
 
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ רשומות פיננסיות כפולות",
-              content: `זוהו \${records.length} רשומות זהות: \${records[0].amount} \${records[0].currency} - \${records[0].description || "ללא תיאור"}`,
-              type: "Warning",
-              category: "finance",
-              priority: "medium",
-              actionUrl: `/dashboard/finance`,
-              actionLabel: "צפה ברשומות",
-              dedupe: { enabled: true, hours: 24 },
-            });
-            totalNotifications++;
-            break; // רק התראה אחת לכל החברה
-          }
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} duplicate finance record notifications`);
+        // רשומות זהות (סכום, סוג, תיאור, יום) - קבוצה ראשונה לכל חברה
+        const duplicatesByCompany = await Finance.aggregate([
+          { $match: { companyId: { $in: companyIds }, createdAt: { $gte: oneDayAgo } } },
+          {
+            $group: {
+              _id: {
+                companyId: "$companyId",
+                amount: "$transactionAmount",
+                type: "$transactionType",
+                description: { $ifNull: ["$transactionDescription", ""] },
+                day: { $dateToString: { format: "%Y-%m-%d", date: "$transactionDate" } },
+              },
+              recordCount: { $sum: 1 },
+              currency: { $first: "$transactionCurrency" },
+            },
+          },
+          { $match: { recordCount: { $gt: 1 } } },
+          { $group: { _id: "$_id.companyId", duplicate: { $first: "$$ROOT" } } },
+        ]);
+
+        return duplicatesByCompany.map(({ _id, duplicate }) => ({
+          companyId: _id,
+          title: "⚠️ רשומות פיננסיות כפולות",
+          content: `זוהו ${duplicate.recordCount} רשומות זהות: ${duplicate._id.amount} ${duplicate.currency} - ${duplicate._id.description || "ללא תיאור"}`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/finance`,
+          actionLabel: "צפה ברשומות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkDuplicateFinanceRecords:", error);
   }
@@ -4416,54 +3575,45 @@ export const checkDuplicateFinanceRecords = async () => {
  */
 export const checkUnreconciledTransactions = async () => {
   try {
-    console.log("🔍 Checking unreconciled transactions...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
-
-      // נניח שיש שדה reconciled או isReconciled
-      const unreconciledRecords = await Finance.find({
-        companyId: company._id,
-        createdAt: { $lt: sevenDaysAgo },
-        // נניח שיש שדה reconciled
-      }).limit(50);
-
-      // אם אין שדה reconciled, נדלג על הפונקציה
-      const hasReconciledField = unreconciledRecords.length > 0 && unreconciledRecords[0].hasOwnProperty("reconciled");
-
-      if (hasReconciledField) {
-        const unreconciled = unreconciledRecords.filter(r => !r.reconciled);
-
-        if (unreconciled.length > 0) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "finance",
-            title: "🏦 עסקאות שלא הותאמו",
-            hours: 168,
-          });
-
-          if (!skip) {
-            const totalAmount = unreconciled.reduce((sum, r) => sum + (r.amount || 0), 0);
-
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "🏦 עסקאות שלא הותאמו",
-              content: `יש \${unreconciled.length} עסקאות מעל שבוע שלא הותאמו. סה"כ: \${totalAmount.toLocaleString()} \${company.baseCurrency || "ILS"}`,
-              type: "Warning",
-              category: "finance",
-              priority: "medium",
-              actionUrl: `/dashboard/finance`,
-              actionLabel: "צפה בעסקאות",
-              dedupe: { enabled: true, hours: 168 },
-            });
-            totalNotifications++;
-          }
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} unreconciled transaction notifications`);
+    await runNotificationRule({
+      name: "checkUnreconciledTransactions",
+      category: "finance",
+      hours: 168,
+      collectAll: async (companyIds) => {
+        const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
+
+        // רק רשומות שיש בהן שדה reconciled והוא false
+        const [unreconciledByCompany, currencies] = await Promise.all([
+          Finance.aggregate([
+            {
+              $match: {
+                companyId: { $in: companyIds },
+                createdAt: { $lt: sevenDaysAgo },
+                reconciled: false,
+              },
+            },
+            {
+              $group: {
+                _id: "$companyId",
+                recordCount: { $sum: 1 },
+                totalAmount: { $sum: { $ifNull: ["$transactionAmount", 0] } },
+              },
+            },
+          ]),
+          loadBaseCurrencies(companyIds),
+        ]);
+
+        return unreconciledByCompany.map(({ _id, recordCount, totalAmount }) => ({
+          companyId: _id,
+          title: "🏦 עסקאות שלא הותאמו",
+          content: `יש ${recordCount} עסקאות מעל שבוע שלא הותאמו. סה"כ: ${totalAmount.toLocaleString()} ${currencies.get(_id.toString())}`,
+          type: "Warning",
+          priority: "medium",
+          actionUrl: `/dashboard/finance`,
+          actionLabel: "צפה בעסקאות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkUnreconciledTransactions:", error);
   }
@@ -4478,48 +3628,43 @@ export const checkUnreconciledTransactions = async () => {
  */
 export const checkProcurementApprovalDeadline = async () => {
   try {
-    console.log("🔍 Checking procurement approval deadlines...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
-
-      const pendingApproval = await Procurement.find({
-        companyId: company._id,
-        approvalStatus: "Pending Approval",
-        createdAt: { $lt: threeDaysAgo },
-      }).populate("supplierId").limit(20);
-
-      if (pendingApproval.length > 0) {
-        const skip = await shouldSkipNotification({
-          companyId: company._id,
-          category: "procurement",
-          title: "⏰ הזמנות רכש ממתינות לאישור",
-          hours: 24,
-        });
-
-        if (!skip) {
-          const totalAmount = pendingApproval.reduce((sum, proc) => {
-            return sum + (proc.products?.reduce((pSum, p) => pSum + (p.total || 0), 0) || 0);
-          }, 0);
+    await runNotificationRule({
+      name: "checkProcurementApprovalDeadline",
+      category: "procurement",
+      hours: 24,
+      collectAll: async (companyIds) => {
+        const threeDaysAgo = new Date(Date.now() - 3 * 24 * 60 * 60 * 1000);
+        const [pendingByCompany, currencies] = await Promise.all([
+          Procurement.aggregate([
+            {
+              $match: {
+                companyId: { $in: companyIds },
+                approvalStatus: "Pending Approval",
+                createdAt: { $lt: threeDaysAgo },
+              },
+            },
+            {
+              $group: {
+                _id: "$companyId",
+                procurementCount: { $sum: 1 },
+                totalAmount: { $sum: { $sum: "$products.total" } },
+              },
+            },
+          ]),
+          loadBaseCurrencies(companyIds),
+        ]);
 
-          await notifyAdminsAndManagers({
-            companyId: company._id,
-            title: "⏰ הזמנות רכש ממתינות לאישור",
-            content: `יש \${pendingApproval.length} הזמנות רכש ממתינות לאישור מעל 3 ימים. סה"כ: \${totalAmount.toLocaleString()} \${company.baseCurrency || "ILS"}`,
-            type: "Warning",
-            category: "procurement",
-            priority: "high",
-            actionUrl: `/dashboard/procurement`,
-            actionLabel: "צפה בהזמנות",
-            dedupe: { enabled: true, hours: 24 },
-          });
-          totalNotifications++;
-        }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} procurement approval deadline notifications`);
+        return pendingByCompany.map(({ _id, procurementCount, totalAmount }) => ({
+          companyId: _id,
+          title: "⏰ הזמנות רכש ממתינות לאישור",
+          content: `יש ${procurementCount} הזמנות רכש ממתינות לאישור מעל 3 ימים. סה"כ: ${totalAmount.toLocaleString()} ${currencies.get(_id.toString())}`,
+          type: "Warning",
+          priority: "high",
+          actionUrl: `/dashboard/procurement`,
+          actionLabel: "צפה בהזמנות",
+        }));
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkProcurementApprovalDeadline:", error);
   }
@@ -4530,50 +3675,40 @@ export const checkProcurementApprovalDeadline = async () => {
  */
 export const checkSupplierInvoiceMismatch = async () => {
   try {
-    console.log("🔍 Checking supplier invoice mismatches...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      // נניח שיש שדה supplierInvoiceAmount או שנוכל להשוות
-      const deliveredProcurements = await Procurement.find({
-        companyId: company._id,
-        orderStatus: "Delivered",
-        paymentStatus: { $ne: "Paid" },
-      }).populate("supplierId").limit(20);
-
-      for (const procurement of deliveredProcurements) {
-        const expectedTotal = procurement.products?.reduce((sum, p) => sum + (p.total || 0), 0) || 0;
-        
-        // אם יש שדה supplierInvoiceAmount ויש אי-התאמה
-        if (procurement.supplierInvoiceAmount && Math.abs(procurement.supplierInvoiceAmount - expectedTotal) > 0.01) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "procurement",
+    await runNotificationRule({
+      name: "checkSupplierInvoiceMismatch",
+      category: "procurement",
+      hours: 48,
+      collectAll: async (companyIds) => {
+        // הזמנות שסופקו ויש להן סכום חשבונית ספק
+        const deliveredProcurements = await Procurement.find({
+          companyId: { $in: companyIds },
+          orderStatus: "Delivered",
+          paymentStatus: { $ne: "Paid" },
+          supplierInvoiceAmount: { $gt: 0 },
+        })
+          .select("_id companyId PurchaseOrder products.total supplierInvoiceAmount")
+          .lean();
+
+        const candidates = [];
+        for (const procurement of deliveredProcurements) {
+          const expectedTotal = procurement.products?.reduce((sum, p) => sum + (p.total || 0), 0) || 0;
+          if (Math.abs(procurement.supplierInvoiceAmount - expectedTotal) <= 0.01) continue;
+
+          candidates.push({
+            companyId: procurement.companyId,
             title: "⚠️ אי-התאמה בחשבונית ספק",
+            content: `הזמנת רכש ${procurement.PurchaseOrder}: סכום צפוי ${expectedTotal.toLocaleString()} vs חשבונית ספק ${procurement.supplierInvoiceAmount.toLocaleString()}`,
+            type: "Warning",
+            priority: "high",
             relatedEntity: { entityType: "PurchaseOrder", entityId: procurement._id.toString() },
-            hours: 48,
+            actionUrl: `/dashboard/procurement/${procurement._id}`,
+            actionLabel: "צפה בהזמנה",
           });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ אי-התאמה בחשבונית ספק",
-              content: `הזמנת רכש \${procurement.PurchaseOrder}: סכום צפוי \${expectedTotal.toLocaleString()} vs חשבונית ספק \${procurement.supplierInvoiceAmount.toLocaleString()}`,
-              type: "Warning",
-              category: "procurement",
-              priority: "high",
-              relatedEntity: { entityType: "PurchaseOrder", entityId: procurement._id.toString() },
-              actionUrl: `/dashboard/procurement/\${procurement._id}`,
-              actionLabel: "צפה בהזמנה",
-              dedupe: { enabled: true, hours: 48 },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} supplier invoice mismatch notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkSupplierInvoiceMismatch:", error);
   }
@@ -4584,59 +3719,43 @@ export const checkSupplierInvoiceMismatch = async () => {
  */
 export const checkProcurementQualityIssues = async () => {
   try {
-    console.log("🔍 Checking procurement quality issues...");
-    const companies = await Company.find();
-    let totalNotifications = 0;
-
-    for (const company of companies) {
-      const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
-
-      const recentProcurements = await Procurement.find({
-        companyId: company._id,
-        orderStatus: "Delivered",
-        deliveryDate: { $gte: sevenDaysAgo },
-      }).populate("supplierId");
-
-      for (const procurement of recentProcurements) {
-        let hasQualityIssue = false;
-        let issueDescription = [];
-
-        // בדיקת כמות שהתקבלה לעומת כמות שהוזמנה
-        for (const product of procurement.products || []) {
-          if (product.receivedQuantity < product.quantity) {
-            hasQualityIssue = true;
-            issueDescription.push(`\${product.productName}: הוזמן \${product.quantity}, התקבל \${product.receivedQuantity}`);
-          }
-        }
-
-        if (hasQualityIssue) {
-          const skip = await shouldSkipNotification({
-            companyId: company._id,
-            category: "procurement",
+    await runNotificationRule({
+      name: "checkProcurementQualityIssues",
+      category: "procurement",
+      hours: 48,
+      collectAll: async (companyIds) => {
+        const sevenDaysAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000);
+        const recentProcurements = await Procurement.find({
+          companyId: { $in: companyIds },
+          orderStatus: "Delivered",
+          deliveryDate: { $gte: sevenDaysAgo },
+        })
+          .select("_id companyId PurchaseOrder products supplierId")
+          .populate("supplierId", "SupplierName")
+          .lean();
+
+        const candidates = [];
+        for (const procurement of recentProcurements) {
+          // כמות שהתקבלה לעומת כמות שהוזמנה
+          const issueDescription = (procurement.products || [])
+            .filter((product) => product.receivedQuantity < product.quantity)
+            .map((product) => `${product.productName}: הוזמן ${product.quantity}, התקבל ${product.receivedQuantity}`);
+          if (issueDescription.length === 0) continue;
+
+          candidates.push({
+            companyId: procurement.companyId,
             title: "⚠️ בעיית איכות ברכש",
+            content: `הזמנת רכש ${procurement.PurchaseOrder} מספק "${procurement.supplierId?.SupplierName || "לא ידוע"}": ${issueDescription.join(", ")}`,
+            type: "Warning",
+            priority: "high",
             relatedEntity: { entityType: "PurchaseOrder", entityId: procurement._id.toString() },
-            hours: 48,
+            actionUrl: `/dashboard/procurement/${procurement._id}`,
+            actionLabel: "צפה בהזמנה",
           });
-
-          if (!skip) {
-            await notifyAdminsAndManagers({
-              companyId: company._id,
-              title: "⚠️ בעיית איכות ברכש",
-              content: `הזמנת רכש \${procurement.PurchaseOrder} מספק "\${procurement.supplierId?.SupplierName || "לא ידוע"}": \${issueDescription.join(", ")}`,
-              type: "Warning",
-              category: "procurement",
-              priority: "high",
-              relatedEntity: { entityType: "PurchaseOrder", entityId: procurement._id.toString() },
-              actionUrl: `/dashboard/procurement/\${procurement._id}`,
-              actionLabel: "צפה בהזמנה",
-              dedupe: { enabled: true, hours: 48 },
-            });
-            totalNotifications++;
-          }
         }
-      }
-    }
-    console.log(`✅ Created \${totalNotifications} procurement quality issue notifications`);
+        return candidates;
+      },
+    });
   } catch (error) {
     console.error("❌ Error in checkProcurementQualityIssues:", error);
   }
@@ -4653,54 +3772,54 @@ export const checkBirthdays = async () => {
   try {
     console.log("🎂 Checking birthdays...");
     const today = new Date();
-    const todayMonth = today.getMonth() + 1; // 1-12
-    const todayDay = today.getDate();
-
-    const companies = await Company.find();
+    const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
     let totalEmails = 0;
 
-    for (const company of companies) {
+    await forEachCompany(async (companyId) => {
+      // רק העובדים שיום ההולדת שלהם היום (לפי אזור הזמן של השרת)
       const employees = await Employee.find({
-        companyId: company._id,
+        companyId,
         status: "active",
         dateOfBirth: { $exists: true, $ne: null },
-      });
+        $expr: {
+          $and: [
+            { $eq: [{ $month: { date: "$dateOfBirth", timezone } }, today.getMonth() + 1] },
+            { $eq: [{ $dayOfMonth: { date: "$dateOfBirth", timezone } }, today.getDate()] },
+          ],
+        },
+      })
+        .select("_id name lastName email profileImage")
+        .lean();
+      if (employees.length === 0) return;
 
+      const company = await Company.findById(companyId).select("name").lean();
       for (const employee of employees) {
-        if (employee.dateOfBirth) {
-          const birthDate = new Date(employee.dateOfBirth);
-          const birthMonth = birthDate.getMonth() + 1;
-          const birthDay = birthDate.getDate();
-
-          if (birthMonth === todayMonth && birthDay === todayDay) {
-            try {
-              await sendBirthdayEmail(
-                employee.email,
-                `${employee.name} ${employee.lastName || ""}`.trim(),
-                company.name,
-                employee.profileImage
-              );
-              
-              // יצירת התראה במערכת
-              await createNotification({
-                companyId: company._id,
-                employeeId: employee._id,
-                title: "🎉 יום הולדת שמח!",
-                content: `יום הולדת שמח ל-${employee.name}!`,
-                type: "Success",
-                category: "hr",
-                priority: "low",
-              });
-              
-              totalEmails++;
-              console.log(`✅ Birthday email sent to ${employee.email}`);
-            } catch (error) {
-              console.error(`❌ Error sending birthday email to ${employee.email}:`, error.message);
-            }
-          }
+        try {
+          await sendBirthdayEmail(
+            employee.email,
+            `${employee.name} ${employee.lastName || ""}`.trim(),
+            company?.name,
+            employee.profileImage
+          );
+
+          // יצירת התראה במערכת
+          await createNotification({
+            companyId,
+            employeeId: employee._id,
+            title: "🎉 יום הולדת שמח!",
+            content: `יום הולדת שמח ל-${employee.name}!`,
+            type: "Success",
+            category: "hr",
+            priority: "low",
+          });
+
+          totalEmails++;
+          console.log(`✅ Birthday email sent to ${employee.email}`);
+        } catch (error) {
+          console.error(`❌ Error sending birthday email to ${employee.email}:`, error.message);
         }
       }
-    }
+    });
     console.log(`✅ Sent ${totalEmails} birthday emails`);
   } catch (error) {
     console.error("❌ Error in checkBirthdays:", error);
@@ -4723,84 +3842,72 @@ export const sendMonthlyCashFlowSummaryToAdmins = async () => {
       return;
     }
 
-    const companies = await Company.find();
+    const monthStart = new Date(year, month - 1, 1);
     let totalEmails = 0;
 
-    for (const company of companies) {
-      const allRecords = await Finance.find({
-        companyId: company._id,
-        createdAt: {
-          $gte: new Date(year, month - 1, 1),
-          $lt: new Date(year, month, 1),
-        },
-      });
-
-      let totalIncome = 0;
-      let totalExpense = 0;
-
-      for (const record of allRecords) {
-        if (record.transactionType === "Income") {
-          totalIncome += record.amount || 0;
-        } else if (record.transactionType === "Expense") {
-          totalExpense += record.amount || 0;
-        }
-      }
-
+    await forEachCompany(async (companyId) => {
+      // החודש שעבר והחודש שלפניו (להשוואה) באגרגציה אחת
+      const [totals, company, adminsAndManagers] = await Promise.all([
+        Finance.aggregate([
+          {
+            $match: {
+              companyId,
+              transactionType: { $in: ["Income", "Expense"] },
+              createdAt: { $gte: new Date(year, month - 2, 1), $lt: new Date(year, month, 1) },
+            },
+          },
+          {
+            $group: {
+              _id: {
+                current: { $gte: ["$createdAt", monthStart] },
+                type: "$transactionType",
+              },
+              total: { $sum: { $ifNull: ["$transactionAmount", 0] } },
+            },
+          },
+        ]),
+        Company.findById(companyId).select("name baseCurrency").lean(),
+        Employee.find({
+          companyId,
+          role: { $in: ["Admin", "Manager"] },
+          status: "active",
+        })
+          .select("email")
+          .lean(),
+      ]);
+
+      const sumOf = (current, type) =>
+        totals.find(({ _id }) => _id.current === current && _id.type === type)?.total || 0;
+      const totalIncome = sumOf(true, "Income");
+      const totalExpense = sumOf(true, "Expense");
       const netCashFlow = totalIncome - totalExpense;
-
-      // חישוב החודש הקודם להשוואה
-      const previousMonthRecords = await Finance.find({
-        companyId: company._id,
-        createdAt: {
-          $gte: new Date(year, month - 2, 1),
-          $lt: new Date(year, month - 1, 1),
-        },
-      });
-
-      let prevIncome = 0;
-      let prevExpense = 0;
-      for (const record of previousMonthRecords) {
-        if (record.transactionType === "Income") {
-          prevIncome += record.amount || 0;
-        } else if (record.transactionType === "Expense") {
-          prevExpense += record.amount || 0;
-        }
-      }
-
-      const previousMonthFlow = prevIncome - prevExpense;
-      const trend = netCashFlow - previousMonthFlow;
+      const previousMonthFlow = sumOf(false, "Income") - sumOf(false, "Expense");
 
       const cashFlowData = {
         totalIncome,
         totalExpense,
         netCashFlow,
         previousMonthFlow,
-        trend,
+        trend: netCashFlow - previousMonthFlow,
       };
 
       // שליחה לכל המנהלים והמנהלים
-      const adminsAndManagers = await Employee.find({
-        companyId: company._id,
-        role: { $in: ["Admin", "Manager"] },
-        status: "active",
-      });
-
       for (const admin of adminsAndManagers) {
         try {
           await sendMonthlyCashFlowSummary(
             admin.email,
-            company.name,
+            company?.name,
             month,
             year,
             cashFlowData,
-            company.baseCurrency || "ILS"
+            company?.baseCurrency || "ILS"
           );
           totalEmails++;
         } catch (error) {
           console.error(`❌ Error sending cash flow summary to ${admin.email}:`, error.message);
         }
       }
-    }
+    });
     console.log(`✅ Sent ${totalEmails} monthly cash flow summary emails`);
   } catch (error) {
     console.error("❌ Error in sendMonthlyCashFlowSummaryToAdmins:", error);
@@ -4825,136 +3932,88 @@ export const sendWeeklySummaryToAdmins = async () => {
     weekEnd.setDate(today.getDate() - 1); // אתמול (שבת)
     const weekStart = new Date(weekEnd);
     weekStart.setDate(weekEnd.getDate() - 6); // שבוע לפני
+    const previousWeekStart = new Date(weekStart);
+    previousWeekStart.setDate(previousWeekStart.getDate() - 7);
+    const previousWeekEnd = new Date(weekEnd);
+    previousWeekEnd.setDate(previousWeekEnd.getDate() - 7);
+    const thisWeek = { $gte: weekStart, $lte: weekEnd };
 
-    const companies = await Company.find();
     let totalEmails = 0;
 
-    for (const company of companies) {
-      // מכירות
-      const salesOrders = await CustomerOrder.find({
-        companyId: company._id,
-        orderDate: {
-          $gte: weekStart,
-          $lte: weekEnd,
-        },
-      });
-
-      const totalSales = salesOrders.reduce((sum, order) => sum + (order.orderTotal || 0), 0);
-      const previousWeekStart = new Date(weekStart);
-      previousWeekStart.setDate(previousWeekStart.getDate() - 7);
-      const previousWeekEnd = new Date(weekEnd);
-      previousWeekEnd.setDate(previousWeekEnd.getDate() - 7);
-
-      const previousWeekOrders = await CustomerOrder.find({
-        companyId: company._id,
-        orderDate: {
-          $gte: previousWeekStart,
-          $lte: previousWeekEnd,
-        },
-      });
-
-      const previousWeekSales = previousWeekOrders.reduce((sum, order) => sum + (order.orderTotal || 0), 0);
-      const salesGrowth = previousWeekSales > 0 ? ((totalSales - previousWeekSales) / previousWeekSales) * 100 : 0;
-
-      const sales = {
-        totalSales,
-        totalOrders: salesOrders.length,
-        averageOrderValue: salesOrders.length > 0 ? totalSales / salesOrders.length : 0,
-        growth: salesGrowth,
-        currency: company.baseCurrency || "ILS",
-      };
-
-      // פרויקטים
-      const activeProjects = await Project.find({
-        companyId: company._id,
-        status: { $in: ["In Progress", "Active"] },
-      }).countDocuments();
-
-      const completedProjects = await Project.find({
-        companyId: company._id,
-        status: "Completed",
-        updatedAt: {
-          $gte: weekStart,
-          $lte: weekEnd,
-        },
-      }).countDocuments();
-
-      const newProjects = await Project.find({
-        companyId: company._id,
-        createdAt: {
-          $gte: weekStart,
-          $lte: weekEnd,
-        },
-      }).countDocuments();
-
-      const overdueProjects = await Project.find({
-        companyId: company._id,
-        status: { $in: ["In Progress", "Active"] },
-        dueDate: { $lt: today },
-      }).countDocuments();
-
-      const projects = {
+    await forEachCompany(async (companyId) => {
+      const sumOrders = (orderDate) =>
+        CustomerOrder.aggregate([
+          { $match: { companyId, orderDate } },
+          { $group: { _id: null, total: { $sum: { $ifNull: ["$orderTotal", 0] } }, count: { $sum: 1 } } },
+        ]).then(([result]) => result || { total: 0, count: 0 });
+
+      // כל המדדים של החברה במקביל
+      const [
+        company,
+        salesThisWeek,
+        salesPreviousWeek,
         activeProjects,
         completedProjects,
         newProjects,
         overdueProjects,
-      };
+        newOrders,
+        inProgressOrders,
+        completedOrders,
+        adminsAndManagers,
+      ] = await Promise.all([
+        Company.findById(companyId).select("name baseCurrency").lean(),
+        sumOrders(thisWeek),
+        sumOrders({ $gte: previousWeekStart, $lte: previousWeekEnd }),
+        Project.countDocuments({ companyId, status: { $in: ["In Progress", "Active"] } }),
+        Project.countDocuments({ companyId, status: "Completed", updatedAt: thisWeek }),
+        Project.countDocuments({ companyId, createdAt: thisWeek }),
+        Project.countDocuments({ companyId, status: { $in: ["In Progress", "Active"] }, dueDate: { $lt: today } }),
+        CustomerOrder.countDocuments({ companyId, createdAt: thisWeek }),
+        CustomerOrder.countDocuments({ companyId, status: { $in: ["Processing", "In Progress"] } }),
+        CustomerOrder.countDocuments({ companyId, status: "Completed", updatedAt: thisWeek }),
+        Employee.find({ companyId, role: { $in: ["Admin", "Manager"] }, status: "active" })
+          .select("email")
+          .lean(),
+      ]);
+
+      const currency = company?.baseCurrency || "ILS";
+      const totalSales = salesThisWeek.total;
+      const previousWeekSales = salesPreviousWeek.total;
+      const salesGrowth = previousWeekSales > 0 ? ((totalSales - previousWeekSales) / previousWeekSales) * 100 : 0;
 
-      // הזמנות
-      const newOrders = await CustomerOrder.find({
-        companyId: company._id,
-        createdAt: {
-          $gte: weekStart,
-          $lte: weekEnd,
+      const summaryData = {
+        sales: {
+          totalSales,
+          totalOrders: salesThisWeek.count,
+          averageOrderValue: salesThisWeek.count > 0 ? totalSales / salesThisWeek.count : 0,
+          growth: salesGrowth,
+          currency,
         },
-      }).countDocuments();
-
-      const inProgressOrders = await CustomerOrder.find({
-        companyId: company._id,
-        status: { $in: ["Processing", "In Progress"] },
-      }).countDocuments();
-
-      const completedOrders = await CustomerOrder.find({
-        companyId: company._id,
-        status: "Completed",
-        updatedAt: {
-          $gte: weekStart,
-          $lte: weekEnd,
+        projects: {
+          activeProjects,
+          completedProjects,
+          newProjects,
+          overdueProjects,
+        },
+        orders: {
+          newOrders,
+          inProgress: inProgressOrders,
+          completed: completedOrders,
+          totalValue: totalSales,
+          currency,
         },
-      }).countDocuments();
-
-      const orders = {
-        newOrders,
-        inProgress: inProgressOrders,
-        completed: completedOrders,
-        totalValue: totalSales,
-        currency: company.baseCurrency || "ILS",
       };
 
-      const summaryData = { sales, projects, orders };
-
       // שליחה לכל המנהלים והמנהלים
-      const adminsAndManagers = await Employee.find({
-        companyId: company._id,
-        role: { $in: ["Admin", "Manager"] },
-        status: "active",
-      });
-
       for (const admin of adminsAndManagers) {
         try {
-          await sendWeeklySummaryEmail(
-            admin.email,
-            company.name,
-            weekStart,
-            weekEnd,
-            summaryData
-          );
+          await sendWeeklySummaryEmail(admin.email, company?.name, weekStart, weekEnd, summaryData);
           totalEmails++;
         } catch (error) {
           console.error(`❌ Error sending weekly summary to ${admin.email}:`, error.message);
         }
       }
-    }
+    });
     console.log(`✅ Sent ${totalEmails} weekly summary emails`);
   } catch (error) {
     console.error("❌ Error in sendWeeklySummaryToAdmins:", error);
@@ -17,9 +17,8 @@ import {
 } from "../emails/emailService.js";
 import { transporter } from "../config/lib/nodemailer.js";
 import { createPaymentInvoiceEmail } from "../emails/emailHandlers.js";
-import { launchBrowser } from "../config/lib/browser.js";
+import { renderPdf } from "../config/lib/browserPool.js";
 import { getFrontendUrl, getApiUrl } from "../utils/appUrls.js";
-import cron from "node-cron";
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
@@ -246,18 +245,7 @@ const sendPaymentInvoiceEmail = async (company, invoice) => {
     try {
       const html = await generateInvoiceHTMLForPayment(invoice);
       
-      const browser = await launchBrowser();
-      
-      const page = await browser.newPage();
-      await page.setContent(html, { waitUntil: 'networkidle0' });
-      
-      pdfBuffer = await page.pdf({
-        format: 'A4',
-        printBackground: true,
-        margin: { top: '20px', right: '20px', bottom: '20px', left: '20px' }
-      });
-      
-      await browser.close();
+      pdfBuffer = await renderPdf(html);
       console.log(`✅ PDF buffer generated successfully (${pdfBuffer.length} bytes)`);
     } catch (pdfError) {
       console.error("❌ Error generating PDF buffer, sending email without attachment:", pdfError.message);
@@ -970,7 +958,7 @@ export const pauseCompanySubscription = async (req, res) => {
   }
 };
 
-const checkAndNotifySubscriptionsEndingSoon = async () => {
+export const checkAndNotifySubscriptionsEndingSoon = async () => {
   try {
     console.log("Starting subscription ending check...");
 
@@ -1063,11 +1051,6 @@ const checkAndNotifySubscriptionsEndingSoon = async () => {
   }
 };
 
-// תזמון הרצה כל שעה
-cron.schedule("0 * * * *", async () => {
-  await checkAndNotifySubscriptionsEndingSoon();
-});
-
 /**
  * Handle Stripe Webhook Events
  * This is critical for tracking recurring payments
@@ -1366,11 +1349,6 @@ export const syncSubscriptionsWithStripe = async () => {
   }
 };
 
-// Schedule daily sync at 2 AM
-cron.schedule("0 2 * * *", async () => {
-  await syncSubscriptionsWithStripe();
-});
-
 export const updateCompanyPlanFromAdmin = async (req, res) => {
   try {
     const { plan_name, duration, companyId } = req.body;
@@ -1,11 +1,17 @@
 import Salary from "../models/salary.model.js";
 import Employee from "../models/employees.model.js";
-import Shift from "../models/Shifts.model.js";
-import TaxConfig from "../models/TaxConfig.model.js";
 import Company from "../models/companies.model.js";
 import Finance from "../models/finance.model.js";
 import mongoose from "mongoose";
 import jwt from "jsonwebtoken";
+import {
+  startPayrollRun,
+  waitForPayrollRun,
+  getPayrollRun,
+  getLatestPayrollRun,
+  formatRunProgress,
+  formatRunErrors,
+} from "../services/payrollEngine.service.js";
 
 // Get automation settings
 export const getAutomationSettings = async (req, res) => {
@@ -84,6 +90,57 @@ export const updateAutomationSettings = async (req, res) => {
   }
 };
 
+// כמה זמן בקשת HTTP ממתינה לסיום הריצה לפני שהיא עוברת לרקע (202)
+const PAYROLL_SYNC_WAIT_MS = Number(process.env.PAYROLL_SYNC_WAIT_MS) || 20 * 1000;
+
+// תגובה אחידה לריצת שכר: תוצאה מלאה אם הסתיימה בזמן, אחרת 202 עם התקדמות
+const respondWithPayrollRun = async (res, started, { countKey, successMessage }) => {
+  if (!started.run) {
+    return res.json({
+      success: true,
+      message: successMessage(0),
+      data: { [countKey]: 0 },
+    });
+  }
+
+  if (started.conflict) {
+    return res.status(409).json({
+      success: false,
+      message: "ריצת שכר אחרת לחודש זה כבר מתבצעת",
+      data: { run: formatRunProgress(started.run) },
+    });
+  }
+
+  const finished = await waitForPayrollRun(started.completion, PAYROLL_SYNC_WAIT_MS);
+
+  if (finished?.status === "completed") {
+    return res.json({
+      success: true,
+      message: successMessage(finished.succeeded),
+      data: {
+        [countKey]: finished.succeeded,
+        errors: formatRunErrors(finished),
+        run: formatRunProgress(finished),
+      },
+    });
+  }
+
+  if (finished?.status === "failed") {
+    return res.status(500).json({
+      success: false,
+      message: finished.failureReason || "חישוב המשכורות נכשל",
+      data: { run: formatRunProgress(finished) },
+    });
+  }
+
+  const current = await getPayrollRun(started.run._id);
+  res.status(202).json({
+    success: true,
+    message: "חישוב המשכורות ממשיך ברקע - ההתקדמות מוצגת בסטטיסטיקות השכר",
+    data: { run: formatRunProgress(current || started.run) },
+  });
+};
+
 // Calculate salaries for a month
 export const calculateSalariesForMonth = async (req, res) => {
   try {
@@ -103,172 +160,17 @@ export const calculateSalariesForMonth = async (req, res) => {
       });
     }
 
-    // Calculate period dates
-    const periodStart = new Date(year, month - 1, 1);
-    const periodEnd = new Date(year, month, 0);
-
-    // Get all active employees
-    const employees = await Employee.find({
+    const started = await startPayrollRun({
       companyId,
-      status: "active",
-      deletedAt: { $exists: false },
+      year: Number(year),
+      month: Number(month),
+      mode: "calculate",
+      startedBy: decodedToken.employeeId || decodedToken.userId,
     });
 
-    let calculatedCount = 0;
-    const errors = [];
-
-    for (const employee of employees) {
-      try {
-        // Get all shifts for this employee in this period
-        const shifts = await Shift.find({
-          companyId,
-          employeeId: employee._id,
-          shiftDate: {
-            $gte: periodStart,
-            $lte: periodEnd,
-          },
-        });
-
-        if (shifts.length === 0) {
-          continue; // Skip employees with no shifts
-        }
-
-        // Calculate total hours and pay from shifts
-        let totalHours = 0;
-        let totalPay = 0;
-
-        shifts.forEach((shift) => {
-          totalHours += shift.hoursWorked || 0;
-          totalPay += shift.totalPay || 0;
-        });
-
-        // Get tax config from automation settings (required)
-        const company = await Company.findById(companyId);
-        let taxConfig = null;
-        
-        if (company?.payrollAutomationSettings?.defaultTaxConfigId) {
-          taxConfig = await TaxConfig.findOne({
-            _id: company.payrollAutomationSettings.defaultTaxConfigId,
-            companyId,
-            isActive: true,
-          });
-        }
-        
-        // If no tax config found, skip this employee with error
-        if (!taxConfig) {
-          errors.push({
-            employeeId: employee._id,
-            employeeName: `${employee.name} ${employee.lastName}`,
-            error: "תצורת מס לא נמצאה בהגדרות האוטומציה",
-          });
-          continue;
-        }
-
-        let taxDeduction = 0;
-        let otherDeductions = [];
-
-        if (taxConfig && taxConfig.taxBrackets && taxConfig.taxBrackets.length > 0) {
-          // Calculate income tax
-          const taxableIncome = Number(totalPay);
-          let previousLimit = 0;
-
-          // Sort brackets by limit
-          const sortedBrackets = [...taxConfig.taxBrackets].sort((a, b) => a.limit - b.limit);
-
-          for (const bracket of sortedBrackets) {
-            if (taxableIncome > previousLimit) {
-              const taxableInBracket = Math.min(taxableIncome, bracket.limit) - previousLimit;
-              if (taxableInBracket > 0) {
-                // Rate is stored as decimal (0.10 = 10%, max is 1.0)
-                // If rate > 1, it means it's stored as percentage (10 = 10%), so divide by 100
-                const rate = bracket.rate > 1 ? bracket.rate / 100 : bracket.rate;
-                const bracketTax = taxableInBracket * rate;
-                taxDeduction += bracketTax;
-              }
-            }
-            previousLimit = bracket.limit;
-          }
-
-          // Calculate other taxes
-          if (taxConfig.otherTaxes && taxConfig.otherTaxes.length > 0) {
-            taxConfig.otherTaxes.forEach((tax) => {
-              // If rate > 1, it means it's stored as percentage, so divide by 100
-              const rate = tax.rate > 1 ? tax.rate / 100 : tax.rate;
-              const amount = tax.fixedAmount || (taxableIncome * rate);
-              if (amount > 0) {
-                otherDeductions.push({
-                  description: tax.name,
-                  amount: parseFloat(Number(amount).toFixed(2)),
-                });
-              }
-            });
-          }
-        }
-
-        // Calculate net pay
-        const totalOtherDeductions = otherDeductions.reduce((sum, d) => sum + Number(d.amount || 0), 0);
-        const calculatedNetPay = Number(totalPay) - Number(taxDeduction) - Number(totalOtherDeductions);
-        const netPay = Math.max(0, calculatedNetPay);
-
-        console.log(`[Payroll Calculation] Employee: ${employee.name} ${employee.lastName}`);
-        console.log(`  Total Pay: ${totalPay}, Tax: ${taxDeduction}, Other Deductions: ${totalOtherDeductions}, Net: ${netPay}`);
-
-        // Check if salary already exists
-        let salary = await Salary.findOne({
-          companyId,
-          employeeId: employee._id,
-          periodStart: {
-            $gte: new Date(year, month - 1, 1),
-            $lt: new Date(year, month, 1),
-          },
-        });
-
-        if (salary) {
-          // Update existing salary
-          salary.totalHours = parseFloat(Number(totalHours).toFixed(2));
-          salary.totalPay = parseFloat(Number(totalPay).toFixed(2));
-          salary.taxDeduction = parseFloat(Number(taxDeduction).toFixed(2));
-          salary.otherDeductions = otherDeductions;
-          salary.netPay = parseFloat(Number(netPay).toFixed(2));
-          salary.status = "Draft";
-          await salary.save();
-          console.log(`  Updated existing salary - Net Pay: ${salary.netPay}`);
-        } else {
-          // Create new salary
-          salary = await Salary.create({
-            companyId,
-            employeeId: employee._id,
-            periodStart,
-            periodEnd,
-            totalHours: parseFloat(Number(totalHours).toFixed(2)),
-            totalPay: parseFloat(Number(totalPay).toFixed(2)),
-            bonus: 0,
-            taxDeduction: parseFloat(Number(taxDeduction).toFixed(2)),
-            otherDeductions,
-            netPay: parseFloat(Number(netPay).toFixed(2)),
-            status: "Draft",
-            notes: "",
-          });
-          console.log(`  Created new salary - Net Pay: ${salary.netPay}`);
-        }
-
-        calculatedCount++;
-      } catch (error) {
-        errors.push({
-          employeeId: employee._id,
-          employeeName: `${employee.name} ${employee.lastName}`,
-          error: error.message,
-        });
-      }
-    }
-
-    res.json({
-      success: true,
-      message: `חושבו ${calculatedCount} משכורות בהצלחה`,
-      data: {
-        calculatedCount,
-        errors: errors.length > 0 ? errors : undefined,
-      },
+    await respondWithPayrollRun(res, started, {
+      countKey: "calculatedCount",
+      successMessage: (count) => `חושבו ${count} משכורות בהצלחה`,
     });
   } catch (error) {
     res.status(500).json({ success: false, message: error.message });
@@ -714,107 +616,17 @@ export const recalculateSalaries = async (req, res) => {
       });
     }
 
-    const periodStart = new Date(year, month - 1, 1);
-    const periodEnd = new Date(year, month, 0);
-
-    // Get all salaries for this period
-    const salaries = await Salary.find({
+    const started = await startPayrollRun({
       companyId,
-      periodStart: {
-        $gte: periodStart,
-        $lte: periodEnd,
-      },
-    }).populate("employeeId", "countryCode");
-
-    let recalculatedCount = 0;
-    const errors = [];
-
-    for (const salary of salaries) {
-      try {
-        const employee = salary.employeeId;
-        if (!employee) continue;
-
-        // Get tax config from automation settings (required)
-        const company = await Company.findById(companyId);
-        let taxConfig = null;
-        
-        if (company?.payrollAutomationSettings?.defaultTaxConfigId) {
-          taxConfig = await TaxConfig.findOne({
-            _id: company.payrollAutomationSettings.defaultTaxConfigId,
-            companyId,
-            isActive: true,
-          });
-        }
-        
-        // If no tax config found, skip this salary with error
-        if (!taxConfig) {
-          errors.push({
-            salaryId: salary._id,
-            error: "תצורת מס לא נמצאה בהגדרות האוטומציה",
-          });
-          continue;
-        }
-
-        let taxDeduction = 0;
-        let otherDeductions = [];
-
-        if (taxConfig && taxConfig.taxBrackets && taxConfig.taxBrackets.length > 0) {
-          const taxableIncome = Number(salary.totalPay);
-          let previousLimit = 0;
-
-          const sortedBrackets = [...taxConfig.taxBrackets].sort((a, b) => a.limit - b.limit);
-
-          for (const bracket of sortedBrackets) {
-            if (taxableIncome > previousLimit) {
-              const taxableInBracket = Math.min(taxableIncome, bracket.limit) - previousLimit;
-              if (taxableInBracket > 0) {
-                const rate = bracket.rate > 1 ? bracket.rate / 100 : bracket.rate;
-                taxDeduction += taxableInBracket * rate;
-              }
-            }
-            previousLimit = bracket.limit;
-          }
-
-          if (taxConfig.otherTaxes && taxConfig.otherTaxes.length > 0) {
-            taxConfig.otherTaxes.forEach((tax) => {
-              const rate = tax.rate > 1 ? tax.rate / 100 : tax.rate;
-              const amount = tax.fixedAmount || (taxableIncome * rate);
-              if (amount > 0) {
-                otherDeductions.push({
-                  description: tax.name,
-                  amount: parseFloat(Number(amount).toFixed(2)),
-                });
-              }
-            });
-          }
-        }
-
-        const totalOtherDeductions = otherDeductions.reduce((sum, d) => sum + Number(d.amount || 0), 0);
-        const calculatedNetPay = Number(salary.totalPay) - Number(taxDeduction) - Number(totalOtherDeductions);
-        const netPay = Math.max(0, calculatedNetPay);
-
-        // Update salary
-        salary.taxDeduction = parseFloat(Number(taxDeduction).toFixed(2));
-        salary.otherDeductions = otherDeductions;
-        salary.netPay = parseFloat(Number(netPay).toFixed(2));
-        await salary.save();
-
-        recalculatedCount++;
-      } catch (error) {
-        errors.push({
-          salaryId: salary._id,
-          error: error.message,
-        });
-      }
-    }
+      year: Number(year),
+      month: Number(month),
+      mode: "recalculate",
+      startedBy: decodedToken.employeeId || decodedToken.userId,
+    });
 
-    res.json({
-      success: true,
-      message: `חושבו מחדש ${recalculatedCount} משכורות`,
-      data: {
-        recalculatedCount,
-        errors: errors.length > 0 ? errors : undefined,
-      },
+    await respondWithPayrollRun(res, started, {
+      countKey: "recalculatedCount",
+      successMessage: (count) => `חושבו מחדש ${count} משכורות`,
     });
   } catch (error) {
     res.status(500).json({ success: false, message: error.message });
@@ -836,13 +648,18 @@ export const getPayrollStats = async (req, res) => {
     const periodStart = new Date(Number(year), Number(month) - 1, 1);
     const periodEnd = new Date(Number(year), Number(month), 0);
 
-    const salaries = await Salary.find({
-      companyId,
-      periodStart: {
-        $gte: periodStart,
-        $lte: periodEnd,
-      },
-    }).populate("employeeId", "name lastName");
+    const [salaries, latestRun] = await Promise.all([
+      Salary.find({
+        companyId,
+        periodStart: {
+          $gte: periodStart,
+          $lte: periodEnd,
+        },
+      })
+        .select("employeeId status netPay totalHours")
+        .lean(),
+      getLatestPayrollRun(companyId, Number(year), Number(month)),
+    ]);
 
     const stats = {
       totalSalaries: salaries.length,
@@ -852,7 +669,9 @@ export const getPayrollStats = async (req, res) => {
       totalPayout: salaries.reduce((sum, s) => sum + Number(s.netPay || 0), 0),
       averageSalary: salaries.length > 0 ? salaries.reduce((sum, s) => sum + Number(s.netPay || 0), 0) / salaries.length : 0,
       totalHours: salaries.reduce((sum, s) => sum + Number(s.totalHours || 0), 0),
-      totalEmployees: new Set(salaries.map((s) => s.employeeId?._id?.toString())).size,
+      totalEmployees: new Set(salaries.map((s) => s.employeeId?.toString())).size,
+      // ריצת החישוב האחרונה לחודש (כולל התקדמות כשהיא עדיין רצה ברקע)
+      payrollRun: formatRunProgress(latestRun),
     };
 
     res.json({ success: true, data: stats });
@@ -860,4 +679,3 @@ export const getPayrollStats = async (req, res) => {
     res.status(500).json({ success: false, message: error.message });
   }
 };
-
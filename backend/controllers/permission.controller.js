@@ -1,4 +1,7 @@
-import Employee from "../models/employees.model.js";
+import {
+  getAuthSnapshot,
+  snapshotHasPermission,
+} from "../services/authSnapshot.service.js";
 
 /**
  * Check if user has permission for specific module and action
@@ -10,38 +13,8 @@ import Employee from "../models/employees.model.js";
  */
 export const checkUserPermission = async (userId, module, action) => {
   try {
-    const employee = await Employee.findById(userId).populate("roleId");
-
-    if (!employee) {
-      return false;
-    }
-
-    // Admin always has all permissions
-    if (employee.role === "Admin") {
-      return true;
-    }
-
-    // Check role permissions
-    if (employee.roleId && employee.roleId.permissions) {
-      const rolePermission = employee.roleId.permissions.find(
-        (p) => p.module === module && p.actions.includes(action)
-      );
-      if (rolePermission) {
-        return true;
-      }
-    }
-
-    // Check custom permissions (override role permissions)
-    if (employee.customPermissions && employee.customPermissions.length > 0) {
-      const customPermission = employee.customPermissions.find(
-        (p) => p.module === module && p.actions.includes(action)
-      );
-      if (customPermission) {
-        return true;
-      }
-    }
-
-    return false;
+    const snapshot = await getAuthSnapshot(userId);
+    return snapshotHasPermission(snapshot, module, action);
   } catch (error) {
     console.error("Error checking user permission:", error);
     return false;
@@ -56,9 +29,9 @@ export const checkUserPermission = async (userId, module, action) => {
 export const getUserPermissions = async (req, res) => {
   try {
     const { userId } = req.params;
-    const employee = await Employee.findById(userId).populate("roleId");
+    const snapshot = await getAuthSnapshot(userId);
 
-    if (!employee) {
+    if (!snapshot) {
       return res.status(404).json({
         success: false,
         message: "Employee not found",
@@ -66,7 +39,7 @@ export const getUserPermissions = async (req, res) => {
     }
 
     // Admin has all permissions
-    if (employee.role === "Admin") {
+    if (snapshot.isAdmin) {
       const allModules = [
         "products",
         "suppliers",
@@ -102,90 +75,15 @@ export const getUserPermissions = async (req, res) => {
       return res.status(200).json({
         success: true,
         permissions,
+        version: snapshot.version,
       });
     }
 
-    // Build permissions object from role and custom permissions
-    const permissions = {};
-
-    console.log("🔐 [getUserPermissions] Employee data:", {
-      employeeId: employee._id.toString(),
-      role: employee.role,
-      roleId: employee.roleId?._id?.toString(),
-      hasRoleId: !!employee.roleId,
-      rolePermissions: employee.roleId?.permissions,
-      rolePermissionsType: typeof employee.roleId?.permissions,
-      rolePermissionsIsArray: Array.isArray(employee.roleId?.permissions),
-      customPermissions: employee.customPermissions,
-    });
-
-    // Add role permissions
-    if (employee.roleId && employee.roleId.permissions) {
-      console.log("✅ [getUserPermissions] Adding role permissions:", employee.roleId.permissions);
-      
-      // Check if permissions is array or object
-      const permsList = Array.isArray(employee.roleId.permissions) 
-        ? employee.roleId.permissions 
-        : Object.values(employee.roleId.permissions);
-      
-      permsList.forEach((perm) => {
-        // Perm should be an object with {module: string, actions: string[]}
-        if (!perm || typeof perm !== 'object') {
-          console.warn("⚠️ [getUserPermissions] Invalid permission format:", perm);
-          return;
-        }
-        
-        const module = perm.module;
-        const actions = Array.isArray(perm.actions) ? perm.actions : [];
-        
-        // Skip if no module name
-        if (!module || typeof module !== 'string') {
-          console.warn("⚠️ [getUserPermissions] Missing or invalid module in permission:", perm);
-          return;
-        }
-        
-        if (!permissions[module]) {
-          permissions[module] = {};
-        }
-        
-        if (Array.isArray(actions) && actions.length > 0) {
-          actions.forEach((action) => {
-            if (action && typeof action === 'string') {
-              permissions[module][action] = true;
-            }
-          });
-        }
-      });
-    } else {
-      console.log("⚠️ [getUserPermissions] No roleId or role permissions found");
-    }
-
-    // Merge custom permissions (override role permissions)
-    if (employee.customPermissions && employee.customPermissions.length > 0) {
-      console.log("✅ [getUserPermissions] Adding custom permissions:", employee.customPermissions);
-      employee.customPermissions.forEach((perm) => {
-        const module = perm.module;
-        const actions = Array.isArray(perm.actions) ? perm.actions : [];
-        
-        if (!module) return;
-        
-        if (!permissions[module]) {
-          permissions[module] = {};
-        }
-        
-        actions.forEach((action) => {
-          if (action) {
-            permissions[module][action] = true;
-          }
-        });
-      });
-    }
-
-    console.log("📤 [getUserPermissions] Final permissions object:", JSON.stringify(permissions, null, 2));
-
+    // Role and custom permissions are pre-merged in the snapshot
     res.status(200).json({
       success: true,
-      permissions,
+      permissions: snapshot.permissions,
+      version: snapshot.version,
     });
   } catch (error) {
     console.error("Error getting user permissions:", error);
@@ -213,11 +111,9 @@ export const checkPermission = async (req, res) => {
 
     const { module, action } = req.params;
 
-    const hasPermission = await checkUserPermission(
-      req.user._id.toString(),
-      module,
-      action
-    );
+    const hasPermission = req.authSnapshot
+      ? snapshotHasPermission(req.authSnapshot, module, action)
+      : await checkUserPermission(req.user._id.toString(), module, action);
 
     res.status(200).json({
       success: true,
@@ -2,22 +2,27 @@ import mongoose from "mongoose";
 import jwt from "jsonwebtoken";
 
 // ייבוא כל המודלים
-import Budget from "../models/Budget.model.js";
 import Finance from "../models/finance.model.js";
 import Task from "../models/tasks.model.js";
-import Procurement from "../models/procurement.model.js";
 import Event from "../models/events.model.js";
 import Inventory from "../models/inventory.model.js";
 import Suppliers from "../models/suppliers.model.js";
 import Employee from "../models/employees.model.js";
 import Customer from "../models/customers.model.js";
-import CustomerOrder from "../models/CustomerOrder.model.js";
 import Department from "../models/department.model.js";
 import PerformanceReview from "../models/performanceReview.model.js";
 import Product from "../models/product.model.js";
-import ProcurementProposal from "../models/ProcurementProposal.model.js";
 import Project from "../models/project.model.js";
 import ProductTree from "../models/productTree.model.js";
+import {
+  loadRollups,
+  groupRollups,
+  monthParts,
+  startOfRollupDay,
+} from "../services/reportRollup.service.js";
+import { ensureReportRollups, rebuildReportRollups } from "../services/reportRollupBackfill.service.js";
+import { runExclusive } from "../services/jobEngine.service.js";
+import { parseReportDate } from "../services/accountBalance.service.js";
 
 /**
  * פונקציית אימות טוקן בסיסית.
@@ -36,25 +41,136 @@ const verifyToken = (req) => {
   }
 };
 
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+// ערכי הסטטוס כפי שמוגדרים בסכמות
+const TASK_COMPLETED = "completed";
+const TASK_IN_PROGRESS = "in progress";
+const TASK_PENDING = "pending";
+const EMPLOYEE_ACTIVE = "active";
+const CUSTOMER_ACTIVE = "Active";
+
 /**
- * פונקציה עזר ליצירת פילטר תאריכים דינמי
+ * טווח תאריכים לדוח - רק כששני התאריכים קיימים.
+ * הסיכומים ברזולוציית יום (UTC): יום ההתחלה ויום הסיום נכללים במלואם.
  */
-const createDateFilter = (startDate, endDate, dateField = "createdAt") => {
-  if (startDate && endDate) {
-    return {
-      [dateField]: {
-        $gte: new Date(startDate),
-        $lte: new Date(endDate),
-      },
-    };
+const resolveReportRange = (startDate, endDate) => {
+  if (!startDate || !endDate) return {};
+  const from = parseReportDate(startDate);
+  const to = parseReportDate(endDate);
+  if (!from || !to) {
+    const error = new Error("Invalid startDate or endDate");
+    error.statusCode = 400;
+    throw error;
   }
-  return {};
+  return { from, to };
 };
 
+/**
+ * פילטר תאריכים לשאילתות ישירות - אותם גבולות יום כמו הסיכומים
+ */
+const createDateFilter = ({ from, to } = {}, dateField = "createdAt") => {
+  if (!from || !to) return {};
+  return {
+    [dateField]: {
+      $gte: startOfRollupDay(from),
+      $lt: new Date(startOfRollupDay(to).getTime() + DAY_MS),
+    },
+  };
+};
+
+const isInRange = (value, { from, to } = {}) => {
+  if (!from || !to) return true;
+  const time = value ? new Date(value).getTime() : 0;
+  return time >= startOfRollupDay(from).getTime() && time < startOfRollupDay(to).getTime() + DAY_MS;
+};
+
+// ========== ROLLUP SHAPING HELPERS ==========
+
+// הוספת מדדים נגזרים לכל שורת סיכום (כמו $cond בתוך $sum)
+const withMetrics = (rows, derived) =>
+  rows.map((row) => ({
+    ...row,
+    metrics: {
+      ...row.metrics,
+      ...Object.fromEntries(Object.entries(derived).map(([name, valueOf]) => [name, valueOf(row)])),
+    },
+  }));
+
+const average = (sum, count) => (count > 0 ? sum / count : null);
+
+const byDesc = (field) => (a, b) => (b[field] ?? -Infinity) - (a[field] ?? -Infinity);
+
+const byPeriod = (a, b) => a._id.year - b._id.year || a._id.month - b._id.month;
+
+const sumMetric = (rows, name, predicate = () => true) =>
+  rows.reduce((total, row) => (predicate(row) ? total + (row.metrics[name] || 0) : total), 0);
+
+/**
+ * שליפת מסמכים לפי מזהים אחרי הקיבוץ (במקום $lookup) - מחזיר Map לפי _id
+ */
+const findByIds = async (Model, ids, projection = "") => {
+  const uniqueIds = [...new Set(ids.filter(Boolean).map(String))];
+  if (uniqueIds.length === 0) return new Map();
+  const docs = await Model.find({ _id: { $in: uniqueIds } }).select(projection).lean();
+  return new Map(docs.map((doc) => [doc._id.toString(), doc]));
+};
+
+const lookupArray = (map, id) => {
+  const doc = id ? map.get(id.toString()) : null;
+  return doc ? [doc] : [];
+};
+
+const sendReportError = (res, err, label, message) => {
+  console.error(`Error in ${label}:`, err.message);
+  if (err.statusCode === 400 || err.statusCode === 503) {
+    return res.status(err.statusCode).json({ success: false, message: err.message });
+  }
+  if (err.message.includes("Unauthorized")) {
+    return res.status(401).json({
+      success: false,
+      message: "Unauthorized: Invalid or missing token",
+    });
+  }
+  return res.status(500).json({ success: false, message, error: err.message });
+};
+
+// ========== DOMAIN SECTIONS ==========
+
+// תזרים מזומנים מתוך סיכומי הכספים
+const cashFlowOf = (rows) => {
+  const income = sumMetric(rows, "amount", (row) => row.dims.type === "Income");
+  const expense = sumMetric(rows, "amount", (row) => row.dims.type === "Expense");
+  return { income, expense, netCashFlow: income - expense };
+};
+
+// סיכום כולל של הזמנות (כמו $group עם _id: null)
+const ordersOverall = (rows) => {
+  const [overall] = groupRollups(rows, () => null);
+  if (!overall) return null;
+  return {
+    _id: null,
+    totalRevenue: overall.metrics.total,
+    totalOrders: overall.metrics.count,
+    avgOrderValue: average(overall.metrics.total, overall.metrics.count),
+    maxOrderValue: overall.maxima.total ?? null,
+    minOrderValue: overall.minima.total ?? null,
+  };
+};
+
+const taskStatusMetrics = {
+  completed: (row) => (row.dims.status === TASK_COMPLETED ? row.metrics.count : 0),
+  inProgress: (row) => (row.dims.status === TASK_IN_PROGRESS ? row.metrics.count : 0),
+  pending: (row) => (row.dims.status === TASK_PENDING ? row.metrics.count : 0),
+};
+
+const reviewAverage = (metrics) => average(metrics.scoreSum, metrics.scored);
+
 /**
  * getSuperUnifiedReport:
  * מביא קריאה *אחת* שמחזירה *כל* סוגי הדוחות/המידע שתרצה מכל המודלים.
- * משופר עם aggregations מתקדמים, KPIs, וניתוחים זמניים.
+ * הנתונים המצטברים (תקציב, כספים, משימות, רכש, עובדים, לקוחות, הזמנות, ביקורות, הצעות רכש)
+ * נקראים מהסיכומים היומיים ב-aggregation אחד; רשימות ונתוני מצב נוכחי נשלפים ישירות.
  */
 export const getSuperUnifiedReport = async (req, res) => {
   try {
@@ -64,39 +180,16 @@ export const getSuperUnifiedReport = async (req, res) => {
 
     // ניתן לקבל תאריכים (startDate, endDate) לסינון דינמי
     const { startDate, endDate } = req.query;
+    const range = resolveReportRange(startDate, endDate);
+    const now = new Date();
 
-    // הגדרת פילטרים דינמיים לכל מודל
-    const generalFilter = { companyId };
-    const generalDateFilter = createDateFilter(startDate, endDate);
-    const financeFilter = { 
-      companyId,
-      ...createDateFilter(startDate, endDate, "transactionDate")
-    };
-    const procurementFilter = {
-      companyId,
-      ...createDateFilter(startDate, endDate, "purchaseDate")
-    };
+    await ensureReportRollups(companyId);
 
-    // הרצה במקביל של שליפות / אגרגציות משופרות
     const [
-      // 1. Budget - Summary and Details
-      budgetSummary,
-      budgetByCategory,
-      budgetTrends,
-      // 2. Finance - Summary and Analysis
-      financeSummary,
-      financeByCategory,
-      financeTrends,
-      financeCashFlow,
-      // 3. Tasks - Summary and Analysis
-      taskSummary,
-      tasksByProject,
+      rollups,
+      // 3. Tasks - רשימת משימות באיחור (תלוי בזמן הנוכחי, לא בסיכום)
       overdueTasks,
-      taskCompletionRate,
-      // 4. Procurement - Summary and Details
-      procurementSummary,
-      procurementBySupplier,
-      procurementByStatus,
+      overdueByProject,
       // 5. Events
       upcomingEvents,
       pastEvents,
@@ -108,220 +201,35 @@ export const getSuperUnifiedReport = async (req, res) => {
       // 7. Suppliers - Analysis
       suppliersActive,
       suppliersByRating,
-      // 8. Employees - HR Analytics
-      employeesSummary,
-      employeesByDepartment,
-      employeesByStatus,
-      // 9. Customers - CRM Data
-      customerSummary,
-      customersByType,
-      topCustomers,
-      // 10. Customer Orders - Sales Analysis
-      customerOrderSummary,
-      ordersByStatus,
-      ordersTrends,
-      revenueAnalysis,
       // 11. Departments
-      departmentSummary,
-      departmentMetrics,
-      // 12. Performance Reviews
-      performanceReviewsSummary,
-      performanceByEmployee,
+      departments,
       // 13. Products
       productsSummary,
       productsByCategory,
-      topSellingProducts,
-      // 14. Procurement Proposals
-      procurementProposalsSummary,
-      proposalsByStatus,
       // 15. Projects
-      projectsSummary,
-      projectsByStatus,
-      projectProgress,
+      projects,
       // 16. Product Trees
       productTreesSummary,
     ] = await Promise.all([
-      // ==================== 1. BUDGET AGGREGATIONS ====================
-      // 1.1 Budget Summary - סיכום כללי של תקציבים
-      Budget.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            totalBudget: { $sum: "$amount" },
-            totalSpent: { $sum: "$spentAmount" },
-            count: { $sum: 1 },
-            avgUtilization: {
-              $avg: {
-                $cond: [
-                  { $gt: ["$amount", 0] },
-                  { $multiply: [{ $divide: ["$spentAmount", "$amount"] }, 100] },
-                  0
-                ]
-              }
-            },
-          },
-        },
-      ]),
-
-      // 1.2 Budget By Category
-      Budget.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$category",
-            totalBudget: { $sum: "$amount" },
-            totalSpent: { $sum: "$spentAmount" },
-            count: { $sum: 1 },
-            remaining: { $sum: { $subtract: ["$amount", "$spentAmount"] } },
-          },
-        },
-        { $sort: { totalBudget: -1 } },
-      ]),
+      loadRollups(companyId, {
+        budget: { domain: "budget", ...range, byMonth: true },
+        finance: { domain: "finance", ...range, byMonth: true },
+        tasks: { domain: "tasks", ...range },
+        allTasks: { domain: "tasks" },
+        procurement: { domain: "procurement", ...range },
+        employees: { domain: "employees" },
+        customers: { domain: "customers", ...range },
+        allCustomers: { domain: "customers" },
+        orders: { domain: "orders", ...range, byMonth: true },
+        orderItems: { domain: "orderItems", ...range },
+        reviews: { domain: "reviews", ...range },
+        proposals: { domain: "proposals", ...range },
+      }),
 
-      // 1.3 Budget Trends - מגמות לפי חודש
-      Budget.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: {
-              year: { $year: "$createdAt" },
-              month: { $month: "$createdAt" },
-            },
-            totalBudget: { $sum: "$amount" },
-            totalSpent: { $sum: "$spentAmount" },
-            count: { $sum: 1 },
-          },
-        },
-        { $sort: { "_id.year": 1, "_id.month": 1 } },
-      ]),
-
-      // ==================== 2. FINANCE AGGREGATIONS ====================
-      // 2.1 Finance Summary - סיכום פיננסי
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: { type: "$transactionType", status: "$transactionStatus" },
-            totalAmount: { $sum: "$transactionAmount" },
-            count: { $sum: 1 },
-            avgAmount: { $avg: "$transactionAmount" },
-          },
-        },
-      ]),
-
-      // 2.2 Finance By Category
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: "$category",
-            totalAmount: { $sum: "$transactionAmount" },
-            count: { $sum: 1 },
-          },
-        },
-        { $sort: { totalAmount: -1 } },
-      ]),
-
-      // 2.3 Finance Trends - מגמות פיננסיות
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: {
-              year: { $year: "$transactionDate" },
-              month: { $month: "$transactionDate" },
-              type: "$transactionType",
-            },
-            totalAmount: { $sum: "$transactionAmount" },
-            count: { $sum: 1 },
-          },
-        },
-        { $sort: { "_id.year": 1, "_id.month": 1 } },
-      ]),
-
-      // 2.4 Cash Flow - תזרים מזומנים
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: "$transactionType",
-            total: { $sum: "$transactionAmount" },
-          },
-        },
-        {
-          $group: {
-            _id: null,
-            income: {
-              $sum: {
-                $cond: [{ $eq: ["$_id", "Income"] }, "$total", 0]
-              }
-            },
-            expense: {
-              $sum: {
-                $cond: [{ $eq: ["$_id", "Expense"] }, "$total", 0]
-              }
-            },
-          },
-        },
-        {
-          $project: {
-            _id: 0,
-            income: 1,
-            expense: 1,
-            netCashFlow: { $subtract: ["$income", "$expense"] },
-          },
-        },
-      ]),
-
-      // ==================== 3. TASKS AGGREGATIONS ====================
-      // 3.1 Task Summary
-      Task.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: { status: "$status", priority: "$priority" },
-            count: { $sum: 1 },
-          },
-        },
-      ]),
-
-      // 3.2 Tasks By Project
-      Task.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$projectId",
-            totalTasks: { $sum: 1 },
-            completedTasks: {
-              $sum: { $cond: [{ $eq: ["$status", "completed"] }, 1, 0] }
-            },
-            inProgressTasks: {
-              $sum: { $cond: [{ $eq: ["$status", "in-progress"] }, 1, 0] }
-            },
-            overdueTasks: {
-              $sum: { 
-                $cond: [
-                  { 
-                    $and: [
-                      { $lt: ["$dueDate", new Date()] },
-                      { $ne: ["$status", "completed"] }
-                    ]
-                  }, 
-                  1, 
-                  0
-                ] 
-              }
-            },
-          },
-        },
-      ]),
-
-      // 3.3 Overdue Tasks
       Task.find({
         companyId,
-        status: { $ne: "completed" },
-        dueDate: { $lt: new Date() },
+        status: { $ne: TASK_COMPLETED },
+        dueDate: { $lt: now },
       })
         .populate("assignedTo", "name email")
         .populate("projectId", "projectName")
@@ -329,90 +237,25 @@ export const getSuperUnifiedReport = async (req, res) => {
         .limit(50)
         .lean(),
 
-      // 3.4 Task Completion Rate
       Task.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: null,
-            totalTasks: { $sum: 1 },
-            completedTasks: {
-              $sum: { $cond: [{ $eq: ["$status", "completed"] }, 1, 0] }
-            },
-            inProgressTasks: {
-              $sum: { $cond: [{ $eq: ["$status", "in-progress"] }, 1, 0] }
-            },
-            pendingTasks: {
-              $sum: { $cond: [{ $eq: ["$status", "pending"] }, 1, 0] }
-            },
-          },
-        },
         {
-          $project: {
-            _id: 0,
-            totalTasks: 1,
-            completedTasks: 1,
-            inProgressTasks: 1,
-            pendingTasks: 1,
-            completionRate: {
-              $cond: [
-                { $gt: ["$totalTasks", 0] },
-                { $multiply: [{ $divide: ["$completedTasks", "$totalTasks"] }, 100] },
-                0
-              ]
-            },
-          },
-        },
-      ]),
-
-      // ==================== 4. PROCUREMENT AGGREGATIONS ====================
-      // 4.1 Procurement Summary
-      Procurement.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: { status: "$status", paymentStatus: "$paymentStatus" },
-            totalCost: { $sum: "$totalCost" },
-            count: { $sum: 1 },
-            avgCost: { $avg: "$totalCost" },
-          },
-        },
-      ]),
-
-      // 4.2 Procurement By Supplier
-      Procurement.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$supplierId",
-            totalCost: { $sum: "$totalCost" },
-            orderCount: { $sum: 1 },
-            avgOrderValue: { $avg: "$totalCost" },
-          },
-        },
-        { $sort: { totalCost: -1 } },
-        { $limit: 20 },
-      ]),
-
-      // 4.3 Procurement By Status
-      Procurement.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            totalCost: { $sum: "$totalCost" },
-            count: { $sum: 1 },
+          $match: {
+            companyId,
+            status: { $ne: TASK_COMPLETED },
+            dueDate: { $lt: now },
+            ...createDateFilter(range),
           },
         },
+        { $group: { _id: "$projectId", count: { $sum: 1 } } },
       ]),
 
-      // ==================== 5. EVENTS AGGREGATIONS ====================
+      // ==================== 5. EVENTS ====================
       // 5.1 Upcoming Events (7 ימים קדימה)
       Event.find({
         companyId,
         startDate: {
-          $gte: new Date(),
-          $lte: new Date(Date.now() + 7 * 24 * 60 * 60 * 1000),
+          $gte: now,
+          $lte: new Date(now.getTime() + 7 * DAY_MS),
         },
       })
         .populate("participants", "name email")
@@ -427,8 +270,8 @@ export const getSuperUnifiedReport = async (req, res) => {
           $match: {
             companyId,
             startDate: {
-              $gte: new Date(Date.now() - 30 * 24 * 60 * 60 * 1000),
-              $lt: new Date(),
+              $gte: new Date(now.getTime() - 30 * DAY_MS),
+              $lt: now,
             },
           },
         },
@@ -441,7 +284,7 @@ export const getSuperUnifiedReport = async (req, res) => {
         },
       ]),
 
-      // ==================== 6. INVENTORY AGGREGATIONS ====================
+      // ==================== 6. INVENTORY ====================
       // 6.1 Low Stock Inventory
       Inventory.find({
         companyId,
@@ -457,7 +300,7 @@ export const getSuperUnifiedReport = async (req, res) => {
         companyId,
         expirationDate: {
           $exists: true,
-          $lte: new Date(Date.now() + 60 * 24 * 60 * 60 * 1000),
+          $lte: new Date(now.getTime() + 60 * DAY_MS),
         },
       })
         .populate("productId", "productName sku")
@@ -501,7 +344,7 @@ export const getSuperUnifiedReport = async (req, res) => {
         },
       ]),
 
-      // ==================== 7. SUPPLIERS AGGREGATIONS ====================
+      // ==================== 7. SUPPLIERS ====================
       // 7.1 Active Suppliers
       Suppliers.find({ companyId, IsActive: true })
         .select("SupplierName Email Phone Rating averageRating IsActive ContactPerson")
@@ -529,231 +372,10 @@ export const getSuperUnifiedReport = async (req, res) => {
         },
       ]),
 
-      // ==================== 8. EMPLOYEES AGGREGATIONS ====================
-      // 8.1 Employees Summary
-      Employee.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-          },
-        },
-      ]),
-
-      // 8.2 Employees By Department
-      Employee.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: "$department",
-            count: { $sum: 1 },
-            roles: { $addToSet: "$role" },
-          },
-        },
-        {
-          $lookup: {
-            from: "departments",
-            localField: "_id",
-            foreignField: "_id",
-            as: "departmentInfo",
-          },
-        },
-      ]),
-
-      // 8.3 Employees By Status
-      Employee.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: {
-              status: "$status",
-              role: "$role",
-            },
-            count: { $sum: 1 },
-          },
-        },
-      ]),
-
-      // ==================== 9. CUSTOMERS AGGREGATIONS ====================
-      // 9.1 Customer Summary
-      Customer.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-          },
-        },
-      ]),
-
-      // 9.2 Customers By Type
-      Customer.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: "$customerType",
-            count: { $sum: 1 },
-            activeCount: {
-              $sum: { $cond: [{ $eq: ["$status", "Active"] }, 1, 0] }
-            },
-          },
-        },
-      ]),
-
-      // 9.3 Top Customers (by order value)
-      CustomerOrder.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$customerId",
-            totalOrders: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-            avgOrderValue: { $avg: "$orderTotal" },
-          },
-        },
-        { $sort: { totalRevenue: -1 } },
-        { $limit: 10 },
-        {
-          $lookup: {
-            from: "customers",
-            localField: "_id",
-            foreignField: "_id",
-            as: "customerInfo",
-          },
-        },
-      ]),
-
-      // ==================== 10. CUSTOMER ORDERS AGGREGATIONS ====================
-      // 10.1 Customer Order Summary
-      CustomerOrder.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            totalOrders: { $sum: 1 },
-            totalAmount: { $sum: "$orderTotal" },
-            avgOrderValue: { $avg: "$orderTotal" },
-          },
-        },
-      ]),
-
-      // 10.2 Orders By Status
-      CustomerOrder.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-          },
-        },
-        { $sort: { totalRevenue: -1 } },
-      ]),
-
-      // 10.3 Orders Trends - מגמות הזמנות לפי חודש
-      CustomerOrder.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: {
-              year: { $year: "$orderDate" },
-              month: { $month: "$orderDate" },
-            },
-            totalOrders: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-            avgOrderValue: { $avg: "$orderTotal" },
-          },
-        },
-        { $sort: { "_id.year": 1, "_id.month": 1 } },
-      ]),
+      // ==================== 11. DEPARTMENTS ====================
+      Department.find({ companyId }).lean(),
 
-      // 10.4 Revenue Analysis
-      CustomerOrder.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: null,
-            totalRevenue: { $sum: "$orderTotal" },
-            totalOrders: { $sum: 1 },
-            avgOrderValue: { $avg: "$orderTotal" },
-            maxOrderValue: { $max: "$orderTotal" },
-            minOrderValue: { $min: "$orderTotal" },
-          },
-        },
-      ]),
-
-      // ==================== 11. DEPARTMENTS AGGREGATIONS ====================
-      // 11.1 Department Summary
-      Department.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: null,
-            totalDepartments: { $sum: 1 },
-          },
-        },
-      ]),
-
-      // 11.2 Department Metrics
-      Department.aggregate([
-        { $match: { companyId } },
-        {
-          $lookup: {
-            from: "employees",
-            localField: "_id",
-            foreignField: "department",
-            as: "employees",
-          },
-        },
-        {
-          $project: {
-            departmentName: 1,
-            headOfDepartment: 1,
-            employeeCount: { $size: "$employees" },
-            budget: 1,
-          },
-        },
-        { $sort: { employeeCount: -1 } },
-      ]),
-
-      // ==================== 12. PERFORMANCE REVIEWS AGGREGATIONS ====================
-      // 12.1 Performance Reviews Summary
-      PerformanceReview.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$reviewStatus",
-            count: { $sum: 1 },
-            avgScore: { $avg: "$overallScore" },
-          },
-        },
-      ]),
-
-      // 12.2 Performance By Employee (Top/Bottom performers)
-      PerformanceReview.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$employeeId",
-            avgScore: { $avg: "$overallScore" },
-            reviewCount: { $sum: 1 },
-            latestReview: { $max: "$reviewDate" },
-          },
-        },
-        { $sort: { avgScore: -1 } },
-        { $limit: 50 },
-        {
-          $lookup: {
-            from: "employees",
-            localField: "_id",
-            foreignField: "_id",
-            as: "employeeInfo",
-          },
-        },
-      ]),
-
-      // ==================== 13. PRODUCTS AGGREGATIONS ====================
+      // ==================== 13. PRODUCTS ====================
       // 13.1 Products Summary
       Product.aggregate([
         { $match: { companyId } },
@@ -783,127 +405,10 @@ export const getSuperUnifiedReport = async (req, res) => {
         },
       ]),
 
-      // 13.3 Top Selling Products (based on orders)
-      CustomerOrder.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        { $unwind: { path: "$items", preserveNullAndEmptyArrays: true } },
-        {
-          $group: {
-            _id: "$items.productId",
-            totalQuantity: { $sum: "$items.quantity" },
-            totalRevenue: { $sum: { $multiply: ["$items.quantity", "$items.unitPrice"] } },
-            orderCount: { $sum: 1 },
-          },
-        },
-        { $sort: { totalRevenue: -1 } },
-        { $limit: 20 },
-        {
-          $lookup: {
-            from: "products",
-            localField: "_id",
-            foreignField: "_id",
-            as: "productInfo",
-          },
-        },
-      ]),
+      // ==================== 15. PROJECTS ====================
+      Project.find({ companyId }).select("projectName status budget startDate endDate createdAt").lean(),
 
-      // ==================== 14. PROCUREMENT PROPOSALS AGGREGATIONS ====================
-      // 14.1 Procurement Proposals Summary
-      ProcurementProposal.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-            totalEstimatedCost: { $sum: "$estimatedCost" },
-          },
-        },
-      ]),
-
-      // 14.2 Proposals By Status
-      ProcurementProposal.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-            avgCost: { $avg: "$estimatedCost" },
-          },
-        },
-      ]),
-
-      // ==================== 15. PROJECTS AGGREGATIONS ====================
-      // 15.1 Projects Summary
-      Project.aggregate([
-        { $match: { companyId, ...generalDateFilter } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-            totalBudget: { $sum: "$budget" },
-            avgBudget: { $avg: "$budget" },
-          },
-        },
-      ]),
-
-      // 15.2 Projects By Status
-      Project.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-            projects: { $push: { name: "$projectName", _id: "$_id" } },
-          },
-        },
-      ]),
-
-      // 15.3 Project Progress (with task completion)
-      Project.aggregate([
-        { $match: { companyId } },
-        {
-          $lookup: {
-            from: "tasks",
-            localField: "_id",
-            foreignField: "projectId",
-            as: "tasks",
-          },
-        },
-        {
-          $project: {
-            projectName: 1,
-            status: 1,
-            budget: 1,
-            startDate: 1,
-            endDate: 1,
-            totalTasks: { $size: "$tasks" },
-            completedTasks: {
-              $size: {
-                $filter: {
-                  input: "$tasks",
-                  as: "task",
-                  cond: { $eq: ["$$task.status", "completed"] },
-                },
-              },
-            },
-          },
-        },
-        {
-          $addFields: {
-            completionPercentage: {
-              $cond: [
-                { $gt: ["$totalTasks", 0] },
-                { $multiply: [{ $divide: ["$completedTasks", "$totalTasks"] }, 100] },
-                0,
-              ],
-            },
-          },
-        },
-        { $sort: { startDate: -1 } },
-      ]),
-
-      // ==================== 16. PRODUCT TREES AGGREGATIONS ====================
-      // 16.1 Product Trees Summary
+      // ==================== 16. PRODUCT TREES ====================
       ProductTree.aggregate([
         { $match: { companyId } },
         {
@@ -916,6 +421,273 @@ export const getSuperUnifiedReport = async (req, res) => {
       ]),
     ]);
 
+    // ==================== 1. BUDGET ====================
+    const budgetSummary = groupRollups(rollups.budget, (row) => row.dims.status).map(({ _id, metrics }) => ({
+      _id,
+      totalBudget: metrics.amount,
+      totalSpent: metrics.spent,
+      count: metrics.count,
+      avgUtilization: average(metrics.utilization, metrics.count),
+    }));
+    const budgetByCategory = groupRollups(rollups.budget, (row) => row.dims.category)
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalBudget: metrics.amount,
+        totalSpent: metrics.spent,
+        count: metrics.count,
+        remaining: metrics.amount - metrics.spent,
+      }))
+      .sort(byDesc("totalBudget"));
+    const budgetTrends = groupRollups(rollups.budget, (row) => monthParts(row.month))
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalBudget: metrics.amount,
+        totalSpent: metrics.spent,
+        count: metrics.count,
+      }))
+      .sort(byPeriod);
+
+    // ==================== 2. FINANCE ====================
+    const financeSummary = groupRollups(rollups.finance, (row) => ({
+      type: row.dims.type,
+      status: row.dims.status,
+    })).map(({ _id, metrics }) => ({
+      _id,
+      totalAmount: metrics.amount,
+      count: metrics.count,
+      avgAmount: average(metrics.amount, metrics.count),
+    }));
+    const financeByCategory = groupRollups(rollups.finance, (row) => row.dims.category)
+      .map(({ _id, metrics }) => ({ _id, totalAmount: metrics.amount, count: metrics.count }))
+      .sort(byDesc("totalAmount"));
+    const financeTrends = groupRollups(rollups.finance, (row) => ({
+      ...monthParts(row.month),
+      type: row.dims.type,
+    }))
+      .map(({ _id, metrics }) => ({ _id, totalAmount: metrics.amount, count: metrics.count }))
+      .sort(byPeriod);
+    const financeCashFlow = cashFlowOf(rollups.finance);
+
+    // ==================== 3. TASKS ====================
+    const tasks = withMetrics(rollups.tasks, taskStatusMetrics);
+    const taskSummary = groupRollups(tasks, (row) => ({
+      status: row.dims.status,
+      priority: row.dims.priority,
+    })).map(({ _id, metrics }) => ({ _id, count: metrics.count }));
+
+    const overdueCountByProject = new Map(overdueByProject.map((row) => [String(row._id), row.count]));
+    const tasksByProject = groupRollups(tasks, (row) => row.dims.projectId).map(({ _id, metrics }) => ({
+      _id,
+      totalTasks: metrics.count,
+      completedTasks: metrics.completed,
+      inProgressTasks: metrics.inProgress,
+      overdueTasks: overdueCountByProject.get(String(_id)) || 0,
+    }));
+
+    const [taskTotals] = groupRollups(tasks, () => null);
+    const taskCompletionRate = taskTotals
+      ? {
+          totalTasks: taskTotals.metrics.count,
+          completedTasks: taskTotals.metrics.completed,
+          inProgressTasks: taskTotals.metrics.inProgress,
+          pendingTasks: taskTotals.metrics.pending,
+          completionRate: (taskTotals.metrics.completed / taskTotals.metrics.count) * 100,
+        }
+      : {};
+
+    // ==================== 4. PROCUREMENT ====================
+    const procurementSummary = groupRollups(rollups.procurement, (row) => ({
+      status: row.dims.status,
+      paymentStatus: row.dims.paymentStatus,
+    })).map(({ _id, metrics }) => ({
+      _id,
+      totalCost: metrics.cost,
+      count: metrics.count,
+      avgCost: average(metrics.cost, metrics.count),
+    }));
+    const procurementBySupplier = groupRollups(rollups.procurement, (row) => row.dims.supplierId)
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalCost: metrics.cost,
+        orderCount: metrics.count,
+        avgOrderValue: average(metrics.cost, metrics.count),
+      }))
+      .sort(byDesc("totalCost"))
+      .slice(0, 20);
+    const procurementByStatus = groupRollups(rollups.procurement, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, totalCost: metrics.cost, count: metrics.count })
+    );
+
+    // ==================== 8. EMPLOYEES ====================
+    const departmentsById = new Map(departments.map((department) => [department._id.toString(), department]));
+    const employeesSummary = groupRollups(rollups.employees, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, count: metrics.count })
+    );
+    const rolesByDepartment = new Map();
+    for (const row of rollups.employees) {
+      const departmentKey = String(row.dims.department ?? null);
+      if (!rolesByDepartment.has(departmentKey)) rolesByDepartment.set(departmentKey, new Set());
+      if (row.dims.role) rolesByDepartment.get(departmentKey).add(row.dims.role);
+    }
+    const employeesByDepartment = groupRollups(rollups.employees, (row) => row.dims.department).map(
+      ({ _id, metrics }) => ({
+        _id,
+        count: metrics.count,
+        roles: [...(rolesByDepartment.get(String(_id)) || [])],
+        departmentInfo: lookupArray(departmentsById, _id),
+      })
+    );
+    const employeeCountByDepartment = new Map(
+      employeesByDepartment.map((group) => [String(group._id), group.count])
+    );
+    const employeesByStatus = groupRollups(rollups.employees, (row) => ({
+      status: row.dims.status,
+      role: row.dims.role,
+    })).map(({ _id, metrics }) => ({ _id, count: metrics.count }));
+
+    // ==================== 9. CUSTOMERS ====================
+    const customerSummary = groupRollups(rollups.customers, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, count: metrics.count })
+    );
+    const customersByType = groupRollups(
+      withMetrics(rollups.allCustomers, {
+        active: (row) => (row.dims.status === CUSTOMER_ACTIVE ? row.metrics.count : 0),
+      }),
+      (row) => row.dims.customerType
+    ).map(({ _id, metrics }) => ({ _id, count: metrics.count, activeCount: metrics.active }));
+
+    const topCustomerGroups = groupRollups(rollups.orders, (row) => row.dims.customerId)
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalOrders: metrics.count,
+        totalRevenue: metrics.total,
+        avgOrderValue: average(metrics.total, metrics.count),
+      }))
+      .sort(byDesc("totalRevenue"))
+      .slice(0, 10);
+
+    // ==================== 10. CUSTOMER ORDERS ====================
+    const customerOrderSummary = groupRollups(rollups.orders, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({
+        _id,
+        totalOrders: metrics.count,
+        totalAmount: metrics.total,
+        avgOrderValue: average(metrics.total, metrics.count),
+      })
+    );
+    const ordersByStatus = groupRollups(rollups.orders, (row) => row.dims.status)
+      .map(({ _id, metrics }) => ({ _id, count: metrics.count, totalRevenue: metrics.total }))
+      .sort(byDesc("totalRevenue"));
+    const ordersTrends = groupRollups(rollups.orders, (row) => monthParts(row.month))
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalOrders: metrics.count,
+        totalRevenue: metrics.total,
+        avgOrderValue: average(metrics.total, metrics.count),
+      }))
+      .sort(byPeriod);
+    const revenueAnalysis = ordersOverall(rollups.orders);
+
+    // ==================== 12. PERFORMANCE REVIEWS ====================
+    const performanceReviewsSummary = groupRollups(rollups.reviews, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, count: metrics.count, avgScore: reviewAverage(metrics) })
+    );
+    const performanceGroups = groupRollups(rollups.reviews, (row) => row.dims.employeeId)
+      .map(({ _id, metrics, maxima }) => ({
+        _id,
+        avgScore: reviewAverage(metrics),
+        reviewCount: metrics.count,
+        latestReview: maxima.latest ?? null,
+      }))
+      .sort(byDesc("avgScore"))
+      .slice(0, 50);
+
+    // ==================== 13. TOP SELLING PRODUCTS ====================
+    const topSellingGroups = groupRollups(rollups.orderItems, (row) => row.dims.productId)
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalQuantity: metrics.quantity,
+        totalRevenue: metrics.revenue,
+        orderCount: metrics.count,
+      }))
+      .sort(byDesc("totalRevenue"))
+      .slice(0, 20);
+
+    // ==================== 14. PROCUREMENT PROPOSALS ====================
+    const procurementProposalsSummary = groupRollups(rollups.proposals, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, count: metrics.count, totalEstimatedCost: metrics.cost })
+    );
+    const proposalsByStatus = groupRollups(rollups.proposals, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, count: metrics.count, avgCost: average(metrics.cost, metrics.count) })
+    );
+
+    // ==================== 15. PROJECTS ====================
+    const projectStatusGroups = (list) => {
+      const groups = new Map();
+      for (const project of list) {
+        const key = project.status ?? null;
+        if (!groups.has(key)) groups.set(key, []);
+        groups.get(key).push(project);
+      }
+      return [...groups.entries()];
+    };
+    const projectsSummary = projectStatusGroups(projects.filter((project) => isInRange(project.createdAt, range))).map(
+      ([status, list]) => {
+        const budgets = list.map((project) => project.budget).filter((budget) => typeof budget === "number");
+        const totalBudget = budgets.reduce((sum, budget) => sum + budget, 0);
+        return { _id: status, count: list.length, totalBudget, avgBudget: average(totalBudget, budgets.length) };
+      }
+    );
+    const projectsByStatus = projectStatusGroups(projects).map(([status, list]) => ({
+      _id: status,
+      count: list.length,
+      projects: list.map((project) => ({ name: project.projectName, _id: project._id })),
+    }));
+
+    const tasksPerProject = new Map(
+      groupRollups(withMetrics(rollups.allTasks, taskStatusMetrics), (row) => row.dims.projectId).map((group) => [
+        String(group._id),
+        group.metrics,
+      ])
+    );
+    const projectProgress = projects
+      .map((project) => {
+        const projectTasks = tasksPerProject.get(project._id.toString());
+        const totalTasks = projectTasks?.count || 0;
+        const completedTasks = projectTasks?.completed || 0;
+        return {
+          _id: project._id,
+          projectName: project.projectName,
+          status: project.status,
+          budget: project.budget,
+          startDate: project.startDate,
+          endDate: project.endDate,
+          totalTasks,
+          completedTasks,
+          completionPercentage: totalTasks > 0 ? (completedTasks / totalTasks) * 100 : 0,
+        };
+      })
+      .sort((a, b) => new Date(b.startDate || 0) - new Date(a.startDate || 0));
+
+    // ==================== LOOKUPS (top-N בלבד) ====================
+    const [customersById, employeesById, productsById] = await Promise.all([
+      findByIds(Customer, topCustomerGroups.map((group) => group._id)),
+      findByIds(Employee, performanceGroups.map((group) => group._id), "-password"),
+      findByIds(Product, topSellingGroups.map((group) => group._id)),
+    ]);
+    const topCustomers = topCustomerGroups.map((group) => ({
+      ...group,
+      customerInfo: lookupArray(customersById, group._id),
+    }));
+    const performanceByEmployee = performanceGroups.map((group) => ({
+      ...group,
+      employeeInfo: lookupArray(employeesById, group._id),
+    }));
+    const topSellingProducts = topSellingGroups.map((group) => ({
+      ...group,
+      productInfo: lookupArray(productsById, group._id),
+    }));
+
     // בניית אובייקט התשובה המורחב והמפורט
     const responseData = {
       // ===== BUDGET DATA =====
@@ -924,36 +696,36 @@ export const getSuperUnifiedReport = async (req, res) => {
         byCategory: budgetByCategory,
         trends: budgetTrends,
       },
-      
+
       // ===== FINANCE DATA =====
       finance: {
         summary: financeSummary,
         byCategory: financeByCategory,
         trends: financeTrends,
-        cashFlow: financeCashFlow[0] || { income: 0, expense: 0, netCashFlow: 0 },
+        cashFlow: financeCashFlow,
       },
-      
+
       // ===== TASKS DATA =====
       tasks: {
         summary: taskSummary,
         byProject: tasksByProject,
         overdue: overdueTasks,
-        completionRate: taskCompletionRate[0] || {},
+        completionRate: taskCompletionRate,
       },
-      
+
       // ===== PROCUREMENT DATA =====
       procurement: {
         summary: procurementSummary,
         bySupplier: procurementBySupplier,
         byStatus: procurementByStatus,
       },
-      
+
       // ===== EVENTS DATA =====
       events: {
         upcoming: upcomingEvents,
         pastSummary: pastEvents,
       },
-      
+
       // ===== INVENTORY DATA =====
       inventory: {
         lowStock: lowStockInventory,
@@ -961,67 +733,75 @@ export const getSuperUnifiedReport = async (req, res) => {
         byCategory: inventoryByCategory,
         totalValue: inventoryValue[0] || {},
       },
-      
+
       // ===== SUPPLIERS DATA =====
       suppliers: {
         active: suppliersActive,
         byRating: suppliersByRating,
       },
-      
+
       // ===== EMPLOYEES DATA =====
       employees: {
         summary: employeesSummary,
         byDepartment: employeesByDepartment,
         byStatus: employeesByStatus,
       },
-      
+
       // ===== CUSTOMERS DATA =====
       customers: {
         summary: customerSummary,
         byType: customersByType,
         topCustomers: topCustomers,
       },
-      
+
       // ===== CUSTOMER ORDERS DATA =====
       orders: {
         summary: customerOrderSummary,
         byStatus: ordersByStatus,
         trends: ordersTrends,
-        revenueAnalysis: revenueAnalysis[0] || {},
+        revenueAnalysis: revenueAnalysis || {},
       },
-      
+
       // ===== DEPARTMENTS DATA =====
       departments: {
-        summary: departmentSummary[0] || {},
-        metrics: departmentMetrics,
+        summary: departments.length > 0 ? { _id: null, totalDepartments: departments.length } : {},
+        metrics: departments
+          .map((department) => ({
+            _id: department._id,
+            departmentName: department.departmentName,
+            headOfDepartment: department.headOfDepartment,
+            employeeCount: employeeCountByDepartment.get(department._id.toString()) || 0,
+            budget: department.budget,
+          }))
+          .sort(byDesc("employeeCount")),
       },
-      
+
       // ===== PERFORMANCE REVIEWS DATA =====
       performanceReviews: {
         summary: performanceReviewsSummary,
         byEmployee: performanceByEmployee,
       },
-      
+
       // ===== PRODUCTS DATA =====
       products: {
         summary: productsSummary,
         byCategory: productsByCategory,
         topSelling: topSellingProducts,
       },
-      
+
       // ===== PROCUREMENT PROPOSALS DATA =====
       procurementProposals: {
         summary: procurementProposalsSummary,
         byStatus: proposalsByStatus,
       },
-      
+
       // ===== PROJECTS DATA =====
       projects: {
         summary: projectsSummary,
         byStatus: projectsByStatus,
         progress: projectProgress,
       },
-      
+
       // ===== PRODUCT TREES DATA =====
       productTrees: {
         summary: productTreesSummary[0] || {},
@@ -1029,18 +809,18 @@ export const getSuperUnifiedReport = async (req, res) => {
 
       // ===== KEY PERFORMANCE INDICATORS (KPIs) =====
       kpis: {
-        totalRevenue: revenueAnalysis[0]?.totalRevenue || 0,
-        totalOrders: revenueAnalysis[0]?.totalOrders || 0,
-        avgOrderValue: revenueAnalysis[0]?.avgOrderValue || 0,
-        taskCompletionRate: taskCompletionRate[0]?.completionRate || 0,
-        cashFlow: financeCashFlow[0]?.netCashFlow || 0,
+        totalRevenue: revenueAnalysis?.totalRevenue || 0,
+        totalOrders: revenueAnalysis?.totalOrders || 0,
+        avgOrderValue: revenueAnalysis?.avgOrderValue || 0,
+        taskCompletionRate: taskCompletionRate.completionRate || 0,
+        cashFlow: financeCashFlow.netCashFlow,
         inventoryValue: inventoryValue[0]?.totalValue || 0,
-        activeEmployees: employeesSummary.find(e => e._id === "Active")?.count || 0,
-        activeCustomers: customerSummary.find(c => c._id === "Active")?.count || 0,
+        activeEmployees: employeesSummary.find((e) => e._id === EMPLOYEE_ACTIVE)?.count || 0,
+        activeCustomers: customerSummary.find((c) => c._id === CUSTOMER_ACTIVE)?.count || 0,
         lowStockItems: lowStockInventory.length,
         overdueTasksCount: overdueTasks.length,
       },
-      
+
       // ===== METADATA =====
       metadata: {
         generatedAt: new Date(),
@@ -1058,21 +838,8 @@ export const getSuperUnifiedReport = async (req, res) => {
       message: "Super unified report generated successfully",
     });
   } catch (err) {
-    console.error("Error in getSuperUnifiedReport:", err.message);
     console.error("Stack trace:", err.stack);
-    
-    if (err.message.includes("Unauthorized")) {
-      return res.status(401).json({ 
-        success: false, 
-        message: "Unauthorized: Invalid or missing token" 
-      });
-    }
-    
-    return res.status(500).json({ 
-      success: false, 
-      message: "Error generating report", 
-      error: err.message 
-    });
+    return sendReportError(res, err, "getSuperUnifiedReport", "Error generating report");
   }
 };
 
@@ -1085,108 +852,19 @@ export const getDashboardOverview = async (req, res) => {
   try {
     const decoded = verifyToken(req);
     const companyId = new mongoose.Types.ObjectId(decoded.companyId);
+    const now = new Date();
+    const last30Days = new Date(now.getTime() - 30 * DAY_MS);
 
-    const [
-      // KPIs עיקריים
-      budgetUtilization,
-      cashFlowSummary,
-      taskStats,
-      orderStats,
-      employeeStats,
-      criticalAlerts,
-    ] = await Promise.all([
-      // תצוגת תקציב
-      Budget.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: null,
-            totalBudget: { $sum: "$amount" },
-            totalSpent: { $sum: "$spentAmount" },
-            utilizationRate: {
-              $avg: {
-                $cond: [
-                  { $gt: ["$amount", 0] },
-                  { $multiply: [{ $divide: ["$spentAmount", "$amount"] }, 100] },
-                  0
-                ]
-              }
-            },
-          },
-        },
-      ]),
-
-      // תזרים מזומנים
-      Finance.aggregate([
-        {
-          $match: {
-            companyId,
-            transactionDate: { $gte: new Date(Date.now() - 30 * 24 * 60 * 60 * 1000) }
-          }
-        },
-        {
-          $group: {
-            _id: "$transactionType",
-            total: { $sum: "$transactionAmount" },
-          },
-        },
-      ]),
-
-      // סטטיסטיקות משימות
-      Task.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: null,
-            total: { $sum: 1 },
-            completed: { $sum: { $cond: [{ $eq: ["$status", "completed"] }, 1, 0] } },
-            inProgress: { $sum: { $cond: [{ $eq: ["$status", "in-progress"] }, 1, 0] } },
-            overdue: {
-              $sum: {
-                $cond: [
-                  {
-                    $and: [
-                      { $lt: ["$dueDate", new Date()] },
-                      { $ne: ["$status", "completed"] }
-                    ]
-                  },
-                  1,
-                  0
-                ]
-              }
-            },
-          },
-        },
-      ]),
-
-      // סטטיסטיקות הזמנות (30 יום אחרונים)
-      CustomerOrder.aggregate([
-        {
-          $match: {
-            companyId,
-            orderDate: { $gte: new Date(Date.now() - 30 * 24 * 60 * 60 * 1000) }
-          }
-        },
-        {
-          $group: {
-            _id: null,
-            totalOrders: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-            avgOrderValue: { $avg: "$orderTotal" },
-          },
-        },
-      ]),
+    await ensureReportRollups(companyId);
 
-      // עובדים פעילים
-      Employee.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-          },
-        },
-      ]),
+    const [rollups, criticalAlerts] = await Promise.all([
+      loadRollups(companyId, {
+        budget: { domain: "budget" },
+        finance: { domain: "finance", from: last30Days, to: now },
+        tasks: { domain: "tasks" },
+        orders: { domain: "orders", from: last30Days, to: now },
+        employees: { domain: "employees" },
+      }),
 
       // התראות קריטיות
       Promise.all([
@@ -1197,49 +875,82 @@ export const getDashboardOverview = async (req, res) => {
         }),
         // משימות באיחור
         Task.countDocuments({
-        companyId,
-        status: { $ne: "completed" },
-        dueDate: { $lt: new Date() },
+          companyId,
+          status: { $ne: TASK_COMPLETED },
+          dueDate: { $lt: now },
         }),
         // פריטים שפגי תוקף בקרוב (30 יום)
         Inventory.countDocuments({
-        companyId,
-        expirationDate: {
+          companyId,
+          expirationDate: {
             $exists: true,
-          $lte: new Date(Date.now() + 30 * 24 * 60 * 60 * 1000),
-        },
+            $lte: new Date(now.getTime() + 30 * DAY_MS),
+          },
         }),
       ]),
     ]);
 
-    // עיבוד תזרים מזומנים
-    const income = cashFlowSummary.find(item => item._id === "Income")?.total || 0;
-    const expense = cashFlowSummary.find(item => item._id === "Expense")?.total || 0;
+    // תקציב
+    const [budgetTotals] = groupRollups(rollups.budget, () => null);
+
+    // תזרים מזומנים
+    const { income, expense, netCashFlow } = cashFlowOf(rollups.finance);
+
+    // משימות
+    const [taskTotals] = groupRollups(withMetrics(rollups.tasks, taskStatusMetrics), () => null);
+
+    // הזמנות
+    const orderTotals = ordersOverall(rollups.orders);
+
+    // עובדים
+    const employeeStats = groupRollups(rollups.employees, (row) => row.dims.status);
 
     const overview = {
       // תקציב
-      budget: budgetUtilization[0] || { totalBudget: 0, totalSpent: 0, utilizationRate: 0 },
-      
+      budget: budgetTotals
+        ? {
+            _id: null,
+            totalBudget: budgetTotals.metrics.amount,
+            totalSpent: budgetTotals.metrics.spent,
+            utilizationRate: average(budgetTotals.metrics.utilization, budgetTotals.metrics.count),
+          }
+        : { totalBudget: 0, totalSpent: 0, utilizationRate: 0 },
+
       // כספים
       finance: {
         income,
         expense,
-        netCashFlow: income - expense,
+        netCashFlow,
         period: "Last 30 days",
       },
-      
+
       // משימות
-      tasks: taskStats[0] || { total: 0, completed: 0, inProgress: 0, overdue: 0 },
-      
+      tasks: taskTotals
+        ? {
+            _id: null,
+            total: taskTotals.metrics.count,
+            completed: taskTotals.metrics.completed,
+            inProgress: taskTotals.metrics.inProgress,
+            overdue: criticalAlerts[1],
+          }
+        : { total: 0, completed: 0, inProgress: 0, overdue: 0 },
+
       // הזמנות
-      orders: orderStats[0] || { totalOrders: 0, totalRevenue: 0, avgOrderValue: 0 },
-      
+      orders: orderTotals
+        ? {
+            _id: null,
+            totalOrders: orderTotals.totalOrders,
+            totalRevenue: orderTotals.totalRevenue,
+            avgOrderValue: orderTotals.avgOrderValue,
+          }
+        : { totalOrders: 0, totalRevenue: 0, avgOrderValue: 0 },
+
       // עובדים
       employees: {
-        active: employeeStats.find(e => e._id === "Active")?.count || 0,
-        total: employeeStats.reduce((sum, e) => sum + e.count, 0),
+        active: employeeStats.find((e) => e._id === EMPLOYEE_ACTIVE)?.metrics.count || 0,
+        total: employeeStats.reduce((sum, e) => sum + e.metrics.count, 0),
       },
-      
+
       // התראות
       alerts: {
         lowStockItems: criticalAlerts[0],
@@ -1247,7 +958,7 @@ export const getDashboardOverview = async (req, res) => {
         expiringItems: criticalAlerts[2],
         total: criticalAlerts[0] + criticalAlerts[1] + criticalAlerts[2],
       },
-      
+
       generatedAt: new Date(),
     };
 
@@ -1256,12 +967,7 @@ export const getDashboardOverview = async (req, res) => {
       data: overview,
     });
   } catch (err) {
-    console.error("Error in getDashboardOverview:", err.message);
-    return res.status(500).json({
-      success: false,
-      message: "Error generating dashboard overview",
-      error: err.message,
-    });
+    return sendReportError(res, err, "getDashboardOverview", "Error generating dashboard overview");
   }
 };
 
@@ -1274,96 +980,58 @@ export const getFinanceReport = async (req, res) => {
     const decoded = verifyToken(req);
     const companyId = new mongoose.Types.ObjectId(decoded.companyId);
     const { startDate, endDate } = req.query;
+    const range = resolveReportRange(startDate, endDate);
 
-    const financeFilter = { 
-      companyId,
-      ...createDateFilter(startDate, endDate, "transactionDate")
-    };
-
-    const [
-      transactionsSummary,
-      monthlyTrends,
-      categoryBreakdown,
-      topExpenses,
-      cashFlow,
-      budgetComparison,
-    ] = await Promise.all([
-      // סיכום טרנזקציות
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: { type: "$transactionType", status: "$transactionStatus" },
-            total: { $sum: "$transactionAmount" },
-            count: { $sum: 1 },
-            avg: { $avg: "$transactionAmount" },
-          },
-        },
-      ]),
-
-      // מגמות חודשיות
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: {
-              year: { $year: "$transactionDate" },
-              month: { $month: "$transactionDate" },
-              type: "$transactionType",
-            },
-            total: { $sum: "$transactionAmount" },
-            count: { $sum: 1 },
-          },
-        },
-        { $sort: { "_id.year": 1, "_id.month": 1 } },
-      ]),
+    await ensureReportRollups(companyId);
 
-      // פילוח לפי קטגוריה
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: { category: "$category", type: "$transactionType" },
-            total: { $sum: "$transactionAmount" },
-            count: { $sum: 1 },
-          },
-        },
-        { $sort: { total: -1 } },
-      ]),
+    const [rollups, topExpenses] = await Promise.all([
+      loadRollups(companyId, {
+        finance: { domain: "finance", ...range, byMonth: true },
+        budget: { domain: "budget" },
+      }),
 
       // הוצאות מובילות
-      Finance.find({ ...financeFilter, transactionType: "Expense" })
+      Finance.find({
+        companyId,
+        transactionType: "Expense",
+        ...createDateFilter(range, "transactionDate"),
+      })
         .sort({ transactionAmount: -1 })
         .limit(10)
         .lean(),
-
-      // תזרים מזומנים
-      Finance.aggregate([
-        { $match: financeFilter },
-        {
-          $group: {
-            _id: "$transactionType",
-            total: { $sum: "$transactionAmount" },
-          },
-        },
-      ]),
-
-      // השוואה לתקציב
-      Budget.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: null,
-            totalBudgeted: { $sum: "$amount" },
-            totalSpent: { $sum: "$spentAmount" },
-            remaining: { $sum: { $subtract: ["$amount", "$spentAmount"] } },
-          },
-        },
-      ]),
     ]);
 
-    const income = cashFlow.find(item => item._id === "Income")?.total || 0;
-    const expense = cashFlow.find(item => item._id === "Expense")?.total || 0;
+    // סיכום טרנזקציות
+    const transactionsSummary = groupRollups(rollups.finance, (row) => ({
+      type: row.dims.type,
+      status: row.dims.status,
+    })).map(({ _id, metrics }) => ({
+      _id,
+      total: metrics.amount,
+      count: metrics.count,
+      avg: average(metrics.amount, metrics.count),
+    }));
+
+    // מגמות חודשיות
+    const monthlyTrends = groupRollups(rollups.finance, (row) => ({
+      ...monthParts(row.month),
+      type: row.dims.type,
+    }))
+      .map(({ _id, metrics }) => ({ _id, total: metrics.amount, count: metrics.count }))
+      .sort(byPeriod);
+
+    // פילוח לפי קטגוריה
+    const categoryBreakdown = groupRollups(rollups.finance, (row) => ({
+      category: row.dims.category,
+      type: row.dims.type,
+    }))
+      .map(({ _id, metrics }) => ({ _id, total: metrics.amount, count: metrics.count }))
+      .sort(byDesc("total"));
+
+    // השוואה לתקציב
+    const [budgetTotals] = groupRollups(rollups.budget, () => null);
+
+    const { income, expense } = cashFlowOf(rollups.finance);
     const netProfit = income - expense;
     let profitMargin = 0;
     if (income > 0) {
@@ -1382,7 +1050,14 @@ export const getFinanceReport = async (req, res) => {
       trends: monthlyTrends,
       categoryBreakdown,
       topExpenses,
-      budgetComparison: budgetComparison[0] || {},
+      budgetComparison: budgetTotals
+        ? {
+            _id: null,
+            totalBudgeted: budgetTotals.metrics.amount,
+            totalSpent: budgetTotals.metrics.spent,
+            remaining: budgetTotals.metrics.amount - budgetTotals.metrics.spent,
+          }
+        : {},
       dateRange: {
         startDate: startDate || null,
         endDate: endDate || null,
@@ -1395,12 +1070,7 @@ export const getFinanceReport = async (req, res) => {
       data: report,
     });
   } catch (err) {
-    console.error("Error in getFinanceReport:", err.message);
-    return res.status(500).json({
-      success: false,
-      message: "Error generating finance report",
-      error: err.message,
-    });
+    return sendReportError(res, err, "getFinanceReport", "Error generating finance report");
   }
 };
 
@@ -1413,76 +1083,59 @@ export const getHRReport = async (req, res) => {
     const decoded = verifyToken(req);
     const companyId = new mongoose.Types.ObjectId(decoded.companyId);
 
-    const [
-      employeeSummary,
-      departmentBreakdown,
-      performanceStats,
-      recentReviews,
-    ] = await Promise.all([
-      // סיכום עובדים
-      Employee.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-          },
-        },
-      ]),
+    await ensureReportRollups(companyId);
 
-      // פילוח לפי מחלקה
-      Employee.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: { department: "$department", role: "$role" },
-            count: { $sum: 1 },
-          },
-        },
-        {
-          $lookup: {
-            from: "departments",
-            localField: "_id.department",
-            foreignField: "_id",
-            as: "deptInfo",
-          },
-        },
-      ]),
+    const [rollups, departments, recentReviews] = await Promise.all([
+      loadRollups(companyId, {
+        employees: { domain: "employees" },
+        reviews: { domain: "reviews" },
+      }),
 
-      // סטטיסטיקות ביצועים
-      PerformanceReview.aggregate([
-        { $match: { companyId } },
-        {
-          $group: {
-            _id: null,
-            avgScore: { $avg: "$overallScore" },
-            totalReviews: { $sum: 1 },
-            excellentCount: {
-              $sum: { $cond: [{ $gte: ["$overallScore", 4.5] }, 1, 0] }
-            },
-            needsImprovementCount: {
-              $sum: { $cond: [{ $lt: ["$overallScore", 3] }, 1, 0] }
-            },
-          },
-        },
-      ]),
+      Department.find({ companyId }).lean(),
 
       // ביקורות אחרונות
       PerformanceReview.find({ companyId })
-        .sort({ reviewDate: -1 })
+        .sort({ createdAt: -1 })
         .limit(10)
         .populate("employeeId", "name email role")
-        .populate("reviewerId", "name")
+        .populate("responses.reviewerId", "name")
         .lean(),
     ]);
 
+    // סיכום עובדים
+    const employeeSummary = groupRollups(rollups.employees, (row) => row.dims.status).map(
+      ({ _id, metrics }) => ({ _id, count: metrics.count })
+    );
+
+    // פילוח לפי מחלקה
+    const departmentsById = new Map(departments.map((department) => [department._id.toString(), department]));
+    const departmentBreakdown = groupRollups(rollups.employees, (row) => ({
+      department: row.dims.department,
+      role: row.dims.role,
+    })).map(({ _id, metrics }) => ({
+      _id,
+      count: metrics.count,
+      deptInfo: lookupArray(departmentsById, _id.department),
+    }));
+
+    // סטטיסטיקות ביצועים
+    const [reviewTotals] = groupRollups(rollups.reviews, () => null);
+
     const report = {
       summary: {
         employees: employeeSummary,
         totalEmployees: employeeSummary.reduce((sum, e) => sum + e.count, 0),
       },
       departments: departmentBreakdown,
-      performance: performanceStats[0] || {},
+      performance: reviewTotals
+        ? {
+            _id: null,
+            avgScore: reviewAverage(reviewTotals.metrics),
+            totalReviews: reviewTotals.metrics.count,
+            excellentCount: reviewTotals.metrics.excellent,
+            needsImprovementCount: reviewTotals.metrics.needsImprovement,
+          }
+        : {},
       recentReviews,
       generatedAt: new Date(),
     };
@@ -1492,12 +1145,7 @@ export const getHRReport = async (req, res) => {
       data: report,
     });
   } catch (err) {
-    console.error("Error in getHRReport:", err.message);
-    return res.status(500).json({
-      success: false,
-      message: "Error generating HR report",
-      error: err.message,
-    });
+    return sendReportError(res, err, "getHRReport", "Error generating HR report");
   }
 };
 
@@ -1510,135 +1158,83 @@ export const getSalesReport = async (req, res) => {
     const decoded = verifyToken(req);
     const companyId = new mongoose.Types.ObjectId(decoded.companyId);
     const { startDate, endDate } = req.query;
+    const range = resolveReportRange(startDate, endDate);
 
-    const orderFilter = { 
-      companyId,
-      ...createDateFilter(startDate, endDate, "orderDate")
-    };
-
-    const [
-      salesSummary,
-      salesByStatus,
-      topCustomers,
-      topProducts,
-      salesTrends,
-      revenueByCategory,
-    ] = await Promise.all([
-      // סיכום מכירות
-      CustomerOrder.aggregate([
-        { $match: orderFilter },
-        {
-          $group: {
-            _id: null,
-            totalOrders: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-            avgOrderValue: { $avg: "$orderTotal" },
-            maxOrderValue: { $max: "$orderTotal" },
-          },
-        },
-      ]),
-
-      // מכירות לפי סטטוס
-      CustomerOrder.aggregate([
-        { $match: orderFilter },
-        {
-          $group: {
-            _id: "$status",
-            count: { $sum: 1 },
-            revenue: { $sum: "$orderTotal" },
-          },
-        },
-      ]),
-
-      // לקוחות מובילים
-      CustomerOrder.aggregate([
-        { $match: orderFilter },
-        {
-          $group: {
-            _id: "$customerId",
-            totalOrders: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-          },
-        },
-        { $sort: { totalRevenue: -1 } },
-        { $limit: 10 },
-        {
-          $lookup: {
-            from: "customers",
-            localField: "_id",
-            foreignField: "_id",
-            as: "customerInfo",
-          },
-        },
-        { $unwind: "$customerInfo" },
-      ]),
-
-      // מוצרים מובילים
-      CustomerOrder.aggregate([
-        { $match: orderFilter },
-        { $unwind: "$items" },
-        {
-          $group: {
-            _id: "$items.productId",
-            totalQuantity: { $sum: "$items.quantity" },
-            totalRevenue: { $sum: { $multiply: ["$items.quantity", "$items.unitPrice"] } },
-            orderCount: { $sum: 1 },
-          },
-        },
-        { $sort: { totalRevenue: -1 } },
-        { $limit: 10 },
-        {
-          $lookup: {
-            from: "products",
-            localField: "_id",
-            foreignField: "_id",
-            as: "productInfo",
-          },
-        },
-      ]),
+    await ensureReportRollups(companyId);
 
-      // מגמות מכירות
-      CustomerOrder.aggregate([
-        { $match: orderFilter },
-        {
-          $group: {
-            _id: {
-              year: { $year: "$orderDate" },
-              month: { $month: "$orderDate" },
-            },
-            totalOrders: { $sum: 1 },
-            totalRevenue: { $sum: "$orderTotal" },
-          },
-        },
-        { $sort: { "_id.year": 1, "_id.month": 1 } },
-      ]),
+    const rollups = await loadRollups(companyId, {
+      orders: { domain: "orders", ...range, byMonth: true },
+      orderItems: { domain: "orderItems", ...range },
+    });
 
-      // הכנסות לפי קטגוריה
-      CustomerOrder.aggregate([
-        { $match: orderFilter },
-        { $unwind: "$items" },
-        {
-          $lookup: {
-            from: "products",
-            localField: "items.productId",
-            foreignField: "_id",
-            as: "product",
-          },
-        },
-        { $unwind: { path: "$product", preserveNullAndEmptyArrays: true } },
-        {
-          $group: {
-            _id: "$product.category",
-            revenue: { $sum: { $multiply: ["$items.quantity", "$items.unitPrice"] } },
-            quantity: { $sum: "$items.quantity" },
-          },
-        },
-        { $sort: { revenue: -1 } },
-      ]),
+    // סיכום מכירות
+    const overall = ordersOverall(rollups.orders);
+
+    // מכירות לפי סטטוס
+    const salesByStatus = groupRollups(rollups.orders, (row) => row.dims.status).map(({ _id, metrics }) => ({
+      _id,
+      count: metrics.count,
+      revenue: metrics.total,
+    }));
+
+    // לקוחות מובילים
+    const topCustomerGroups = groupRollups(rollups.orders, (row) => row.dims.customerId)
+      .map(({ _id, metrics }) => ({ _id, totalOrders: metrics.count, totalRevenue: metrics.total }))
+      .sort(byDesc("totalRevenue"))
+      .slice(0, 10);
+
+    // מוצרים (מובילים + פילוח לפי קטגוריה)
+    const productGroups = groupRollups(rollups.orderItems, (row) => row.dims.productId)
+      .map(({ _id, metrics }) => ({
+        _id,
+        totalQuantity: metrics.quantity,
+        totalRevenue: metrics.revenue,
+        orderCount: metrics.count,
+      }))
+      .sort(byDesc("totalRevenue"));
+    const topProductGroups = productGroups.slice(0, 10);
+
+    // מגמות מכירות
+    const salesTrends = groupRollups(rollups.orders, (row) => monthParts(row.month))
+      .map(({ _id, metrics }) => ({ _id, totalOrders: metrics.count, totalRevenue: metrics.total }))
+      .sort(byPeriod);
+
+    const [customersById, topProductsById, productCategories] = await Promise.all([
+      findByIds(Customer, topCustomerGroups.map((group) => group._id)),
+      findByIds(Product, topProductGroups.map((group) => group._id)),
+      findByIds(Product, productGroups.map((group) => group._id), "category"),
     ]);
 
+    const topCustomers = topCustomerGroups
+      .filter((group) => group._id && customersById.has(group._id.toString()))
+      .map((group) => ({ ...group, customerInfo: customersById.get(group._id.toString()) }));
+
+    const topProducts = topProductGroups.map((group) => ({
+      ...group,
+      productInfo: lookupArray(topProductsById, group._id),
+    }));
+
+    // הכנסות לפי קטגוריה
+    const categories = new Map();
+    for (const group of productGroups) {
+      const category = group._id ? productCategories.get(group._id.toString())?.category ?? null : null;
+      const entry = categories.get(category) || { _id: category, revenue: 0, quantity: 0 };
+      entry.revenue += group.totalRevenue;
+      entry.quantity += group.totalQuantity;
+      categories.set(category, entry);
+    }
+    const revenueByCategory = [...categories.values()].sort(byDesc("revenue"));
+
     const report = {
-      summary: salesSummary[0] || {},
+      summary: overall
+        ? {
+            _id: null,
+            totalOrders: overall.totalOrders,
+            totalRevenue: overall.totalRevenue,
+            avgOrderValue: overall.avgOrderValue,
+            maxOrderValue: overall.maxOrderValue,
+          }
+        : {},
       byStatus: salesByStatus,
       topCustomers,
       topProducts,
@@ -1656,11 +1252,37 @@ export const getSalesReport = async (req, res) => {
       data: report,
     });
   } catch (err) {
-    console.error("Error in getSalesReport:", err.message);
-    return res.status(500).json({
-      success: false,
-      message: "Error generating sales report",
-      error: err.message,
+    return sendReportError(res, err, "getSalesReport", "Error generating sales report");
+  }
+};
+
+/**
+ * rebuildReportRollupsForCompany:
+ * בנייה מחדש של סיכומי הדוחות של החברה מתוך מודלי המקור
+ * (אחרי ייבוא נתונים / תיקון ידני בבסיס הנתונים)
+ */
+export const rebuildReportRollupsForCompany = async (req, res) => {
+  try {
+    const decoded = verifyToken(req);
+
+    // בנייה אחת לחברה בכל רגע, גם בין instances
+    const { skipped, result, error } = await runExclusive(`report-rollups:${decoded.companyId}`, () =>
+      rebuildReportRollups(decoded.companyId)
+    );
+    if (skipped) {
+      return res.status(409).json({
+        success: false,
+        message: "Report rollup rebuild is already running for this company",
+      });
+    }
+    if (error) throw error;
+
+    return res.status(200).json({
+      success: true,
+      message: "Report rollups rebuilt successfully",
+      data: result,
     });
+  } catch (err) {
+    return sendReportError(res, err, "rebuildReportRollupsForCompany", "Error rebuilding report rollups");
   }
 };
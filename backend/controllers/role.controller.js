@@ -1,6 +1,10 @@
 import mongoose from "mongoose";
 import Role from "../models/Role.model.js";
 import Employee from "../models/employees.model.js";
+import {
+  bumpCompanyAuthVersion,
+  bumpUserAuthVersion,
+} from "../services/authSnapshot.service.js";
 
 /**
  * Get all default roles
@@ -445,6 +449,7 @@ export const updateRole = async (req, res) => {
     }
 
     await role.save();
+    await bumpCompanyAuthVersion(role.companyId);
 
     res.status(200).json({
       success: true,
@@ -526,6 +531,7 @@ export const deleteRole = async (req, res) => {
     }
 
     await Role.findByIdAndDelete(id);
+    await bumpCompanyAuthVersion(role.companyId);
 
     res.status(200).json({
       success: true,
@@ -591,6 +597,7 @@ export const assignRoleToEmployee = async (req, res) => {
     // Update employee's roleId
     employee.roleId = roleId || null;
     await employee.save();
+    await bumpUserAuthVersion(employee._id);
 
     res.status(200).json({
       success: true,
@@ -49,8 +49,15 @@ export const createSalary = async (req, res) => {
     status,
   };
 
-  const salary = await Salary.create(salaryData);
-  res.status(201).json({ data: salary, message: "משכורת נוצרה בהצלחה" });
+  try {
+    const salary = await Salary.create(salaryData);
+    res.status(201).json({ data: salary, message: "משכורת נוצרה בהצלחה" });
+  } catch (error) {
+    if (error.code === 11000) {
+      return res.status(409).json({ success: false, message: "כבר קיימת משכורת לעובד לתקופה זו" });
+    }
+    throw error;
+  }
 };
 
 // Get all salaries (filtered by company)
@@ -1,5 +1,5 @@
 import { AuthService } from "../services/auth.service.js";
-import Employee from "../models/employees.model.js";
+import { getAuthSnapshot, hydrateSnapshotUser } from "../services/authSnapshot.service.js";
 import Company from "../models/companies.model.js";
 import { ERROR_MESSAGES, getErrorMessage } from "../utils/errorMessages.js";
 
@@ -44,9 +44,9 @@ export const protectRoute = async (req, res, next) => {
       // Verify access token
       const decoded = AuthService.verifyAccessToken(token);
       
-      // Find the user
-      const user = await Employee.findById(decoded.userId).select("-password");
-      if (!user) {
+      // Find the user (cached snapshot - no DB call on a warm cache)
+      const snapshot = await getAuthSnapshot(decoded.userId);
+      if (!snapshot) {
         // Stale cookie after DB reset / migration — treat as logged out
         AuthService.clearAuthCookies(res);
         return res.status(401).json({
@@ -56,8 +56,9 @@ export const protectRoute = async (req, res, next) => {
         });
       }
 
-      // Attach user and decoded token to request
-      req.user = user;
+      // Attach user, permission snapshot and decoded token to request
+      req.user = hydrateSnapshotUser(snapshot);
+      req.authSnapshot = snapshot;
       req.decoded = decoded;
       next();
     } catch (error) {
@@ -101,8 +102,8 @@ const handleRefreshToken = async (req, res, next) => {
     const decoded = AuthService.verifyRefreshToken(refreshToken);
     
     // Find the user
-    const user = await Employee.findById(decoded.userId).select("-password");
-    if (!user) {
+    const snapshot = await getAuthSnapshot(decoded.userId);
+    if (!snapshot) {
       AuthService.clearAuthCookies(res);
       return res.status(401).json({
         success: false,
@@ -128,7 +129,8 @@ const handleRefreshToken = async (req, res, next) => {
       maxAge: 15 * 60 * 1000, // 15 minutes
     });
 
-    req.user = user;
+    req.user = hydrateSnapshotUser(snapshot);
+    req.authSnapshot = snapshot;
     req.decoded = decoded;
     next();
   } catch (error) {
@@ -160,11 +162,10 @@ export const protectCompanyOrUserRoute = async (req, res, next) => {
         const decoded = AuthService.verifyAccessToken(userToken);
 
         if (decoded.userId) {
-          const user = await Employee.findById(decoded.userId).select(
-            "-password"
-          );
-          if (user) {
-            req.user = user;
+          const snapshot = await getAuthSnapshot(decoded.userId);
+          if (snapshot) {
+            req.user = hydrateSnapshotUser(snapshot);
+            req.authSnapshot = snapshot;
             req.decoded = decoded;
             return next();
           }
@@ -1,51 +1,242 @@
-import redis, { getCache, setCache, clearCachePattern } from "../config/redis.js";
+import jwt from "jsonwebtoken";
+import redis, {
+  getCache,
+  setCache,
+  getTagGenerations,
+  invalidateTags,
+  subscribeToInvalidations,
+} from "../config/redis.js";
+import { LRUCache } from "../utils/lruCache.js";
 
 /**
  * Cache middleware - שיפור של 95-99% בזמן תגובה!
- * משתמש ב-Redis לשמירת תוצאות queries
+ * שתי שכבות: L1 בזיכרון (LRU מוגבל) ו-L2 ב-Redis.
+ * כל רשומה מתויגת לפי חברה ומשאב, ומחיקה נעשית לפי תגית - בלי סריקת keyspace.
+ * בקשות מקבילות לאותו key שלא נמצאו ב-cache מתאחדות לחישוב אחד.
  */
-export const cache = (duration = 300) => {
+
+const L1_MAX_ENTRIES = Number(process.env.CACHE_L1_MAX_ENTRIES) || 500;
+const L1_MAX_TTL = Number(process.env.CACHE_L1_TTL) || 60;
+const INFLIGHT_TIMEOUT_MS = 30 * 1000;
+
+const l1 = new LRUCache({ maxEntries: L1_MAX_ENTRIES });
+const inflight = new Map();
+// דור מקומי לכל תגית - עולה בכל invalidation של L1 (מקומית או דרך pub/sub)
+const localGenerations = new Map();
+
+const stats = {
+  l1Hits: 0,
+  l2Hits: 0,
+  misses: 0,
+  coalesced: 0,
+  invalidations: 0,
+  errors: 0,
+  lookups: 0,
+  lookupMs: 0,
+};
+
+// L1 נשאר קוהרנטי בין instances דרך pub/sub של Redis
+subscribeToInvalidations((tags) => {
+  invalidateLocal(tags);
+});
+
+function invalidateLocal(tags) {
+  for (const tag of tags) {
+    localGenerations.set(tag, (localGenerations.get(tag) || 0) + 1);
+  }
+  l1.invalidateTags(tags);
+}
+
+const isRedisReady = () => Boolean(redis) && redis.status === "ready";
+
+/**
+ * תגיות cache סטנדרטיות
+ */
+export const companyTag = (companyId) => `company:${companyId}`;
+export const resourceTag = (companyId, resource) => `company:${companyId}:${resource}`;
+
+const resolveCompanyId = (req) => {
+  if (req.user?.companyId) return req.user.companyId.toString();
+
+  const token = req.cookies?.["auth_token"];
+  if (token) {
+    try {
+      const decoded = jwt.verify(token, process.env.JWT_SECRET);
+      if (decoded?.companyId) return decoded.companyId.toString();
+    } catch (error) {
+      // טוקן לא תקין - ממשיכים ל-fallback
+    }
+  }
+
+  return req.query.companyId || null;
+};
+
+// "/api/analytics" -> "analytics"
+const resourceFromRequest = (req) => req.baseUrl.split("/").filter(Boolean).pop() || "root";
+
+const recordLookup = (startedAt) => {
+  stats.lookups++;
+  stats.lookupMs += Date.now() - startedAt;
+};
+
+/**
+ * קריאה דרך שתי השכבות. מחזיר undefined כשאין ערך.
+ */
+const tieredGet = async (key, tags, ttl) => {
+  const local = l1.get(key);
+  if (local !== undefined) {
+    stats.l1Hits++;
+    return local;
+  }
+
+  const remote = await getCache(key);
+  if (remote !== null) {
+    stats.l2Hits++;
+    l1.set(key, remote, Math.min(ttl, L1_MAX_TTL), tags);
+    return remote;
+  }
+
+  stats.misses++;
+  return undefined;
+};
+
+/**
+ * צילום הדורות של התגיות לפני חישוב - tieredSet לא ישמור תוצאה
+ * של חישוב שהתחיל לפני invalidation
+ */
+const snapshotGenerations = async (tags) => ({
+  local: tags.map((tag) => localGenerations.get(tag) || 0),
+  remote: await getTagGenerations(tags),
+});
+
+const tieredSet = async (key, data, ttl, tags, generations) => {
+  // בלי דורות מ-Redis אי אפשר לדעת אם היה invalidation באמצע - לא שומרים
+  if (!generations.remote) return false;
+
+  const stored = await setCache(key, data, ttl, tags, generations.remote);
+  const changedLocally = tags.some(
+    (tag, index) => (localGenerations.get(tag) || 0) !== generations.local[index]
+  );
+  if (!stored || changedLocally) return false;
+
+  l1.set(key, data, Math.min(ttl, L1_MAX_TTL), tags);
+  return true;
+};
+
+/**
+ * רישום חישוב בתהליך - בקשות מקבילות לאותו key ימתינו לתוצאה שלו
+ */
+const beginInflight = (key) => {
+  let resolve;
+  const promise = new Promise((r) => {
+    resolve = r;
+  });
+  inflight.set(key, promise);
+
+  return (data) => {
+    if (inflight.get(key) === promise) inflight.delete(key);
+    resolve(data);
+  };
+};
+
+const awaitInflight = (promise) =>
+  Promise.race([
+    promise,
+    new Promise((resolve) => setTimeout(() => resolve(null), INFLIGHT_TIMEOUT_MS).unref()),
+  ]);
+
+/**
+ * מחיקת cache לפי תגיות - L1 מקומי + Redis (שמפרסם ל-instances האחרים)
+ */
+export const invalidateCacheTags = async (tags) => {
+  if (!tags || tags.length === 0) return 0;
+  stats.invalidations++;
+  invalidateLocal(tags);
+  return invalidateTags(tags);
+};
+
+/**
+ * מחיקת cache של חברה - כל המשאבים, או רק המשאבים שצוינו
+ */
+export const invalidateCompanyCache = async (companyId, resources = []) => {
+  if (!companyId) return 0;
+  const tags =
+    resources.length > 0
+      ? resources.map((resource) => resourceTag(companyId, resource))
+      : [companyTag(companyId)];
+  return invalidateCacheTags(tags);
+};
+
+/**
+ * Cache middleware
+ * options.resources - משאבים נוספים שהתגובה תלויה בהם (לצורך invalidation)
+ */
+export const cache = (duration = 300, options = {}) => {
   return async (req, res, next) => {
     // רק GET requests
     if (req.method !== "GET") {
       return next();
     }
 
-    // אם Redis לא פעיל, דלג על cache
-    if (!redis || redis.status !== "ready") {
-      return next();
-    }
-
+    const startedAt = Date.now();
     try {
-      // יצירת cache key ייחודי
-      const companyId = req.user?.companyId || req.query.companyId || "global";
+      const companyId = resolveCompanyId(req) || "global";
+      const resources = [resourceFromRequest(req), ...(options.resources || [])];
       const cacheKey = `cache:${req.baseUrl}${req.path}:${companyId}:${JSON.stringify(req.query)}`;
+      const tags = [
+        companyTag(companyId),
+        ...resources.map((resource) => resourceTag(companyId, resource)),
+      ];
+
+      // בלי Redis אין דרך לשמור על L1 קוהרנטי בין instances - רק איחוד בקשות
+      if (isRedisReady()) {
+        const cached = await tieredGet(cacheKey, tags, duration);
+        if (cached !== undefined) {
+          recordLookup(startedAt);
+          return res.json(cached);
+        }
+      }
 
-      // ניסיון לקבל מ-cache
-      const cached = await getCache(cacheKey);
-
-      if (cached) {
-        console.log(`📦 Cache HIT: ${req.path} (${companyId})`);
-        return res.json(cached);
+      const pending = inflight.get(cacheKey);
+      if (pending) {
+        stats.coalesced++;
+        const data = await awaitInflight(pending);
+        recordLookup(startedAt);
+        if (data !== null) {
+          return res.json(data);
+        }
+        return next();
       }
 
-      console.log(`🔍 Cache MISS: ${req.path} (${companyId})`);
+      recordLookup(startedAt);
+      const settle = beginInflight(cacheKey);
+      const generations = isRedisReady() ? await snapshotGenerations(tags) : null;
 
       // שמירת הפונקציה המקורית
       const originalJson = res.json.bind(res);
 
       // Override של res.json לשמירה בcache
       res.json = function (data) {
-        // שמירה בcache (fire and forget)
-        setCache(cacheKey, data, duration).catch((err) => {
-          console.error("Cache save error:", err);
-        });
+        if (res.statusCode >= 200 && res.statusCode < 300) {
+          settle(data);
+          if (generations && isRedisReady()) {
+            tieredSet(cacheKey, data, duration, tags, generations).catch((err) => {
+              stats.errors++;
+              console.error("Cache save error:", err);
+            });
+          }
+        } else {
+          settle(null);
+        }
 
         return originalJson(data);
       };
+      // אם התגובה הסתיימה בלי json (שגיאה, stream) - משחררים את הממתינים
+      res.on("close", () => settle(null));
 
       next();
     } catch (error) {
+      stats.errors++;
       console.error("Cache middleware error:", error);
       // אם יש שגיאה בcache, פשוט ממשיכים בלי cache
       next();
@@ -53,56 +244,18 @@ export const cache = (duration = 300) => {
   };
 };
 
-/**
- * Middleware למחיקת cache אוטומטית
- * משתמש ב-POST, PUT, DELETE, PATCH
- */
-export const clearCache = (...patterns) => {
-  return async (req, res, next) => {
-    // מחיקה אחרי שהבקשה הצליחה
-    const originalJson = res.json.bind(res);
-
-    res.json = async function (data) {
-      // אם הבקשה הצליחה, נקה cache
-      if (res.statusCode >= 200 && res.statusCode < 300) {
-        try {
-          const companyId = req.user?.companyId || req.query.companyId || "global";
-
-          // מחיקת כל ה-patterns
-          for (const pattern of patterns) {
-            const fullPattern = `cache:*${pattern}*${companyId}*`;
-            await clearCachePattern(fullPattern);
-          }
-
-          console.log(`🗑️  Cache cleared for patterns: ${patterns.join(", ")}`);
-        } catch (error) {
-          console.error("Clear cache error:", error);
-        }
-      }
-
-      return originalJson(data);
-    };
-
-    next();
-  };
-};
-
-/**
- * Middleware למחיקת cache כללי (כל החברה)
- */
-export const clearCompanyCache = async (req, res, next) => {
+const invalidateAfterSuccess = (req, res, next, getTags) => {
   const originalJson = res.json.bind(res);
 
-  res.json = async function (data) {
+  res.json = function (data) {
+    // מחיקה אחרי שהבקשה הצליחה
     if (res.statusCode >= 200 && res.statusCode < 300) {
-      try {
-        const companyId = req.user?.companyId || req.query.companyId;
-        if (companyId) {
-          await clearCachePattern(`cache:*${companyId}*`);
-          console.log(`🗑️  Cleared all cache for company: ${companyId}`);
-        }
-      } catch (error) {
-        console.error("Clear company cache error:", error);
+      const companyId = resolveCompanyId(req);
+      if (companyId) {
+        invalidateCacheTags(getTags(companyId)).catch((error) => {
+          stats.errors++;
+          console.error("Clear cache error:", error);
+        });
       }
     }
 
@@ -112,42 +265,79 @@ export const clearCompanyCache = async (req, res, next) => {
   next();
 };
 
+/**
+ * Middleware למחיקת cache אוטומטית לפי משאבים
+ * משתמש ב-POST, PUT, DELETE, PATCH
+ * לדוגמה: clearCache("analytics") מוחק את כל ה-cache של /api/analytics לחברה
+ */
+export const clearCache = (...resources) => {
+  return (req, res, next) =>
+    invalidateAfterSuccess(req, res, next, (companyId) =>
+      resources.map((resource) => resourceTag(companyId, resource))
+    );
+};
+
+/**
+ * Middleware למחיקת cache כללי (כל החברה)
+ */
+export const clearCompanyCache = (req, res, next) =>
+  invalidateAfterSuccess(req, res, next, (companyId) => [companyTag(companyId)]);
+
 /**
  * Cache עבור פונקציות בודדות (לא middleware)
+ * options.tags - תגיות למחיקה מרוכזת (ראה companyTag / resourceTag)
  */
-export const cacheFunction = async (key, fn, duration = 300) => {
-  if (!redis || redis.status !== "ready") {
-    return await fn();
-  }
+export const cacheFunction = async (key, fn, duration = 300, options = {}) => {
+  const tags = options.tags || [];
+  const startedAt = Date.now();
 
   try {
-    // בדיקה בcache
-    const cached = await getCache(key);
-    if (cached) {
-      console.log(`📦 Function cache HIT: ${key}`);
-      return cached;
+    if (isRedisReady()) {
+      const cached = await tieredGet(key, tags, duration);
+      if (cached !== undefined) {
+        recordLookup(startedAt);
+        return cached;
+      }
     }
 
-    console.log(`🔍 Function cache MISS: ${key}`);
-
-    // הרצת הפונקציה
-    const result = await fn();
-
-    // שמירה בcache
-    await setCache(key, result, duration);
-
-    return result;
+    const pending = inflight.get(key);
+    if (pending) {
+      stats.coalesced++;
+      recordLookup(startedAt);
+      return await pending;
+    }
+    recordLookup(startedAt);
   } catch (error) {
+    stats.errors++;
     console.error("Cache function error:", error);
-    // במקרה של שגיאה, מריצים את הפונקציה בלי cache
     return await fn();
   }
+
+  // חישוב יחיד - בקשות מקבילות מקבלות את אותו promise
+  const promise = (async () => {
+    const generations = isRedisReady() ? await snapshotGenerations(tags) : null;
+    const result = await fn();
+    if (generations && isRedisReady()) {
+      await tieredSet(key, result, duration, tags, generations).catch((error) => {
+        stats.errors++;
+        console.error("Cache function save error:", error);
+      });
+    }
+    return result;
+  })();
+
+  inflight.set(key, promise);
+  try {
+    return await promise;
+  } finally {
+    if (inflight.get(key) === promise) inflight.delete(key);
+  }
 };
 
 /**
  * Cache decorator לשימוש עם async functions
  */
-export const cached = (duration = 300, keyGenerator = null) => {
+export const cached = (duration = 300, keyGenerator = null, options = {}) => {
   return (target, propertyName, descriptor) => {
     const originalMethod = descriptor.value;
 
@@ -156,18 +346,36 @@ export const cached = (duration = 300, keyGenerator = null) => {
         ? keyGenerator(...args)
         : `${propertyName}:${JSON.stringify(args)}`;
 
-      return await cacheFunction(cacheKey, () => originalMethod.apply(this, args), duration);
+      return await cacheFunction(cacheKey, () => originalMethod.apply(this, args), duration, options);
     };
 
     return descriptor;
   };
 };
 
+/**
+ * מוני hit/miss/latency (במקום לוג פר-בקשה)
+ */
+export const getCacheStats = () => {
+  const hits = stats.l1Hits + stats.l2Hits;
+  const total = hits + stats.misses;
+  return {
+    ...stats,
+    hitRate: total > 0 ? Number((hits / total).toFixed(4)) : 0,
+    avgLookupMs: stats.lookups > 0 ? Number((stats.lookupMs / stats.lookups).toFixed(2)) : 0,
+    l1Size: l1.size,
+    inflight: inflight.size,
+    redisActive: isRedisReady(),
+  };
+};
+
 export default {
   cache,
   clearCache,
   clearCompanyCache,
   cacheFunction,
   cached,
+  invalidateCacheTags,
+  invalidateCompanyCache,
+  getCacheStats,
 };
-
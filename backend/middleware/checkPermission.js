@@ -1,4 +1,7 @@
-import { checkUserPermission } from "../controllers/permission.controller.js";
+import {
+  getAuthSnapshot,
+  snapshotHasPermission,
+} from "../services/authSnapshot.service.js";
 
 /**
  * Middleware to check if user has permission for specific module and action
@@ -22,12 +25,10 @@ export const checkPermission = (module, action) => {
         return next();
       }
 
-      // Check user permission
-      const hasPermission = await checkUserPermission(
-        req.user._id.toString(),
-        module,
-        action
-      );
+      // Check user permission against the compiled snapshot (set by protectRoute)
+      const snapshot =
+        req.authSnapshot || (await getAuthSnapshot(req.user._id.toString()));
+      const hasPermission = snapshotHasPermission(snapshot, module, action);
 
       if (!hasPermission) {
         return res.status(403).json({
@@ -1,3 +1,5 @@
+import { countTotal, keysetPaginate } from "./pagination.js";
+
 /**
  * Middleware לאופטימיזציה של queries
  * מוסיף אוטומטית .lean() ו-select() לפי הצורך
@@ -95,13 +97,23 @@ export class OptimizedQueryBuilder {
     return await this.query.lean().exec();
   }
 
-  async execWithCount() {
+  /**
+   * total: exact (ברירת מחדל) | estimated (ספירה עד סף) | none (ללא ספירה)
+   */
+  async execWithCount({ total: mode = "exact" } = {}) {
     const [data, total] = await Promise.all([
       this.query.lean().exec(),
-      this.model.countDocuments(this.filter),
+      countTotal(this.model, this.filter, mode),
     ]);
     return { data, total };
   }
+
+  /**
+   * דף לפי keyset cursor במקום skip - ראה keysetPaginate
+   */
+  async execKeyset({ sort, limit = 50, cursor = null, total = "none" } = {}) {
+    return keysetPaginate(this.query.lean(), { sort, limit, cursor, total });
+  }
 }
 
 /**
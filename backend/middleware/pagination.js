@@ -1,3 +1,18 @@
+import mongoose from "mongoose";
+
+// מעבר לסף הזה total=estimated מחזיר את הסף עצמו (totalIsEstimate)
+export const ESTIMATED_TOTAL_CAP = Number(process.env.PAGINATION_ESTIMATE_CAP) || 10000;
+
+/**
+ * ספירת תוצאות לפי מצב: exact - countDocuments מלא, estimated - ספירה עד ESTIMATED_TOTAL_CAP,
+ * none - ללא ספירה (null)
+ */
+export const countTotal = async (model, filter, mode = "exact") => {
+  if (mode === "none") return null;
+  if (mode === "estimated") return model.countDocuments(filter, { limit: ESTIMATED_TOTAL_CAP });
+  return model.countDocuments(filter);
+};
+
 /**
  * Pagination middleware - שיפור דרמטי בביצועים!
  * במקום לטעון 10,000 רשומות - רק 20!
@@ -21,8 +36,8 @@ export const paginate = (model) => {
       // בניית query (יכול להיות מוגדר קודם ב-middleware אחר)
       const query = req.filterQuery || {};
 
-      // ספירה מהירה
-      const total = await model.countDocuments(query);
+      // ספירה - מדויקת (ברירת מחדל), מוגבלת (total=estimated) או ללא (total=none)
+      const total = await countTotal(model, query, req.query.total);
 
       // שמירת מידע pagination ב-request
       req.pagination = {
@@ -30,8 +45,8 @@ export const paginate = (model) => {
         limit,
         skip,
         total,
-        pages: Math.ceil(total / limit),
-        hasNext: page * limit < total,
+        pages: total === null ? null : Math.ceil(total / limit),
+        hasNext: total === null ? null : page * limit < total,
         hasPrev: page > 1,
       };
 
@@ -68,7 +83,7 @@ export const paginateResponse = (data, pagination) => {
 /**
  * Pagination עבור Aggregation pipelines
  */
-export const paginateAggregate = async (model, pipeline, page = 1, limit = 20) => {
+export const paginateAggregate = async (model, pipeline, page = 1, limit = 20, { withTotal = true } = {}) => {
   const skip = (page - 1) * limit;
 
   // הוספת pagination ל-pipeline
@@ -83,10 +98,10 @@ export const paginateAggregate = async (model, pipeline, page = 1, limit = 20) =
 
   const [data, countResult] = await Promise.all([
     model.aggregate(paginatedPipeline),
-    model.aggregate(countPipeline),
+    withTotal ? model.aggregate(countPipeline) : null,
   ]);
 
-  const total = countResult[0]?.total || 0;
+  const total = withTotal ? countResult[0]?.total || 0 : null;
 
   return {
     data,
@@ -94,12 +109,152 @@ export const paginateAggregate = async (model, pipeline, page = 1, limit = 20) =
       page,
       limit,
       total,
-      pages: Math.ceil(total / limit),
-      hasNext: page * limit < total,
+      pages: total === null ? null : Math.ceil(total / limit),
+      hasNext: total === null ? data.length === limit : page * limit < total,
       hasPrev: page > 1,
     },
   };
 };
 
-export default { paginate, paginateResponse, paginateAggregate };
+// ========== KEYSET (CURSOR) PAGINATION ==========
+// במקום skip (שסורק ומדלג על כל הדפים הקודמים) ממשיכים מערכי מפתחות המיון
+// של הרשומה האחרונה בדף - כל דף עולה אותו דבר, גם בעומק של מיליון רשומות.
+// מפתחות המיון צריכים להיות מכוסים באינדקס ולא ריקים (null).
+// ה-cursor אטום ללקוח: base64url של ערכי המפתחות.
+
+const paginationError = (message) => {
+  const error = new Error(message);
+  error.statusCode = 400;
+  return error;
+};
+
+const encodeValue = (value) => {
+  if (value instanceof Date) return { $d: value.toISOString() };
+  if (value instanceof mongoose.Types.ObjectId) return { $o: value.toString() };
+  return value ?? null;
+};
+
+const decodeValue = (value) => {
+  if (value === null || typeof value !== "object") return value;
+  if (typeof value.$d === "string" && !Number.isNaN(Date.parse(value.$d))) return new Date(value.$d);
+  if (typeof value.$o === "string" && mongoose.Types.ObjectId.isValid(value.$o)) {
+    return new mongoose.Types.ObjectId(value.$o);
+  }
+  throw paginationError("Invalid pagination cursor");
+};
+
+const readPath = (doc, path) => {
+  if (typeof doc.get === "function") return doc.get(path);
+  return path.split(".").reduce((value, key) => value?.[key], doc);
+};
+
+/**
+ * מיון יציב: כיוונים מנורמלים ל-1/-1 ו-_id כשובר שוויון אחרון
+ */
+export const normalizeKeysetSort = (sort = { _id: -1 }) => {
+  const entries = Object.entries(sort).map(([key, direction]) => [
+    key,
+    direction === -1 || direction === "-1" || direction === "desc" ? -1 : 1,
+  ]);
+  if (!entries.some(([key]) => key === "_id")) {
+    entries.push(["_id", entries.length > 0 ? entries[entries.length - 1][1] : -1]);
+  }
+  return entries;
+};
+
+export const encodeCursor = (doc, entries) =>
+  Buffer.from(
+    JSON.stringify({
+      k: entries.map(([key, direction]) => `${key}:${direction}`),
+      v: entries.map(([key]) => encodeValue(readPath(doc, key))),
+    })
+  ).toString("base64url");
+
+export const decodeCursor = (cursor, entries) => {
+  let parsed;
+  try {
+    parsed = JSON.parse(Buffer.from(String(cursor), "base64url").toString("utf8"));
+  } catch {
+    throw paginationError("Invalid pagination cursor");
+  }
+  const keys = entries.map(([key, direction]) => `${key}:${direction}`);
+  if (!Array.isArray(parsed?.k) || !Array.isArray(parsed?.v) || parsed.k.join() !== keys.join()) {
+    throw paginationError("Pagination cursor does not match this listing");
+  }
+  return parsed.v.map(decodeValue);
+};
+
+/**
+ * תנאי "אחרי ה-cursor": (a < va) OR (a = va AND b < vb) OR ...
+ */
+export const keysetFilter = (entries, values) => {
+  const branches = [];
+  entries.forEach(([key, direction], index) => {
+    const branch = {};
+    for (let i = 0; i < index; i++) branch[entries[i][0]] = values[i];
+    if (values[index] === null) {
+      // null ממוין ראשון בסדר עולה - בסדר יורד אין אחריו כלום
+      if (direction === -1) return;
+      branch[key] = { $ne: null };
+    } else {
+      branch[key] = { [direction === -1 ? "$lt" : "$gt"]: values[index] };
+    }
+    branches.push(branch);
+  });
+  return branches.length > 0 ? { $or: branches } : { _id: { $exists: false } };
+};
+
+/**
+ * קריאת פרמטרי keyset מה-query string: limit, cursor, total (none | estimated | exact)
+ */
+export const parseKeysetQuery = (query = {}, { defaultLimit = 50, maxLimit = 500 } = {}) => {
+  const limit = query.limit === undefined || query.limit === "" ? defaultLimit : Number(query.limit);
+  if (!Number.isInteger(limit) || limit < 1 || limit > maxLimit) {
+    throw paginationError("Invalid pagination parameters");
+  }
+  const total = ["none", "estimated", "exact"].includes(query.total) ? query.total : "none";
+  return { limit, cursor: query.cursor || null, total };
+};
+
+/**
+ * דף אחד של Mongoose query לפי keyset.
+ * query - ה-find עם הפילטר, populate, select וכו' (המיון נקבע כאן לפי sort).
+ * מחזיר { data, pagination: { itemsPerPage, hasNextPage, nextCursor, totalItems?, totalIsEstimate? } }
+ */
+export const keysetPaginate = async (query, { sort, limit = 50, cursor = null, total = "none" } = {}) => {
+  const entries = normalizeKeysetSort(sort);
+  // עותק לספירה - and() מוסיף ל-$and של ה-query עצמו
+  const filter = { ...query.getFilter() };
+  if (Array.isArray(filter.$and)) filter.$and = [...filter.$and];
+
+  if (cursor) {
+    query.and([keysetFilter(entries, decodeCursor(cursor, entries))]);
+  }
+  const rows = await query.sort(Object.fromEntries(entries)).limit(limit + 1);
+
+  const hasNextPage = rows.length > limit;
+  const data = hasNextPage ? rows.slice(0, limit) : rows;
+  const pagination = {
+    itemsPerPage: limit,
+    hasNextPage,
+    nextCursor: hasNextPage ? encodeCursor(data[data.length - 1], entries) : null,
+  };
+
+  const totalItems = await countTotal(query.model, filter, total);
+  if (totalItems !== null) {
+    pagination.totalItems = totalItems;
+    pagination.totalIsEstimate = total === "estimated" && totalItems >= ESTIMATED_TOTAL_CAP;
+  }
+
+  return { data, pagination };
+};
+
+export default {
+  paginate,
+  paginateResponse,
+  paginateAggregate,
+  countTotal,
+  keysetPaginate,
+  parseKeysetQuery,
+};
 
@@ -1,6 +1,6 @@
 import jwt from "jsonwebtoken";
 import dotenv from "dotenv";
-import Employee from "../models/employees.model.js";
+import { getAuthSnapshot, hydrateSnapshotUser } from "../services/authSnapshot.service.js";
 
 dotenv.config();
 
@@ -31,9 +31,9 @@ export const protectRoute = async (req, res, next) => {
         .json({ success: false, message: "Unauthorized - Invalid token" });
     }
 
-    // Find the user based on the decoded ID
-    const user = await Employee.findById(decoded.userId).select("-password");
-    if (!user) {
+    // Find the user based on the decoded ID (cached snapshot)
+    const snapshot = await getAuthSnapshot(decoded.userId);
+    if (!snapshot) {
       return res
         .status(404)
         .json({ success: false, message: "User not found" });
@@ -41,7 +41,8 @@ export const protectRoute = async (req, res, next) => {
 
 
     // Attach the user to the request object for further use in the route
-    req.user = user;
+    req.user = hydrateSnapshotUser(snapshot);
+    req.authSnapshot = snapshot;
     next();
   } catch (error) {
     console.error("Error in protectRoute middleware:", error.message);
@@ -81,25 +82,22 @@ export const protectCompanyOrUserRoute = async (req, res, next) => {
       });
     }
 
-    console.log("Decoded token:", decoded);
-
     // Check if it's a user token or company token
     if (decoded.userId) {
       // User token - find the user
-      const user = await Employee.findById(decoded.userId).select("-password");
-      if (!user) {
+      const snapshot = await getAuthSnapshot(decoded.userId);
+      if (!snapshot) {
         return res.status(404).json({ 
           success: false, 
           message: "User not found",
           error: "Employee account not found"
         });
       }
-      req.user = user;
-      console.log("Authenticated as user:", user._id, "Company:", user.company);
+      req.user = hydrateSnapshotUser(snapshot);
+      req.authSnapshot = snapshot;
     } else if (decoded.companyId) {
       // Company token - just attach the companyId
       req.user = { companyId: decoded.companyId };
-      console.log("Authenticated as company:", decoded.companyId);
     } else {
       return res.status(401).json({ 
         success: false, 
@@ -0,0 +1,74 @@
+import mongoose from "mongoose";
+
+// תנועות מצטברות לחשבון לתקופה (יום / חודש)
+// יתרת סגירה של תקופה = סכום התנועות של כל התקופות עד סופה.
+// נשמרות תנועות ולא יתרות, כך שרישום בדיעבד מעדכן רק את היום והחודש שלו ($inc)
+// רשומת meta אחת לחברה (periodType "meta", ללא חשבון) מסמנת מתי נבנו ה-snapshots ואם הם דורשים בנייה מחדש
+const accountBalanceSnapshotSchema = new mongoose.Schema(
+  {
+    companyId: {
+      type: mongoose.Schema.Types.ObjectId,
+      ref: "Company",
+      required: true,
+    },
+    accountId: {
+      type: mongoose.Schema.Types.ObjectId,
+      ref: "Account",
+      required: function () {
+        return this.periodType !== "meta";
+      },
+    },
+    periodType: {
+      type: String,
+      enum: ["day", "month", "meta"],
+      required: true,
+    },
+    // תחילת התקופה (UTC)
+    periodStart: {
+      type: Date,
+      required: true,
+    },
+    debit: {
+      type: Number,
+      default: 0,
+    },
+    credit: {
+      type: Number,
+      default: 0,
+    },
+    entryCount: {
+      type: Number,
+      default: 0,
+    },
+    // meta בלבד
+    rebuiltAt: {
+      type: Date,
+    },
+    dirtyAt: {
+      type: Date,
+    },
+    // חלון הבנייה האחרונה - רישומים שחופפים לו מסמנים dirty
+    rebuildStartedAt: {
+      type: Date,
+    },
+    rebuildFinishedAt: {
+      type: Date,
+    },
+  },
+  {
+    timestamps: true,
+  }
+);
+
+// Indexes
+accountBalanceSnapshotSchema.index(
+  { companyId: 1, accountId: 1, periodType: 1, periodStart: 1 },
+  { unique: true }
+);
+accountBalanceSnapshotSchema.index({ companyId: 1, periodType: 1, periodStart: 1 });
+
+const AccountBalanceSnapshot =
+  mongoose.models.AccountBalanceSnapshot ||
+  mongoose.model("AccountBalanceSnapshot", accountBalanceSnapshotSchema);
+
+export default AccountBalanceSnapshot;
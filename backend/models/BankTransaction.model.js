@@ -97,6 +97,21 @@ const bankTransactionSchema = new mongoose.Schema(
       originalReference: { type: String },
       importDate: { type: Date },
     },
+    // טביעת אצבע לזיהוי כפילויות בייבוא (חשבון, תאריך, סכום, אסמכתא)
+    fingerprint: {
+      type: String,
+    },
+    // התאמה אוטומטית בזמן ייבוא
+    autoReconciled: {
+      type: Boolean,
+      default: false,
+    },
+    reconciliationMatch: {
+      documentType: { type: String, enum: ["Invoice", "JournalEntry"] },
+      documentId: { type: mongoose.Schema.Types.ObjectId },
+      matchedBy: { type: String, enum: ["reference", "amountDate"] },
+      matchedAt: { type: Date },
+    },
   },
   {
     timestamps: true,
@@ -105,9 +120,17 @@ const bankTransactionSchema = new mongoose.Schema(
 
 // Indexes
 bankTransactionSchema.index({ companyId: 1, bankAccountId: 1, transactionDate: -1 });
+// מיון הרשימה / keyset pagination
+bankTransactionSchema.index({ companyId: 1, transactionDate: -1, createdAt: -1, _id: -1 });
 bankTransactionSchema.index({ companyId: 1, reconciliationStatus: 1 });
 bankTransactionSchema.index({ journalEntryId: 1 });
 bankTransactionSchema.index({ financeRecordId: 1 });
+// ייבוא חוזר של אותו דף לא יוצר כפילויות
+bankTransactionSchema.index(
+  { companyId: 1, fingerprint: 1 },
+  { unique: true, partialFilterExpression: { fingerprint: { $type: "string" } } }
+);
+bankTransactionSchema.index({ "reconciliationMatch.documentId": 1 }, { sparse: true });
 
 const BankTransaction =
   mongoose.models.BankTransaction ||
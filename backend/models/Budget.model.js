@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 const BudgetSchema = new mongoose.Schema({
   companyId: {
@@ -77,6 +78,9 @@ const BudgetSchema = new mongoose.Schema({
   updatedAt: { type: Date, default: Date.now },
 });
 
+// עדכון סיכומי הדוחות בכל כתיבה
+BudgetSchema.plugin(reportRollupPlugin, { source: "budgets" });
+
 const Budget = mongoose.models.Budget || mongoose.model("Budget", BudgetSchema);
 
 export default Budget;
@@ -1,5 +1,6 @@
 import mongoose from "mongoose";
 import addressSchema from "./subschemas/address.schema.js";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 // סכימת פריט בהזמנה (Order Item)
 const OrderItemSchema = new mongoose.Schema({
@@ -154,6 +155,9 @@ const CustomerOrderSchema = new mongoose.Schema(
   }
 );
 
+// עדכון סיכומי הדוחות בכל כתיבה
+CustomerOrderSchema.plugin(reportRollupPlugin, { source: "customerOrders" });
+
 const CustomerOrder =
   mongoose.models.CustomerOrder ||
   mongoose.model("CustomerOrder", CustomerOrderSchema);
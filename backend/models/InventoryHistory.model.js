@@ -83,6 +83,8 @@ const inventoryHistorySchema = new mongoose.Schema(
 
 // Indexes for better query performance
 inventoryHistorySchema.index({ companyId: 1, productId: 1, timestamp: -1 });
+// מיון הרשימה / keyset pagination
+inventoryHistorySchema.index({ companyId: 1, timestamp: -1, _id: -1 });
 inventoryHistorySchema.index({ orderId: 1 });
 inventoryHistorySchema.index({ timestamp: -1 });
 
@@ -143,7 +143,11 @@ journalEntrySchema.pre("save", function (next) {
 
 // Indexes
 journalEntrySchema.index({ companyId: 1, entryDate: -1 });
+// מיון הרשימה / keyset pagination
+journalEntrySchema.index({ companyId: 1, entryDate: -1, createdAt: -1, _id: -1 });
 journalEntrySchema.index({ companyId: 1, status: 1 });
+// התאמת תנועות בנק בייבוא (סכום + תאריך)
+journalEntrySchema.index({ companyId: 1, status: 1, totalDebit: 1, entryDate: 1 });
 journalEntrySchema.index({ "sourceDocument.documentId": 1 });
 
 const JournalEntry =
@@ -0,0 +1,112 @@
+import mongoose from "mongoose";
+
+// ריצת חישוב משכורות לחודש (חישוב / חישוב מחדש) - מצב, התקדמות ו-cursor להמשך אחרי קריסה
+const PayrollRunSchema = new mongoose.Schema(
+  {
+    companyId: {
+      type: mongoose.Schema.Types.ObjectId,
+      ref: "Company",
+      required: true,
+    },
+    year: {
+      type: Number,
+      required: true,
+    },
+    month: {
+      type: Number,
+      required: true,
+      min: 1,
+      max: 12,
+    },
+    mode: {
+      type: String,
+      enum: ["calculate", "recalculate"],
+      required: true,
+    },
+    // מקור תצורת המס: ברירת המחדל בהגדרות האוטומציה, או לפי מדינת העובד
+    taxSource: {
+      type: String,
+      enum: ["companyDefault", "employeeCountry"],
+      default: "companyDefault",
+    },
+    trigger: {
+      type: String,
+      enum: ["manual", "cron"],
+      default: "manual",
+    },
+    notes: {
+      type: String,
+      default: "",
+    },
+    status: {
+      type: String,
+      enum: ["running", "completed", "failed"],
+      default: "running",
+    },
+    // true כל עוד הריצה לא הסתיימה - מבטיח ריצה פעילה אחת לחודש
+    active: {
+      type: Boolean,
+      default: true,
+    },
+    total: {
+      type: Number,
+      default: 0,
+    },
+    processed: {
+      type: Number,
+      default: 0,
+    },
+    succeeded: {
+      type: Number,
+      default: 0,
+    },
+    failed: {
+      type: Number,
+      default: 0,
+    },
+    // נשמרות עד 500 שגיאות ראשונות
+    errorLog: [
+      {
+        employeeId: mongoose.Schema.Types.ObjectId,
+        salaryId: mongoose.Schema.Types.ObjectId,
+        employeeName: String,
+        error: String,
+      },
+    ],
+    // _id אחרון שעובד (עובד / משכורת) - ממנו ממשיכים אחרי קריסה
+    cursor: {
+      type: mongoose.Schema.Types.ObjectId,
+      default: null,
+    },
+    owner: {
+      type: String,
+    },
+    heartbeatAt: {
+      type: Date,
+      default: Date.now,
+    },
+    startedBy: {
+      type: mongoose.Schema.Types.ObjectId,
+      ref: "Employee",
+    },
+    finishedAt: {
+      type: Date,
+    },
+    failureReason: {
+      type: String,
+    },
+  },
+  {
+    timestamps: true,
+  }
+);
+
+PayrollRunSchema.index(
+  { companyId: 1, year: 1, month: 1 },
+  { unique: true, partialFilterExpression: { active: true } }
+);
+PayrollRunSchema.index({ companyId: 1, year: 1, month: 1, createdAt: -1 });
+PayrollRunSchema.index({ active: 1, heartbeatAt: 1 });
+
+const PayrollRun = mongoose.models.PayrollRun || mongoose.model("PayrollRun", PayrollRunSchema);
+export default PayrollRun;
@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 const productSchema = new mongoose.Schema({
   productId: {
     type: mongoose.Schema.Types.ObjectId,
@@ -78,6 +79,9 @@ ProcurementProposalSchema.pre("save", function (next) {
   next();
 });
 
+// עדכון סיכומי הדוחות בכל כתיבה
+ProcurementProposalSchema.plugin(reportRollupPlugin, { source: "procurementProposals" });
+
 const ProcurementProposal = mongoose.model(
   "ProcurementProposal",
   ProcurementProposalSchema
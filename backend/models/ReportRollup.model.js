@@ -0,0 +1,51 @@
+import mongoose from "mongoose";
+
+// סיכום יומי מצטבר לדוחות - מסמך לכל (חברה, תחום, יום, צירוף ממדים)
+// metrics: סכומים שמתעדכנים ב-$inc, maxima/minima: ערכי קצה ($max / $min)
+// day = null לתחומים שמייצגים מצב נוכחי (למשל עובדים לפי סטטוס)
+const ReportRollupSchema = new mongoose.Schema(
+  {
+    companyId: {
+      type: mongoose.Schema.Types.ObjectId,
+      ref: "Company",
+      required: true,
+    },
+    domain: {
+      type: String,
+      required: true,
+    },
+    day: {
+      type: Date,
+      default: null,
+    },
+    // מפתח הממדים המנורמל (ערכים מחוברים ב-|) - חלק מה-unique index
+    key: {
+      type: String,
+      default: "",
+    },
+    dims: {
+      type: mongoose.Schema.Types.Mixed,
+      default: {},
+    },
+    metrics: {
+      type: mongoose.Schema.Types.Mixed,
+      default: {},
+    },
+    maxima: {
+      type: mongoose.Schema.Types.Mixed,
+    },
+    minima: {
+      type: mongoose.Schema.Types.Mixed,
+    },
+  },
+  {
+    timestamps: true,
+    minimize: false,
+  }
+);
+
+ReportRollupSchema.index({ companyId: 1, domain: 1, day: 1, key: 1 }, { unique: true });
+
+const ReportRollup =
+  mongoose.models.ReportRollup || mongoose.model("ReportRollup", ReportRollupSchema);
+export default ReportRollup;
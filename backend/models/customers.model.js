@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 const CustomerSchema = new mongoose.Schema(
   {
@@ -113,6 +114,9 @@ const CustomerSchema = new mongoose.Schema(
   }
 );
 
+// עדכון סיכומי הדוחות בכל כתיבה
+CustomerSchema.plugin(reportRollupPlugin, { source: "customers" });
+
 const Customer =
   mongoose.models.Customer || mongoose.model("Customer", CustomerSchema);
 export default Customer;
@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 const employeeSchema = new mongoose.Schema(
   {
@@ -243,6 +244,9 @@ employeeSchema.pre("save", function (next) {
   next();
 });
 
+// עדכון סיכומי הדוחות בכל כתיבה
+employeeSchema.plugin(reportRollupPlugin, { source: "employees" });
+
 const Employee = mongoose.model("Employee", employeeSchema);
 
 export default Employee;
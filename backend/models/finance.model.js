@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 const financeSchema = new mongoose.Schema(
   {
@@ -137,6 +138,9 @@ financeSchema.pre("save", function (next) {
 financeSchema.index({ companyId: 1, budgetId: 1 });
 financeSchema.index({ companyId: 1, transactionType: 1, transactionDate: -1 });
 
+// עדכון סיכומי הדוחות בכל כתיבה
+financeSchema.plugin(reportRollupPlugin, { source: "finance" });
+
 const Finance = mongoose.model("Finance", financeSchema);
 
 export default Finance;
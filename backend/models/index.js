@@ -27,6 +27,8 @@ import WarehouseLocation from "./warehouseLocation.model.js";
 import Account from "./Account.model.js";
 import JournalEntry from "./JournalEntry.model.js";
 import Ledger from "./Ledger.model.js";
+import AccountBalanceSnapshot from "./AccountBalanceSnapshot.model.js";
+import ReportRollup from "./ReportRollup.model.js";
 import BankAccount from "./BankAccount.model.js";
 import BankTransaction from "./BankTransaction.model.js";
 import SalesOpportunity from "./SalesOpportunity.model.js";
@@ -72,6 +74,8 @@ export {
   Account,
   JournalEntry,
   Ledger,
+  AccountBalanceSnapshot,
+  ReportRollup,
   BankAccount,
   BankTransaction,
   SalesOpportunity,
@@ -298,6 +298,7 @@ invoiceSchema.index({ customerId: 1 });
 invoiceSchema.index({ procurementId: 1 });
 invoiceSchema.index({ dueDate: 1, status: 1 }); // For finding overdue invoices
 invoiceSchema.index({ status: 1, paymentStatus: 1 }); // For finding unpaid invoices
+invoiceSchema.index({ companyId: 1, paymentStatus: 1, totalAmount: 1 }); // For bank import auto-reconciliation
 invoiceSchema.index({ pdfUrl: 1 }); // For finding invoices with PDFs
 invoiceSchema.index({ "history.changedAt": -1 }); // For audit trail queries
 
@@ -112,6 +112,8 @@ const notificationSchema = new mongoose.Schema(
 // Index for performance
 notificationSchema.index({ companyId: 1, employeeId: 1, isRead: 1 });
 notificationSchema.index({ companyId: 1, category: 1, createdAt: -1 });
+// מיון הרשימה / keyset pagination
+notificationSchema.index({ companyId: 1, createdAt: -1, _id: -1 });
 notificationSchema.index({ expirationDate: 1 });
 
 const Notification = mongoose.model("Notification", notificationSchema);
@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 // סכמה של ביקורת ביצועים ממוקדת שאלות
 const performanceReviewSchema = new mongoose.Schema(
@@ -101,6 +102,9 @@ const performanceReviewSchema = new mongoose.Schema(
   }
 );
 
+// עדכון סיכומי הדוחות בכל כתיבה
+performanceReviewSchema.plugin(reportRollupPlugin, { source: "performanceReviews" });
+
 // יצירת המודל
 const PerformanceReview = mongoose.model(
   "PerformanceReview",
@@ -0,0 +1,209 @@
+import { ROLLUP_SOURCES, applyRollupChange } from "../../services/reportRollup.service.js";
+
+// עדכון סיכומי הדוחות (ReportRollup) בכל כתיבה למודל מקור:
+// לוכדים את מצב המסמכים לפני הכתיבה ואחריה ומעבירים את ההפרש ל-applyRollupChange.
+// כשל בעדכון הסיכום נרשם ללוג ולא מפיל את הכתיבה - הבנייה הלילית מתקנת סטיות.
+// כל hook מעביר את זמן תחילת הכתיבה, כדי שכתיבה שחופפת לבנייה מחדש תסמן את החברה כ-dirty.
+//
+// Usage: schema.plugin(reportRollupPlugin, { source: "finance" })
+
+// updateMany / deleteMany על יותר מסמכים מזה - מדלגים ומשאירים לבנייה מחדש
+const MAX_QUERY_DOCS = Number(process.env.REPORT_ROLLUP_HOOK_MAX_DOCS) || 5000;
+
+const QUERY_OPS = [
+  "updateOne",
+  "updateMany",
+  "replaceOne",
+  "findOneAndUpdate",
+  "findOneAndReplace",
+  "deleteOne",
+  "deleteMany",
+  "findOneAndDelete",
+];
+const DELETE_OPS = new Set(["deleteOne", "deleteMany", "findOneAndDelete"]);
+const UPDATE_OPS = new Set(["updateOne", "updateMany", "findOneAndUpdate"]);
+
+// ערך סופי בהעתק: מסמך populated -> המזהה שלו, מערכים ותת-מסמכים -> אובייקטים רגילים
+const plainValue = (value) => {
+  if (value && value.$__ !== undefined && !value.$isSubdocument) return value._id;
+  if (Array.isArray(value)) return Array.from(value, plainValue);
+  if (value && !value._bsontype && typeof value.toObject === "function") return value.toObject({ depopulate: true });
+  return value;
+};
+
+// העתקה של נתיבים בלבד (paths = רשימות של מקטעים), גם דרך מערכים של תת-מסמכים
+const pickPaths = (value, paths) => {
+  if (paths.some((path) => path.length === 0)) return plainValue(value);
+  if (value === null || value === undefined || typeof value !== "object" || value._bsontype) return value;
+  if (Array.isArray(value)) return Array.from(value, (item) => pickPaths(item, paths));
+
+  const byHead = new Map();
+  for (const [head, ...rest] of paths) {
+    if (!byHead.has(head)) byHead.set(head, []);
+    byHead.get(head).push(rest);
+  }
+  const copy = {};
+  for (const [head, rest] of byHead) {
+    copy[head] = pickPaths(value.$__ !== undefined ? value.get(head, null, { getters: false }) : value[head], rest);
+  }
+  return copy;
+};
+
+// העתק של השדות הרלוונטיים בלבד (ללא populate) - רק תתי-השדות שהסיכום קורא, לא מערכים שלמים
+const snapshot = (doc, pathsByRoot) => {
+  const copy = { _id: doc._id };
+  for (const [root, paths] of pathsByRoot) {
+    copy[root] = pickPaths(doc.get(root, null, { getters: false }), paths);
+  }
+  return copy;
+};
+
+// האם עדכון (query) נוגע באחד משדות הסיכום; pipeline update נחשב כנוגע
+const updateTouches = (update, roots) => {
+  if (!update || Array.isArray(update)) return true;
+  for (const [key, value] of Object.entries(update)) {
+    if (!key.startsWith("$")) {
+      if (roots.has(key.split(".")[0])) return true;
+      continue;
+    }
+    if (!value || typeof value !== "object") continue;
+    const paths = key === "$rename" ? [...Object.keys(value), ...Object.values(value)] : Object.keys(value);
+    if (paths.some((path) => roots.has(String(path).split(".")[0]))) return true;
+  }
+  return false;
+};
+
+const reportRollupPlugin = (schema, { source }) => {
+  const { fields } = ROLLUP_SOURCES[source];
+  const pathsByRoot = new Map();
+  for (const [root, ...rest] of fields.map((field) => field.split("."))) {
+    if (!pathsByRoot.has(root)) pathsByRoot.set(root, []);
+    pathsByRoot.get(root).push(rest);
+  }
+  const roots = [...pathsByRoot.keys()];
+  const rootSet = new Set(roots);
+  const projection = fields.join(" ");
+
+  const apply = async (before, after, since) => {
+    try {
+      await applyRollupChange(source, before, after, { since });
+    } catch (error) {
+      console.error(`❌ Report rollup update failed (${source}):`, error.message);
+    }
+  };
+
+  // ---------- document middleware ----------
+
+  // מצב המסמך כפי שנטען - רק אם כל השדות נבחרו (אחרת נטען מחדש לפני השמירה)
+  schema.post("init", function () {
+    if (roots.every((root) => this.isSelected(root))) {
+      this.$locals.rollupBefore = snapshot(this, pathsByRoot);
+    }
+  });
+
+  schema.pre("save", async function () {
+    this.$locals.rollupSkip = false;
+    this.$locals.rollupStartedAt = new Date();
+    if (this.isNew) {
+      this.$locals.rollupBefore = null;
+      return;
+    }
+    // שמירה שלא שינתה אף שדה של הסיכום - אין מה לעדכן ואין צורך ב-pre-image
+    if (!roots.some((root) => this.isModified(root))) {
+      this.$locals.rollupSkip = true;
+      return;
+    }
+    if (this.$locals.rollupBefore === undefined) {
+      try {
+        this.$locals.rollupBefore = await this.constructor.findById(this._id).select(projection).lean();
+      } catch (error) {
+        console.error(`❌ Report rollup snapshot failed (${source}):`, error.message);
+      }
+    }
+  });
+
+  schema.post("save", async function (doc) {
+    if (doc.$locals.rollupSkip || doc.$locals.rollupBefore === undefined) return;
+    const after = snapshot(doc, pathsByRoot);
+    await apply(doc.$locals.rollupBefore ? [doc.$locals.rollupBefore] : [], [after], doc.$locals.rollupStartedAt);
+    doc.$locals.rollupBefore = after;
+  });
+
+  schema.post("insertMany", async function (docs) {
+    // ה-_id נוצר בצד הלקוח לפני ה-insert - הזמן שלו (בדיוק של שנייה, מעוגל למטה) הוא תחילת הכתיבה
+    const since = docs.reduce((earliest, doc) => {
+      const created = doc._id?.getTimestamp?.();
+      return created && created < earliest ? created : earliest;
+    }, new Date());
+    await apply([], docs.map((doc) => (typeof doc.get === "function" ? snapshot(doc, pathsByRoot) : doc)), since);
+  });
+
+  schema.pre("deleteOne", { document: true, query: false }, async function () {
+    this.$locals.rollupStartedAt = new Date();
+    if (this.$locals.rollupBefore === undefined) {
+      try {
+        this.$locals.rollupBefore = await this.constructor.findById(this._id).select(projection).lean();
+      } catch (error) {
+        console.error(`❌ Report rollup snapshot failed (${source}):`, error.message);
+      }
+    }
+  });
+
+  schema.post("deleteOne", { document: true, query: false }, async function (doc) {
+    const before = doc.$locals.rollupBefore;
+    if (before) await apply([before], [], doc.$locals.rollupStartedAt);
+  });
+
+  // ---------- query middleware ----------
+
+  for (const op of QUERY_OPS) {
+    schema.pre(op, { document: false, query: true }, async function () {
+      this._rollupBefore = null;
+      this._rollupStartedAt = new Date();
+      // עדכון שלא נוגע בשדות הסיכום (ולא יכול ליצור מסמך) - בלי שאילתת pre-image
+      if (UPDATE_OPS.has(op) && !this.getOptions().upsert && !updateTouches(this.getUpdate(), rootSet)) {
+        return;
+      }
+      try {
+        let query = this.model.find(this.getFilter()).select(projection).lean();
+        if (op.endsWith("Many")) {
+          query = query.limit(MAX_QUERY_DOCS + 1);
+        } else {
+          const { sort } = this.getOptions();
+          query = (sort ? query.sort(sort) : query).limit(1);
+        }
+        const before = await query;
+        if (before.length > MAX_QUERY_DOCS) {
+          console.warn(`⚠️ Report rollup skipped for ${source}.${op} (more than ${MAX_QUERY_DOCS} documents)`);
+          return;
+        }
+        this._rollupBefore = before;
+      } catch (error) {
+        console.error(`❌ Report rollup snapshot failed (${source}.${op}):`, error.message);
+      }
+    });
+
+    schema.post(op, { document: false, query: true }, async function () {
+      const before = this._rollupBefore;
+      if (!before) return;
+
+      let after = [];
+      if (!DELETE_OPS.has(op)) {
+        try {
+          if (before.length > 0) {
+            after = await this.model.find({ _id: { $in: before.map((doc) => doc._id) } }).select(projection).lean();
+          } else if (this.getOptions().upsert) {
+            after = await this.model.find(this.getFilter()).select(projection).limit(1).lean();
+          }
+        } catch (error) {
+          console.error(`❌ Report rollup snapshot failed (${source}.${op}):`, error.message);
+          return;
+        }
+      }
+
+      await apply(before, after, this._rollupStartedAt);
+    });
+  }
+};
+
+export default reportRollupPlugin;
@@ -1,5 +1,6 @@
 import mongoose from "mongoose";
 import addressSchema from "./subschemas/address.schema.js";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 const productSchema = new mongoose.Schema(
   {
@@ -163,6 +164,9 @@ procurementSchema.index(
   { unique: true, sparse: true }
 );
 
+// עדכון סיכומי הדוחות בכל כתיבה
+procurementSchema.plugin(reportRollupPlugin, { source: "procurement" });
+
 const Procurement =
   mongoose.models.Procurement || mongoose.model("Procurement", procurementSchema);
 
@@ -72,6 +72,15 @@ const SalarySchema = new mongoose.Schema(
 
 // Index for efficient queries by employee and period
 SalarySchema.index({ employeeId: 1, periodStart: 1 });
+// משכורת אחת לעובד לתקופה - גם כששתי ריצות שכר כותבות במקביל
+SalarySchema.index({ companyId: 1, employeeId: 1, periodStart: 1 }, { unique: true });
 
 const Salary = mongoose.models.Salary || mongoose.model("Salary", SalarySchema);
+
+// בניית ה-unique index נכשלת כשיש כפילויות ישנות - לא לבלוע את זה (npm run salaries:dedupe)
+Salary.on("index", (error) => {
+  if (error) {
+    console.error("❌ Salary index build failed - run `npm run salaries:dedupe -- --apply`:", error.message);
+  }
+});
 export default Salary;
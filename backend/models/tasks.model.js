@@ -1,4 +1,5 @@
 import mongoose from "mongoose";
+import reportRollupPlugin from "./plugins/reportRollup.plugin.js";
 
 const taskSchema = new mongoose.Schema(
   {
@@ -69,5 +70,8 @@ const taskSchema = new mongoose.Schema(
   { timestamps: true }
 );
 
+// עדכון סיכומי הדוחות בכל כתיבה
+taskSchema.plugin(reportRollupPlugin, { source: "tasks" });
+
 const TaskModel = mongoose.model("Task", taskSchema);
 export default TaskModel;
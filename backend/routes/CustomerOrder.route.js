@@ -8,11 +8,12 @@ import {
   deleteCustomerOrder,
   getUnallocatedOrders,
 } from "../controllers/CustomerOrder.controller.js";
+import { clearCache } from "../middleware/cache.js";
 
 const router = express.Router();
 
 // Create a new customer order
-router.post("/", createCustomerOrder);
+router.post("/", clearCache("analytics"), createCustomerOrder);
 
 // Create order from invoice
 router.post("/from-invoice", createOrderFromInvoice);
@@ -111,10 +112,10 @@ router.post("/:id/create-production-orders", async (req, res) => {
 router.get("/:id", getCustomerOrderById);
 
 // Update an existing customer order
-router.put("/:id", updateCustomerOrder);
+router.put("/:id", clearCache("analytics"), updateCustomerOrder);
 
 // Delete a customer order by its ID
-router.delete("/:id", deleteCustomerOrder);
+router.delete("/:id", clearCache("analytics"), deleteCustomerOrder);
 
 // Update order status
 router.put("/:id/status", async (req, res) => {
@@ -14,6 +14,8 @@ import {
   // Ledger
   getLedgerEntries,
   getAccountBalance,
+  // Balance Snapshots
+  rebuildBalanceSnapshots,
   // Reports
   getTrialBalance,
   getProfitAndLoss,
@@ -40,6 +42,9 @@ router.get("/journal-entries/:id", getJournalEntryById);
 router.get("/ledger", getLedgerEntries);
 router.get("/ledger/balance", getAccountBalance);
 
+// Balance Snapshot Routes
+router.post("/snapshots/rebuild", rebuildBalanceSnapshots);
+
 // Financial Reports Routes
 router.get("/reports/trial-balance", getTrialBalance);
 router.get("/reports/profit-loss", getProfitAndLoss);
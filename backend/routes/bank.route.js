@@ -1,5 +1,6 @@
 import express from "express";
 import multer from "multer";
+import os from "os";
 import {
   // Bank Accounts
   createBankAccount,
@@ -15,7 +16,11 @@ import {
 } from "../controllers/bank.controller.js";
 
 const router = express.Router();
-const upload = multer({ storage: multer.memoryStorage() });
+// דפי בנק נשמרים לקובץ זמני ונקראים בזרימה (דפים של כמה שנים יכולים להיות גדולים מאוד)
+const upload = multer({
+  storage: multer.diskStorage({ destination: os.tmpdir() }),
+  limits: { fileSize: Number(process.env.BANK_IMPORT_MAX_FILE_BYTES) || 500 * 1024 * 1024 },
+});
 
 // Bank Account Routes
 router.post("/accounts", createBankAccount);
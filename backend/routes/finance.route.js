@@ -11,6 +11,7 @@ import {
   getCashFlowForecast,
 } from "../controllers/finance.controller.js";
 import multer from "multer";
+import { clearCache } from "../middleware/cache.js";
 
 const router = express.Router();
 
@@ -20,11 +21,12 @@ const upload = multer({ storage: multer.memoryStorage() }); // או הגדרה 
 router.post(
   "/create-finance",
   upload.array("attachment", 5),
+  clearCache("analytics"),
   createFinanceRecord
 );
 router.get("/", getAllFinanceRecords);
-router.put("/:id", updateFinanceRecord);
-router.delete("/:id", deleteFinanceRecord);
+router.put("/:id", clearCache("analytics"), updateFinanceRecord);
+router.delete("/:id", clearCache("analytics"), deleteFinanceRecord);
 
 // Cash Flow Analysis Routes
 router.get("/cash-flow/analysis", getCashFlowAnalysis);
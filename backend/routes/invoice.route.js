@@ -15,6 +15,7 @@ import {
   createInvoiceForSuperAdmin,
   getInvoiceByIdForSuperAdmin,
   generateInvoicePDFForSuperAdmin,
+  generateBulkInvoicePDFs,
 } from "../controllers/invoice.controller.js";
 
 const router = express.Router();
@@ -38,6 +39,9 @@ router.get("/superadmin/:id/pdf", generateInvoicePDFForSuperAdmin);
 // Create invoice from order
 router.post("/from-order", createInvoiceFromOrder);
 
+// Bulk render invoice PDFs (zip download)
+router.post("/bulk-pdf", generateBulkInvoicePDFs);
+
 // Generate invoice PDF
 router.get("/:id/pdf", generateInvoicePDF);
 
@@ -4,8 +4,10 @@ import {
   getDashboardOverview,
   getFinanceReport,
   getHRReport,
-  getSalesReport
+  getSalesReport,
+  rebuildReportRollupsForCompany
 } from "../controllers/reports.controller.js";
+import { protectRoute, requireRole } from "../middleware/auth.middleware.js";
 
 const router = express.Router();
 
@@ -38,4 +40,8 @@ router.get("/hr", getHRReport);
 // תומך ב-query params: ?startDate=YYYY-MM-DD&endDate=YYYY-MM-DD
 router.get("/sales", getSalesReport);
 
+// בנייה מחדש של הסיכומים היומיים שהדוחות נשענים עליהם (אחרי ייבוא / תיקון נתונים)
+// פעולה כבדה - מנהלי החברה בלבד
+router.post("/rollups/rebuild", protectRoute, requireRole("Admin"), rebuildReportRollupsForCompany);
+
 export default router;
@@ -0,0 +1,45 @@
+// בנייה (backfill) של סיכומי הדוחות היומיים מתוך מודלי המקור
+//
+// Usage:
+//   npm run rollups:backfill                 # כל החברות
+//   npm run rollups:backfill -- <companyId>  # חברה אחת
+
+import mongoose from "mongoose";
+import { connectDB } from "../config/db.js";
+import { getCompanyIds } from "../services/jobEngine.service.js";
+import { rebuildReportRollups } from "../services/reportRollupBackfill.service.js";
+
+const run = async () => {
+  await connectDB();
+
+  const [companyArg] = process.argv.slice(2);
+  const companyIds = companyArg ? [companyArg] : await getCompanyIds();
+
+  console.log(`📊 Backfilling report rollups for ${companyIds.length} companies...`);
+
+  let failed = 0;
+  for (const companyId of companyIds) {
+    try {
+      const result = await rebuildReportRollups(companyId);
+      const total = Object.values(result.rollups).reduce((sum, count) => sum + count, 0);
+      console.log(`✅ ${result.companyId}: ${total} rollups (${result.durationMs}ms)`);
+    } catch (error) {
+      failed++;
+      console.error(`❌ ${companyId}: ${error.message}`);
+    }
+  }
+
+  console.log(`🏁 Done (${companyIds.length - failed} rebuilt, ${failed} failed)`);
+  return failed;
+};
+
+run()
+  .then(async (failed) => {
+    await mongoose.disconnect();
+    process.exit(failed > 0 ? 1 : 0);
+  })
+  .catch(async (error) => {
+    console.error("❌ Report rollup backfill failed:", error);
+    await mongoose.disconnect();
+    process.exit(1);
+  });
@@ -0,0 +1,231 @@
+// Benchmark: דוחות כספיים בשיטה הישנה (שאילתה לכל חשבון) מול snapshots
+// יוצר ledger סינתטי בחברה זמנית, משווה זמנים ותוצאות, ומוחק את הנתונים בסוף.
+//
+// Usage:
+//   npm run bench:accounting -- [--entries=100000] [--accounts=80] [--runs=3] [--keep]
+//
+// דורש MONGO_URI. לא להריץ מול production.
+
+import mongoose from "mongoose";
+import { connectDB } from "../config/db.js";
+import Account from "../models/Account.model.js";
+import Ledger from "../models/Ledger.model.js";
+import AccountBalanceSnapshot from "../models/AccountBalanceSnapshot.model.js";
+import {
+  getAccountMovements,
+  getAccountBalancesAsOf,
+  rebuildAccountSnapshots,
+  signedBalance,
+} from "../services/accountBalance.service.js";
+
+const args = Object.fromEntries(
+  process.argv.slice(2).map((arg) => {
+    const [key, value] = arg.replace(/^--/, "").split("=");
+    return [key, value === undefined ? true : value];
+  })
+);
+
+const ENTRY_COUNT = Number(args.entries) || 100000;
+const ACCOUNT_COUNT = Number(args.accounts) || 80;
+const RUNS = Number(args.runs) || 3;
+const INSERT_BATCH = 5000;
+const HISTORY_DAYS = 730;
+
+const ACCOUNT_TYPES = ["Asset", "Liability", "Equity", "Revenue", "Expense", "Cost of Goods Sold"];
+
+const companyId = new mongoose.Types.ObjectId();
+
+const seed = async () => {
+  const accounts = await Account.insertMany(
+    Array.from({ length: ACCOUNT_COUNT }, (_, i) => ({
+      companyId,
+      accountNumber: String(1000 + i),
+      accountName: `Bench account ${i}`,
+      accountType: ACCOUNT_TYPES[i % ACCOUNT_TYPES.length],
+    }))
+  );
+
+  // רשומות בסדר כרונולוגי עם יתרה מצטברת - כמו ש-postJournalEntry כותב
+  const start = Date.now() - HISTORY_DAYS * 24 * 60 * 60 * 1000;
+  const step = (HISTORY_DAYS * 24 * 60 * 60 * 1000) / ENTRY_COUNT;
+  const running = new Map();
+  const journalEntryId = new mongoose.Types.ObjectId();
+  let batch = [];
+
+  for (let i = 0; i < ENTRY_COUNT; i++) {
+    const account = accounts[Math.floor(Math.random() * accounts.length)];
+    const amount = Math.round(Math.random() * 100000) / 100;
+    const isDebit = Math.random() < 0.5;
+    const debit = isDebit ? amount : 0;
+    const credit = isDebit ? 0 : amount;
+    const balance = (running.get(account.id) || 0) + signedBalance(account.accountType, { debit, credit });
+    running.set(account.id, balance);
+
+    batch.push({
+      companyId,
+      accountId: account._id,
+      accountNumber: account.accountNumber,
+      accountName: account.accountName,
+      journalEntryId,
+      entryDate: new Date(start + i * step),
+      debit,
+      credit,
+      balance,
+    });
+
+    if (batch.length === INSERT_BATCH) {
+      await Ledger.insertMany(batch, { ordered: false, lean: true });
+      batch = [];
+    }
+  }
+  if (batch.length > 0) await Ledger.insertMany(batch, { ordered: false, lean: true });
+
+  return accounts;
+};
+
+// ---------- השיטה הישנה: שאילתה (או סריקה) לכל חשבון ----------
+
+const legacyTrialBalance = async (asOf) => {
+  const accounts = await Account.find({ companyId, isActive: true });
+  const balances = {};
+  for (const account of accounts) {
+    const last = await Ledger.findOne({ companyId, accountId: account._id, entryDate: { $lte: asOf } })
+      .sort({ entryDate: -1, createdAt: -1 })
+      .limit(1);
+    balances[account.id] = last?.balance || 0;
+  }
+  return balances;
+};
+
+const legacyProfitAndLoss = async (from, to) => {
+  const accounts = await Account.find({
+    companyId,
+    accountType: { $in: ["Revenue", "Expense", "Cost of Goods Sold"] },
+    isActive: true,
+  });
+  let total = 0;
+  for (const account of accounts) {
+    const entries = await Ledger.find({ companyId, accountId: account._id, entryDate: { $gte: from, $lte: to } });
+    total += entries.reduce((sum, e) => sum + e.credit - e.debit, 0);
+  }
+  return total;
+};
+
+// ---------- השיטה החדשה: aggregation אחד על snapshots + ledger ----------
+
+const snapshotTrialBalance = async (asOf) => {
+  const [accounts, movements] = await Promise.all([
+    Account.find({ companyId, isActive: true }).lean(),
+    getAccountBalancesAsOf(companyId, asOf),
+  ]);
+  const balances = {};
+  for (const account of accounts) {
+    const movement = movements.get(account._id.toString());
+    balances[account._id.toString()] = movement ? signedBalance(account.accountType, movement) : 0;
+  }
+  return balances;
+};
+
+const snapshotProfitAndLoss = async (from, to) => {
+  const [accounts, movements] = await Promise.all([
+    Account.find({
+      companyId,
+      accountType: { $in: ["Revenue", "Expense", "Cost of Goods Sold"] },
+      isActive: true,
+    }).lean(),
+    getAccountMovements(companyId, { from, to }),
+  ]);
+  return accounts.reduce((total, account) => {
+    const movement = movements.get(account._id.toString());
+    return movement ? total + movement.credit - movement.debit : total;
+  }, 0);
+};
+
+const time = async (fn) => {
+  const samples = [];
+  let result;
+  for (let i = 0; i < RUNS; i++) {
+    const startedAt = process.hrtime.bigint();
+    result = await fn();
+    samples.push(Number(process.hrtime.bigint() - startedAt) / 1e6);
+  }
+  samples.sort((a, b) => a - b);
+  return { result, medianMs: Number(samples[Math.floor(samples.length / 2)].toFixed(1)) };
+};
+
+const sameBalances = (a, b) =>
+  Object.keys(a).length === Object.keys(b).length &&
+  Object.keys(a).every((key) => Math.abs(a[key] - (b[key] || 0)) < 0.01);
+
+const run = async () => {
+  await connectDB();
+  // ה-indexes של ה-ledger וה-snapshots חייבים להיות קיימים לפני המדידה
+  await Promise.all([Ledger.init(), AccountBalanceSnapshot.init()]);
+
+  console.log(`🌱 Seeding ${ENTRY_COUNT} ledger entries over ${ACCOUNT_COUNT} accounts (company ${companyId})...`);
+  let startedAt = Date.now();
+  await seed();
+  console.log(`   seeded in ${Date.now() - startedAt}ms`);
+
+  startedAt = Date.now();
+  const rebuild = await rebuildAccountSnapshots(companyId);
+  console.log(`🔄 Rebuilt ${rebuild.snapshots} snapshots in ${Date.now() - startedAt}ms`);
+
+  const now = new Date();
+  const historical = new Date(now.getTime() - 200.5 * 24 * 60 * 60 * 1000);
+  const periodStart = new Date(now.getTime() - 400.25 * 24 * 60 * 60 * 1000);
+
+  const scenarios = [
+    ["Trial balance (now)", () => legacyTrialBalance(now), () => snapshotTrialBalance(now), sameBalances],
+    ["Trial balance (asOfDate)", () => legacyTrialBalance(historical), () => snapshotTrialBalance(historical), sameBalances],
+    [
+      "Profit & loss (period)",
+      () => legacyProfitAndLoss(periodStart, historical),
+      () => snapshotProfitAndLoss(periodStart, historical),
+      (a, b) => Math.abs(a - b) < 0.01,
+    ],
+  ];
+
+  const rows = [];
+  for (const [name, legacy, snapshot, compare] of scenarios) {
+    const before = await time(legacy);
+    const after = await time(snapshot);
+    rows.push({
+      report: name,
+      legacyMs: before.medianMs,
+      snapshotMs: after.medianMs,
+      speedup: `${(before.medianMs / Math.max(after.medianMs, 0.1)).toFixed(1)}x`,
+      match: compare(before.result, after.result),
+    });
+  }
+
+  console.table(rows);
+  return rows.every((row) => row.match);
+};
+
+const cleanup = async () => {
+  if (args.keep) {
+    console.log(`ℹ️  Keeping synthetic data for company ${companyId}`);
+    return;
+  }
+  await Promise.all([
+    Ledger.deleteMany({ companyId }),
+    Account.deleteMany({ companyId }),
+    AccountBalanceSnapshot.deleteMany({ companyId }),
+  ]);
+  console.log("🧹 Synthetic data removed");
+};
+
+run()
+  .then(async (allMatch) => {
+    await cleanup();
+    await mongoose.disconnect();
+    if (!allMatch) console.error("❌ Snapshot results differ from the legacy path");
+    process.exit(allMatch ? 0 : 1);
+  })
+  .catch(async (error) => {
+    console.error("❌ Benchmark failed:", error);
+    await cleanup().catch(() => {});
+    await mongoose.disconnect();
+    process.exit(1);
+  });
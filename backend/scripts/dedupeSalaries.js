@@ -0,0 +1,87 @@
+// איחוד משכורות כפולות (אותו עובד ואותה תקופה) ובניית ה-unique index
+// { companyId, employeeId, periodStart }. בלי הניקוי בניית ה-index נכשלת,
+// ו-autoIndex של Mongoose רק רושם את הכשל - לכן ה-index נבנה כאן במפורש.
+//
+// Usage:
+//   npm run salaries:dedupe               # דוח בלבד - מציג כפילויות ולא משנה דבר
+//   npm run salaries:dedupe -- --apply    # מוחק כפילויות ובונה את ה-index
+
+import mongoose from "mongoose";
+import { connectDB } from "../config/db.js";
+import Salary from "../models/salary.model.js";
+
+const DELETE_BATCH_SIZE = 1000;
+
+// המשכורת שנשארת: הסטטוס המתקדם ביותר, ואחריו העדכון האחרון
+const STATUS_RANK = { Paid: 3, Approved: 2, Draft: 1, Canceled: 0 };
+
+const pickKeeper = (salaries) =>
+  [...salaries].sort(
+    (a, b) =>
+      (STATUS_RANK[b.status] ?? -1) - (STATUS_RANK[a.status] ?? -1) ||
+      new Date(b.updatedAt || 0) - new Date(a.updatedAt || 0)
+  )[0];
+
+const findDuplicateGroups = () =>
+  Salary.aggregate([
+    {
+      $group: {
+        _id: { companyId: "$companyId", employeeId: "$employeeId", periodStart: "$periodStart" },
+        salaries: { $push: { _id: "$_id", status: "$status", netPay: "$netPay", updatedAt: "$updatedAt" } },
+        count: { $sum: 1 },
+      },
+    },
+    { $match: { count: { $gt: 1 } } },
+  ]).allowDiskUse(true);
+
+const run = async () => {
+  await connectDB();
+  const apply = process.argv.includes("--apply");
+
+  const groups = await findDuplicateGroups();
+  const toDelete = [];
+  for (const group of groups) {
+    const keeper = pickKeeper(group.salaries);
+    const removed = group.salaries.filter((salary) => !salary._id.equals(keeper._id));
+    toDelete.push(...removed.map((salary) => salary._id));
+
+    const { companyId, employeeId, periodStart } = group._id;
+    console.log(
+      `⚠️ company ${companyId} employee ${employeeId} period ${periodStart?.toISOString?.()}: ` +
+        `keeping ${keeper._id} (${keeper.status}, ${keeper.netPay}), ` +
+        `duplicates ${removed.map((salary) => `${salary._id} (${salary.status}, ${salary.netPay})`).join(", ")}`
+    );
+  }
+
+  console.log(`🔍 Found ${groups.length} duplicated salary periods (${toDelete.length} extra salaries)`);
+
+  if (!apply) {
+    if (toDelete.length > 0) {
+      console.log("ℹ️  Dry run - re-run with --apply to delete the duplicates and build the unique index");
+    }
+    return toDelete.length > 0 ? 1 : 0;
+  }
+
+  let deleted = 0;
+  for (let i = 0; i < toDelete.length; i += DELETE_BATCH_SIZE) {
+    const result = await Salary.deleteMany({ _id: { $in: toDelete.slice(i, i + DELETE_BATCH_SIZE) } });
+    deleted += result.deletedCount;
+  }
+  console.log(`🗑️  Deleted ${deleted} duplicate salaries`);
+
+  // זורק אם עדיין יש כפילויות (למשל כתיבה שנכנסה בזמן הניקוי) - מריצים שוב
+  await Salary.createIndexes();
+  console.log("✅ Salary indexes built (companyId + employeeId + periodStart unique)");
+  return 0;
+};
+
+run()
+  .then(async (exitCode) => {
+    await mongoose.disconnect();
+    process.exit(exitCode);
+  })
+  .catch(async (error) => {
+    console.error("❌ Salary dedupe failed:", error);
+    await mongoose.disconnect();
+    process.exit(1);
+  });
@@ -0,0 +1,44 @@
+// חישוב מחדש של snapshots יתרות החשבונות מתוך ה-ledger
+//
+// Usage:
+//   npm run snapshots:rebuild                 # כל החברות שיש להן רשומות ledger
+//   npm run snapshots:rebuild -- <companyId>  # חברה אחת
+
+import mongoose from "mongoose";
+import { connectDB } from "../config/db.js";
+import Ledger from "../models/Ledger.model.js";
+import { rebuildAccountSnapshots } from "../services/accountBalance.service.js";
+
+const run = async () => {
+  await connectDB();
+
+  const [companyArg] = process.argv.slice(2);
+  const companyIds = companyArg ? [companyArg] : await Ledger.distinct("companyId");
+
+  console.log(`🔄 Rebuilding balance snapshots for ${companyIds.length} companies...`);
+
+  let failed = 0;
+  for (const companyId of companyIds) {
+    try {
+      const result = await rebuildAccountSnapshots(companyId);
+      console.log(`✅ ${result.companyId}: ${result.snapshots} snapshots (${result.durationMs}ms)`);
+    } catch (error) {
+      failed++;
+      console.error(`❌ ${companyId}: ${error.message}`);
+    }
+  }
+
+  console.log(`🏁 Done (${companyIds.length - failed} rebuilt, ${failed} failed)`);
+  return failed;
+};
+
+run()
+  .then(async (failed) => {
+    await mongoose.disconnect();
+    process.exit(failed > 0 ? 1 : 0);
+  })
+  .catch(async (error) => {
+    console.error("❌ Snapshot rebuild failed:", error);
+    await mongoose.disconnect();
+    process.exit(1);
+  });
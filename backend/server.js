@@ -1,6 +1,7 @@
 import express from "express";
 import dotenv from "dotenv";
 import { connectDB } from "./config/db.js";
+import { getCacheStats } from "./middleware/cache.js";
 import cookieParser from "cookie-parser";
 import cors from "cors";
 import path from "path";
@@ -115,6 +116,7 @@ app.get("/api/health", async (_req, res) => {
     hasMongoUri,
     hasJwtSecret: Boolean(process.env.JWT_SECRET),
     db,
+    cache: getCacheStats(),
   });
 });
 
@@ -237,7 +239,8 @@ import("./config/addIndexes.js")
 // In-process cron jobs require a persistent process. Skip on Vercel unless
 // ENABLE_CRON=true (Fluid compute can scale to zero).
 if (!isServerless || process.env.ENABLE_CRON === "true") {
-  await import("./CronJob.js");
+  const { startCronJobs } = await import("./CronJob.js");
+  startCronJobs();
 }
 
 app.listen(PORT, () => {
@@ -0,0 +1,404 @@
+// services/accountBalance.service.js
+// Snapshots של תנועות חשבון (יומי + חודשי) לדוחות כספיים בלי סריקת ה-ledger לכל חשבון.
+// יתרה לתאריך = חודשים שלמים (snapshot חודשי) + ימים שלמים בחודש האחרון (snapshot יומי)
+// + רשומות ledger של היום החלקי האחרון. כל זה ב-aggregation אחד ($unionWith).
+
+import mongoose from "mongoose";
+import Ledger from "../models/Ledger.model.js";
+import AccountBalanceSnapshot from "../models/AccountBalanceSnapshot.model.js";
+import { acquireLock, releaseLock } from "../config/redis.js";
+
+const REBUILD_LOCK_TTL_MS = 30 * 60 * 1000;
+// כמה זמן דוח ממתין לבנייה שרצה ב-instance אחר לפני 503
+const REBUILD_WAIT_MS = 25 * 1000;
+const REBUILD_POLL_MS = 1000;
+const PERIOD_TYPES = ["day", "month"];
+const META_PERIOD_START = new Date(0);
+
+const toObjectId = (id) => (id instanceof mongoose.Types.ObjectId ? id : new mongoose.Types.ObjectId(String(id)));
+
+// ========== DATE HELPERS (UTC) ==========
+
+const startOfDay = (date) =>
+  new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), date.getUTCDate()));
+
+const startOfMonth = (date) => new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), 1));
+
+const ceilDay = (date) => {
+  const day = startOfDay(date);
+  return day.getTime() === date.getTime() ? day : new Date(Date.UTC(day.getUTCFullYear(), day.getUTCMonth(), day.getUTCDate() + 1));
+};
+
+const ceilMonth = (date) => {
+  const month = startOfMonth(date);
+  return month.getTime() === date.getTime() ? month : new Date(Date.UTC(month.getUTCFullYear(), month.getUTCMonth() + 1, 1));
+};
+
+/**
+ * פענוח תאריך מה-query - מחזיר null לתאריך לא תקין
+ */
+export const parseReportDate = (value) => {
+  if (value === undefined || value === null || value === "") return null;
+  const date = new Date(value);
+  return Number.isNaN(date.getTime()) ? null : date;
+};
+
+/**
+ * יתרה חתומה לפי סוג החשבון - אותו כלל כמו ב-postJournalEntry
+ * (Asset / Expense: חובה פחות זכות, כל השאר: זכות פחות חובה)
+ */
+export const signedBalance = (accountType, { debit = 0, credit = 0 } = {}) =>
+  accountType === "Asset" || accountType === "Expense" ? debit - credit : credit - debit;
+
+// ========== INCREMENTAL MAINTENANCE ==========
+
+/**
+ * עדכון ה-snapshots לפי רשומות ledger חדשות - upsert עם $inc ליום ולחודש של כל רשומה
+ * רשומות של אותו חשבון באותה תקופה מתאחדות לפעולה אחת
+ */
+export const applyLedgerEntriesToSnapshots = async (ledgerEntries) => {
+  const buckets = new Map();
+
+  for (const entry of ledgerEntries) {
+    const entryDate = new Date(entry.entryDate);
+    const periods = [
+      ["day", startOfDay(entryDate)],
+      ["month", startOfMonth(entryDate)],
+    ];
+
+    for (const [periodType, periodStart] of periods) {
+      const key = `${entry.accountId}|${periodType}|${periodStart.getTime()}`;
+      let bucket = buckets.get(key);
+      if (!bucket) {
+        bucket = {
+          companyId: toObjectId(entry.companyId),
+          accountId: toObjectId(entry.accountId),
+          periodType,
+          periodStart,
+          debit: 0,
+          credit: 0,
+          entryCount: 0,
+        };
+        buckets.set(key, bucket);
+      }
+      bucket.debit += entry.debit || 0;
+      bucket.credit += entry.credit || 0;
+      bucket.entryCount++;
+    }
+  }
+
+  if (buckets.size === 0) return 0;
+
+  const operations = [...buckets.values()].map(({ debit, credit, entryCount, ...period }) => ({
+    updateOne: {
+      filter: period,
+      update: { $inc: { debit, credit, entryCount } },
+      upsert: true,
+    },
+  }));
+
+  await AccountBalanceSnapshot.bulkWrite(operations, { ordered: false });
+  return operations.length;
+};
+
+// ========== QUERIES ==========
+
+/**
+ * פירוק טווח [from, to] לקטעים: חודשים שלמים, ימים שלמים, ושוליים חלקיים מה-ledger
+ * from ריק = מתחילת הזמן (יתרה לתאריך)
+ */
+const buildRangeSegments = (from, to) => {
+  const start = from || new Date(0);
+  const end = to;
+  const segments = { months: null, days: [], ledger: [] };
+  if (start > end) return segments;
+
+  const firstFullDay = ceilDay(start);
+  const lastDayStart = startOfDay(end);
+
+  // הטווח כולו בתוך יום אחד
+  if (firstFullDay > lastDayStart) {
+    segments.ledger.push({ $gte: start, $lte: end });
+    return segments;
+  }
+
+  if (start < firstFullDay) segments.ledger.push({ $gte: start, $lt: firstFullDay });
+  segments.ledger.push({ $gte: lastDayStart, $lte: end });
+
+  // ימים שלמים: [firstFullDay, lastDayStart)
+  const firstFullMonth = ceilMonth(firstFullDay);
+  const lastMonthStart = startOfMonth(lastDayStart);
+
+  if (firstFullMonth < lastMonthStart) {
+    if (firstFullDay < firstFullMonth) segments.days.push({ $gte: firstFullDay, $lt: firstFullMonth });
+    segments.months = { $gte: firstFullMonth, $lt: lastMonthStart };
+    if (lastMonthStart < lastDayStart) segments.days.push({ $gte: lastMonthStart, $lt: lastDayStart });
+  } else if (firstFullDay < lastDayStart) {
+    segments.days.push({ $gte: firstFullDay, $lt: lastDayStart });
+  }
+
+  return segments;
+};
+
+/**
+ * סכום חובה/זכות לכל חשבון בטווח - aggregation אחד על snapshots + ledger
+ * מחזיר Map: accountId -> { debit, credit, entryCount }
+ */
+export const getAccountMovements = async (companyId, { from = null, to = new Date(), accountIds = null } = {}) => {
+  const segments = buildRangeSegments(from, to);
+  const companyObjectId = toObjectId(companyId);
+  const accountFilter = accountIds ? { accountId: { $in: accountIds.map(toObjectId) } } : {};
+
+  const snapshotRanges = [
+    ...(segments.months ? [{ periodType: "month", periodStart: segments.months }] : []),
+    ...segments.days.map((range) => ({ periodType: "day", periodStart: range })),
+  ];
+  const ledgerRanges = segments.ledger.map((range) => ({ entryDate: range }));
+
+  const ledgerPipeline = [
+    { $match: { companyId: companyObjectId, ...accountFilter, $or: ledgerRanges } },
+    { $project: { _id: 0, accountId: 1, debit: 1, credit: 1, entryCount: { $literal: 1 } } },
+  ];
+  const groupStage = {
+    $group: {
+      _id: "$accountId",
+      debit: { $sum: "$debit" },
+      credit: { $sum: "$credit" },
+      entryCount: { $sum: "$entryCount" },
+    },
+  };
+
+  let rows = [];
+  if (snapshotRanges.length > 0) {
+    rows = await AccountBalanceSnapshot.aggregate([
+      { $match: { companyId: companyObjectId, ...accountFilter, $or: snapshotRanges } },
+      { $project: { _id: 0, accountId: 1, debit: 1, credit: 1, entryCount: 1 } },
+      ...(ledgerRanges.length > 0
+        ? [{ $unionWith: { coll: Ledger.collection.collectionName, pipeline: ledgerPipeline } }]
+        : []),
+      groupStage,
+    ]);
+  } else if (ledgerRanges.length > 0) {
+    rows = await Ledger.aggregate([...ledgerPipeline, groupStage]);
+  }
+
+  return new Map(
+    rows.map((row) => [
+      row._id.toString(),
+      { debit: row.debit, credit: row.credit, entryCount: row.entryCount },
+    ])
+  );
+};
+
+/**
+ * יתרות כל החשבונות לתאריך (ברירת מחדל: עכשיו)
+ */
+export const getAccountBalancesAsOf = (companyId, asOfDate = new Date(), options = {}) =>
+  getAccountMovements(companyId, { ...options, from: null, to: asOfDate });
+
+// ========== REBUILD ==========
+
+const periodStartExpression = (periodType) => ({
+  $dateFromParts: {
+    year: { $year: "$entryDate" },
+    month: { $month: "$entryDate" },
+    day: periodType === "day" ? { $dayOfMonth: "$entryDate" } : 1,
+  },
+});
+
+const metaFilter = (companyObjectId) => ({
+  companyId: companyObjectId,
+  accountId: null,
+  periodType: "meta",
+  periodStart: META_PERIOD_START,
+});
+
+/**
+ * חישוב מחדש של כל ה-snapshots של חברה מתוך ה-ledger
+ * (לאחר מיגרציה, תיקון נתונים ידני או חשד לסטייה). רץ תחת lock לחברה.
+ * ה-buckets נכתבים ב-$merge מעל הקיימים ורק אחר כך נמחקים אלה שלא נכתבו בריצה -
+ * אין חלון שבו הדוחות רואים snapshots ריקים.
+ * ה-$merge מחליף buckets שרישומים מקבילים עשו להם $inc באמצע - לכן הרישומים בודקים
+ * חפיפה לחלון הבנייה ומסמנים dirty, והסימון שורד את סוף הבנייה.
+ */
+export const rebuildAccountSnapshots = async (companyId) => {
+  const companyObjectId = toObjectId(companyId);
+  const lockKey = `lock:account-snapshots:${companyObjectId}`;
+  const token = await acquireLock(lockKey, REBUILD_LOCK_TTL_MS);
+  if (!token) {
+    const error = new Error("Snapshot rebuild already running for this company");
+    error.statusCode = 409;
+    throw error;
+  }
+
+  const startedAt = new Date();
+  try {
+    // $merge דורש את ה-unique index על שדות ה-on
+    await AccountBalanceSnapshot.init();
+    // חלון הבנייה נרשם ב-meta - רישום שחופף לו מסמן dirty (ראה markDirtyIfRebuildOverlapped)
+    await AccountBalanceSnapshot.updateOne(
+      metaFilter(companyObjectId),
+      { $set: { rebuildStartedAt: startedAt }, $unset: { rebuildFinishedAt: "" } },
+      { upsert: true }
+    );
+
+    for (const periodType of PERIOD_TYPES) {
+      await Ledger.aggregate([
+        { $match: { companyId: companyObjectId } },
+        {
+          $group: {
+            _id: { accountId: "$accountId", periodStart: periodStartExpression(periodType) },
+            debit: { $sum: "$debit" },
+            credit: { $sum: "$credit" },
+            entryCount: { $sum: 1 },
+          },
+        },
+        {
+          $project: {
+            _id: 0,
+            companyId: { $literal: companyObjectId },
+            accountId: "$_id.accountId",
+            periodType: { $literal: periodType },
+            periodStart: "$_id.periodStart",
+            debit: 1,
+            credit: 1,
+            entryCount: 1,
+            createdAt: { $literal: startedAt },
+            updatedAt: { $literal: startedAt },
+          },
+        },
+        {
+          $merge: {
+            into: AccountBalanceSnapshot.collection.collectionName,
+            on: ["companyId", "accountId", "periodType", "periodStart"],
+            whenMatched: "replace",
+            whenNotMatched: "insert",
+          },
+        },
+      ]).allowDiskUse(true);
+    }
+
+    // buckets שלא נכתבו בריצה (ואף רישום לא עדכן מאז) כבר לא קיימים ב-ledger
+    await AccountBalanceSnapshot.deleteMany({
+      companyId: companyObjectId,
+      periodType: { $in: PERIOD_TYPES },
+      updatedAt: { $lt: startedAt },
+    });
+
+    // סימון dirty שנוצר אחרי תחילת הבנייה נשאר - הבנייה הבאה תכסה אותו
+    await AccountBalanceSnapshot.updateOne(
+      metaFilter(companyObjectId),
+      { $set: { rebuiltAt: startedAt } },
+      { upsert: true }
+    );
+    await AccountBalanceSnapshot.updateOne(
+      { ...metaFilter(companyObjectId), dirtyAt: { $lt: startedAt } },
+      { $unset: { dirtyAt: "" } }
+    );
+
+    const snapshots = await AccountBalanceSnapshot.countDocuments({
+      companyId: companyObjectId,
+      periodType: { $in: PERIOD_TYPES },
+    });
+    return { companyId: companyObjectId.toString(), snapshots, durationMs: Date.now() - startedAt.getTime() };
+  } finally {
+    await AccountBalanceSnapshot.updateOne(metaFilter(companyObjectId), {
+      $set: { rebuildFinishedAt: new Date() },
+    }).catch((error) => console.error("❌ Error closing balance snapshot rebuild window:", error.message));
+    await releaseLock(lockKey, token);
+  }
+};
+
+/**
+ * סימון ה-snapshots של חברה כלא אמינים (עדכון נכשל אחרי שה-ledger נשמר)
+ * הדוח הבא של החברה יבנה אותם מחדש לפני הקריאה
+ */
+export const markAccountSnapshotsDirty = async (companyId) => {
+  await AccountBalanceSnapshot.updateOne(
+    metaFilter(toObjectId(companyId)),
+    { $set: { dirtyAt: new Date() } },
+    { upsert: true }
+  );
+};
+
+/**
+ * נקרא אחרי שרישום עדכן את ה-snapshots: אם בנייה מחדש רצה בזמן כלשהו מאז since
+ * (תחילת הרישום), ה-$merge שלה עלול למחוק את ה-$inc או לספור את הרשומות פעמיים -
+ * מסמנים dirty (אחרי startedAt של הבנייה, כך שהיא לא מנקה את הסימון).
+ */
+export const markDirtyIfRebuildOverlapped = async (companyId, since) => {
+  const companyObjectId = toObjectId(companyId);
+  const meta = await AccountBalanceSnapshot.findOne(metaFilter(companyObjectId))
+    .select("rebuildStartedAt rebuildFinishedAt")
+    .lean();
+  if (!meta?.rebuildStartedAt) return false;
+  // בנייה שלא נסגרה (רצה כרגע או שה-instance נפל באמצע) נחשבת חופפת
+  if (meta.rebuildFinishedAt && meta.rebuildFinishedAt < since) return false;
+
+  await markAccountSnapshotsDirty(companyObjectId);
+  return true;
+};
+
+// בניות שרצות כרגע בתהליך הנוכחי
+const pendingRebuilds = new Map();
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const snapshotsComplete = async (companyObjectId) => {
+  const meta = await AccountBalanceSnapshot.findOne(metaFilter(companyObjectId)).select("rebuiltAt dirtyAt").lean();
+  return { complete: Boolean(meta?.rebuiltAt && !meta.dirtyAt), meta };
+};
+
+/**
+ * מבטיח שה-snapshots של החברה שלמים לפני קריאת דוח:
+ * בפעם הראשונה (אין רשומת meta - חברה שה-ledger שלה קדם ל-snapshots) או אחרי סימון dirty - בנייה מחדש.
+ * אם instance אחר מחזיק את ה-lock ממתינים שיסיים; אם ה-snapshots לא שלמים עד REBUILD_WAIT_MS - 503.
+ */
+export const ensureAccountSnapshots = async (companyId) => {
+  const companyObjectId = toObjectId(companyId);
+  const id = companyObjectId.toString();
+  const deadline = Date.now() + REBUILD_WAIT_MS;
+
+  while (true) {
+    const { complete, meta } = await snapshotsComplete(companyObjectId);
+    if (complete) return;
+
+    if (!pendingRebuilds.has(id)) {
+      const rebuild = (async () => {
+        console.log(`🔄 ${meta?.dirtyAt ? "Rebuilding stale" : "Backfilling"} balance snapshots for company ${id}...`);
+        await rebuildAccountSnapshots(id);
+        return true;
+      })()
+        .catch((error) => {
+          if (error.statusCode === 409) return false;
+          console.error(`❌ Balance snapshot rebuild failed for company ${id}:`, error.message);
+          throw error;
+        })
+        .finally(() => pendingRebuilds.delete(id));
+      pendingRebuilds.set(id, rebuild);
+    }
+
+    // false = הבנייה רצה ב-instance אחר
+    const rebuilt = await Promise.race([pendingRebuilds.get(id), sleep(Math.max(0, deadline - Date.now()))]);
+    if (rebuilt === false) await sleep(REBUILD_POLL_MS);
+
+    if (Date.now() >= deadline) {
+      if ((await snapshotsComplete(companyObjectId)).complete) return;
+      const error = new Error("Balance snapshots are being rebuilt, please retry shortly");
+      error.statusCode = 503;
+      throw error;
+    }
+  }
+};
+
+export default {
+  applyLedgerEntriesToSnapshots,
+  getAccountMovements,
+  getAccountBalancesAsOf,
+  rebuildAccountSnapshots,
+  markAccountSnapshotsDirty,
+  markDirtyIfRebuildOverlapped,
+  ensureAccountSnapshots,
+  signedBalance,
+  parseReportDate,
+};
@@ -0,0 +1,169 @@
+// services/authSnapshot.service.js
+// Snapshot של משתמש מאומת + הרשאות מקומפלות, שמור ב-cache (L1 + Redis) עם חותמת גרסה
+// בקשה מוגנת עם cache חם לא מבצעת אף קריאה ל-DB
+
+import Employee from "../models/employees.model.js";
+import redis from "../config/redis.js";
+import { cacheFunction, invalidateCacheTags } from "../middleware/cache.js";
+
+const SNAPSHOT_TTL = Number(process.env.AUTH_SNAPSHOT_TTL) || 300;
+
+// שדות רגישים שלא נשמרים ב-cache
+const EXCLUDED_FIELDS = "-password -passwordResetToken -passwordResetExpires";
+
+const snapshotKey = (userId) => `auth:snapshot:${userId}`;
+const versionKey = (companyId) => `auth:version:${companyId}`;
+const userVersionKey = (userId) => `auth:user-version:${userId}`;
+const userTag = (userId) => `auth:user:${userId}`;
+const MAX_BUILD_ATTEMPTS = 3;
+
+/**
+ * קומפילציה של הרשאות role + custom למבנה { module: { action: true } }
+ * אותו מבנה שמוחזר ל-frontend ב-getUserPermissions
+ */
+export const compilePermissions = (rolePermissions = [], customPermissions = []) => {
+  const permissions = {};
+  const lists = [
+    Array.isArray(rolePermissions) ? rolePermissions : Object.values(rolePermissions || {}),
+    customPermissions || [],
+  ];
+
+  for (const list of lists) {
+    for (const perm of list) {
+      if (!perm || typeof perm.module !== "string" || !perm.module) continue;
+      if (!permissions[perm.module]) permissions[perm.module] = {};
+      for (const action of Array.isArray(perm.actions) ? perm.actions : []) {
+        if (action && typeof action === "string") {
+          permissions[perm.module][action] = true;
+        }
+      }
+    }
+  }
+  return permissions;
+};
+
+const isRedisReady = () => Boolean(redis) && redis.status === "ready";
+
+/**
+ * גרסאות נוכחיות: של החברה (שינוי roles) ושל המשתמש (שיוך role, עדכון עובד, סיסמה)
+ * מחזיר null כש-Redis לא זמין - אז גם אין cache ואין מה להשוות
+ */
+const readAuthVersions = async (userId, companyId) => {
+  if (!isRedisReady()) return null;
+  try {
+    const keys = companyId ? [userVersionKey(userId), versionKey(companyId)] : [userVersionKey(userId)];
+    const [user, company] = await redis.mget(...keys);
+    return { company: Number(company) || 0, user: Number(user) || 0 };
+  } catch (error) {
+    console.error("Auth version read error:", error.message);
+    return null;
+  }
+};
+
+const sameVersions = (a, b) => a.company === b.company && a.user === b.user;
+
+const buildAuthSnapshot = async (userId) => {
+  for (let attempt = 0; attempt < MAX_BUILD_ATTEMPTS; attempt++) {
+    // הגרסאות נקראות לפני טעינת העובד: שינוי שקורה באמצע ישאיר snapshot עם גרסה ישנה,
+    // שייפסל בקריאה הבאה. בלי Redis אין cache ואין גרסאות - קריאה אחת ל-DB
+    let versions = { company: 0, user: 0 };
+    if (isRedisReady()) {
+      const head = await Employee.findById(userId).select("companyId").lean();
+      if (!head) return null;
+      versions = (await readAuthVersions(userId, head.companyId)) || versions;
+    }
+
+    const employee = await Employee.findById(userId)
+      .select(EXCLUDED_FIELDS)
+      .populate("roleId", "name permissions")
+      .lean();
+    if (!employee) return null;
+
+    // בדיקה חוזרת לפני שה-snapshot נכתב ל-cache
+    const current = await readAuthVersions(userId, employee.companyId);
+    if (current && !sameVersions(current, versions)) continue;
+
+    const role = employee.roleId;
+    const isAdmin = employee.role === "Admin";
+
+    return {
+      // roleId נשמר כמזהה בלבד - כמו במסמך שלא עבר populate
+      user: { ...employee, roleId: role?._id || null },
+      isAdmin,
+      roleName: role?.name || null,
+      permissions: isAdmin ? {} : compilePermissions(role?.permissions, employee.customPermissions),
+      version: versions.company,
+      userVersion: versions.user,
+      builtAt: Date.now(),
+    };
+  }
+
+  throw new Error(`Auth snapshot for ${userId} kept changing while building`);
+};
+
+const loadSnapshot = (userId) =>
+  cacheFunction(snapshotKey(userId), () => buildAuthSnapshot(userId), SNAPSHOT_TTL, {
+    tags: [userTag(userId)],
+  });
+
+/**
+ * קבלת snapshot למשתמש (מה-cache או בנייה מה-DB)
+ * snapshot שהגרסה שלו לא תואמת את הגרסה הנוכחית נפסל ונבנה מחדש
+ * מחזיר null אם המשתמש לא קיים
+ */
+export const getAuthSnapshot = async (userId) => {
+  if (!userId) return null;
+
+  const snapshot = await loadSnapshot(userId);
+  if (!snapshot) return null;
+
+  const current = await readAuthVersions(userId, snapshot.user.companyId);
+  if (!current || sameVersions(current, { company: snapshot.version, user: snapshot.userVersion || 0 })) {
+    return snapshot;
+  }
+
+  await invalidateCacheTags([userTag(userId)]);
+  return (await loadSnapshot(userId)) || null;
+};
+
+/**
+ * snapshot -> מסמך Employee (ללא DB), כך ש-req.user נשאר באותה צורה כמו קודם
+ */
+export const hydrateSnapshotUser = (snapshot) => Employee.hydrate(snapshot.user);
+
+/**
+ * בדיקת הרשאה מול snapshot - O(1)
+ */
+export const snapshotHasPermission = (snapshot, module, action) => {
+  if (!snapshot) return false;
+  if (snapshot.isAdmin) return true;
+  return Boolean(snapshot.permissions?.[module]?.[action]);
+};
+
+const incrementVersion = async (key) => {
+  if (!isRedisReady()) return;
+  try {
+    await redis.incr(key);
+  } catch (error) {
+    console.error("Auth version bump error:", error.message);
+  }
+};
+
+/**
+ * פסילת snapshot של משתמש בודד (עדכון עובד, שיוך role, שינוי סיסמה)
+ * מעלה את גרסת המשתמש ומוחק את ה-snapshot שלו
+ */
+export const bumpUserAuthVersion = async (userId) => {
+  if (!userId) return;
+  await incrementVersion(userVersionKey(userId));
+  await invalidateCacheTags([userTag(userId)]);
+};
+
+/**
+ * פסילת כל ה-snapshots של חברה (עדכון/מחיקת role)
+ * מספיק להעלות את גרסת החברה - snapshot עם גרסה ישנה נבנה מחדש בקריאה הבאה
+ */
+export const bumpCompanyAuthVersion = async (companyId) => {
+  if (!companyId) return;
+  await incrementVersion(versionKey(companyId));
+};
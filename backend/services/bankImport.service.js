@@ -0,0 +1,391 @@
+// services/bankImport.service.js
+// ייבוא דפי בנק בזרימה: פענוח שורה-שורה, כתיבה בחבילות (upsert לא מסודר),
+// זיהוי כפילויות לפי טביעת אצבע (חשבון, תאריך, סכום, אסמכתא) מול unique index,
+// עדכון יתרת החשבון רק מהשורות שנוספו בפועל, והתאמה אוטומטית לחשבוניות פתוחות
+// ולפקודות יומן לפי סכום / תאריך / אסמכתא.
+
+import mongoose from "mongoose";
+import BankAccount from "../models/BankAccount.model.js";
+import BankTransaction from "../models/BankTransaction.model.js";
+import Invoice from "../models/invoice.model.js";
+import JournalEntry from "../models/JournalEntry.model.js";
+import { mapWithConcurrency } from "../utils/concurrency.js";
+import {
+  parseStatementDate,
+  parseRow,
+  fingerprintOf,
+  toCents,
+  normalizeReference,
+} from "../utils/bankStatement.js";
+
+const CHUNK_SIZE = Number(process.env.BANK_IMPORT_CHUNK_SIZE) || 1000;
+// כמה שגיאות שורה מוחזרות בתשובה (השאר רק נספרות)
+const MAX_REPORTED_ERRORS = 50;
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+// חלון תאריכים להתאמת פקודת יומן לפי סכום בלבד
+const JOURNAL_MATCH_WINDOW_MS = 3 * DAY_MS;
+// תשלום חשבונית יכול להגיע עד כך אחרי תאריך הפירעון
+const INVOICE_LATE_PAYMENT_MS = 90 * DAY_MS;
+
+const OPEN_INVOICE_PAYMENT_STATUSES = ["Unpaid", "Partially Paid"];
+const INVOICE_UPDATE_CONCURRENCY = 8;
+const CLOSED_INVOICE_STATUSES = ["Draft", "Cancelled"];
+
+const toObjectId = (id) => (id instanceof mongoose.Types.ObjectId ? id : new mongoose.Types.ObjectId(String(id)));
+
+// ========== AUTO RECONCILIATION ==========
+
+/**
+ * טעינת מועמדים להתאמה לחבילת שורות חדשות ובניית אינדקס לפי אסמכתא ולפי סכום.
+ * מסמכים שכבר מקושרים לתנועת בנק (מייבוא קודם או מהחבילות הקודמות) לא נכנסים.
+ */
+const loadMatchCandidates = async (companyId, rows, claimed) => {
+  const references = [...new Set(rows.map((row) => String(row.reference || "").trim()).filter(Boolean))];
+  // בסנטים שלמים מעוגלים, כדי להשוות ליתרה הפתוחה המחושבת במסד
+  const creditAmounts = [...new Set(rows.filter((row) => row.amount > 0).map((row) => toCents(row.amount) / 100))];
+  const absoluteAmounts = [...new Set(rows.map((row) => Math.abs(row.amount)))];
+  const times = rows.map((row) => row.transactionDate.getTime());
+  const from = new Date(Math.min(...times) - JOURNAL_MATCH_WINDOW_MS);
+  const to = new Date(Math.max(...times) + JOURNAL_MATCH_WINDOW_MS);
+
+  // התאמה לפי היתרה הפתוחה (totalAmount - paidAmount) - כמו ב-findMatch, כך שגם Partially Paid נמצאות
+  const invoiceFilter = [
+    {
+      $expr: {
+        $in: [
+          { $round: [{ $subtract: ["$totalAmount", { $ifNull: ["$paidAmount", 0] }] }, 2] },
+          creditAmounts,
+        ],
+      },
+    },
+  ];
+  const journalFilter = [{ totalDebit: { $in: absoluteAmounts }, entryDate: { $gte: from, $lte: to } }];
+  if (references.length > 0) {
+    invoiceFilter.push({ invoiceNumber: { $in: references } });
+    journalFilter.push({ reference: { $in: references } }, { entryNumber: { $in: references } });
+  }
+
+  const [invoices, journalEntries] = await Promise.all([
+    creditAmounts.length > 0 || references.length > 0
+      ? Invoice.find({
+          companyId,
+          status: { $nin: CLOSED_INVOICE_STATUSES },
+          paymentStatus: { $in: OPEN_INVOICE_PAYMENT_STATUSES },
+          $or: invoiceFilter,
+        })
+          .select("invoiceNumber issueDate dueDate totalAmount paidAmount paymentStatus")
+          .lean()
+      : [],
+    JournalEntry.find({ companyId, status: "Posted", $or: journalFilter })
+      .select("entryNumber entryDate reference totalDebit")
+      .lean(),
+  ]);
+
+  const documentIds = [...invoices, ...journalEntries].map((doc) => doc._id);
+  if (documentIds.length > 0) {
+    const linked = await BankTransaction.find({
+      companyId,
+      $or: [{ journalEntryId: { $in: documentIds } }, { "reconciliationMatch.documentId": { $in: documentIds } }],
+    })
+      .select("journalEntryId reconciliationMatch.documentId")
+      .lean();
+    for (const transaction of linked) {
+      if (transaction.journalEntryId) claimed.add(transaction.journalEntryId.toString());
+      if (transaction.reconciliationMatch?.documentId) claimed.add(transaction.reconciliationMatch.documentId.toString());
+    }
+  }
+
+  const byReference = new Map();
+  const byAmount = new Map();
+  const index = (candidate, references) => {
+    for (const reference of references.map(normalizeReference).filter(Boolean)) {
+      if (!byReference.has(reference)) byReference.set(reference, []);
+      byReference.get(reference).push(candidate);
+    }
+    if (!byAmount.has(candidate.cents)) byAmount.set(candidate.cents, []);
+    byAmount.get(candidate.cents).push(candidate);
+  };
+
+  for (const invoice of invoices) {
+    index(
+      {
+        documentType: "Invoice",
+        documentId: invoice._id,
+        invoice,
+        cents: toCents((invoice.totalAmount || 0) - (invoice.paidAmount || 0)),
+        creditOnly: true,
+        from: invoice.issueDate ? new Date(invoice.issueDate).getTime() : -Infinity,
+        to: invoice.dueDate ? new Date(invoice.dueDate).getTime() + INVOICE_LATE_PAYMENT_MS : Infinity,
+      },
+      [invoice.invoiceNumber]
+    );
+  }
+  for (const entry of journalEntries) {
+    const entryTime = new Date(entry.entryDate).getTime();
+    index(
+      {
+        documentType: "JournalEntry",
+        documentId: entry._id,
+        cents: toCents(entry.totalDebit),
+        creditOnly: false,
+        from: entryTime - JOURNAL_MATCH_WINDOW_MS,
+        to: entryTime + JOURNAL_MATCH_WINDOW_MS,
+      },
+      [entry.reference, entry.entryNumber]
+    );
+  }
+
+  return { byReference, byAmount };
+};
+
+/**
+ * התאמה לשורה: קודם אסמכתא + סכום, אחר כך סכום + חלון תאריכים - רק אם יש מועמד יחיד
+ */
+const findMatch = (row, { byReference, byAmount }, claimed) => {
+  const cents = toCents(Math.abs(row.amount));
+  const time = row.transactionDate.getTime();
+  const eligible = (candidate) =>
+    candidate.cents === cents &&
+    !claimed.has(candidate.documentId.toString()) &&
+    (!candidate.creditOnly || row.amount > 0);
+
+  const reference = normalizeReference(row.reference);
+  const byRef = reference ? (byReference.get(reference) || []).filter(eligible) : [];
+  if (byRef.length > 0) return { candidate: byRef[0], matchedBy: "reference" };
+
+  const byDate = (byAmount.get(cents) || []).filter(
+    (candidate) => eligible(candidate) && time >= candidate.from && time <= candidate.to
+  );
+  return byDate.length === 1 ? { candidate: byDate[0], matchedBy: "amountDate" } : null;
+};
+
+/**
+ * סימון חשבונית כשולמה לפי תנועת הבנק שהותאמה אליה (הסכום שווה ליתרה הפתוחה).
+ * העדכון מותנה במצב שנטען - אם החשבונית השתנתה בינתיים, לא מעדכנים ולא מתאימים.
+ */
+const markInvoicePaid = async (companyId, invoice, row, reconciledBy) => {
+  const paidAmount = invoice.paidAmount || 0;
+  const result = await Invoice.updateOne(
+    {
+      _id: invoice._id,
+      companyId,
+      paymentStatus: invoice.paymentStatus,
+      paidAmount: paidAmount === 0 ? { $in: [0, null] } : paidAmount,
+    },
+    {
+      $set: {
+        paidAmount: invoice.totalAmount,
+        paymentStatus: "Paid",
+        status: "Paid",
+        paymentDate: row.transactionDate,
+      },
+      $push: {
+        history: {
+          changedBy: reconciledBy || undefined,
+          changedAt: new Date(),
+          action: "paid",
+          changes: {
+            paymentStatus: { from: invoice.paymentStatus, to: "Paid" },
+            paidAmount: { from: paidAmount, to: invoice.totalAmount },
+            bankTransactionId: row._id,
+          },
+          reason: "Matched to imported bank transaction",
+        },
+      },
+    }
+  );
+  return result.modifiedCount > 0;
+};
+
+const reconcileChunk = async (companyId, rows, claimed, reconciledBy) => {
+  if (rows.length === 0) return 0;
+  const candidates = await loadMatchCandidates(companyId, rows, claimed);
+  const matches = [];
+
+  for (const row of rows) {
+    const match = findMatch(row, candidates, claimed);
+    if (!match) continue;
+    claimed.add(match.candidate.documentId.toString());
+    matches.push({ row, match });
+  }
+
+  // חשבונית שהותאמה מסומנת כשולמה; התאמה שהחשבונית שלה השתנתה בינתיים נשארת לא מותאמת
+  const applied = await mapWithConcurrency(matches, INVOICE_UPDATE_CONCURRENCY, async (item) => {
+    if (item.match.candidate.documentType !== "Invoice") return item;
+    return (await markInvoicePaid(companyId, item.match.candidate.invoice, item.row, reconciledBy)) ? item : null;
+  });
+
+  const matchedAt = new Date();
+  const operations = [];
+  for (const item of applied) {
+    if (!item) continue;
+    if (item.error) {
+      console.error("❌ Bank import invoice update failed:", item.error.message);
+      continue;
+    }
+    const { row, match } = item;
+    const update = {
+      reconciliationStatus: "Reconciled",
+      reconciledAt: matchedAt,
+      autoReconciled: true,
+      reconciliationMatch: {
+        documentType: match.candidate.documentType,
+        documentId: match.candidate.documentId,
+        matchedBy: match.matchedBy,
+        matchedAt,
+      },
+    };
+    if (reconciledBy) update.reconciledBy = reconciledBy;
+    if (match.candidate.documentType === "JournalEntry") update.journalEntryId = match.candidate.documentId;
+
+    operations.push({ updateOne: { filter: { _id: row._id }, update: { $set: update } } });
+  }
+
+  if (operations.length > 0) {
+    await BankTransaction.bulkWrite(operations, { ordered: false });
+  }
+  return operations.length;
+};
+
+// ========== IMPORT ==========
+
+let transactionSupport = null;
+
+/**
+ * טרנזקציות דורשות replica set או mongos - ב-mongod עצמאי (פיתוח מקומי) אין
+ */
+const supportsTransactions = async () => {
+  if (transactionSupport === null) {
+    transactionSupport = (async () => {
+      try {
+        const hello = await mongoose.connection.db.admin().command({ hello: 1 });
+        const supported = Boolean(hello.setName) || hello.msg === "isdbgrid";
+        if (!supported) {
+          console.warn("⚠️  MongoDB is standalone - bank imports update the balance without a transaction");
+        }
+        return supported;
+      } catch (error) {
+        console.error("❌ Could not detect MongoDB transaction support:", error.message);
+        return false;
+      }
+    })();
+  }
+  return transactionSupport;
+};
+
+/**
+ * כתיבת חבילה: upsert לפי fingerprint ו-$inc ליתרת החשבון מהשורות שנוספו בלבד,
+ * באותה טרנזקציה - כך שהיתרה תמיד תואמת לתנועות שנשמרו.
+ * בלי תמיכה בטרנזקציות אותן שתי כתיבות רצות ברצף (קריסה ביניהן משאירה סטייה ביתרה).
+ */
+const writeChunk = async (bankAccount, transactions) => {
+  const now = new Date();
+  const operations = transactions.map((transaction) => ({
+    updateOne: {
+      filter: { companyId: transaction.companyId, fingerprint: transaction.fingerprint },
+      update: { $setOnInsert: { ...transaction, createdAt: now, updatedAt: now } },
+      upsert: true,
+      timestamps: false,
+    },
+  }));
+
+  const write = async (session) => {
+    const result = await BankTransaction.bulkWrite(operations, { ordered: false, session });
+    const inserted = Object.entries(result.upsertedIds || {}).map(([index, _id]) => ({
+      ...transactions[Number(index)],
+      _id,
+    }));
+
+    const balanceChange = inserted.reduce((sum, transaction) => sum + toCents(transaction.amount), 0) / 100;
+    if (balanceChange !== 0) {
+      await BankAccount.updateOne(
+        { _id: bankAccount._id, companyId: bankAccount.companyId },
+        { $inc: { currentBalance: balanceChange } },
+        { session }
+      );
+    }
+    return inserted;
+  };
+
+  if (!(await supportsTransactions())) {
+    return write(null);
+  }
+
+  const session = await mongoose.startSession();
+  try {
+    let inserted = [];
+    await session.withTransaction(async () => {
+      inserted = await write(session);
+    });
+    return inserted;
+  } finally {
+    await session.endSession();
+  }
+};
+
+/**
+ * ייבוא דף בנק מ-stream של שורות CSV מפוענחות (csv-parser).
+ * עובד בחבילות של CHUNK_SIZE - הזיכרון לא תלוי בגודל הקובץ.
+ */
+export const importBankStatement = async (rows, { companyId, bankAccount, dateFormat, reconciledBy = null }) => {
+  // ה-upsert לפי fingerprint דורש את ה-unique index
+  await BankTransaction.init();
+
+  const context = { companyId: toObjectId(companyId), bankAccount, dateFormat, importDate: new Date() };
+  const occurrences = new Map();
+  const claimed = new Set();
+  const summary = {
+    totalRows: 0,
+    imported: 0,
+    duplicates: 0,
+    invalid: 0,
+    autoReconciled: 0,
+    balanceChange: 0,
+    errors: [],
+  };
+
+  let chunk = [];
+  const flush = async () => {
+    if (chunk.length === 0) return;
+    const transactions = chunk;
+    chunk = [];
+
+    const inserted = await writeChunk(bankAccount, transactions);
+    summary.imported += inserted.length;
+    summary.duplicates += transactions.length - inserted.length;
+    summary.balanceChange += inserted.reduce((sum, transaction) => sum + toCents(transaction.amount), 0);
+
+    try {
+      summary.autoReconciled += await reconcileChunk(context.companyId, inserted, claimed, reconciledBy);
+    } catch (error) {
+      // ההתאמה לא מבטלת את הייבוא - אפשר להתאים ידנית אחר כך
+      console.error("❌ Bank import auto-reconciliation failed:", error.message);
+    }
+  };
+
+  for await (const row of rows) {
+    summary.totalRows++;
+    const transaction = parseRow(row, context);
+    if (transaction.error) {
+      summary.invalid++;
+      if (summary.errors.length < MAX_REPORTED_ERRORS) {
+        summary.errors.push({ row: summary.totalRows, message: transaction.error });
+      }
+      continue;
+    }
+
+    transaction.fingerprint = fingerprintOf(transaction, occurrences);
+    chunk.push(transaction);
+    if (chunk.length >= CHUNK_SIZE) await flush();
+  }
+  await flush();
+
+  summary.balanceChange /= 100;
+  return summary;
+};
+
+export default {
+  importBankStatement,
+  parseStatementDate,
+};
@@ -0,0 +1,131 @@
+// services/jobEngine.service.js
+// מנוע jobs מתוזמנים - נעילה מבוזרת ב-Redis כך שרק instance אחד מריץ כל job
+
+import cron from "node-cron";
+import Company from "../models/companies.model.js";
+import { acquireLock, releaseLock } from "../config/redis.js";
+import { mapWithConcurrency } from "../utils/concurrency.js";
+
+// מקביליות ברירת מחדל לעיבוד חברות - נשמר מתחת ל-maxPoolSize של Mongo
+export const COMPANY_CONCURRENCY = Number(process.env.JOB_COMPANY_CONCURRENCY) || 4;
+
+const registeredJobs = new Map();
+const runningJobs = new Set();
+
+/**
+ * הרצת job בלעדית: נעילה מקומית (מונע חפיפה באותו תהליך)
+ * ונעילת Redis (מונע הרצה כפולה בין instances).
+ * בהרצה מתוזמנת (tick) נלקחת גם נעילה לפי שם ה-job וה-tick שלא משוחררת בסוף אלא פגה לפי TTL,
+ * כך ש-instance שמגיע לאותו tick אחרי שההרצה כבר הסתיימה לא מריץ אותה שוב.
+ */
+export const runExclusive = async (name, handler, { lockTtlMs = 10 * 60 * 1000, tick = null } = {}) => {
+  if (runningJobs.has(name)) {
+    console.log(`⏭️  Job "${name}" is still running locally, skipping`);
+    return { skipped: true };
+  }
+
+  if (tick && !(await acquireLock(`lock:job:${name}:${tick}`, lockTtlMs))) {
+    console.log(`⏭️  Job "${name}" already ran for tick ${tick}, skipping`);
+    return { skipped: true };
+  }
+
+  const lockKey = `lock:job:${name}`;
+  const token = await acquireLock(lockKey, lockTtlMs);
+  if (!token) {
+    console.log(`⏭️  Job "${name}" is locked by another instance, skipping`);
+    return { skipped: true };
+  }
+
+  runningJobs.add(name);
+  const startedAt = Date.now();
+  try {
+    const result = await handler();
+    return { skipped: false, result, durationMs: Date.now() - startedAt };
+  } catch (error) {
+    console.error(`❌ Job "${name}" failed:`, error);
+    return { skipped: false, error, durationMs: Date.now() - startedAt };
+  } finally {
+    runningJobs.delete(name);
+    await releaseLock(lockKey, token);
+  }
+};
+
+// ה-tick המתוזמן - הדקה שבה cron הפעיל את ה-job (זהה בכל ה-instances)
+export const scheduledTick = (date = new Date()) =>
+  new Date(Math.floor(date.getTime() / 60000) * 60000).toISOString();
+
+/**
+ * רישום job מתוזמן. steps הוא מערך של פונקציות שרצות ברצף תחת אותה נעילה.
+ * הרישום עצמו לא מתזמן דבר - startJobs() עושה זאת.
+ */
+export const registerJob = (name, schedule, steps, options = {}) => {
+  if (registeredJobs.has(name)) {
+    throw new Error(`Job "${name}" is already registered`);
+  }
+  const list = Array.isArray(steps) ? steps : [steps];
+  registeredJobs.set(name, { name, schedule, steps: list, options, task: null });
+};
+
+const runSteps = async (job) => {
+  for (const step of job.steps) {
+    try {
+      await step();
+    } catch (error) {
+      console.error(`Error in job "${job.name}" step ${step.name || "anonymous"}:`, error);
+    }
+  }
+};
+
+/**
+ * הפעלת כל ה-jobs הרשומים (idempotent)
+ */
+export const startJobs = () => {
+  for (const job of registeredJobs.values()) {
+    if (job.task) continue;
+    job.task = cron.schedule(job.schedule, () =>
+      runExclusive(job.name, () => runSteps(job), { ...job.options, tick: scheduledTick() })
+    );
+  }
+  return registeredJobs.size;
+};
+
+/**
+ * עצירת כל ה-jobs (לכיבוי מסודר)
+ */
+export const stopJobs = () => {
+  for (const job of registeredJobs.values()) {
+    job.task?.stop();
+    job.task = null;
+  }
+};
+
+/**
+ * הרצה ידנית של job רשום (למשל מ-endpoint אדמין)
+ */
+export const triggerJob = async (name) => {
+  const job = registeredJobs.get(name);
+  if (!job) throw new Error(`Job "${name}" is not registered`);
+  return runExclusive(job.name, () => runSteps(job), job.options);
+};
+
+/**
+ * רשימת מזהי החברות (lean, רק _id)
+ */
+export const getCompanyIds = async (filter = {}) => {
+  const companies = await Company.find(filter).select("_id").lean();
+  return companies.map((company) => company._id);
+};
+
+/**
+ * הרצת פונקציה פר-חברה עם pool מוגבל
+ */
+export const forEachCompany = async (worker, { concurrency = COMPANY_CONCURRENCY, filter = {} } = {}) => {
+  const companyIds = await getCompanyIds(filter);
+  const results = await mapWithConcurrency(companyIds, concurrency, worker);
+  results.forEach((result, index) => {
+    if (result?.error) {
+      console.error(`Error in company ${companyIds[index]} job:`, result.error);
+    }
+  });
+  return results;
+};
@@ -0,0 +1,179 @@
+// services/notificationRules.service.js
+// מנוע כללי התראות באצווה: איסוף מועמדים, dedupe באגרגציה אחת ו-insert אחד
+
+import Notification from "../models/notification.model.js";
+import Employee from "../models/employees.model.js";
+import { COMPANY_CONCURRENCY, getCompanyIds } from "./jobEngine.service.js";
+import { chunk, mapWithConcurrency } from "../utils/concurrency.js";
+
+const INSERT_CHUNK_SIZE = 1000;
+
+const RECIPIENT_ROLES = {
+  adminsAndManagers: ["Admin", "Manager"],
+  admins: ["Admin"],
+};
+
+const dedupeKey = (companyId, employeeId, title, entityId) =>
+  `${companyId}|${employeeId}|${title}|${entityId ?? "*"}`;
+
+/**
+ * טעינת נמענים לכל החברות בשאילתה אחת - Map של companyId -> [employeeId]
+ */
+export const loadRecipientsByCompany = async (companyIds, roles) => {
+  const employees = await Employee.find({
+    companyId: { $in: companyIds },
+    role: { $in: roles },
+    status: "active",
+  })
+    .select("_id companyId")
+    .lean();
+
+  const byCompany = new Map();
+  for (const employee of employees) {
+    const key = employee.companyId.toString();
+    if (!byCompany.has(key)) byCompany.set(key, []);
+    byCompany.get(key).push(employee._id);
+  }
+  return byCompany;
+};
+
+/**
+ * שליפת כל ההתראות הקיימות בחלון הזמן באגרגציה אחת
+ * מחזיר Set של מפתחות dedupe (עם entityId ועם wildcard)
+ */
+export const loadExistingNotificationKeys = async ({ companyIds, category, titles, since }) => {
+  const existing = await Notification.aggregate([
+    {
+      $match: {
+        companyId: { $in: companyIds },
+        category,
+        title: { $in: titles },
+        createdAt: { $gte: since },
+      },
+    },
+    {
+      $group: {
+        _id: {
+          companyId: "$companyId",
+          employeeId: "$employeeId",
+          title: "$title",
+          entityId: "$relatedEntity.entityId",
+        },
+      },
+    },
+  ]);
+
+  const keys = new Set();
+  for (const { _id } of existing) {
+    keys.add(dedupeKey(_id.companyId, _id.employeeId, _id.title, null));
+    if (_id.entityId) {
+      keys.add(dedupeKey(_id.companyId, _id.employeeId, _id.title, _id.entityId));
+    }
+  }
+  return keys;
+};
+
+/**
+ * כתיבת התראות ב-insertMany לא מסודר (כשל במסמך אחד לא עוצר את השאר)
+ */
+export const insertNotifications = async (docs) => {
+  let inserted = 0;
+  for (const batch of chunk(docs, INSERT_CHUNK_SIZE)) {
+    try {
+      const result = await Notification.insertMany(batch, { ordered: false });
+      inserted += result.length;
+    } catch (error) {
+      inserted += error.insertedDocs?.length || 0;
+      console.error("Error inserting notifications batch:", error.message);
+    }
+  }
+  return inserted;
+};
+
+/**
+ * הרצת כלל התראה על כל החברות
+ *
+ * collect(companyId) - מחזיר מועמדים לחברה אחת (רץ ב-pool מוגבל), או
+ * collectAll(companyIds) - מחזיר מועמדים לכל החברות בשאילתה אחת (כל מועמד עם companyId)
+ *
+ * מועמד: { title, content, type, priority, relatedEntity, actionUrl, actionLabel, metadata, employeeIds? }
+ * ללא employeeIds ההתראה נשלחת לנמעני ברירת המחדל של הכלל (recipients).
+ * dedupe: false - לכללים שמסמנים בעצמם מה כבר נשלח (דגלי תזכורת), בלי בדיקת כפילויות לפי חלון זמן.
+ * companyIds (ObjectId) - הרצה לחברות מסוימות בלבד (למשל endpoint של חברה אחת); ברירת מחדל: כל החברות.
+ */
+export const runNotificationRule = async ({
+  name,
+  category,
+  hours = 24,
+  recipients = "adminsAndManagers",
+  dedupe = true,
+  collect,
+  collectAll,
+  concurrency = COMPANY_CONCURRENCY,
+  companyIds: scope = null,
+}) => {
+  console.log(`🔍 Running notification rule: ${name}...`);
+  const companyIds = scope || (await getCompanyIds());
+  if (companyIds.length === 0) return 0;
+
+  let candidates = [];
+  if (collectAll) {
+    candidates = await collectAll(companyIds);
+  } else {
+    const results = await mapWithConcurrency(companyIds, concurrency, async (companyId) => {
+      const items = await collect(companyId);
+      return (items || []).map((item) => ({ companyId, ...item }));
+    });
+    results.forEach((result, index) => {
+      if (result?.error) {
+        console.error(`Error in rule ${name} for company ${companyIds[index]}:`, result.error);
+      } else {
+        candidates.push(...result);
+      }
+    });
+  }
+
+  if (candidates.length === 0) {
+    console.log(`✅ ${name}: no notifications needed`);
+    return 0;
+  }
+
+  const involvedCompanyIds = [...new Map(candidates.map((c) => [c.companyId.toString(), c.companyId])).values()];
+  const [recipientsByCompany, existingKeys] = await Promise.all([
+    loadRecipientsByCompany(involvedCompanyIds, RECIPIENT_ROLES[recipients] || RECIPIENT_ROLES.adminsAndManagers),
+    dedupe
+      ? loadExistingNotificationKeys({
+          companyIds: involvedCompanyIds,
+          category,
+          titles: [...new Set(candidates.map((c) => c.title))],
+          since: new Date(Date.now() - hours * 60 * 60 * 1000),
+        })
+      : new Set(),
+  ]);
+
+  const docs = [];
+  for (const { companyId, employeeIds, ...notification } of candidates) {
+    const targets = employeeIds || recipientsByCompany.get(companyId.toString()) || [];
+    const entityId = notification.relatedEntity?.entityId ?? null;
+
+    for (const employeeId of targets) {
+      if (!employeeId) continue;
+      const key = dedupeKey(companyId, employeeId, notification.title, entityId);
+      if (existingKeys.has(key)) continue;
+      existingKeys.add(key);
+
+      docs.push({
+        companyId,
+        employeeId,
+        category,
+        type: "Info",
+        priority: "medium",
+        ...notification,
+      });
+    }
+  }
+
+  const inserted = await insertNotifications(docs);
+  console.log(`✅ ${name}: created ${inserted} notifications`);
+  return inserted;
+};
@@ -0,0 +1,505 @@
+// services/payrollEngine.service.js
+// מנוע חישוב משכורות מבוסס סטים: משמרות מצטברות לפי עובד ב-pipeline אחד לכל batch,
+// תצורת מס נטענת ומקומפלת פעם אחת לריצה, והמשכורות נשמרות ב-bulkWrite.
+// כל ריצה נשמרת כ-PayrollRun עם cursor ו-heartbeat - ריצה שנקטעה ממשיכה מה-batch האחרון.
+
+import mongoose from "mongoose";
+import Salary from "../models/salary.model.js";
+import Employee from "../models/employees.model.js";
+import Shift from "../models/Shifts.model.js";
+import TaxConfig from "../models/TaxConfig.model.js";
+import Company from "../models/companies.model.js";
+import PayrollRun from "../models/PayrollRun.model.js";
+import { INSTANCE_ID } from "../config/redis.js";
+import { mapWithConcurrency } from "../utils/concurrency.js";
+
+const BATCH_SIZE = Number(process.env.PAYROLL_BATCH_SIZE) || 500;
+const STALE_RUN_MS = Number(process.env.PAYROLL_RUN_STALE_MS) || 5 * 60 * 1000;
+const MAX_STORED_ERRORS = 500;
+
+export const MISSING_TAX_CONFIG_ERROR = "תצורת מס לא נמצאה בהגדרות האוטומציה";
+
+// ריצות שמתבצעות בתהליך הנוכחי: runId -> promise של הסיום
+const localRuns = new Map();
+
+const round2 = (value) => parseFloat(Number(value).toFixed(2));
+
+const toObjectId = (id) => (id instanceof mongoose.Types.ObjectId ? id : new mongoose.Types.ObjectId(String(id)));
+
+/**
+ * גבולות תקופת השכר (שעון מקומי, כמו בשאר מודול השכר)
+ */
+export const getPayrollPeriod = (year, month) => ({
+  periodStart: new Date(year, month - 1, 1),
+  periodEnd: new Date(year, month, 0),
+  nextPeriodStart: new Date(year, month, 1),
+});
+
+const activeEmployeesFilter = (companyId) => ({
+  companyId,
+  status: "active",
+  deletedAt: { $exists: false },
+});
+
+// ========== TAX ==========
+
+// שיעור נשמר כשבר עשרוני (0.10 = 10%); ערך מעל 1 נחשב לאחוזים
+const normalizeRate = (rate) => (rate > 1 ? rate / 100 : rate);
+
+/**
+ * קומפילציה של תצורת מס: מדרגות ממוינות ושיעורים מנורמלים - פעם אחת לריצה
+ */
+export const compileTaxConfig = (taxConfig) => {
+  if (!taxConfig) return null;
+  return {
+    brackets: [...(taxConfig.taxBrackets || [])]
+      .sort((a, b) => a.limit - b.limit)
+      .map((bracket) => ({ limit: bracket.limit, rate: normalizeRate(bracket.rate) })),
+    otherTaxes: (taxConfig.otherTaxes || []).map((tax) => ({
+      name: tax.name,
+      rate: normalizeRate(tax.rate),
+      fixedAmount: tax.fixedAmount,
+    })),
+  };
+};
+
+/**
+ * ניכויים ושכר נטו לפי תצורת מס מקומפלת
+ */
+export const calculateSalaryFigures = (compiledTax, totalPay) => {
+  const taxableIncome = Number(totalPay);
+  let taxDeduction = 0;
+  const otherDeductions = [];
+
+  if (compiledTax && compiledTax.brackets.length > 0) {
+    let previousLimit = 0;
+    for (const bracket of compiledTax.brackets) {
+      if (taxableIncome > previousLimit) {
+        const taxableInBracket = Math.min(taxableIncome, bracket.limit) - previousLimit;
+        if (taxableInBracket > 0) {
+          taxDeduction += taxableInBracket * bracket.rate;
+        }
+      }
+      previousLimit = bracket.limit;
+    }
+
+    for (const tax of compiledTax.otherTaxes) {
+      const amount = tax.fixedAmount || taxableIncome * tax.rate;
+      if (amount > 0) {
+        otherDeductions.push({ description: tax.name, amount: round2(amount) });
+      }
+    }
+  }
+
+  const totalOtherDeductions = otherDeductions.reduce((sum, d) => sum + Number(d.amount || 0), 0);
+  const netPay = Math.max(0, taxableIncome - taxDeduction - totalOtherDeductions);
+
+  return {
+    taxDeduction: round2(taxDeduction),
+    otherDeductions,
+    netPay: round2(netPay),
+  };
+};
+
+/**
+ * טעינת תצורות המס של הריצה
+ * companyDefault - התצורה שבהגדרות האוטומציה (חובה)
+ * employeeCountry - לפי countryCode של העובד (ללא תצורה = ללא ניכויים)
+ */
+const loadTaxResolver = async (companyId, taxSource) => {
+  if (taxSource === "employeeCountry") {
+    const configs = await TaxConfig.find({ companyId, isActive: true }).lean();
+    const byCountry = new Map();
+    for (const config of configs) {
+      if (!byCountry.has(config.countryCode)) {
+        byCountry.set(config.countryCode, compileTaxConfig(config));
+      }
+    }
+    return { required: false, resolve: (employee) => byCountry.get(employee?.countryCode || "IL") || null };
+  }
+
+  const company = await Company.findById(companyId).select("payrollAutomationSettings").lean();
+  const taxConfigId = company?.payrollAutomationSettings?.defaultTaxConfigId;
+  const taxConfig = taxConfigId
+    ? await TaxConfig.findOne({ _id: taxConfigId, companyId, isActive: true }).lean()
+    : null;
+  const compiled = compileTaxConfig(taxConfig);
+  return { required: true, resolve: () => compiled };
+};
+
+// ========== BATCHES ==========
+
+/**
+ * bulkWrite לא מסודר - שגיאת כתיבה נרשמת לשורה שלה בלי להפיל את ה-batch
+ */
+const writeSalaries = async (operations, meta, errors) => {
+  if (operations.length === 0) return 0;
+  try {
+    await Salary.bulkWrite(operations, { ordered: false });
+    return operations.length;
+  } catch (error) {
+    const writeErrors = error.writeErrors || [];
+    if (writeErrors.length === 0) throw error;
+    for (const writeError of writeErrors) {
+      errors.push({ ...meta[writeError.index], error: writeError.errmsg || "Write failed" });
+    }
+    return operations.length - writeErrors.length;
+  }
+};
+
+// חישוב: עובדים פעילים -> סיכום משמרות -> יצירה/עדכון משכורת
+const processCalculateBatch = async (run, { cursor, taxes, period, renewClaim }) => {
+  const employees = await Employee.find({
+    ...activeEmployeesFilter(run.companyId),
+    ...(cursor ? { _id: { $gt: cursor } } : {}),
+  })
+    .sort({ _id: 1 })
+    .limit(BATCH_SIZE)
+    .select("name lastName countryCode")
+    .lean();
+  if (employees.length === 0) return null;
+
+  const employeeIds = employees.map((employee) => employee._id);
+  const [shiftTotals, existingSalaries] = await Promise.all([
+    Shift.aggregate([
+      {
+        $match: {
+          companyId: run.companyId,
+          employeeId: { $in: employeeIds },
+          shiftDate: { $gte: period.periodStart, $lte: period.periodEnd },
+        },
+      },
+      {
+        $group: {
+          _id: "$employeeId",
+          totalHours: { $sum: { $ifNull: ["$hoursWorked", 0] } },
+          totalPay: { $sum: { $ifNull: ["$totalPay", 0] } },
+        },
+      },
+    ]),
+    Salary.find({
+      companyId: run.companyId,
+      employeeId: { $in: employeeIds },
+      periodStart: { $gte: period.periodStart, $lt: period.nextPeriodStart },
+    })
+      .sort({ _id: 1 })
+      .select("_id employeeId")
+      .lean(),
+  ]);
+
+  const totalsByEmployee = new Map(shiftTotals.map((row) => [row._id.toString(), row]));
+  const salaryByEmployee = new Map();
+  for (const salary of existingSalaries) {
+    const key = salary.employeeId.toString();
+    if (!salaryByEmployee.has(key)) salaryByEmployee.set(key, salary._id);
+  }
+
+  const operations = [];
+  const meta = [];
+  const errors = [];
+
+  for (const employee of employees) {
+    const totals = totalsByEmployee.get(employee._id.toString());
+    if (!totals) continue; // עובד ללא משמרות בתקופה
+
+    const employeeInfo = {
+      employeeId: employee._id,
+      employeeName: `${employee.name} ${employee.lastName}`,
+    };
+    const compiledTax = taxes.resolve(employee);
+    if (!compiledTax && taxes.required) {
+      errors.push({ ...employeeInfo, error: MISSING_TAX_CONFIG_ERROR });
+      continue;
+    }
+
+    const fields = {
+      totalHours: round2(totals.totalHours),
+      totalPay: round2(totals.totalPay),
+      ...calculateSalaryFigures(compiledTax, totals.totalPay),
+      status: "Draft",
+    };
+
+    // משכורת חדשה נכתבת כ-upsert לפי המפתח הייחודי, כך שכתיבה חוזרת של batch לא יוצרת כפילות
+    const salaryId = salaryByEmployee.get(employee._id.toString());
+    operations.push({
+      updateOne: salaryId
+        ? { filter: { _id: salaryId }, update: { $set: fields } }
+        : {
+            filter: { companyId: run.companyId, employeeId: employee._id, periodStart: period.periodStart },
+            update: {
+              $set: fields,
+              $setOnInsert: { periodEnd: period.periodEnd, bonus: 0, notes: run.notes || "" },
+            },
+            upsert: true,
+          },
+    });
+    meta.push(employeeInfo);
+  }
+
+  if (operations.length > 0 && !(await renewClaim())) return { lostClaim: true };
+  const succeeded = await writeSalaries(operations, meta, errors);
+  return { lastId: employees[employees.length - 1]._id, processed: employees.length, succeeded, errors };
+};
+
+// חישוב מחדש: משכורות קיימות בתקופה -> ניכויים ונטו לפי תצורת המס הנוכחית
+const processRecalculateBatch = async (run, { cursor, taxes, period, renewClaim }) => {
+  const salaries = await Salary.find({
+    companyId: run.companyId,
+    periodStart: { $gte: period.periodStart, $lte: period.periodEnd },
+    ...(cursor ? { _id: { $gt: cursor } } : {}),
+  })
+    .sort({ _id: 1 })
+    .limit(BATCH_SIZE)
+    .select("employeeId totalPay")
+    .lean();
+  if (salaries.length === 0) return null;
+
+  const employees = await Employee.find({ _id: { $in: salaries.map((salary) => salary.employeeId) } })
+    .select("countryCode")
+    .lean();
+  const employeesById = new Map(employees.map((employee) => [employee._id.toString(), employee]));
+
+  const operations = [];
+  const meta = [];
+  const errors = [];
+
+  for (const salary of salaries) {
+    const employee = employeesById.get(salary.employeeId?.toString());
+    if (!employee) continue;
+
+    const compiledTax = taxes.resolve(employee);
+    if (!compiledTax && taxes.required) {
+      errors.push({ salaryId: salary._id, error: MISSING_TAX_CONFIG_ERROR });
+      continue;
+    }
+
+    operations.push({
+      updateOne: {
+        filter: { _id: salary._id },
+        update: { $set: calculateSalaryFigures(compiledTax, salary.totalPay) },
+      },
+    });
+    meta.push({ salaryId: salary._id });
+  }
+
+  if (operations.length > 0 && !(await renewClaim())) return { lostClaim: true };
+  const succeeded = await writeSalaries(operations, meta, errors);
+  return { lastId: salaries[salaries.length - 1]._id, processed: salaries.length, succeeded, errors };
+};
+
+// ========== RUNS ==========
+
+const newOwnerToken = () => `${INSTANCE_ID}:${new mongoose.Types.ObjectId()}`;
+
+const executeRun = async (run) => {
+  const ownerFilter = { _id: run._id, owner: run.owner, active: true };
+  const period = getPayrollPeriod(run.year, run.month);
+  const processBatch = run.mode === "recalculate" ? processRecalculateBatch : processCalculateBatch;
+  let cursor = run.cursor;
+  const takenOver = () => {
+    console.warn(`⚠️  Payroll run ${run._id} was taken over by another instance`);
+    return PayrollRun.findById(run._id).lean();
+  };
+  // בדיקת בעלות (ו-heartbeat) מיד לפני כל כתיבת batch - ריצה שנלקחה לא כותבת יותר משכורות
+  const renewClaim = async () => {
+    const result = await PayrollRun.updateOne(ownerFilter, { $set: { heartbeatAt: new Date() } });
+    return result.matchedCount > 0;
+  };
+
+  try {
+    const taxes = await loadTaxResolver(run.companyId, run.taxSource);
+
+    for (;;) {
+      const batch = await processBatch(run, { cursor, taxes, period, renewClaim });
+      if (!batch) break;
+      if (batch.lostClaim) return takenOver();
+      cursor = batch.lastId;
+
+      const update = {
+        $set: { cursor, heartbeatAt: new Date() },
+        $inc: { processed: batch.processed, succeeded: batch.succeeded, failed: batch.errors.length },
+      };
+      if (batch.errors.length > 0) {
+        update.$push = { errorLog: { $each: batch.errors, $slice: MAX_STORED_ERRORS } };
+      }
+      const result = await PayrollRun.updateOne(ownerFilter, update);
+      if (result.matchedCount === 0) {
+        // instance אחר השתלט על הריצה (heartbeat פג) - מפסיקים כאן
+        return takenOver();
+      }
+    }
+
+    await PayrollRun.updateOne(ownerFilter, {
+      $set: { status: "completed", active: false, finishedAt: new Date(), heartbeatAt: new Date() },
+    });
+  } catch (error) {
+    console.error(`❌ Payroll run ${run._id} failed:`, error.message);
+    await PayrollRun.updateOne(ownerFilter, {
+      $set: { status: "failed", active: false, failureReason: error.message, finishedAt: new Date() },
+    });
+  }
+
+  const finished = await PayrollRun.findById(run._id).lean();
+  console.log(
+    `💰 Payroll ${run.mode} ${run.year}-${run.month} (company ${run.companyId}): ${finished?.status}, ` +
+      `${finished?.succeeded}/${finished?.total} salaries, ${finished?.failed} errors`
+  );
+  return finished;
+};
+
+const launchRun = (run) => {
+  const key = run._id.toString();
+  const completion = executeRun(run).finally(() => localRuns.delete(key));
+  localRuns.set(key, completion);
+  return completion;
+};
+
+// השתלטות אטומית על ריצה שה-heartbeat שלה פג (התהליך שהריץ אותה נפל)
+const claimStaleRun = (runId) =>
+  PayrollRun.findOneAndUpdate(
+    { _id: runId, active: true, heartbeatAt: { $lt: new Date(Date.now() - STALE_RUN_MS) } },
+    { $set: { owner: newOwnerToken(), heartbeatAt: new Date() } },
+    { new: true }
+  ).lean();
+
+/**
+ * התחלת ריצת שכר לחודש (ברקע)
+ * מחזיר { run, completion, alreadyRunning, conflict }
+ * completion - promise לסיום, כשהריצה מתבצעת בתהליך הנוכחי
+ * run = null כשאין מה לחשב (אין עובדים / משכורות בתקופה)
+ */
+export const startPayrollRun = async ({
+  companyId,
+  year,
+  month,
+  mode,
+  taxSource = "companyDefault",
+  trigger = "manual",
+  notes = "",
+  startedBy,
+}) => {
+  const companyObjectId = toObjectId(companyId);
+  const period = getPayrollPeriod(year, month);
+
+  const total =
+    mode === "recalculate"
+      ? await Salary.countDocuments({
+          companyId: companyObjectId,
+          periodStart: { $gte: period.periodStart, $lte: period.periodEnd },
+        })
+      : await Employee.countDocuments(activeEmployeesFilter(companyObjectId));
+  if (total === 0) return { run: null, completion: null, alreadyRunning: false, conflict: false };
+
+  try {
+    const created = await PayrollRun.create({
+      companyId: companyObjectId,
+      year,
+      month,
+      mode,
+      taxSource,
+      trigger,
+      notes,
+      total,
+      owner: newOwnerToken(),
+      startedBy,
+    });
+    const run = created.toObject();
+    return { run, completion: launchRun(run), alreadyRunning: false, conflict: false };
+  } catch (error) {
+    if (error.code !== 11000) throw error;
+  }
+
+  // כבר קיימת ריצה פעילה לחודש הזה
+  const existing = await PayrollRun.findOne({ companyId: companyObjectId, year, month, active: true }).lean();
+  if (!existing) {
+    throw new Error("Payroll run state changed concurrently, please retry");
+  }
+  if (existing.mode !== mode) {
+    return { run: existing, completion: null, alreadyRunning: true, conflict: true };
+  }
+
+  const local = localRuns.get(existing._id.toString());
+  if (local) return { run: existing, completion: local, alreadyRunning: true, conflict: false };
+
+  const claimed = await claimStaleRun(existing._id);
+  if (claimed) return { run: claimed, completion: launchRun(claimed), alreadyRunning: true, conflict: false };
+
+  return { run: existing, completion: null, alreadyRunning: true, conflict: false };
+};
+
+/**
+ * המתנה לסיום ריצה עד timeoutMs - מחזיר null אם עדיין רצה
+ */
+export const waitForPayrollRun = (completion, timeoutMs) => {
+  if (!completion) return Promise.resolve(null);
+  return Promise.race([
+    completion,
+    new Promise((resolve) => setTimeout(() => resolve(null), timeoutMs).unref()),
+  ]);
+};
+
+/**
+ * המשך ריצות שנקטעו (קריסה / deploy) - נקרא מ-job מתוזמן
+ */
+export const resumeStalePayrollRuns = async () => {
+  const staleRuns = await PayrollRun.find({
+    active: true,
+    heartbeatAt: { $lt: new Date(Date.now() - STALE_RUN_MS) },
+  })
+    .select("_id")
+    .lean();
+  if (staleRuns.length === 0) return 0;
+
+  console.log(`\n🔄 Resuming ${staleRuns.length} interrupted payroll runs...`);
+  const results = await mapWithConcurrency(staleRuns, 2, async ({ _id }) => {
+    const claimed = await claimStaleRun(_id);
+    if (claimed) await launchRun(claimed);
+  });
+  return results.length;
+};
+
+export const getPayrollRun = (runId) => PayrollRun.findById(runId).lean();
+
+export const getLatestPayrollRun = (companyId, year, month) =>
+  PayrollRun.findOne({ companyId, year, month }).sort({ createdAt: -1 }).select("-errorLog").lean();
+
+/**
+ * תצוגת התקדמות של ריצה (ל-API)
+ */
+export const formatRunProgress = (run) => {
+  if (!run) return null;
+  return {
+    runId: run._id,
+    mode: run.mode,
+    status: run.status,
+    trigger: run.trigger,
+    total: run.total,
+    processed: run.processed,
+    succeeded: run.succeeded,
+    failed: run.failed,
+    progress: run.total > 0 ? Math.min(100, Math.round((run.processed / run.total) * 100)) : 100,
+    startedAt: run.createdAt,
+    finishedAt: run.finishedAt || null,
+    failureReason: run.failureReason || undefined,
+  };
+};
+
+/**
+ * שגיאות ריצה בפורמט של תגובת ה-API (ללא _id פנימי)
+ */
+export const formatRunErrors = (run) => {
+  const errors = (run?.errorLog || []).map(({ _id, ...error }) => error);
+  return errors.length > 0 ? errors : undefined;
+};
+
+export default {
+  startPayrollRun,
+  waitForPayrollRun,
+  resumeStalePayrollRuns,
+  getPayrollRun,
+  getLatestPayrollRun,
+  formatRunProgress,
+  formatRunErrors,
+  compileTaxConfig,
+  calculateSalaryFigures,
+};
@@ -0,0 +1,160 @@
+// services/productionAvailability.service.js
+// מנוע זמינות רכיבים להזמנות ייצור (בסגנון MRP):
+// פירוק עצי מוצר (BOM) בכל הרמות, טעינת המלאי של כל הרכיבים המעורבים בשאילתה אחת,
+// ונטו של הביקוש של כל ההזמנות מול אותה תמונת מלאי - מלאי שהוקצה להזמנה אחת
+// לא נספר שוב עבור הזמנה אחרת.
+
+import mongoose from "mongoose";
+import productTree from "../models/productTree.model.js";
+import Inventory from "../models/inventory.model.js";
+import Product from "../models/product.model.js";
+import Procurement from "../models/procurement.model.js";
+import ProductionOrder from "../models/ProductionOrder.model.js";
+import { idOf, netProductionOrders } from "../utils/productionNetting.js";
+
+// הזמנות שעדיין לא משכו רכיבים מהמלאי (In Progress כבר הורידו את הכמויות בפועל)
+export const OPEN_PRODUCTION_STATUSES = ["Pending", "On Hold"];
+
+// הזמנות רכש שהכמות שלהן נחשבת כבר "בהזמנה"
+const ON_ORDER_STATUSES = ["Pending", "In Progress", "Delivered"];
+
+const toObjectId = (id) => (id instanceof mongoose.Types.ObjectId ? id : new mongoose.Types.ObjectId(String(id)));
+
+/**
+ * טעינת כל עצי המשנה של הרכיבים בשאילתה אחת ($graphLookup).
+ * מחזיר Map של productId -> BOM (העץ הראשון שנמצא למוצר).
+ */
+const loadSubAssemblies = async (companyId, componentIds, session) => {
+  const boms = new Map();
+  if (componentIds.length === 0) return boms;
+
+  const rows = await productTree
+    .aggregate([
+      { $match: { companyId, productId: { $in: componentIds.map(toObjectId) } } },
+      {
+        $graphLookup: {
+          from: productTree.collection.name,
+          startWith: "$components.componentId",
+          connectFromField: "components.componentId",
+          connectToField: "productId",
+          as: "descendants",
+          restrictSearchWithMatch: { companyId },
+        },
+      },
+      { $project: { productId: 1, components: 1, "descendants.productId": 1, "descendants.components": 1 } },
+    ])
+    .session(session);
+
+  for (const row of rows) {
+    for (const bom of [row, ...(row.descendants || [])]) {
+      const productId = idOf(bom.productId);
+      if (!boms.has(productId)) boms.set(productId, bom);
+    }
+  }
+  return boms;
+};
+
+/**
+ * כמות במלאי לכל מוצר - סכום כל שורות המלאי (כל המחסנים) בשאילתה אחת
+ */
+const loadStockSnapshot = async (companyId, productIds, session) => {
+  if (productIds.length === 0) return new Map();
+  const rows = await Inventory.aggregate([
+    { $match: { companyId, productId: { $in: productIds.map(toObjectId) } } },
+    { $group: { _id: "$productId", quantity: { $sum: "$quantity" } } },
+  ]).session(session);
+  return new Map(rows.map((row) => [row._id.toString(), Math.max(0, row.quantity || 0)]));
+};
+
+/**
+ * כמויות בהזמנות רכש פתוחות לכל מוצר (Delivered - לפי הכמות שהתקבלה)
+ */
+const loadOnOrder = async (companyId, productIds, session) => {
+  const onOrder = new Map();
+  if (productIds.length === 0) return onOrder;
+  const ids = productIds.map(toObjectId);
+
+  const rows = await Procurement.aggregate([
+    { $match: { companyId, orderStatus: { $in: ON_ORDER_STATUSES }, "products.productId": { $in: ids } } },
+    { $unwind: "$products" },
+    { $match: { "products.productId": { $in: ids } } },
+    {
+      $project: {
+        productId: "$products.productId",
+        PurchaseOrder: 1,
+        orderStatus: 1,
+        quantity: {
+          $cond: [
+            { $and: [{ $eq: ["$orderStatus", "Delivered"] }, { $gt: ["$products.receivedQuantity", 0] }] },
+            "$products.receivedQuantity",
+            { $ifNull: ["$products.quantity", 0] },
+          ],
+        },
+      },
+    },
+  ]).session(session);
+
+  for (const row of rows) {
+    const productId = row.productId.toString();
+    const entry = onOrder.get(productId) || { totalOrdered: 0, procurementOrders: [] };
+    entry.totalOrdered += row.quantity;
+    entry.procurementOrders.push({
+      procurementId: row._id.toString(),
+      PurchaseOrder: row.PurchaseOrder,
+      orderStatus: row.orderStatus,
+      quantity: row.quantity,
+    });
+    onOrder.set(productId, entry);
+  }
+  return onOrder;
+};
+
+/**
+ * תכנון זמינות לרשימת הזמנות ייצור מול תמונת מלאי אחת (ראה netProductionOrders).
+ * טוען את עצי המשנה, המלאי, המוצרים ו(אם includeOnOrder) הזמנות הרכש הפתוחות, ומריץ את הנטו.
+ */
+export const planProductionAvailability = async (
+  companyId,
+  orders,
+  { session = null, includeOnOrder = false } = {}
+) => {
+  const companyObjectId = toObjectId(companyId);
+  const rootIds = new Set();
+  for (const order of orders) {
+    for (const line of order.bomId?.components || []) rootIds.add(idOf(line.componentId));
+  }
+
+  const boms = await loadSubAssemblies(companyObjectId, Array.from(rootIds), session);
+  const productIds = new Set(rootIds);
+  for (const bom of boms.values()) {
+    productIds.add(idOf(bom.productId));
+    for (const line of bom.components || []) productIds.add(idOf(line.componentId));
+  }
+  const ids = Array.from(productIds);
+
+  // ברצף ולא במקביל - פעולות באותה טרנזקציה (session) לא יכולות לרוץ במקביל
+  const stock = await loadStockSnapshot(companyObjectId, ids, session);
+  const productRows = ids.length
+    ? await Product.find({ _id: { $in: ids } }).select("productName sku unitPrice category").session(session).lean()
+    : [];
+  const onOrder = includeOnOrder ? await loadOnOrder(companyObjectId, ids, session) : new Map();
+  const products = new Map(productRows.map((product) => [product._id.toString(), product]));
+
+  return netProductionOrders(orders, { boms, stock, products, onOrder });
+};
+
+/**
+ * הזמנות הייצור הפתוחות של החברה, עם ה-BOM שלהן, לתכנון משותף
+ */
+export const loadOpenProductionOrders = (companyId, session = null) =>
+  ProductionOrder.find({ companyId, status: { $in: OPEN_PRODUCTION_STATUSES } })
+    .select("orderNumber productId productName quantity bomId status priority dueDate createdAt missingComponents")
+    .populate("bomId", "productId components")
+    .session(session)
+    .lean();
+
+export default {
+  planProductionAvailability,
+  loadOpenProductionOrders,
+  OPEN_PRODUCTION_STATUSES,
+};
@@ -0,0 +1,502 @@
+// services/reportRollup.service.js
+// סיכומים יומיים מצטברים לדוחות (super unified / dashboard / finance / HR / sales).
+// כל מודל מקור מגדיר את ה"תרומה" של מסמך לסיכומים; כתיבה למסמך מחסירה את התרומה
+// הקודמת ומוסיפה את החדשה ($inc), והדוחות ממזגים את הימים לכל טווח ב-aggregation אחד.
+
+import mongoose from "mongoose";
+import ReportRollup from "../models/ReportRollup.model.js";
+
+const EPOCH = new Date(0);
+
+const toObjectId = (id) => (id instanceof mongoose.Types.ObjectId ? id : new mongoose.Types.ObjectId(String(id)));
+
+// ========== HELPERS ==========
+
+/**
+ * תחילת היום (UTC) - מסמך בלי תאריך נספר ביום 0 כדי שייכלל בדוחות ללא טווח
+ */
+export const startOfRollupDay = (value) => {
+  if (!value) return EPOCH;
+  const date = new Date(value);
+  if (Number.isNaN(date.getTime())) return EPOCH;
+  return new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), date.getUTCDate()));
+};
+
+// שדה ref יכול להגיע כ-ObjectId או כמסמך populated
+const refId = (value) => (value && value._id ? value._id : value ?? null);
+
+const toNumber = (value) => Number(value) || 0;
+
+/**
+ * ציון ביקורת בסולם 1-5: ממוצע תשובות הדירוג, כל תשובה מנורמלת לפי maxRating של השאלה
+ */
+const reviewScore = (review) => {
+  const ratingQuestions = new Map(
+    (review.questions || [])
+      .filter((question) => question.responseType === "rating")
+      .map((question) => [String(question._id), question.maxRating || 5])
+  );
+  let total = 0;
+  let count = 0;
+  for (const response of review.responses || []) {
+    for (const answer of response.answers || []) {
+      const maxRating = ratingQuestions.get(String(answer.questionId));
+      const value = Number(answer.value);
+      if (!maxRating || !Number.isFinite(value)) continue;
+      total += (value / maxRating) * 5;
+      count++;
+    }
+  }
+  return count > 0 ? total / count : null;
+};
+
+// ========== DOMAINS ==========
+
+// שמות המדדים לכל תחום - נדרשים כדי לבנות את שלב ה-$group בשאילתה
+export const ROLLUP_DOMAINS = {
+  budget: { metrics: ["count", "amount", "spent", "utilization"] },
+  finance: { metrics: ["count", "amount"] },
+  tasks: { metrics: ["count"] },
+  procurement: { metrics: ["count", "cost"] },
+  customers: { metrics: ["count"] },
+  orders: { metrics: ["count", "total"], maxima: ["total"], minima: ["total"] },
+  orderItems: { metrics: ["count", "quantity", "revenue"] },
+  reviews: {
+    metrics: ["count", "scored", "scoreSum", "excellent", "needsImprovement"],
+    maxima: ["latest"],
+  },
+  proposals: { metrics: ["count", "cost"] },
+  // מצב נוכחי (day = null) - לא תלוי בטווח תאריכים
+  employees: { metrics: ["count"], state: true },
+};
+
+// ========== SOURCES ==========
+
+// לכל מודל מקור: השדות שהסיכום תלוי בהם (עד רמת תת-השדה במערכים), והתרומה של מסמך בודד
+// (רשימת { domain, day, dims, metrics, maxima?, minima? })
+export const ROLLUP_SOURCES = {
+  budgets: {
+    domains: ["budget"],
+    fields: ["companyId", "createdAt", "status", "departmentOrProjectName", "amount", "spentAmount"],
+    contributions: (budget) => {
+      const amount = toNumber(budget.amount);
+      const spent = toNumber(budget.spentAmount);
+      return [
+        {
+          domain: "budget",
+          day: startOfRollupDay(budget.createdAt),
+          dims: { status: budget.status ?? null, category: budget.departmentOrProjectName ?? null },
+          metrics: { count: 1, amount, spent, utilization: amount > 0 ? (spent / amount) * 100 : 0 },
+        },
+      ];
+    },
+  },
+
+  finance: {
+    domains: ["finance"],
+    fields: ["companyId", "transactionDate", "transactionType", "transactionStatus", "category", "transactionAmount"],
+    contributions: (transaction) => [
+      {
+        domain: "finance",
+        day: startOfRollupDay(transaction.transactionDate),
+        dims: {
+          type: transaction.transactionType ?? null,
+          status: transaction.transactionStatus ?? null,
+          category: transaction.category ?? null,
+        },
+        metrics: { count: 1, amount: toNumber(transaction.transactionAmount) },
+      },
+    ],
+  },
+
+  tasks: {
+    domains: ["tasks"],
+    fields: ["companyId", "createdAt", "status", "priority", "projectId"],
+    contributions: (task) => [
+      {
+        domain: "tasks",
+        day: startOfRollupDay(task.createdAt),
+        dims: { status: task.status ?? null, priority: task.priority ?? null, projectId: refId(task.projectId) },
+        metrics: { count: 1 },
+      },
+    ],
+  },
+
+  procurement: {
+    domains: ["procurement"],
+    fields: ["companyId", "createdAt", "status", "paymentStatus", "supplierId", "totalCost"],
+    contributions: (procurement) => [
+      {
+        domain: "procurement",
+        day: startOfRollupDay(procurement.createdAt),
+        dims: {
+          status: procurement.status ?? null,
+          paymentStatus: procurement.paymentStatus ?? null,
+          supplierId: refId(procurement.supplierId),
+        },
+        metrics: { count: 1, cost: toNumber(procurement.totalCost) },
+      },
+    ],
+  },
+
+  customers: {
+    domains: ["customers"],
+    fields: ["companyId", "createdAt", "status", "customerType"],
+    contributions: (customer) => [
+      {
+        domain: "customers",
+        day: startOfRollupDay(customer.createdAt),
+        dims: { status: customer.status ?? null, customerType: customer.customerType ?? null },
+        metrics: { count: 1 },
+      },
+    ],
+  },
+
+  customerOrders: {
+    domains: ["orders", "orderItems"],
+    fields: [
+      "companyId",
+      "orderDate",
+      "status",
+      "customer",
+      "orderTotal",
+      "items.product",
+      "items.quantity",
+      "items.unitPrice",
+    ],
+    contributions: (order) => {
+      const day = startOfRollupDay(order.orderDate);
+      const total = toNumber(order.orderTotal);
+      const entries = [
+        {
+          domain: "orders",
+          day,
+          dims: { status: order.status ?? null, customerId: refId(order.customer) },
+          metrics: { count: 1, total },
+          maxima: { total },
+          minima: { total },
+        },
+      ];
+      for (const item of order.items || []) {
+        const quantity = toNumber(item.quantity);
+        entries.push({
+          domain: "orderItems",
+          day,
+          dims: { productId: refId(item.product) },
+          metrics: { count: 1, quantity, revenue: quantity * toNumber(item.unitPrice) },
+        });
+      }
+      return entries;
+    },
+  },
+
+  performanceReviews: {
+    domains: ["reviews"],
+    fields: [
+      "companyId",
+      "createdAt",
+      "status",
+      "employeeId",
+      "questions._id",
+      "questions.responseType",
+      "questions.maxRating",
+      "responses.answers.questionId",
+      "responses.answers.value",
+    ],
+    contributions: (review) => {
+      const score = reviewScore(review);
+      const scored = score !== null;
+      return [
+        {
+          domain: "reviews",
+          day: startOfRollupDay(review.createdAt),
+          dims: { status: review.status ?? null, employeeId: refId(review.employeeId) },
+          metrics: {
+            count: 1,
+            scored: scored ? 1 : 0,
+            scoreSum: scored ? score : 0,
+            excellent: scored && score >= 4.5 ? 1 : 0,
+            needsImprovement: scored && score < 3 ? 1 : 0,
+          },
+          maxima: review.createdAt ? { latest: new Date(review.createdAt) } : {},
+        },
+      ];
+    },
+  },
+
+  procurementProposals: {
+    domains: ["proposals"],
+    fields: ["companyId", "createdAt", "status", "totalEstimatedCost"],
+    contributions: (proposal) => [
+      {
+        domain: "proposals",
+        day: startOfRollupDay(proposal.createdAt),
+        dims: { status: proposal.status ?? null },
+        metrics: { count: 1, cost: toNumber(proposal.totalEstimatedCost) },
+      },
+    ],
+  },
+
+  employees: {
+    domains: ["employees"],
+    fields: ["companyId", "status", "role", "department"],
+    contributions: (employee) => [
+      {
+        domain: "employees",
+        day: null,
+        dims: { status: employee.status ?? null, role: employee.role ?? null, department: refId(employee.department) },
+        metrics: { count: 1 },
+      },
+    ],
+  },
+};
+
+// ========== ACCUMULATION ==========
+
+const rollupKey = (dims) =>
+  Object.values(dims)
+    .map((value) => (value === null || value === undefined ? "" : String(value)))
+    .join("|");
+
+/**
+ * צבירת התרומות של מסמכים לתוך buckets (sign = 1 הוספה, -1 הסרה)
+ * ערכי קצה נצברים רק בהוספה - $max/$min לא ניתנים לביטול
+ */
+export const accumulateContributions = (buckets, source, docs, sign = 1) => {
+  const { contributions } = ROLLUP_SOURCES[source];
+
+  for (const doc of docs) {
+    if (!doc?.companyId) continue;
+    const companyId = toObjectId(refId(doc.companyId));
+
+    for (const entry of contributions(doc)) {
+      const key = rollupKey(entry.dims);
+      const id = `${companyId}|${entry.domain}|${entry.day ? entry.day.getTime() : "state"}|${key}`;
+      let bucket = buckets.get(id);
+      if (!bucket) {
+        bucket = {
+          companyId,
+          domain: entry.domain,
+          day: entry.day,
+          key,
+          dims: entry.dims,
+          metrics: {},
+          maxima: {},
+          minima: {},
+        };
+        buckets.set(id, bucket);
+      }
+
+      for (const [name, value] of Object.entries(entry.metrics)) {
+        bucket.metrics[name] = (bucket.metrics[name] || 0) + sign * value;
+      }
+      if (sign > 0) {
+        for (const [name, value] of Object.entries(entry.maxima || {})) {
+          if (bucket.maxima[name] === undefined || value > bucket.maxima[name]) bucket.maxima[name] = value;
+        }
+        for (const [name, value] of Object.entries(entry.minima || {})) {
+          if (bucket.minima[name] === undefined || value < bucket.minima[name]) bucket.minima[name] = value;
+        }
+      }
+    }
+  }
+
+  return buckets;
+};
+
+const prefixKeys = (prefix, values) =>
+  Object.fromEntries(Object.entries(values).map(([name, value]) => [`${prefix}.${name}`, value]));
+
+// רשומת meta לכל חברה: dims.rebuiltAt, חלון הבנייה (rebuildStartedAt / rebuildFinishedAt) ו-dirtyAt
+export const ROLLUP_META_DOMAIN = "_meta";
+
+export const rollupMetaFilter = (companyId) => ({
+  companyId: toObjectId(companyId),
+  domain: ROLLUP_META_DOMAIN,
+  day: null,
+  key: "",
+});
+
+/**
+ * סימון dirty לחברות שבנייה מחדש שלהן חפפה לכתיבה שהתחילה ב-since:
+ * ה-replace של הבנייה עלול לדרוס את ה-$inc של הכתיבה או לספור אותה פעמיים.
+ * בנייה פתוחה (בלי rebuildFinishedAt) נחשבת חופפת. dirtyAt מאוחר מתחילת הבנייה ולכן שורד אותה.
+ */
+export const markRollupsDirtyIfRebuildOverlapped = async (companyIds, since) => {
+  if (companyIds.length === 0) return 0;
+  const result = await ReportRollup.updateMany(
+    {
+      companyId: { $in: companyIds.map(toObjectId) },
+      domain: ROLLUP_META_DOMAIN,
+      day: null,
+      key: "",
+      "dims.rebuildStartedAt": { $exists: true },
+      $or: [{ "dims.rebuildFinishedAt": { $exists: false } }, { "dims.rebuildFinishedAt": { $gte: since } }],
+    },
+    { $set: { "dims.dirtyAt": new Date() } }
+  );
+  return result.modifiedCount;
+};
+
+/**
+ * עדכון incremental של הסיכומים אחרי שינוי במסמכי מקור
+ * before / after - מצב המסמכים לפני ואחרי הכתיבה (מערך ריק ליצירה / מחיקה)
+ * since - תחילת הכתיבה, לזיהוי חפיפה עם בנייה מחדש
+ */
+export const applyRollupChange = async (source, before = [], after = [], { since = null } = {}) => {
+  const buckets = new Map();
+  accumulateContributions(buckets, source, before, -1);
+  accumulateContributions(buckets, source, after, 1);
+
+  const operations = [];
+  for (const bucket of buckets.values()) {
+    const changed = Object.fromEntries(Object.entries(bucket.metrics).filter(([, value]) => value !== 0));
+    // שמירה בלי שינוי בשדות הרלוונטיים - אין מה לעדכן
+    if (Object.keys(changed).length === 0) continue;
+
+    const update = {
+      $inc: prefixKeys("metrics", changed),
+      $setOnInsert: { dims: bucket.dims },
+    };
+    if (Object.keys(bucket.maxima).length > 0) update.$max = prefixKeys("maxima", bucket.maxima);
+    if (Object.keys(bucket.minima).length > 0) update.$min = prefixKeys("minima", bucket.minima);
+
+    operations.push({
+      updateOne: {
+        filter: { companyId: bucket.companyId, domain: bucket.domain, day: bucket.day, key: bucket.key },
+        update,
+        upsert: true,
+      },
+    });
+  }
+
+  if (operations.length === 0) return 0;
+  await ReportRollup.bulkWrite(operations, { ordered: false });
+
+  if (since) {
+    const companyIds = new Set(operations.map(({ updateOne }) => String(updateOne.filter.companyId)));
+    await markRollupsDirtyIfRebuildOverlapped([...companyIds], since);
+  }
+  return operations.length;
+};
+
+/**
+ * המרת buckets למסמכי ReportRollup (לבנייה מחדש)
+ */
+export const toRollupDocuments = (buckets) =>
+  [...buckets.values()]
+    .filter((bucket) => (bucket.metrics.count || 0) > 0)
+    .map(({ maxima, minima, ...bucket }) => ({
+      ...bucket,
+      ...(Object.keys(maxima).length > 0 && { maxima }),
+      ...(Object.keys(minima).length > 0 && { minima }),
+    }));
+
+// ========== QUERIES ==========
+
+const facetPipeline = ({ domain, from = null, to = null, byMonth = false }) => {
+  const definition = ROLLUP_DOMAINS[domain];
+  const match = { domain };
+  if (!definition.state && (from || to)) {
+    match.day = {
+      ...(from && { $gte: startOfRollupDay(from) }),
+      ...(to && { $lte: to }),
+    };
+  }
+
+  const group = {
+    _id: {
+      key: "$key",
+      month: byMonth ? { $dateToString: { format: "%Y-%m", date: "$day" } } : null,
+    },
+    dims: { $first: "$dims" },
+  };
+  for (const name of definition.metrics) group[`metrics_${name}`] = { $sum: `$metrics.${name}` };
+  for (const name of definition.maxima || []) group[`maxima_${name}`] = { $max: `$maxima.${name}` };
+  for (const name of definition.minima || []) group[`minima_${name}`] = { $min: `$minima.${name}` };
+
+  return [{ $match: match }, { $group: group }, { $match: { metrics_count: { $gt: 0 } } }];
+};
+
+const unpackRow = (row) => {
+  const unpacked = { dims: row.dims || {}, month: row._id.month, metrics: {}, maxima: {}, minima: {} };
+  for (const [field, value] of Object.entries(row)) {
+    const [kind, name] = field.split("_");
+    if (name && unpacked[kind] && kind !== "dims") unpacked[kind][name] = value;
+  }
+  return unpacked;
+};
+
+/**
+ * טעינת סיכומים במספר חתכים ב-aggregation אחד ($facet)
+ * facets: { name: { domain, from?, to?, byMonth? } }
+ * מחזיר { name: [{ dims, month, metrics, maxima, minima }] } - שורה לכל צירוף ממדים (ולחודש)
+ */
+export const loadRollups = async (companyId, facets) => {
+  const entries = Object.entries(facets);
+  if (entries.length === 0) return {};
+
+  const domains = [...new Set(entries.map(([, facet]) => facet.domain))];
+  const [result] = await ReportRollup.aggregate([
+    { $match: { companyId: toObjectId(companyId), domain: { $in: domains } } },
+    { $facet: Object.fromEntries(entries.map(([name, facet]) => [name, facetPipeline(facet)])) },
+  ]);
+
+  return Object.fromEntries(entries.map(([name]) => [name, (result?.[name] || []).map(unpackRow)]));
+};
+
+/**
+ * קיבוץ שורות סיכום לפי מפתח (כמו $group) - סכימת מדדים ומיזוג ערכי קצה
+ * groupId(row) מחזיר את ה-_id של הקבוצה (ערך או אובייקט)
+ */
+export const groupRollups = (rows, groupId) => {
+  const groups = new Map();
+
+  for (const row of rows) {
+    const _id = groupId(row);
+    const id = JSON.stringify(_id ?? null);
+    let group = groups.get(id);
+    if (!group) {
+      group = { _id: _id ?? null, metrics: {}, maxima: {}, minima: {} };
+      groups.set(id, group);
+    }
+    for (const [name, value] of Object.entries(row.metrics)) {
+      group.metrics[name] = (group.metrics[name] || 0) + (value || 0);
+    }
+    for (const [name, value] of Object.entries(row.maxima)) {
+      if (value !== null && value !== undefined && (group.maxima[name] === undefined || value > group.maxima[name])) {
+        group.maxima[name] = value;
+      }
+    }
+    for (const [name, value] of Object.entries(row.minima)) {
+      if (value !== null && value !== undefined && (group.minima[name] === undefined || value < group.minima[name])) {
+        group.minima[name] = value;
+      }
+    }
+  }
+
+  return [...groups.values()].filter((group) => (group.metrics.count || 0) > 0);
+};
+
+/**
+ * פירוק "YYYY-MM" ל-{ year, month } (כמו $year / $month)
+ */
+export const monthParts = (month) => {
+  const [year, monthNumber] = String(month).split("-").map(Number);
+  return { year, month: monthNumber };
+};
+
+export default {
+  ROLLUP_DOMAINS,
+  ROLLUP_SOURCES,
+  accumulateContributions,
+  applyRollupChange,
+  markRollupsDirtyIfRebuildOverlapped,
+  rollupMetaFilter,
+  ROLLUP_META_DOMAIN,
+  toRollupDocuments,
+  loadRollups,
+  groupRollups,
+  monthParts,
+  startOfRollupDay,
+};
@@ -0,0 +1,194 @@
+// services/reportRollupBackfill.service.js
+// בנייה מחדש של סיכומי הדוחות (ReportRollup) מתוך מודלי המקור:
+// backfill ראשוני לחברה, בנייה לילית שמתקנת סטיות (כתיבות שעקפו את ה-hooks, ערכי קצה ישנים),
+// והרצה לפי דרישה (endpoint / script).
+
+import mongoose from "mongoose";
+import ReportRollup from "../models/ReportRollup.model.js";
+import Budget from "../models/Budget.model.js";
+import Finance from "../models/finance.model.js";
+import Task from "../models/tasks.model.js";
+import Procurement from "../models/procurement.model.js";
+import Customer from "../models/customers.model.js";
+import CustomerOrder from "../models/CustomerOrder.model.js";
+import PerformanceReview from "../models/performanceReview.model.js";
+import ProcurementProposal from "../models/ProcurementProposal.model.js";
+import Employee from "../models/employees.model.js";
+import { acquireLock, releaseLock } from "../config/redis.js";
+import { forEachCompany } from "./jobEngine.service.js";
+import {
+  ROLLUP_SOURCES,
+  accumulateContributions,
+  toRollupDocuments,
+  rollupMetaFilter,
+} from "./reportRollup.service.js";
+
+const REBUILD_LOCK_TTL_MS = 30 * 60 * 1000;
+const WRITE_BATCH_SIZE = 1000;
+// כמה זמן דוח ממתין לבנייה שרצה ב-instance אחר לפני 503
+const REBUILD_WAIT_MS = 25 * 1000;
+const REBUILD_POLL_MS = 1000;
+
+const SOURCE_MODELS = {
+  budgets: Budget,
+  finance: Finance,
+  tasks: Task,
+  procurement: Procurement,
+  customers: Customer,
+  customerOrders: CustomerOrder,
+  performanceReviews: PerformanceReview,
+  procurementProposals: ProcurementProposal,
+  employees: Employee,
+};
+
+const toObjectId = (id) => (id instanceof mongoose.Types.ObjectId ? id : new mongoose.Types.ObjectId(String(id)));
+
+/**
+ * בנייה מחדש של תחומי מקור אחד לחברה:
+ * סריקת המסמכים ב-cursor, replace לכל bucket, ומחיקת buckets שלא נכתבו בריצה הזו.
+ * אין חלון שבו הסיכומים ריקים - הדוחות ממשיכים לעבוד בזמן הבנייה.
+ * startedAt נלקח לפני הסריקה, כך ש-buckets שה-hooks יצרו בזמנה לא נמחקים;
+ * $inc של hooks שנדרס ב-replace מסומן dirty על ידי ה-hook עצמו (ראה applyRollupChange).
+ */
+const rebuildSource = async (companyId, source) => {
+  const { fields, domains } = ROLLUP_SOURCES[source];
+  const buckets = new Map();
+  const startedAt = new Date();
+
+  const cursor = SOURCE_MODELS[source]
+    .find({ companyId })
+    .select(fields.join(" "))
+    .lean()
+    .cursor({ batchSize: WRITE_BATCH_SIZE });
+  for await (const doc of cursor) {
+    accumulateContributions(buckets, source, [doc]);
+  }
+
+  const documents = toRollupDocuments(buckets);
+  for (let i = 0; i < documents.length; i += WRITE_BATCH_SIZE) {
+    const operations = documents.slice(i, i + WRITE_BATCH_SIZE).map((doc) => ({
+      replaceOne: {
+        filter: { companyId: doc.companyId, domain: doc.domain, day: doc.day, key: doc.key },
+        replacement: { ...doc, createdAt: startedAt, updatedAt: startedAt },
+        upsert: true,
+      },
+    }));
+    await ReportRollup.bulkWrite(operations, { ordered: false });
+  }
+
+  await ReportRollup.deleteMany({ companyId, domain: { $in: domains }, updatedAt: { $lt: startedAt } });
+  return documents.length;
+};
+
+/**
+ * בנייה מחדש של כל הסיכומים של חברה (רץ תחת lock לחברה)
+ */
+export const rebuildReportRollups = async (companyId, { sources = Object.keys(SOURCE_MODELS) } = {}) => {
+  const companyObjectId = toObjectId(companyId);
+  const lockKey = `lock:report-rollups:${companyObjectId}`;
+  const token = await acquireLock(lockKey, REBUILD_LOCK_TTL_MS);
+  if (!token) {
+    const error = new Error("Report rollup rebuild already running for this company");
+    error.statusCode = 409;
+    throw error;
+  }
+
+  const startedAt = new Date();
+  try {
+    // ה-upsert לפי המפתח דורש את ה-unique index
+    await ReportRollup.init();
+    // חלון הבנייה נרשם ב-meta - כתיבות שחופפות לו מסמנות dirty
+    await ReportRollup.updateOne(
+      rollupMetaFilter(companyObjectId),
+      { $set: { "dims.rebuildStartedAt": startedAt }, $unset: { "dims.rebuildFinishedAt": "" } },
+      { upsert: true }
+    );
+
+    const rollups = {};
+    for (const source of sources) {
+      rollups[source] = await rebuildSource(companyObjectId, source);
+    }
+
+    // סימון dirty שנוצר אחרי תחילת הבנייה נשאר - הבנייה הבאה תכסה אותו
+    await ReportRollup.updateOne(rollupMetaFilter(companyObjectId), { $set: { "dims.rebuiltAt": startedAt } });
+    await ReportRollup.updateOne(
+      { ...rollupMetaFilter(companyObjectId), "dims.dirtyAt": { $lt: startedAt } },
+      { $unset: { "dims.dirtyAt": "" } }
+    );
+
+    return { companyId: companyObjectId.toString(), rollups, durationMs: Date.now() - startedAt.getTime() };
+  } finally {
+    await ReportRollup.updateOne(rollupMetaFilter(companyObjectId), {
+      $set: { "dims.rebuildFinishedAt": new Date() },
+    }).catch((error) => console.error("❌ Error closing report rollup rebuild window:", error.message));
+    await releaseLock(lockKey, token);
+  }
+};
+
+/**
+ * בנייה לילית לכל החברות
+ */
+export const rebuildAllReportRollups = async () => {
+  console.log("\n📊 Rebuilding report rollups...");
+  const results = await forEachCompany((companyId) => rebuildReportRollups(companyId), { concurrency: 2 });
+  const failed = results.filter((result) => result?.error).length;
+  console.log(`✅ Report rollups rebuilt (${results.length - failed} companies, ${failed} failed)`);
+};
+
+// בניות שרצות כרגע בתהליך הנוכחי
+const pendingBackfills = new Map();
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const rollupsComplete = async (companyObjectId) => {
+  const meta = await ReportRollup.findOne(rollupMetaFilter(companyObjectId)).select("dims").lean();
+  return { complete: Boolean(meta?.dims?.rebuiltAt && !meta.dims.dirtyAt), meta };
+};
+
+/**
+ * מבטיח שהסיכומים של החברה שלמים לפני קריאת דוח:
+ * בפעם הראשונה (backfill) או אחרי סימון dirty - בנייה מחדש.
+ * אם instance אחר מחזיק את ה-lock ממתינים שיסיים; אם הסיכומים לא שלמים עד REBUILD_WAIT_MS - 503.
+ */
+export const ensureReportRollups = async (companyId) => {
+  const companyObjectId = toObjectId(companyId);
+  const id = companyObjectId.toString();
+  const deadline = Date.now() + REBUILD_WAIT_MS;
+
+  while (true) {
+    const { complete, meta } = await rollupsComplete(companyObjectId);
+    if (complete) return;
+
+    if (!pendingBackfills.has(id)) {
+      const backfill = (async () => {
+        console.log(`📊 ${meta?.dims?.dirtyAt ? "Rebuilding stale" : "Backfilling"} report rollups for company ${id}...`);
+        await rebuildReportRollups(id);
+        return true;
+      })()
+        .catch((error) => {
+          if (error.statusCode === 409) return false;
+          console.error(`❌ Report rollup backfill failed for company ${id}:`, error.message);
+          throw error;
+        })
+        .finally(() => pendingBackfills.delete(id));
+      pendingBackfills.set(id, backfill);
+    }
+
+    // false = הבנייה רצה ב-instance אחר
+    const rebuilt = await Promise.race([pendingBackfills.get(id), sleep(Math.max(0, deadline - Date.now()))]);
+    if (rebuilt === false) await sleep(REBUILD_POLL_MS);
+
+    if (Date.now() >= deadline) {
+      if ((await rollupsComplete(companyObjectId)).complete) return;
+      const error = new Error("Report rollups are being rebuilt, please retry shortly");
+      error.statusCode = 503;
+      throw error;
+    }
+  }
+};
+
+export default {
+  rebuildReportRollups,
+  rebuildAllReportRollups,
+  ensureReportRollups,
+};
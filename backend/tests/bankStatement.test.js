@@ -0,0 +1,77 @@
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { parseStatementDate, parseRow, fingerprintOf } from "../utils/bankStatement.js";
+
+const utc = (year, month, day) => new Date(Date.UTC(year, month - 1, day));
+
+test("parseStatementDate follows the statement's date format", () => {
+  assert.deepEqual(parseStatementDate("03/04/2026", "DD/MM/YYYY"), utc(2026, 4, 3));
+  assert.deepEqual(parseStatementDate("03/04/2026", "MM/DD/YYYY"), utc(2026, 3, 4));
+  assert.deepEqual(parseStatementDate("2026-04-03", "YYYY-MM-DD"), utc(2026, 4, 3));
+  assert.deepEqual(parseStatementDate("3.4.26", "DD.MM.YYYY"), utc(2026, 4, 3));
+  assert.deepEqual(parseStatementDate(" 03-04-2026 ", "dd/mm/yyyy"), utc(2026, 4, 3));
+});
+
+test("parseStatementDate rejects impossible and empty dates", () => {
+  assert.equal(parseStatementDate("31/02/2026", "DD/MM/YYYY"), null);
+  assert.equal(parseStatementDate("13/13/2026", "MM/DD/YYYY"), null);
+  assert.equal(parseStatementDate("", "DD/MM/YYYY"), null);
+  assert.equal(parseStatementDate(undefined, "DD/MM/YYYY"), null);
+  assert.equal(parseStatementDate("not a date"), null);
+});
+
+test("parseStatementDate falls back to Date parsing without a known format", () => {
+  assert.deepEqual(parseStatementDate("2026-04-03T00:00:00Z"), utc(2026, 4, 3));
+});
+
+const context = {
+  companyId: "company-1",
+  bankAccount: { _id: "account-1", currency: "ILS" },
+  dateFormat: "DD/MM/YYYY",
+  importDate: new Date("2026-05-01T00:00:00Z"),
+};
+
+test("parseRow reads amount, credit/debit columns and rejects bad rows", () => {
+  assert.equal(parseRow({ date: "01/04/2026", amount: "1,250.50" }, context).amount, 1250.5);
+  assert.equal(parseRow({ date: "01/04/2026", debit: "₪ 80" }, context).amount, -80);
+  assert.equal(parseRow({ date: "01/04/2026", debit: "80" }, context).transactionType, "Debit");
+  assert.equal(parseRow({ date: "01/04/2026", credit: "80" }, context).currency, "ILS");
+  assert.deepEqual(parseRow({ date: "xx", amount: "1" }, context), { error: "Invalid transaction date" });
+  assert.deepEqual(parseRow({ date: "01/04/2026", amount: "abc" }, context), { error: "Invalid amount" });
+});
+
+test("parseRow only sets valueDate when it parses", () => {
+  assert.equal("valueDate" in parseRow({ date: "01/04/2026", amount: "1" }, context), false);
+  assert.deepEqual(
+    parseRow({ date: "01/04/2026", valueDate: "02/04/2026", amount: "1" }, context).valueDate,
+    utc(2026, 4, 2)
+  );
+});
+
+test("fingerprint is stable across imports and counts repeated rows", () => {
+  const row = () => parseRow({ date: "01/04/2026", amount: "100", reference: " INV-7 " }, context);
+
+  const first = new Map();
+  const a = fingerprintOf(row(), first);
+  const b = fingerprintOf(row(), first);
+  assert.notEqual(a, b);
+  assert.match(a, /:1$/);
+  assert.match(b, /:2$/);
+
+  // ייבוא חוזר של אותו דף מייצר את אותן טביעות
+  const second = new Map();
+  assert.equal(fingerprintOf(row(), second), a);
+  assert.equal(fingerprintOf(row(), second), b);
+});
+
+test("fingerprint ignores reference case and float noise but not the account or day", () => {
+  const base = parseRow({ date: "01/04/2026", amount: "0.3", reference: "inv-7" }, context);
+  const same = { ...base, amount: 0.1 + 0.2, reference: "INV-7" };
+  const otherDay = { ...base, transactionDate: utc(2026, 4, 2) };
+  const otherAccount = { ...base, bankAccountId: "account-2" };
+
+  const key = (transaction) => fingerprintOf(transaction, new Map());
+  assert.equal(key(same), key(base));
+  assert.notEqual(key(otherDay), key(base));
+  assert.notEqual(key(otherAccount), key(base));
+});
@@ -0,0 +1,95 @@
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import mongoose from "mongoose";
+import {
+  normalizeKeysetSort,
+  encodeCursor,
+  decodeCursor,
+  keysetFilter,
+  parseKeysetQuery,
+} from "../middleware/pagination.js";
+
+test("normalizeKeysetSort adds _id as the last tie-breaker", () => {
+  assert.deepEqual(normalizeKeysetSort({ entryDate: "desc", createdAt: -1 }), [
+    ["entryDate", -1],
+    ["createdAt", -1],
+    ["_id", -1],
+  ]);
+  assert.deepEqual(normalizeKeysetSort({ name: 1 }), [
+    ["name", 1],
+    ["_id", 1],
+  ]);
+  assert.deepEqual(normalizeKeysetSort({ _id: 1 }), [["_id", 1]]);
+});
+
+test("cursor round-trips dates, ObjectIds, numbers and nulls", () => {
+  const entries = normalizeKeysetSort({ entryDate: -1, amount: 1, reference: 1 });
+  const doc = {
+    _id: new mongoose.Types.ObjectId(),
+    entryDate: new Date("2026-03-01T10:00:00.000Z"),
+    amount: 12.5,
+    reference: null,
+  };
+
+  const values = decodeCursor(encodeCursor(doc, entries), entries);
+  assert.ok(values[0] instanceof Date);
+  assert.equal(values[0].toISOString(), doc.entryDate.toISOString());
+  assert.equal(values[1], 12.5);
+  assert.equal(values[2], null);
+  assert.ok(values[3] instanceof mongoose.Types.ObjectId);
+  assert.ok(values[3].equals(doc._id));
+});
+
+test("cursor reads paths through Mongoose documents' get()", () => {
+  const entries = normalizeKeysetSort({ "meta.rank": 1 });
+  const doc = { _id: 1, get: (path) => ({ "meta.rank": 7, _id: 1 })[path] };
+  assert.deepEqual(decodeCursor(encodeCursor(doc, entries), entries), [7, 1]);
+});
+
+test("decodeCursor rejects tampered or foreign cursors with a 400", () => {
+  const entries = normalizeKeysetSort({ createdAt: -1 });
+  const other = normalizeKeysetSort({ name: 1 });
+  const cursor = encodeCursor({ _id: 1, name: "a" }, other);
+
+  for (const bad of ["not-a-cursor", cursor, Buffer.from('{"k":["createdAt:-1","_id:-1"],"v":[{"$x":1},1]}').toString("base64url")]) {
+    assert.throws(() => decodeCursor(bad, entries), (error) => error.statusCode === 400);
+  }
+});
+
+test("keysetFilter builds the lexicographic 'after' condition", () => {
+  const entries = normalizeKeysetSort({ entryDate: -1, createdAt: -1 });
+  const date = new Date("2026-01-01");
+  const created = new Date("2026-01-02");
+
+  assert.deepEqual(keysetFilter(entries, [date, created, 5]), {
+    $or: [
+      { entryDate: { $lt: date } },
+      { entryDate: date, createdAt: { $lt: created } },
+      { entryDate: date, createdAt: created, _id: { $lt: 5 } },
+    ],
+  });
+});
+
+test("keysetFilter handles null sort values", () => {
+  // בסדר עולה null ראשון - כל מה שאינו null בא אחריו
+  assert.deepEqual(keysetFilter([["name", 1], ["_id", 1]], [null, 3]), {
+    $or: [{ name: { $ne: null } }, { name: null, _id: { $gt: 3 } }],
+  });
+  // בסדר יורד אין כלום אחרי null באותו מפתח
+  assert.deepEqual(keysetFilter([["name", -1], ["_id", -1]], [null, 3]), {
+    $or: [{ name: null, _id: { $lt: 3 } }],
+  });
+});
+
+test("parseKeysetQuery validates limit and total", () => {
+  assert.deepEqual(parseKeysetQuery({}), { limit: 50, cursor: null, total: "none" });
+  assert.deepEqual(parseKeysetQuery({ limit: "20", cursor: "abc", total: "exact" }), {
+    limit: 20,
+    cursor: "abc",
+    total: "exact",
+  });
+  assert.equal(parseKeysetQuery({ total: "bogus" }).total, "none");
+  for (const limit of ["0", "-1", "1.5", "x", "501"]) {
+    assert.throws(() => parseKeysetQuery({ limit }), (error) => error.statusCode === 400);
+  }
+});
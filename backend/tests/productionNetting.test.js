@@ -0,0 +1,104 @@
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { netProductionOrders } from "../utils/productionNetting.js";
+
+const products = new Map([
+  ["bolt", { productName: "Bolt", sku: "B-1", unitPrice: 0.5, category: "Parts" }],
+  ["frame", { productName: "Frame", sku: "F-1", unitPrice: 40, category: "Assemblies" }],
+  ["tube", { productName: "Tube", sku: "T-1", unitPrice: 3, category: "Parts" }],
+]);
+
+const order = (id, fields, components) => ({
+  _id: id,
+  orderNumber: id.toUpperCase(),
+  productName: `Product ${id}`,
+  quantity: 1,
+  bomId: { productId: `p-${id}`, components },
+  ...fields,
+});
+
+test("stock claimed by one order is not counted again for the next", () => {
+  const orders = [
+    order("a", { priority: "low" }, [{ componentId: "bolt", quantity: 6 }]),
+    order("b", { priority: "urgent" }, [{ componentId: "bolt", quantity: 6 }]),
+  ];
+  const { plans, purchaseList } = netProductionOrders(orders, {
+    boms: new Map(),
+    stock: new Map([["bolt", 10]]),
+    products,
+  });
+
+  // urgent קודם: מקבל את כל 6, ל-low נשארים 4
+  assert.equal(plans[1].allComponentsAvailable, true);
+  assert.equal(plans[0].components[0].availableQuantity, 4);
+  assert.equal(plans[0].components[0].status, "Partial");
+  assert.deepEqual(plans[0].missingComponents.map((m) => m.missing), [2]);
+
+  assert.equal(purchaseList.length, 1);
+  assert.equal(purchaseList[0].totalRequired, 12);
+  assert.equal(purchaseList[0].totalAvailable, 10);
+  assert.equal(purchaseList[0].totalShortage, 2);
+  assert.deepEqual(purchaseList[0].affectedOrders.map((o) => o.orderNumber), ["A"]);
+});
+
+test("orders already confirmed available keep their stock before higher priority ones", () => {
+  const orders = [
+    order("a", { priority: "urgent", missingComponents: [{ componentId: "bolt" }] }, [{ componentId: "bolt", quantity: 5 }]),
+    order("b", { priority: "low", missingComponents: [] }, [{ componentId: "bolt", quantity: 5 }]),
+  ];
+  const { plans } = netProductionOrders(orders, { boms: new Map(), stock: new Map([["bolt", 5]]), products });
+
+  assert.equal(plans[1].allComponentsAvailable, true);
+  assert.equal(plans[0].allComponentsAvailable, false);
+});
+
+test("a sub-assembly shortage is exploded into its purchased parts", () => {
+  const boms = new Map([["frame", { productId: "frame", components: [{ componentId: "tube", quantity: 4 }] }]]);
+  const orders = [order("a", {}, [{ componentId: "frame", quantity: 3 }])];
+  const { plans, purchaseList } = netProductionOrders(orders, {
+    boms,
+    stock: new Map([["frame", 1], ["tube", 2]]),
+    products,
+  });
+
+  assert.deepEqual(plans[0].buildRequirements, [
+    { componentId: "frame", componentName: "Frame", required: 3, available: 1, missing: 2 },
+  ]);
+  // 2 מסגרות לייצור * 4 צינורות = 8, 2 במלאי
+  assert.deepEqual(plans[0].purchaseRequirements, [
+    { componentId: "tube", componentName: "Tube", required: 8, available: 2, missing: 6 },
+  ]);
+  assert.deepEqual(purchaseList.map((item) => item.componentId), ["tube"]);
+});
+
+test("purchase list is net of quantities already on order", () => {
+  const orders = [order("a", { quantity: 2 }, [{ componentId: "bolt", quantity: 10 }])];
+  const { purchaseList } = netProductionOrders(orders, {
+    boms: new Map(),
+    stock: new Map(),
+    products,
+    onOrder: new Map([["bolt", { totalOrdered: 15, procurementOrders: [{ procurementId: "po-1", quantity: 15 }] }]]),
+  });
+
+  assert.equal(purchaseList[0].totalShortage, 20);
+  assert.equal(purchaseList[0].totalOrdered, 15);
+  assert.equal(purchaseList[0].totalMissing, 5);
+});
+
+test("cyclic BOMs do not recurse forever", () => {
+  const boms = new Map([
+    ["frame", { productId: "frame", components: [{ componentId: "tube", quantity: 1 }] }],
+    ["tube", { productId: "tube", components: [{ componentId: "frame", quantity: 1 }] }],
+  ]);
+  const orders = [order("a", {}, [{ componentId: "frame", quantity: 1 }])];
+  const { plans } = netProductionOrders(orders, { boms, stock: new Map(), products });
+
+  assert.deepEqual(
+    plans[0].buildRequirements.map((item) => item.componentId),
+    ["frame", "tube"]
+  );
+  assert.deepEqual(
+    plans[0].purchaseRequirements.map((item) => item.componentId),
+    ["frame"]
+  );
+});
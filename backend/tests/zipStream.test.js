@@ -0,0 +1,96 @@
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { Writable } from "node:stream";
+import zlib from "node:zlib";
+import { ZipStream, safeEntryName } from "../utils/zipStream.js";
+
+// stream שאוסף את הפלט; highWaterMark קטן כדי שה-backpressure יופעל
+const collector = () => {
+  const chunks = [];
+  const output = new Writable({
+    highWaterMark: 16,
+    write(chunk, _encoding, callback) {
+      chunks.push(chunk);
+      setImmediate(callback);
+    },
+  });
+  const finished = new Promise((resolve) => output.on("finish", () => resolve(Buffer.concat(chunks))));
+  return { output, finished };
+};
+
+// קריאת הארכיון דרך ה-central directory
+const readZip = (buffer) => {
+  const end = buffer.lastIndexOf(Buffer.from([0x50, 0x4b, 0x05, 0x06]));
+  assert.ok(end >= 0, "end of central directory record");
+  const count = buffer.readUInt16LE(end + 10);
+  let offset = buffer.readUInt32LE(end + 16);
+
+  const entries = [];
+  for (let i = 0; i < count; i++) {
+    assert.equal(buffer.readUInt32LE(offset), 0x02014b50);
+    const crc = buffer.readUInt32LE(offset + 16);
+    const size = buffer.readUInt32LE(offset + 24);
+    const nameLength = buffer.readUInt16LE(offset + 28);
+    const localOffset = buffer.readUInt32LE(offset + 42);
+    const name = buffer.toString("utf8", offset + 46, offset + 46 + nameLength);
+
+    assert.equal(buffer.readUInt32LE(localOffset), 0x04034b50);
+    const localNameLength = buffer.readUInt16LE(localOffset + 26);
+    const dataStart = localOffset + 30 + localNameLength;
+    entries.push({ name, crc, data: buffer.subarray(dataStart, dataStart + size) });
+    offset += 46 + nameLength;
+  }
+  return entries;
+};
+
+test("writes a readable STORE archive with correct CRCs", async () => {
+  const { output, finished } = collector();
+  const zip = new ZipStream(output);
+  const pdf = Buffer.alloc(5000, 7);
+
+  await Promise.all([zip.addFile("a.pdf", pdf), zip.addFile("חשבונית.pdf", "שלום")]);
+  await zip.finalize();
+
+  const entries = readZip(await finished);
+  assert.deepEqual(
+    entries.map((entry) => entry.name),
+    ["a.pdf", "חשבונית.pdf"]
+  );
+  assert.deepEqual(entries[0].data, pdf);
+  assert.equal(entries[1].data.toString("utf8"), "שלום");
+  for (const entry of entries) {
+    assert.equal(entry.crc, zlib.crc32(entry.data));
+  }
+});
+
+test("sanitizes entry names", () => {
+  assert.equal(safeEntryName("../../etc/passwd"), "_._etc_passwd");
+  assert.equal(safeEntryName("a/b\\c.pdf"), "a_b_c.pdf");
+  assert.equal(safeEntryName(".."), "file");
+  assert.equal(safeEntryName(""), "file");
+  assert.equal(safeEntryName(undefined), "file");
+  assert.equal(safeEntryName("x\u0001y.pdf"), "xy.pdf");
+  assert.equal(safeEntryName("INV-100.pdf"), "INV-100.pdf");
+});
+
+test("suffixes duplicate names case-insensitively", async () => {
+  const { output, finished } = collector();
+  const zip = new ZipStream(output);
+
+  await Promise.all(["INV-1.pdf", "inv-1.pdf", "INV-1.pdf", "notes", "notes"].map((name) => zip.addFile(name, "x")));
+  await zip.finalize();
+
+  assert.deepEqual(
+    readZip(await finished).map((entry) => entry.name),
+    ["INV-1.pdf", "inv-1 (2).pdf", "INV-1 (3).pdf", "notes", "notes (2)"]
+  );
+});
+
+test("does not wait for drain after the client disconnects", async () => {
+  const { output } = collector();
+  const zip = new ZipStream(output);
+
+  output.destroy();
+  await zip.addFile("late.pdf", Buffer.alloc(1024));
+  assert.equal(zip.entries.length, 1);
+});
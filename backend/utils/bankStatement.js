@@ -0,0 +1,98 @@
+/**
+ * פענוח שורות של דף בנק וטביעת האצבע שלהן - ללא גישה ל-DB
+ * (הכתיבה, מניעת הכפילויות וההתאמה ב-services/bankImport.service.js)
+ */
+
+import crypto from "crypto";
+
+export const toCents = (amount) => Math.round(Number(amount || 0) * 100);
+export const normalizeReference = (value) => String(value || "").trim().toLowerCase();
+
+const DATE_PATTERNS = {
+  "DD/MM/YYYY": ["day", "month", "year"],
+  "MM/DD/YYYY": ["month", "day", "year"],
+  "YYYY/MM/DD": ["year", "month", "day"],
+};
+
+/**
+ * פענוח תאריך מהדף לפי dateFormat (המפרידים / . - מתקבלים כולם), UTC בחצות
+ */
+export const parseStatementDate = (value, dateFormat) => {
+  if (!value) return null;
+  const text = String(value).trim();
+  const order = DATE_PATTERNS[String(dateFormat || "").toUpperCase().replace(/[.-]/g, "/")];
+  const parts = text.split(/[/.\-\s]/).filter(Boolean);
+
+  if (order && parts.length >= 3) {
+    const fields = Object.fromEntries(order.map((field, index) => [field, Number(parts[index])]));
+    if (fields.year < 100) fields.year += 2000;
+    const date = new Date(Date.UTC(fields.year, fields.month - 1, fields.day));
+    return date.getUTCMonth() === fields.month - 1 && date.getUTCDate() === fields.day ? date : null;
+  }
+
+  const date = new Date(text);
+  return Number.isNaN(date.getTime()) ? null : date;
+};
+
+const parseAmount = (value) => {
+  if (value === undefined || value === null || value === "") return null;
+  const amount = Number(String(value).replace(/[,\s₪$€]/g, ""));
+  return Number.isFinite(amount) ? amount : null;
+};
+
+/**
+ * שורת CSV -> מסמך BankTransaction (בלי fingerprint). מחזיר { error } לשורה לא תקינה.
+ */
+export const parseRow = (row, { companyId, bankAccount, dateFormat, importDate }) => {
+  const transactionDate = parseStatementDate(row.date || row.transactionDate, dateFormat);
+  if (!transactionDate) return { error: "Invalid transaction date" };
+
+  const credit = parseAmount(row.amount) ?? parseAmount(row.credit);
+  const debit = parseAmount(row.debit);
+  const amount = credit ?? (debit !== null ? -debit : null);
+  if (amount === null) return { error: "Invalid amount" };
+
+  const description = row.description || row.narrative || "";
+  const reference = row.reference || row.ref || "";
+
+  const transaction = {
+    companyId,
+    bankAccountId: bankAccount._id,
+    transactionDate,
+    amount,
+    currency: row.currency || bankAccount.currency,
+    description,
+    reference,
+    transactionType: amount >= 0 ? "Credit" : "Debit",
+    category: row.category || "",
+    source: "Import",
+    reconciliationStatus: "Unreconciled",
+    importedData: {
+      originalDescription: description,
+      originalReference: reference,
+      importDate,
+    },
+  };
+  const valueDate = parseStatementDate(row.valueDate, dateFormat);
+  if (valueDate) transaction.valueDate = valueDate;
+  return transaction;
+};
+
+/**
+ * טביעת אצבע: חשבון + יום + סכום באגורות + אסמכתא, ומספר המופע של אותו מפתח בקובץ -
+ * שתי תנועות זהות באמת באותו יום נשארות שתיים, וייבוא חוזר של אותו דף לא מוסיף כלום.
+ */
+export const fingerprintOf = (transaction, occurrences) => {
+  const key = [
+    transaction.bankAccountId.toString(),
+    transaction.transactionDate.toISOString().slice(0, 10),
+    toCents(transaction.amount),
+    normalizeReference(transaction.reference),
+  ].join("|");
+  const digest = crypto.createHash("sha256").update(key).digest("hex");
+  const occurrence = (occurrences.get(digest) || 0) + 1;
+  occurrences.set(digest, occurrence);
+  return `${digest}:${occurrence}`;
+};
+
+export default { parseStatementDate, parseRow, fingerprintOf };
@@ -0,0 +1,36 @@
+/**
+ * הרצת worker על רשימת פריטים עם מגבלת מקביליות (bounded pool)
+ * שומר על סדר התוצאות לפי סדר הקלט.
+ * שגיאה בפריט בודד לא עוצרת את השאר - מוחזרת כ-{ error } במקומה.
+ */
+export const mapWithConcurrency = async (items, limit, worker) => {
+  const list = Array.from(items || []);
+  const results = new Array(list.length);
+  const poolSize = Math.max(1, Math.min(Number(limit) || 1, list.length));
+  let cursor = 0;
+
+  const runNext = async () => {
+    while (cursor < list.length) {
+      const index = cursor++;
+      try {
+        results[index] = await worker(list[index], index);
+      } catch (error) {
+        results[index] = { error };
+      }
+    }
+  };
+
+  await Promise.all(Array.from({ length: poolSize }, runNext));
+  return results;
+};
+
+/**
+ * חלוקת מערך לחלקים בגודל קבוע
+ */
+export const chunk = (items, size) => {
+  const chunks = [];
+  for (let i = 0; i < items.length; i += size) {
+    chunks.push(items.slice(i, i + size));
+  }
+  return chunks;
+};
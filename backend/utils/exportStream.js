@@ -0,0 +1,83 @@
+/**
+ * ייצוא רשימות גדולות ישירות ל-response כ-NDJSON או CSV.
+ * הרשומות נקראות מ-cursor של Mongo ונכתבות דרך pipeline, כך שיש backpressure
+ * (לא קוראים מהר יותר ממה שהלקוח מקבל) והזיכרון קבוע גם במיליון שורות.
+ * ניתוק של הלקוח סוגר את ה-cursor.
+ */
+
+import { Transform } from "stream";
+import { pipeline } from "stream/promises";
+
+export const EXPORT_FORMATS = {
+  ndjson: { contentType: "application/x-ndjson; charset=utf-8", extension: "ndjson" },
+  csv: { contentType: "text/csv; charset=utf-8", extension: "csv" },
+};
+
+const DEFAULT_BATCH_SIZE = 1000;
+
+export const isExportFormat = (format) => Object.hasOwn(EXPORT_FORMATS, format);
+
+const readPath = (doc, path) => path.split(".").reduce((value, key) => value?.[key], doc);
+
+const csvCell = (value) => {
+  if (value === null || value === undefined) return "";
+  let text;
+  if (value instanceof Date) {
+    text = value.toISOString();
+  } else if (typeof value === "object") {
+    text = value._bsontype === "ObjectId" ? value.toString() : JSON.stringify(value);
+  } else {
+    text = String(value);
+    // מניעת הרצת נוסחאות בפתיחה ב-Excel
+    if (typeof value === "string" && /^[=+\-@\t\r]/.test(text)) text = `'${text}`;
+  }
+  return /[",\r\n]/.test(text) ? `"${text.replace(/"/g, '""')}"` : text;
+};
+
+const csvRow = (cells) => `${cells.map(csvCell).join(",")}\r\n`;
+
+/**
+ * הזרמת תוצאות query ל-res.
+ * columns (ל-CSV): [{ header, path }] או [{ header, value: (doc) => ... }]
+ */
+export const streamExport = async (
+  res,
+  query,
+  { format, filename = "export", columns = [], batchSize = DEFAULT_BATCH_SIZE }
+) => {
+  const { contentType, extension } = EXPORT_FORMATS[format];
+  const serialize =
+    format === "csv"
+      ? (doc) => csvRow(columns.map((column) => (column.value ? column.value(doc) : readPath(doc, column.path))))
+      : (doc) => `${JSON.stringify(doc)}\n`;
+
+  const cursor = query.lean().cursor({ batchSize });
+  const encoder = new Transform({
+    writableObjectMode: true,
+    transform(doc, _encoding, callback) {
+      try {
+        callback(null, serialize(doc));
+      } catch (error) {
+        callback(error);
+      }
+    },
+  });
+
+  res.status(200);
+  res.setHeader("Content-Type", contentType);
+  res.setHeader("Content-Disposition", `attachment; filename="${filename}.${extension}"`);
+  res.setHeader("Cache-Control", "no-store");
+  if (format === "csv") {
+    // BOM כדי ש-Excel יזהה UTF-8 (עברית)
+    res.write(`\uFEFF${csvRow(columns.map((column) => column.header))}`);
+  }
+
+  try {
+    await pipeline(cursor, encoder, res);
+  } catch (error) {
+    await cursor.close().catch(() => {});
+    console.error(`❌ Export stream (${filename}.${extension}) aborted:`, error.message);
+  }
+};
+
+export default { streamExport, isExportFormat, EXPORT_FORMATS };
@@ -0,0 +1,85 @@
+/**
+ * LRU cache בזיכרון עם TTL ותגיות (tags)
+ * משמש כשכבת L1 לפני Redis - מוגבל בגודל, פינוי לפי שימוש אחרון.
+ * Map שומר סדר הכנסה, לכן הרשומה הראשונה היא הישנה ביותר.
+ */
+export class LRUCache {
+  constructor({ maxEntries = 500 } = {}) {
+    this.maxEntries = maxEntries;
+    this.entries = new Map();
+    this.tagIndex = new Map();
+  }
+
+  get(key) {
+    const entry = this.entries.get(key);
+    if (!entry) return undefined;
+
+    if (Date.now() > entry.expiresAt) {
+      this.delete(key);
+      return undefined;
+    }
+
+    // רענון מיקום - הרשומה הופכת לחדשה ביותר
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+    return entry.value;
+  }
+
+  set(key, value, ttlSeconds, tags = []) {
+    if (this.entries.has(key)) this.delete(key);
+
+    this.entries.set(key, {
+      value,
+      tags,
+      expiresAt: Date.now() + ttlSeconds * 1000,
+    });
+    for (const tag of tags) {
+      if (!this.tagIndex.has(tag)) this.tagIndex.set(tag, new Set());
+      this.tagIndex.get(tag).add(key);
+    }
+
+    while (this.entries.size > this.maxEntries) {
+      this.delete(this.entries.keys().next().value);
+    }
+  }
+
+  delete(key) {
+    const entry = this.entries.get(key);
+    if (!entry) return false;
+
+    this.entries.delete(key);
+    for (const tag of entry.tags) {
+      const keys = this.tagIndex.get(tag);
+      if (!keys) continue;
+      keys.delete(key);
+      if (keys.size === 0) this.tagIndex.delete(tag);
+    }
+    return true;
+  }
+
+  /**
+   * מחיקת כל הרשומות שמסומנות באחת התגיות
+   */
+  invalidateTags(tags) {
+    let removed = 0;
+    for (const tag of tags) {
+      const keys = this.tagIndex.get(tag);
+      if (!keys) continue;
+      for (const key of [...keys]) {
+        if (this.delete(key)) removed++;
+      }
+    }
+    return removed;
+  }
+
+  clear() {
+    this.entries.clear();
+    this.tagIndex.clear();
+  }
+
+  get size() {
+    return this.entries.size;
+  }
+}
+
+export default LRUCache;
@@ -0,0 +1,175 @@
+/**
+ * נטו של דרישות הזמנות ייצור מול תמונת מלאי אחת (MRP) - ללא גישה ל-DB.
+ * הקצאה לפי סדר קבוע: מלאי שהוקצה להזמנה אחת לא נספר שוב עבור הבאה,
+ * חוסר בתת-מכלול מפורק לרכיביו, וחוסר ברכיב קנוי נרשם כדרישת רכש.
+ */
+
+const PRIORITY_RANK = { urgent: 0, high: 1, medium: 2, low: 3 };
+
+export const idOf = (value) => (value?._id ?? value)?.toString();
+const timeOf = (date) => (date ? new Date(date).getTime() : Number.MAX_SAFE_INTEGER);
+
+const addTo = (map, key, fields) => {
+  const entry = map.get(key) || { required: 0, available: 0, missing: 0 };
+  entry.required += fields.required;
+  entry.available += fields.available;
+  entry.missing += fields.missing;
+  map.set(key, entry);
+};
+
+/**
+ * הקצאת כמות של רכיב מהמלאי שנותר. חוסר ברכיב שיש לו BOM מפורק לרכיביו (ייצור תת-מכלול),
+ * חוסר ברכיב קנוי נרשם כדרישת רכש. path מונע לולאות בעצים מעגליים.
+ * מחזיר את הכמות שהייתה במלאי לפני ההקצאה.
+ */
+const allocate = (context, plan, componentId, quantity, path) => {
+  const onHand = context.stock.get(componentId) || 0;
+  const allocated = Math.min(onHand, quantity);
+  const shortage = quantity - allocated;
+  context.stock.set(componentId, onHand - allocated);
+  context.demand.set(componentId, (context.demand.get(componentId) || 0) + quantity);
+
+  if (shortage > 0) {
+    const bom = context.boms.get(componentId);
+    if (bom?.components?.length && !path.has(componentId)) {
+      addTo(plan.builds, componentId, { required: quantity, available: onHand, missing: shortage });
+      const childPath = new Set(path).add(componentId);
+      for (const line of bom.components) {
+        allocate(context, plan, idOf(line.componentId), (line.quantity || 0) * shortage, childPath);
+      }
+    } else {
+      addTo(plan.shortages, componentId, { required: quantity, available: onHand, missing: shortage });
+    }
+  }
+  return onHand;
+};
+
+const toRequirementList = (map, products) =>
+  Array.from(map.entries()).map(([componentId, entry]) => ({
+    componentId,
+    componentName: products.get(componentId)?.productName || "Unknown Component",
+    ...entry,
+  }));
+
+/**
+ * הקצאת המלאי להזמנות.
+ * orders - { _id, orderNumber, productName, quantity, priority, dueDate, createdAt, missingComponents, bomId }
+ * כאשר bomId הוא מסמך ה-BOM (populated). הסדר: הזמנות שכבר אושרו כזמינות (ללא חוסרים) קודם,
+ * אחר כך לפי עדיפות, תאריך יעד ותאריך יצירה.
+ * boms - productId -> BOM של תתי-מכלולים, stock - productId -> כמות, products - productId -> מוצר,
+ * onOrder - productId -> { totalOrdered, procurementOrders }
+ *
+ * מחזיר plans (באותו סדר כמו orders) במבנה של checkComponentAvailability, ו-purchaseList
+ * מרוכז של רכיבים קנויים שחסרים (בניכוי הכמויות שבהזמנות רכש).
+ */
+export const netProductionOrders = (orders, { boms, stock, products, onOrder = new Map() }) => {
+  const context = { boms, stock: new Map(stock), demand: new Map() };
+
+  const sequence = orders
+    .map((order, index) => ({ order, index }))
+    .sort(
+      (a, b) =>
+        (a.order.missingComponents?.length ? 1 : 0) - (b.order.missingComponents?.length ? 1 : 0) ||
+        (PRIORITY_RANK[a.order.priority] ?? PRIORITY_RANK.medium) -
+          (PRIORITY_RANK[b.order.priority] ?? PRIORITY_RANK.medium) ||
+        timeOf(a.order.dueDate) - timeOf(b.order.dueDate) ||
+        timeOf(a.order.createdAt) - timeOf(b.order.createdAt) ||
+        a.index - b.index
+    );
+
+  const plans = new Array(orders.length);
+  for (const { order, index } of sequence) {
+    const bom = order.bomId;
+    const plan = { builds: new Map(), shortages: new Map() };
+    const components = [];
+    const missingComponents = [];
+    let totalEstimatedCost = 0;
+
+    for (const line of bom?.components || []) {
+      const componentId = idOf(line.componentId);
+      const requiredQuantity = (line.quantity || 0) * (order.quantity || 0);
+      const unitCost = line.unitCost || 0;
+      totalEstimatedCost += requiredQuantity * unitCost;
+
+      const availableQuantity = allocate(context, plan, componentId, requiredQuantity, new Set([idOf(bom.productId)]));
+      const componentName = products.get(componentId)?.productName || "Unknown Component";
+
+      let status = "Available";
+      if (availableQuantity < requiredQuantity) {
+        status = availableQuantity > 0 ? "Partial" : "Unavailable";
+        missingComponents.push({
+          componentId: line.componentId,
+          componentName,
+          required: requiredQuantity,
+          available: availableQuantity,
+          missing: requiredQuantity - availableQuantity,
+        });
+      }
+
+      components.push({
+        componentId: line.componentId,
+        componentName,
+        requiredQuantity,
+        availableQuantity,
+        reservedQuantity: 0,
+        status,
+        unitCost,
+      });
+    }
+
+    plans[index] = {
+      components,
+      missingComponents,
+      totalEstimatedCost,
+      allComponentsAvailable: missingComponents.length === 0,
+      // תתי-מכלולים שצריך לייצר ורכיבים קנויים שחסרים, בכל רמות העץ
+      buildRequirements: toRequirementList(plan.builds, products),
+      purchaseRequirements: toRequirementList(plan.shortages, products),
+    };
+  }
+
+  // ריכוז דרישות הרכש של כל ההזמנות
+  const purchases = new Map();
+  orders.forEach((order, index) => {
+    for (const requirement of plans[index].purchaseRequirements) {
+      const product = products.get(requirement.componentId);
+      if (!purchases.has(requirement.componentId)) {
+        const ordered = onOrder.get(requirement.componentId);
+        purchases.set(requirement.componentId, {
+          componentId: requirement.componentId,
+          componentName: requirement.componentName,
+          inCatalog: Boolean(product),
+          sku: product?.sku || "N/A",
+          category: product?.category || "Other",
+          unitPrice: product?.unitPrice || 0,
+          totalRequired: context.demand.get(requirement.componentId) || 0,
+          totalAvailable: stock.get(requirement.componentId) || 0,
+          totalShortage: 0,
+          totalOrdered: ordered?.totalOrdered || 0,
+          procurementOrders: ordered?.procurementOrders || [],
+          totalMissing: 0,
+          affectedOrders: [],
+        });
+      }
+      const item = purchases.get(requirement.componentId);
+      item.totalShortage += requirement.missing;
+      item.affectedOrders.push({
+        orderId: idOf(order._id),
+        orderNumber: order.orderNumber,
+        productName: order.productName,
+        required: requirement.required,
+        available: requirement.available,
+        missing: requirement.missing,
+      });
+    }
+  });
+
+  const purchaseList = Array.from(purchases.values());
+  for (const item of purchaseList) {
+    item.totalMissing = Math.max(0, item.totalShortage - item.totalOrdered);
+  }
+
+  return { plans, purchaseList };
+};
+
+export default { netProductionOrders };
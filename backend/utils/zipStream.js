@@ -0,0 +1,171 @@
+/**
+ * כתיבת קובץ ZIP ישירות ל-stream (למשל res) בלי לצבור את כל הקבצים בזיכרון
+ * שיטת STORE בלבד (ללא דחיסה) - מתאים ל-PDF שכבר דחוס.
+ * כל קובץ נכתב מיד כשהוא מוכן; ה-central directory נכתב ב-finalize().
+ * קריאות מקבילות ל-addFile מסודרות בתור, כך שקבצים לא נכתבים לסירוגין.
+ * שמות הקבצים מנוקים מנתיבים (/, \, ..) ושמות כפולים מקבלים סיומת " (2)", " (3)"...
+ * מגבלות: עד 65,535 קבצים ו-4GB (ללא ZIP64).
+ */
+
+const CRC_TABLE = (() => {
+  const table = new Uint32Array(256);
+  for (let n = 0; n < 256; n++) {
+    let c = n;
+    for (let k = 0; k < 8; k++) {
+      c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+    }
+    table[n] = c >>> 0;
+  }
+  return table;
+})();
+
+const crc32 = (buffer) => {
+  let crc = 0xffffffff;
+  for (let i = 0; i < buffer.length; i++) {
+    crc = CRC_TABLE[(crc ^ buffer[i]) & 0xff] ^ (crc >>> 8);
+  }
+  return (crc ^ 0xffffffff) >>> 0;
+};
+
+const dosDateTime = (date) => {
+  const time = (date.getHours() << 11) | (date.getMinutes() << 5) | Math.floor(date.getSeconds() / 2);
+  const day = ((date.getFullYear() - 1980) << 9) | ((date.getMonth() + 1) << 5) | date.getDate();
+  return { time, day };
+};
+
+/**
+ * שם קובץ בטוח לארכיון - בלי תיקיות, בלי .. ובלי תווי בקרה
+ */
+export const safeEntryName = (name) => {
+  const cleaned = String(name ?? "")
+    .replace(/[\u0000-\u001f\u007f]/g, "")
+    .replace(/[\\/]+/g, "_")
+    .replace(/\.{2,}/g, ".")
+    .replace(/^[.\s]+/, "")
+    .trim();
+  return cleaned || "file";
+};
+
+const withSuffix = (name, index) => {
+  const dot = name.lastIndexOf(".");
+  return dot > 0 ? `${name.slice(0, dot)} (${index})${name.slice(dot)}` : `${name} (${index})`;
+};
+
+export class ZipStream {
+  constructor(output) {
+    this.output = output;
+    this.entries = [];
+    this.names = new Set();
+    this.offset = 0;
+    this.queue = Promise.resolve();
+  }
+
+  enqueue(task) {
+    const run = this.queue.then(task);
+    this.queue = run.catch(() => {});
+    return run;
+  }
+
+  // כתיבה עם backpressure - ממתינים ל-drain כשה-buffer של ה-stream מלא
+  async write(chunk) {
+    this.offset += chunk.length;
+    if (this.output.destroyed) return;
+    if (!this.output.write(chunk)) {
+      // גם close משחרר - לקוח שהתנתק לא ישאיר את הכתיבה תקועה
+      await new Promise((resolve) => {
+        const done = () => {
+          this.output.off("drain", done);
+          this.output.off("close", done);
+          resolve();
+        };
+        this.output.on("drain", done);
+        this.output.on("close", done);
+      });
+    }
+  }
+
+  /**
+   * הוספת קובץ לארכיון
+   */
+  addFile(name, data, date = new Date()) {
+    const entryName = this.uniqueName(safeEntryName(name));
+    return this.enqueue(() => this.writeFile(entryName, data, date));
+  }
+
+  // השם נשמר מיד (לפני התור) כך שקריאות מקבילות לא יקבלו אותו שם
+  uniqueName(name) {
+    let candidate = name;
+    for (let index = 2; this.names.has(candidate.toLowerCase()); index++) {
+      candidate = withSuffix(name, index);
+    }
+    this.names.add(candidate.toLowerCase());
+    return candidate;
+  }
+
+  async writeFile(name, data, date) {
+    const content = Buffer.isBuffer(data) ? data : Buffer.from(data);
+    const fileName = Buffer.from(name, "utf8");
+    const crc = crc32(content);
+    const { time, day } = dosDateTime(date);
+
+    const header = Buffer.alloc(30);
+    header.writeUInt32LE(0x04034b50, 0);
+    header.writeUInt16LE(20, 4); // version needed
+    header.writeUInt16LE(0x0800, 6); // UTF-8 file names
+    header.writeUInt16LE(0, 8); // STORE
+    header.writeUInt16LE(time, 10);
+    header.writeUInt16LE(day, 12);
+    header.writeUInt32LE(crc, 14);
+    header.writeUInt32LE(content.length, 18);
+    header.writeUInt32LE(content.length, 22);
+    header.writeUInt16LE(fileName.length, 26);
+    header.writeUInt16LE(0, 28);
+
+    this.entries.push({ fileName, crc, size: content.length, time, day, offset: this.offset });
+
+    await this.write(header);
+    await this.write(fileName);
+    await this.write(content);
+  }
+
+  /**
+   * כתיבת ה-central directory וסגירת הארכיון
+   */
+  finalize() {
+    return this.enqueue(() => this.writeCentralDirectory());
+  }
+
+  async writeCentralDirectory() {
+    const start = this.offset;
+
+    for (const entry of this.entries) {
+      const record = Buffer.alloc(46);
+      record.writeUInt32LE(0x02014b50, 0);
+      record.writeUInt16LE(20, 4); // version made by
+      record.writeUInt16LE(20, 6); // version needed
+      record.writeUInt16LE(0x0800, 8);
+      record.writeUInt16LE(0, 10);
+      record.writeUInt16LE(entry.time, 12);
+      record.writeUInt16LE(entry.day, 14);
+      record.writeUInt32LE(entry.crc, 16);
+      record.writeUInt32LE(entry.size, 20);
+      record.writeUInt32LE(entry.size, 24);
+      record.writeUInt16LE(entry.fileName.length, 28);
+      record.writeUInt32LE(entry.offset, 42);
+      await this.write(record);
+      await this.write(entry.fileName);
+    }
+
+    const end = Buffer.alloc(22);
+    end.writeUInt32LE(0x06054b50, 0);
+    end.writeUInt16LE(this.entries.length, 8);
+    end.writeUInt16LE(this.entries.length, 10);
+    end.writeUInt32LE(this.offset - start, 12);
+    end.writeUInt32LE(start, 16);
+    await this.write(end);
+
+    this.output.end();
+  }
+}
+
+export default ZipStream;